@@ -19,6 +19,24 @@ OPENAI_TEXT_MODEL = os.environ.get('OPENAI_TEXT_MODEL', 'gpt-4o-mini')
 OPENAI_MODEL = os.environ.get('OPENAI_MODEL', os.getenv('OPENAI_VISION_MODEL', 'gpt-4o-mini-vision'))
 # Timeout (seconds) for upstream OpenAI calls
 OPENAI_TIMEOUT = int(os.environ.get('OPENAI_TIMEOUT', '20'))
+# Vision uploads are shrunk to this long edge before sending: 512, 768 or 1024
+# (core/services/image_preprocess.py); 512 also switches the request to 'low' detail
+OPENAI_IMAGE_MAX_EDGE = int(os.environ.get('OPENAI_IMAGE_MAX_EDGE', '1024'))
+OPENAI_IMAGE_JPEG_QUALITY = int(os.environ.get('OPENAI_IMAGE_JPEG_QUALITY', '85'))
+# Outbound limits for vision calls (core/services/openai_outbound.py)
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+OPENAI_MAX_CONCURRENCY = int(os.environ.get('OPENAI_MAX_CONCURRENCY', '8'))
+# longest a call may wait for a rate-limit token and a concurrency slot
+OPENAI_QUEUE_TIMEOUT = float(os.environ.get('OPENAI_QUEUE_TIMEOUT', '10'))
+# 'local' (per process) or 'django' (shared through the cache named by OPENAI_RATE_LIMIT_ALIAS)
+OPENAI_RATE_LIMIT_BACKEND = os.environ.get('OPENAI_RATE_LIMIT_BACKEND', 'local')
+OPENAI_RATE_LIMIT_ALIAS = os.environ.get('OPENAI_RATE_LIMIT_ALIAS', 'default')
+OPENAI_RATE_PER_MINUTE = float(os.environ.get('OPENAI_RATE_PER_MINUTE', '500'))
+OPENAI_RATE_BURST = int(os.environ.get('OPENAI_RATE_BURST', '20'))
+OPENAI_BREAKER_FAILURES = int(os.environ.get('OPENAI_BREAKER_FAILURES', '5'))
+OPENAI_BREAKER_RESET_SECONDS = float(os.environ.get('OPENAI_BREAKER_RESET_SECONDS', '30'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '1'))
+OPENAI_RETRY_BACKOFF = float(os.environ.get('OPENAI_RETRY_BACKOFF', '0.5'))
 
 # Optional: single static LibreView account mode. When enabled the server will
 # use the static email/password below for any Libre password-login flows.
@@ -32,10 +50,80 @@ LIBRE_OAUTH_AUTHORIZE_URL = 'https://api.libreview.io/oauth/authorize'
 LIBRE_OAUTH_TOKEN_URL = 'https://api.libreview.io/oauth/token'  
 LIBRE_OAUTH_SCOPE = 'read:glucose read:connections'  
 
-LIBRE_PASSWORD_BASE_URL = 'https://api.libreview.io'
+# LLU password-login host and the regional host a login redirect points at
+# (core/services/libre.py); point both at scripts/fake_libre_server.py for load tests
+LIBRE_PASSWORD_BASE_URL = os.environ.get('LIBRE_PASSWORD_BASE_URL', 'https://api.libreview.io')
+LIBRE_REGION_URL_TEMPLATE = os.environ.get('LIBRE_REGION_URL_TEMPLATE', 'https://api-{region}.libreview.io')
 LIBRE_LLU_PRODUCT = 'llu.android'
 LIBRE_LLU_VERSION = '4.16.0'
 
+# Fan-out sync of every connected user (core/services/libre_sync.py)
+LIBRE_SYNC_CONCURRENCY = int(os.environ.get('LIBRE_SYNC_CONCURRENCY', '16'))
+LIBRE_SYNC_REGION_RATE_PER_MINUTE = float(os.environ.get('LIBRE_SYNC_REGION_RATE_PER_MINUTE', '600'))
+LIBRE_SYNC_REGION_BURST = int(os.environ.get('LIBRE_SYNC_REGION_BURST', '20'))
+# 'local' (per process) or 'django' (shared through the default cache)
+LIBRE_SYNC_RATE_LIMIT_BACKEND = os.environ.get('LIBRE_SYNC_RATE_LIMIT_BACKEND', 'local')
+LIBRE_SYNC_MAX_WAIT = float(os.environ.get('LIBRE_SYNC_MAX_WAIT', '60'))
+LIBRE_SYNC_TIMEOUT = float(os.environ.get('LIBRE_SYNC_TIMEOUT', '15'))
+LIBRE_SYNC_INTERVAL_SECONDS = int(os.environ.get('LIBRE_SYNC_INTERVAL_SECONDS', '300'))
+LIBRE_SYNC_LOCK_SECONDS = int(os.environ.get('LIBRE_SYNC_LOCK_SECONDS', '1800'))
+
+# Adaptive per-connection polling (core/services/libre_scheduler.py)
+LIBRE_POLL_MIN_SECONDS = int(os.environ.get('LIBRE_POLL_MIN_SECONDS', '60'))
+LIBRE_POLL_BASE_SECONDS = int(os.environ.get('LIBRE_POLL_BASE_SECONDS', '300'))
+LIBRE_POLL_MAX_SECONDS = int(os.environ.get('LIBRE_POLL_MAX_SECONDS', '1800'))
+# fixed interval the "polls saved" metric is measured against
+LIBRE_POLL_BASELINE_SECONDS = int(os.environ.get('LIBRE_POLL_BASELINE_SECONDS', str(LIBRE_SYNC_INTERVAL_SECONDS)))
+# mg/dL per minute
+LIBRE_POLL_FAST_RATE = float(os.environ.get('LIBRE_POLL_FAST_RATE', '2'))
+LIBRE_POLL_CHANGING_RATE = float(os.environ.get('LIBRE_POLL_CHANGING_RATE', '1'))
+LIBRE_POLL_FLAT_RATE = float(os.environ.get('LIBRE_POLL_FLAT_RATE', '0.5'))
+LIBRE_POLL_THRESHOLD_MARGIN = float(os.environ.get('LIBRE_POLL_THRESHOLD_MARGIN', '20'))
+# sensor-local hours [start, end)
+LIBRE_POLL_NIGHT_HOURS = tuple(int(h) for h in os.environ.get('LIBRE_POLL_NIGHT_HOURS', '0,6').split(','))
+LIBRE_POLL_NIGHT_FACTOR = float(os.environ.get('LIBRE_POLL_NIGHT_FACTOR', '2'))
+LIBRE_POLL_STALE_FACTOR = float(os.environ.get('LIBRE_POLL_STALE_FACTOR', '2'))
+LIBRE_POLL_JITTER = float(os.environ.get('LIBRE_POLL_JITTER', '0.1'))
+LIBRE_SCHEDULER_BATCH_SIZE = int(os.environ.get('LIBRE_SCHEDULER_BATCH_SIZE', '500'))
+LIBRE_SCHEDULER_TICK_SECONDS = int(os.environ.get('LIBRE_SCHEDULER_TICK_SECONDS', '30'))
+
+# Glucose prediction models (core/services/inference.py)
+PREDICTION_MODEL_DIR = os.environ.get('PREDICTION_MODEL_DIR', str(BASE_DIR / 'model'))
+# Intra-op threads for torch per worker; keep low when running many workers
+PREDICTION_TORCH_THREADS = int(os.environ.get('PREDICTION_TORCH_THREADS', '1'))
+# Minutes of raw history used to build the 48-step feature window
+PREDICTION_FEATURE_HISTORY_MINUTES = int(os.environ.get('PREDICTION_FEATURE_HISTORY_MINUTES', '720'))
+# Coalesce concurrent CNN-LSTM requests into one forward pass (core/services/batching.py)
+PREDICTION_BATCHING_ENABLED = os.environ.get('PREDICTION_BATCHING_ENABLED', '1') in ('1', 'true', 'True')
+PREDICTION_BATCH_MAX_SIZE = int(os.environ.get('PREDICTION_BATCH_MAX_SIZE', '32'))
+PREDICTION_BATCH_MAX_WAIT_MS = float(os.environ.get('PREDICTION_BATCH_MAX_WAIT_MS', '5'))
+
+# Glucose alerts (core/services/alerts.py, core/services/alert_delivery.py)
+ALERT_DEDUPE_MINUTES = int(os.environ.get('ALERT_DEDUPE_MINUTES', '15'))
+# 'thread' (in-process worker), 'celery' or 'sync'
+ALERT_DELIVERY_QUEUE = os.environ.get('ALERT_DELIVERY_QUEUE', 'thread')
+ALERT_DELIVERY_BACKEND = os.environ.get('ALERT_DELIVERY_BACKEND', 'core.services.alert_delivery.LogAlertBackend')
+ALERT_DELIVERY_QUEUE_SIZE = int(os.environ.get('ALERT_DELIVERY_QUEUE_SIZE', '1000'))
+ALERT_DELIVERY_WORKERS = int(os.environ.get('ALERT_DELIVERY_WORKERS', '1'))
+
+# Food-image analysis cache (core/services/analysis_cache.py)
+OPENAI_IMAGE_CACHE_ENABLED = os.environ.get('OPENAI_IMAGE_CACHE_ENABLED', '1') in ('1', 'true', 'True')
+# 'memory' (per-process LRU) or 'django' (the Django cache named by OPENAI_IMAGE_CACHE_ALIAS)
+OPENAI_IMAGE_CACHE_BACKEND = os.environ.get('OPENAI_IMAGE_CACHE_BACKEND', 'memory')
+OPENAI_IMAGE_CACHE_ALIAS = os.environ.get('OPENAI_IMAGE_CACHE_ALIAS', 'default')
+OPENAI_IMAGE_CACHE_TTL = int(os.environ.get('OPENAI_IMAGE_CACHE_TTL', str(7 * 24 * 3600)))
+OPENAI_IMAGE_CACHE_MAX_ENTRIES = int(os.environ.get('OPENAI_IMAGE_CACHE_MAX_ENTRIES', '1024'))
+
+# Background food-image analysis jobs (core/services/analysis_jobs.py)
+# 'thread' (in-process worker pool), 'celery' or 'sync'
+ANALYSIS_JOB_QUEUE = os.environ.get('ANALYSIS_JOB_QUEUE', 'thread')
+ANALYSIS_JOB_QUEUE_SIZE = int(os.environ.get('ANALYSIS_JOB_QUEUE_SIZE', '100'))
+ANALYSIS_JOB_WORKERS = int(os.environ.get('ANALYSIS_JOB_WORKERS', '4'))
+ANALYSIS_JOB_USER_MAX_ACTIVE = int(os.environ.get('ANALYSIS_JOB_USER_MAX_ACTIVE', '2'))
+# queued/running jobs older than this no longer count towards the per-user cap or the
+# queue depth, and the reap-analysis-jobs task fails them
+ANALYSIS_JOB_STALE_SECONDS = int(os.environ.get('ANALYSIS_JOB_STALE_SECONDS', '600'))
+
 #celery settings
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://127.0.0.1:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://127.0.0.1:6379/1')
@@ -46,6 +134,17 @@ CELERY_RESULT_SERIALIZER = 'json'
 
 CELERY_ENABLE_UTC = True
 
+CELERY_BEAT_SCHEDULE = {
+    'sync-due-libre': {
+        'task': 'core.tasks.sync_due_libre',
+        'schedule': LIBRE_SCHEDULER_TICK_SECONDS,
+    },
+    'reap-analysis-jobs': {
+        'task': 'core.tasks.reap_analysis_jobs',
+        'schedule': 60.0,
+    },
+}
+
 
 
 # Quick-start development settings - unsuitable for production
@@ -85,6 +184,8 @@ AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # compress JSON responses (chart series, paged lists) for clients sending Accept-Encoding: gzip
+    'django.middleware.gzip.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -171,6 +272,36 @@ CSRF_COOKIE_HTTPONLY =False
 SESSION_COOKIE_SECURE = False
 CSRF_COOKIE_SAMESITE = 'Lax'
 CSRF_TRUSTED_ORIGINS = ['http://127.0.0.1:8000']
+# Cursor pagination for glucose-records / food-entries (core/services/pagination.py)
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', '500'))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', '2000'))
+
+# Max points in one ?format=columnar glucose-records response (core/services/columnar.py)
+COLUMNAR_MAX_POINTS = int(os.environ.get('COLUMNAR_MAX_POINTS', '200000'))
+
+# glucose/downsample/ point budget cap and result cache lifetime (core/services/downsample.py)
+DOWNSAMPLE_MAX_POINTS = int(os.environ.get('DOWNSAMPLE_MAX_POINTS', '2000'))
+DOWNSAMPLE_CACHE_TTL = int(os.environ.get('DOWNSAMPLE_CACHE_TTL', '300'))
+
+# Rows fetched per database round trip when streaming history exports (core/services/export.py)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', '2000'))
+
+# Per-user hot state: latest reading, thresholds, dosing parameters (core/services/user_state.py)
+# 'memory' (per-process) or 'django' (the Django cache named by USER_STATE_CACHE_ALIAS, e.g. Redis in prod);
+# dosing parameters are only cached when the cache is shared by every worker
+USER_STATE_CACHE_BACKEND = os.environ.get('USER_STATE_CACHE_BACKEND', 'memory')
+USER_STATE_CACHE_ALIAS = os.environ.get('USER_STATE_CACHE_ALIAS', 'default')
+USER_STATE_CACHE_TTL = int(os.environ.get('USER_STATE_CACHE_TTL', '300'))
+USER_STATE_CACHE_MAX_ENTRIES = int(os.environ.get('USER_STATE_CACHE_MAX_ENTRIES', '10000'))
+
+# Bulk history import: rows parsed/validated/written per chunk, and how recent an
+# imported reading must be to raise alerts (core/services/bulk_import.py)
+IMPORT_CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', '20000'))
+IMPORT_ALERT_LOOKBACK_MINUTES = int(os.environ.get('IMPORT_ALERT_LOOKBACK_MINUTES', '60'))
+
+# Max entries in one glucose-records/batch/ or food-entries/batch/ request (core/services/offline_sync.py)
+OFFLINE_BATCH_MAX_ITEMS = int(os.environ.get('OFFLINE_BATCH_MAX_ITEMS', '500'))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -9,6 +9,10 @@ from .models import (
     Alert,
     InsightReport,
     Recommendation,
+    UserFeatureState,
+    GlucoseHourlyRollup,
+    GlucoseDailyRollup,
+    AnalysisJob,
     Images,
 )
 
@@ -33,7 +37,9 @@ class GlucoseRecordAdmin(admin.ModelAdmin):
 
 @admin.register(LibreConnection)
 class LibreConnectionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'email', 'connected')
+    list_display = ('user', 'email', 'connected', 'region', 'last_synced', 'last_sync_status', 'sync_failures',
+                    'sync_interval', 'next_sync_at')
+    list_filter = ('connected', 'region', 'last_sync_status')
     raw_id_fields = ('user',)
 
 
@@ -67,6 +73,32 @@ class RecommendationAdmin(admin.ModelAdmin):
     raw_id_fields = ('user',)
 
 
+@admin.register(UserFeatureState)
+class UserFeatureStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'dirty', 'updated_at')
+    raw_id_fields = ('user',)
+
+
+@admin.register(GlucoseHourlyRollup)
+class GlucoseHourlyRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'bucket', 'count', 'low_count', 'high_count')
+    raw_id_fields = ('user',)
+
+
+@admin.register(GlucoseDailyRollup)
+class GlucoseDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'day', 'count', 'low_count', 'high_count')
+    raw_id_fields = ('user',)
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'error', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    raw_id_fields = ('user', 'food_entry')
+    exclude = ('image',)
+
+
 @admin.register(Images)
 class ImagesAdmin(admin.ModelAdmin):
     list_display = ('id', 'title')
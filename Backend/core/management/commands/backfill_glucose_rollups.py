@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.services import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild hourly/daily glucose rollups from raw GlucoseRecords (migration 0021 does the initial build).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='User id to backfill (repeatable). Defaults to every user with glucose data.')
+        parser.add_argument('--days', type=int, default=None,
+                            help='Only rebuild the last N days (default: full history).')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.filter(glucose_records__isnull=False).distinct()
+        if options['users']:
+            users = User.objects.filter(pk__in=options['users'])
+        start = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+
+        total = 0
+        for user in users.iterator():
+            try:
+                hours = rollups.backfill(user, start=start)
+                total += hours
+                self.stdout.write(f'Backfilled user_id={user.pk}: {hours} hourly buckets')
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'Failed to backfill user_id={user.pk}: {e}'))
+        self.stdout.write(self.style.SUCCESS(f'Backfill complete: {total} hourly buckets.'))
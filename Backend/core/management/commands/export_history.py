@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from core.services import export
+from core.services.pagination import parse_query_timestamp
+
+
+class Command(BaseCommand):
+    help = ('Stream a user\'s glucose and food history as CSV (timestamp,glucose,insulin,carbs, '
+            'the model/*.csv schema) or NDJSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, required=True, help='User id to export.')
+        parser.add_argument('--format', choices=export.FORMATS, default='csv', dest='fmt')
+        parser.add_argument('--output', default='-', help='File to write (default: stdout).')
+        parser.add_argument('--start', help='ISO datetime or date (inclusive).')
+        parser.add_argument('--end', help='ISO datetime or date (inclusive).')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(pk=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+        try:
+            start = parse_query_timestamp(options['start'], 'start') if options['start'] else None
+            end = parse_query_timestamp(options['end'], 'end', end_of_day=True) if options['end'] else None
+        except ValidationError as e:
+            raise CommandError(str(e.detail))
+
+        blocks = export.iter_export(user, options['fmt'], start, end)
+        if options['output'] == '-':
+            for block in blocks:
+                self.stdout.write(block, ending='')
+            return
+        with open(options['output'], 'w', newline='') as out:
+            for block in blocks:
+                out.write(block)
+        self.stderr.write(self.style.SUCCESS(f"Exported user_id={user.pk} to {options['output']}"))
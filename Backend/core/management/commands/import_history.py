@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services import bulk_import
+
+
+class Command(BaseCommand):
+    help = ('Bulk-import a glucose / food history file for one user: CSV in the model/*.csv schema '
+            '(timestamp,glucose,insulin,carbs) or NDJSON as written by export_history.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--user', type=int, required=True, help='User id to import into.')
+        parser.add_argument('--format', choices=bulk_import.FORMATS, default='csv', dest='fmt')
+        parser.add_argument('--source', default='libre', help='GlucoseRecord source for the readings.')
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(pk=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with id {options['user']}")
+        try:
+            with open(options['path'], 'rb') as f:
+                result = bulk_import.import_history(user, f, options['fmt'], source=options['source'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.rows} rows for user_id={user.pk}: {result.glucose_created} glucose, "
+            f"{result.food_created} food, {result.rejected} rejected"
+        ))
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f"  {error}"))
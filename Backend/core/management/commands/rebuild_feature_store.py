@@ -0,0 +1,35 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.services import feature_store
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the incremental prediction feature state from recent glucose/food history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='User id to rebuild (repeatable). Defaults to every user with glucose data.')
+        parser.add_argument('--dirty-only', action='store_true',
+                            help='Only rebuild states marked dirty by out-of-order readings.')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.all()
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+        elif options['dirty_only']:
+            users = users.filter(feature_state__dirty=True)
+        else:
+            users = users.filter(glucose_records__isnull=False).distinct()
+
+        rebuilt = 0
+        for user in users.iterator():
+            try:
+                acc = feature_store.rebuild(user)
+                rebuilt += 1
+                ready = acc.window() is not None
+                self.stdout.write(f'Rebuilt user_id={user.pk} slot={acc.slot} window_ready={ready}')
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'Failed to rebuild user_id={user.pk}: {e}'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt feature state for {rebuilt} user(s).'))
@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.services import libre_scheduler
+
+
+class Command(BaseCommand):
+    help = ('Poll LibreLinkUp per connection as each one falls due, with adaptive intervals '
+            '(see core/services/libre_scheduler.py). Run this or the sync-due-libre beat task, not both.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Sync the connections due now, print the stats and exit.')
+        parser.add_argument('--stats', action='store_true', help='Print the scheduler stats and exit.')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Fetch workers (default: LIBRE_SYNC_CONCURRENCY).')
+        parser.add_argument('--stats-every', type=float, default=300,
+                            help='Seconds between stats lines while running (default: 300).')
+
+    def _print_stats(self):
+        self.stdout.write(json.dumps(libre_scheduler.scheduler_stats(), default=str))
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self._print_stats()
+            return
+        scheduler = libre_scheduler.LibrePollScheduler(concurrency=options['concurrency'])
+        scheduler.load()
+        self.stdout.write(f'{len(scheduler)} connections queued')
+        if options['once']:
+            report = scheduler.run_due()
+            synced = report.connections if report is not None else 0
+            self.stdout.write(self.style.SUCCESS(f'Synced {synced} due connections.'))
+            self._print_stats()
+            return
+
+        last_stats = time.monotonic()
+
+        def on_report(report):
+            nonlocal last_stats
+            if time.monotonic() - last_stats >= options['stats_every']:
+                self._print_stats()
+                last_stats = time.monotonic()
+
+        try:
+            scheduler.run_forever(on_report=on_report)
+        except KeyboardInterrupt:
+            self._print_stats()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core.models import LibreConnection
+from core.services import libre_sync
+
+
+class Command(BaseCommand):
+    help = 'Sync LibreLinkUp readings for every connected user concurrently (see core/services/libre_sync.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='User id to sync (repeatable). Defaults to every connected user.')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Fetch workers (default: LIBRE_SYNC_CONCURRENCY).')
+        parser.add_argument('--no-history', action='store_true',
+                            help='Only fetch /connections, not the ~12h graph per patient.')
+
+    def handle(self, *args, **options):
+        include_history = not options['no_history']
+        if options['users']:
+            report = libre_sync.sync_connections(LibreConnection.objects.filter(user_id__in=options['users']),
+                                                 include_history=include_history,
+                                                 concurrency=options['concurrency'])
+        else:
+            report = libre_sync.sync_all(include_history=include_history, concurrency=options['concurrency'])
+            if report is None:
+                self.stdout.write(self.style.WARNING('Another Libre sync is still running; nothing done.'))
+                return
+
+        summary = report.as_dict()
+        for status, count in sorted(summary['statuses'].items()):
+            self.stdout.write(f'{status}: {count}')
+        message = (f"Synced {summary['connections']} connections in {summary['wall_seconds']}s: "
+                   f"{summary['created']} new readings, {summary['requests']} LLU requests, "
+                   f"{summary['logins']} logins.")
+        if summary['statuses'].get('ok', 0) == summary['connections']:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.WARNING(message))
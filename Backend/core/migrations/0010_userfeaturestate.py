@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-16 22:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_foodentry_total_calories_foodentry_total_carbs_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserFeatureState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.JSONField(blank=True, default=dict)),
+                ('dirty', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='feature_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_userfeaturestate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlucoseDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('sumsq', models.FloatField(default=0.0)),
+                ('minimum', models.FloatField(blank=True, null=True)),
+                ('maximum', models.FloatField(blank=True, null=True)),
+                ('low_count', models.PositiveIntegerField(default=0)),
+                ('high_count', models.PositiveIntegerField(default=0)),
+                ('high_by_hour', models.JSONField(blank=True, default=list)),
+                ('low_threshold', models.FloatField()),
+                ('high_threshold', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='glucose_daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='uniq_glucose_daily_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='GlucoseHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.FloatField(default=0.0)),
+                ('sumsq', models.FloatField(default=0.0)),
+                ('minimum', models.FloatField(blank=True, null=True)),
+                ('maximum', models.FloatField(blank=True, null=True)),
+                ('low_count', models.PositiveIntegerField(default=0)),
+                ('high_count', models.PositiveIntegerField(default=0)),
+                ('low_threshold', models.FloatField()),
+                ('high_threshold', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='glucose_hourly_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'bucket'), name='uniq_glucose_hourly_rollup')],
+            },
+        ),
+    ]
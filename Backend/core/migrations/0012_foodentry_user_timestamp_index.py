@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_glucose_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='foodentry',
+            index=models.Index(fields=['user', 'timestamp'], name='core_fooden_user_id_18cd62_idx'),
+        ),
+    ]
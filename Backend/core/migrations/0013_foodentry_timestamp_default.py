@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-16 23:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_foodentry_user_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='foodentry',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
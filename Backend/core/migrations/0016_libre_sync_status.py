@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_analysis_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libreconnection',
+            name='last_sync_error',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='libreconnection',
+            name='last_sync_status',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='libreconnection',
+            name='sync_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_libre_sync_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libreconnection',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='libreconnection',
+            name='sync_interval',
+            field=models.PositiveIntegerField(default=300),
+        ),
+        migrations.AddField(
+            model_name='libreconnection',
+            name='utc_offset_minutes',
+            field=models.SmallIntegerField(blank=True, null=True),
+        ),
+    ]
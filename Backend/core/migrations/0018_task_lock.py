@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_libre_polling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLock',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('owner', models.CharField(max_length=32)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
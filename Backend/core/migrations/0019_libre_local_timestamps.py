@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-17 01:32
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_local_timestamps(apps, schema_editor):
+    # readings synced so far were stored at the sensor's local time read as UTC
+    LibreConnection = apps.get_model('core', 'LibreConnection')
+    LibreConnection.objects.update(local_timestamps_before=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_task_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libreconnection',
+            name='local_timestamps_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_local_timestamps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.7 on 2026-10-17 11:05
+
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import migrations
+from django.db.models.functions import TruncHour
+
+from core.services.glucose_stats import GlucoseSummary, stats_thresholds, summary_aggregates, summary_from_row
+
+
+def backfill_rollups(apps, schema_editor):
+    # statistics and insights read only rollups; build them for the readings stored before 0011
+    User = apps.get_model('users', 'User')
+    GlucoseRecord = apps.get_model('core', 'GlucoseRecord')
+    GlucoseHourlyRollup = apps.get_model('core', 'GlucoseHourlyRollup')
+    GlucoseDailyRollup = apps.get_model('core', 'GlucoseDailyRollup')
+
+    user_ids = GlucoseRecord.objects.values_list('user_id', flat=True).distinct()
+    for user in User.objects.filter(pk__in=user_ids).iterator():
+        low, high = stats_thresholds(user)
+        rows = (
+            GlucoseRecord.objects.filter(user=user)
+            .annotate(bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('bucket')
+            .annotate(**summary_aggregates(low, high))
+        )
+        hourly = []
+        days = defaultdict(lambda: [GlucoseSummary(), [0] * 24])
+        for row in rows:
+            s = summary_from_row(row)
+            hourly.append(GlucoseHourlyRollup(
+                user=user, bucket=row['bucket'], count=s.count, total=s.total, sumsq=s.sumsq,
+                minimum=s.minimum, maximum=s.maximum, low_count=s.below, high_count=s.above,
+                low_threshold=low, high_threshold=high,
+            ))
+            entry = days[row['bucket'].date()]
+            entry[0] = entry[0] + s
+            entry[1][row['bucket'].hour] += s.above
+        daily = [
+            GlucoseDailyRollup(
+                user=user, day=day, count=s.count, total=s.total, sumsq=s.sumsq,
+                minimum=s.minimum, maximum=s.maximum, low_count=s.below, high_count=s.above,
+                high_by_hour=by_hour, low_threshold=low, high_threshold=high,
+            )
+            for day, (s, by_hour) in days.items()
+        ]
+        # rows written since 0011 are recomputed from the same readings
+        GlucoseHourlyRollup.objects.bulk_create(
+            hourly, batch_size=500, update_conflicts=True, unique_fields=['user', 'bucket'],
+            update_fields=['count', 'total', 'sumsq', 'minimum', 'maximum', 'low_count', 'high_count',
+                           'low_threshold', 'high_threshold', 'updated_at'],
+        )
+        GlucoseDailyRollup.objects.bulk_create(
+            daily, batch_size=500, update_conflicts=True, unique_fields=['user', 'day'],
+            update_fields=['count', 'total', 'sumsq', 'minimum', 'maximum', 'low_count', 'high_count',
+                           'high_by_hour', 'low_threshold', 'high_threshold'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_glucosehourlyrollup_updated_at'),
+        ('users', '0005_alter_user_gender_alter_user_libre_registered'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,10 @@
 import json
-from django.db import models
-from django.db.models.signals import post_save
+import logging
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django.utils.dateparse import parse_datetime
 from django.conf import settings
-from django.db.models import Avg, Count
+from django.db.models import Count
 import uuid
 import hashlib
 import requests
@@ -12,10 +12,11 @@ from datetime import timedelta
 from django.utils import timezone
 from django.core.files.base import ContentFile
 from .services.openai_service import analyze_image
-from .services.insulin import calculate_insulin
-from .services.libre import login_with_password, get_libreview_connection
+from .services.libre import login_with_password, get_libreview_connection, region_from_base_url
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_LOW_GLUC = 69
 DEFAULT_HIGH_GLUC = 200
 
@@ -62,7 +63,8 @@ class FoodEntry(models.Model):
     image = models.ImageField(upload_to='food_images/', blank=True, null=True)
     food_name = models.CharField(max_length=255, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # defaults to creation time; bulk imports and offline sync set the time the meal was logged
+    timestamp = models.DateTimeField(default=timezone.now)
     meal_type = models.CharField(max_length=16, choices=MEAL_TYPES, default="lunch")
     nutritional_info = models.OneToOneField(NutritionalInfo, on_delete=models.SET_NULL, null=True, blank=True)
 
@@ -73,7 +75,17 @@ class FoodEntry(models.Model):
   
     insulin_recommended = models.FloatField(blank=True, null=True)
     insulin_rounded = models.FloatField(blank=True, null=True)
+    # idempotency key from the app's offline queue (services/offline_sync.py)
+    client_id = models.CharField(max_length=64, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'client_id'], condition=models.Q(client_id__isnull=False),
+                                    name='uniq_food_client_id'),
+        ]
    
     def analyze_food(self, image_file=None):
         """Placeholder for analysis, returns NutritionalInfo-like dict or object."""
@@ -100,57 +112,9 @@ class FoodEntry(models.Model):
         except Exception as e:
             return {"error": f"analysis failed: {e}"}
         
-        #result 
-        name = result.get("name")
-        #components + carbs
-        total_carbs = result.get("total_carbs_g")
-
-        #update
-        ni = self.nutritional_info or NutritionalInfo()
-        ni.carbs = total_carbs
-        ni.save()
-
-        #attach to foodentry
-        changed = False
-        if not self.nutritional_info_id or self.nutritional_info_id != ni.id:
-            self.nutritional_info = ni
-            changed = True
-        if name and (not self.food_name):
-            self.food_name = name
-            changed = True
-        
-        #insulin calc
-        try:
-            carb_ratio = getattr(self.user, "insulin_to_carb_ratio", None)
-            correction_factor = getattr(self.user, "correction_factor", None)
-            current_glucose = None
-            try:
-                latest = self.user.glucose_records.order_by('-timestamp').first()
-                if latest:
-                    current_glucose = latest.glucose_level
-            except Exception:
-                current_glucose = getattr(self.user, "current_glucose", None)
-
-            if total_carbs is not None and carb_ratio:
-                calc = calculate_insulin(
-                    total_carbs_g=float(total_carbs),
-                    carb_ratio=float(carb_ratio),
-                    current_glucose=current_glucose,
-                    correction_factor=correction_factor,
-                )
-                self.insulin_recommended = calc.get("recommended_dose")
-                self.insulin_rounded = calc.get("rounded_dose")
-                changed = True
-        except Exception:
-            pass
-
-        if changed:
-            self.save(update_fields=[
-                "nutritional_info",
-                "food_name",
-                "insulin_recommended",
-                "insulin_rounded",
-            ])   
+        #store nutrition, name and insulin dose in one write (services/food_entries.py)
+        from .services.food_entries import apply_analysis
+        ni = apply_analysis(self, result)
         return {
             **result,
             "nutritional_info_id": ni.id,
@@ -190,10 +154,13 @@ class GlucoseRecord(models.Model):
     meal_timing = models.CharField(max_length=20, choices=MEAL_TIMING_CHOICES, blank=True, null=True)
     mood = models.CharField(max_length=20, choices=MOOD_CHOICES, blank=True, null=True)
     notes = models.TextField(blank=True, null=True)  
+    # idempotency key from the app's offline queue (services/offline_sync.py)
+    client_id = models.CharField(max_length=64, blank=True, null=True)
 
   
     def is_abnormal(self, low_threshold=None, high_threshold=None):
-        low, high = _user_glucose_thresholds(self.user)
+        from .services import user_state
+        low, high = user_state.thresholds(self.user_id)
         if low_threshold is not None:
             low = float(low_threshold)
         if high_threshold is not None:
@@ -209,6 +176,8 @@ class GlucoseRecord(models.Model):
         ]
         constraints = [
             models.UniqueConstraint(fields=['user', 'timestamp', 'glucose_level', 'source'], name='uniq_glucose_row'),
+            models.UniqueConstraint(fields=['user', 'client_id'], condition=models.Q(client_id__isnull=False),
+                                    name='uniq_glucose_client_id'),
         ]
 
 class LibreConnection(models.Model):
@@ -227,6 +196,17 @@ class LibreConnection(models.Model):
     connected = models.BooleanField(default=False)
     region = models.CharField(max_length=100, blank=True, null=True)
     last_synced = models.DateTimeField(blank=True, null=True)
+    # outcome of the latest fan-out sync (services/libre_sync.py)
+    last_sync_status = models.CharField(max_length=32, blank=True, default='')
+    last_sync_error = models.CharField(max_length=255, blank=True, default='')
+    sync_failures = models.PositiveIntegerField(default=0)
+    # adaptive polling (services/libre_scheduler.py): when the next sync is due and the interval chosen
+    next_sync_at = models.DateTimeField(blank=True, null=True, db_index=True)
+    sync_interval = models.PositiveIntegerField(default=300)
+    # the sensor's local time minus UTC, from the LLU Timestamp / FactoryTimestamp pair
+    utc_offset_minutes = models.SmallIntegerField(blank=True, null=True)
+    # readings before this were stored at the device's local time read as UTC (services/libre_ingest.py)
+    local_timestamps_before = models.DateTimeField(blank=True, null=True)
 
     # authenticate: placeholder where code would reach out to LibreView/LibreLink
     # API to exchange email/password for tokens.
@@ -252,12 +232,7 @@ class LibreConnection(models.Model):
             self.token = token_response.get("access_token")
             self.account_id = token_response.get("account_id")
             self.api_endpoint = base_url
-            #try to derive region
-            try:
-                if "api-" in base_url:
-                    self.region = base_url.split("//api-")[1].split(".")[0]
-            except Exception:
-                pass
+            self.region = region_from_base_url(base_url)
             self.connected = True if self.token else False
             self.save(update_fields=["token", "account_id", "api_endpoint", "region", "connected"])
             return True
@@ -339,47 +314,12 @@ class GlucoseMonitor(models.Model):
             if not ok:
                 return {"error": "missing or invalid token"}
         try:
-            #if helper not available build manually
-            account_hash = hashlib.sha256(conn.account_id.encode()).hexdigest()
-            headers = {
-                "authorization": f"Bearer {conn.token}",
-                "account-id": account_hash,
-                "accept": "application/json",
-            }
-            resp = requests.get(f"{conn.api_endpoint}/llu/connections", headers=headers, timeout=20)
-            resp.raise_for_status()
-            payload = resp.json()
+            payload = get_libreview_connection(conn.api_endpoint, conn.token, conn.account_id)
         except Exception as e:
             return {"error": f"request_failed: {e}"}
-        data = payload.get("data") or []
-        created, fetched = 0, 0
-        for item in data:
-            gm = (item or {}).get("glucoseMeasurement") or {}
-            if not gm:
-                continue
-            value = gm.get("value") or gm.get("Value")
-            ts_str = gm.get("timestamp") or gm.get("Timestamp")
-            trend = gm.get("TrendArrow") or gm.get("trend_arrow")
-            if value is None or not ts_str:
-                continue
-            fetched += 1
-            ts = parse_datetime(ts_str)
-            if ts and timezone.is_naive(ts):
-                ts = timezone.make_aware(ts, timezone=timezone.utc)
-            try:
-                _, was_created = GlucoseRecord.objects.get_or_create(
-                    user=self.user,
-                    timestamp=ts,
-                    glucose_level=value,
-                    source="libre_live",
-                    defaults={
-                        'trend_arrow': trend,
-                    }
-                )         
-                if was_created:
-                    created += 1
-            except Exception:
-                continue
+        from .services.libre_ingest import ingest_payload
+        result = ingest_payload(self.user, payload, source="libre_live")
+        fetched, created = result.fetched, result.created
         #update
         self.meta = {
             "last_fetch": timezone.now().isoformat(),
@@ -437,37 +377,22 @@ class Alert(models.Model):
     message = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
-    # send: placeholder where notification logic (push, SMS, email) 
+    # send: hand off to the delivery queue (push, SMS, email) without blocking
     def send(self):
-        #we return true to indicate delivered
-        return True
+        from .services.alert_delivery import get_alert_queue
+        return get_alert_queue().enqueue(self)
     
     @classmethod
     def ensure_for_glucose(cls, record):
-        try:
-            low, high = _user_glucose_thresholds(record.user)
-            level = float(record.glucose_level)
-            if level < low:
-                a_type = "low_glucose"
-                msg = f"Low glucose {level:.0f} mg/dl"
-            elif level > high:
-                a_type = "high_glucose"
-                msg = f"High glucose {level:.0f} mg/dl"
-            else:
-                return None  #in range
-            since = timezone.now() - timedelta(minutes=15)
-            recent = (
-                cls.objects.filter(user=record.user, alert_type=a_type, timestamp__gte=since)
-                .order_by("-timestamp")
-                .first()
-            )
-            if recent:
-                return None
-            alert = cls.objects.create(user=record.user, alert_type=a_type, message=msg)
-            alert.send()
-            return alert
-        except Exception:
-            return None
+        from .services.alerts import evaluate_records
+        alerts = evaluate_records([record])
+        return alerts[0] if alerts else None
+
+    @classmethod
+    def ensure_for_glucose_batch(cls, records):
+        """Evaluate many new readings at once (see services/alerts.py)."""
+        from .services.alerts import evaluate_records
+        return evaluate_records(records)
 
     def __str__(self):
         return f"Alert({self.alert_type}) for {self.user_id} at {self.timestamp}"
@@ -482,17 +407,23 @@ class InsightReport(models.Model):
 
 
     def generate_insights(self, days=14):
+        from .services import rollups
+        from .services.glucose_stats import stats_thresholds
+
         now = timezone.now()
         since = now - timedelta(days=int(days or 14))
+        # The statistics range (70/180 unless the user set one), which the rollups
+        # hold counts for. Insights used to count against _user_glucose_thresholds
+        # (69/200 by default), so default-range users see a few more highs.
         try:
-            low_thr, high_thr = _user_glucose_thresholds(self.user)
+            low_thr, high_thr = stats_thresholds(self.user)
         except Exception:
-            low_thr, high_thr = 69.0, 200.0
-        
-        qs = (
-            GlucoseRecord.objects.filter(user=self.user, timestamp__gte=since, timestamp__lte=now).order_by("timestamp")
-        )
-        total = qs.count()
+            low_thr, high_thr = 70.0, 180.0
+
+        # hourly/daily rollups cover the range; only the partial edge hours touch raw rows
+        pieces = rollups.collect(self.user, since, now, low_thr, high_thr)
+        summary = rollups.combine(pieces)
+        total = summary.count
         if total == 0:
             empty = {
                 "days": days,
@@ -515,25 +446,18 @@ class InsightReport(models.Model):
             self.save(update_fields=["avg_glucose", "most_frequent_meal_type", "time_of_day_with_spikes", "general_insights"])
             return empty
 
-        values = list(qs.values_list("glucose_level", flat=True))
-        avg_gluc = sum(values) / float(total)
+        avg_gluc = summary.mean
 
-        lows = qs.filter(glucose_level__lt=low_thr).count()
-        highs = qs.filter(glucose_level__gt=high_thr).count()
+        lows = summary.below
+        highs = summary.above
         in_range = total - (lows + highs)
         tir_pct = round((in_range / total) * 100.0, 1)
 
         gmi = round(3.31 + 0.02392 * avg_gluc, 1)
 
-        by_day = (
-            qs.extra(select={"day": "date(timestamp)"})
-            .values("day")
-            .annotate(mean=Avg("glucose_level"))
-            .order_by("day")
-        )
         meal_impact_series = [
-            {"day": str(row["day"]), "mean": round(float(row["mean"]), 1)}
-            for row in by_day
+            {"day": str(day), "mean": round(float(day_summary.mean), 1)}
+            for day, day_summary in rollups.daily_summaries(pieces).items()
         ]
 
         meals_qs = (
@@ -544,22 +468,13 @@ class InsightReport(models.Model):
         )
         most_freq_meal = meals_qs[0]["meal_type"] if meals_qs else None
 
-        highs_hours = (
-            qs.filter(glucose_level__gt=high_thr)
-            .extra(select={"hr": "extract(hour from timestamp)"})
-            .values_list("hr", flat=True)
-        )
-        bucket_counts = {"Night (0-5)": 0, "Morning (6-11)": 0, "Afternoon (12-17)": 0, "Evening (18-23)": 0}
-        for h in highs_hours:
-            h = int(h)
-            if 0 <= h <= 5:
-                bucket_counts["Night (0-5)"] += 1
-            elif 6 <= h <= 11:
-                bucket_counts["Morning (6-11)"] += 1
-            elif 12 <= h <= 17:
-                bucket_counts["Afternoon (12-17)"] += 1
-            elif 18 <= h <= 23:
-                bucket_counts["Evening (18-23)"] += 1
+        highs_per_hour = rollups.highs_by_hour(pieces)
+        bucket_counts = {
+            "Night (0-5)": sum(highs_per_hour[0:6]),
+            "Morning (6-11)": sum(highs_per_hour[6:12]),
+            "Afternoon (12-17)": sum(highs_per_hour[12:18]),
+            "Evening (18-23)": sum(highs_per_hour[18:24]),
+        }
         time_of_day_with_spikes = max(bucket_counts, key=bucket_counts.get) if sum(bucket_counts.values()) > 0 else None
 
         payload = {
@@ -601,6 +516,117 @@ class Recommendation(models.Model):
 
 
 
+class UserFeatureState(models.Model):
+    """Incremental model-feature state for one user (see services/feature_store.py)."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feature_state')
+    state = models.JSONField(default=dict, blank=True)
+    # set when a reading arrives out of order; the state is rebuilt on next read
+    dirty = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"UserFeatureState(user={self.user_id}, dirty={self.dirty})"
+
+
+class GlucoseHourlyRollup(models.Model):
+    """Per-user, per-UTC-hour glucose aggregates (see services/rollups.py)."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='glucose_hourly_rollups')
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    sumsq = models.FloatField(default=0.0)
+    minimum = models.FloatField(blank=True, null=True)
+    maximum = models.FloatField(blank=True, null=True)
+    low_count = models.PositiveIntegerField(default=0)
+    high_count = models.PositiveIntegerField(default=0)
+    # range the low/high counts were computed against; rows are refreshed when the user's targets change
+    low_threshold = models.FloatField()
+    high_threshold = models.FloatField()
+    # bumped by every refresh; downsample.py keys its cache on it
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'bucket'], name='uniq_glucose_hourly_rollup'),
+        ]
+
+    def __str__(self):
+        return f"GlucoseHourlyRollup(user={self.user_id}, {self.bucket}, n={self.count})"
+
+
+class GlucoseDailyRollup(models.Model):
+    """Per-user, per-UTC-day glucose aggregates, summed from the hourly rollups."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='glucose_daily_rollups')
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)
+    sumsq = models.FloatField(default=0.0)
+    minimum = models.FloatField(blank=True, null=True)
+    maximum = models.FloatField(blank=True, null=True)
+    low_count = models.PositiveIntegerField(default=0)
+    high_count = models.PositiveIntegerField(default=0)
+    # high_count per UTC hour of the day (24 ints), for spike-hour buckets
+    high_by_hour = models.JSONField(default=list, blank=True)
+    low_threshold = models.FloatField()
+    high_threshold = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='uniq_glucose_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f"GlucoseDailyRollup(user={self.user_id}, {self.day}, n={self.count})"
+
+
+class AnalysisJob(models.Model):
+    """A food-image analysis run off the request path (see services/analysis_jobs.py)."""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='analysis_jobs')
+    # when set, the result is stored on this entry as well (nutrition, name, insulin dose)
+    food_entry = models.ForeignKey(FoodEntry, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='analysis_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    # uploaded bytes, cleared once the job has run
+    image = models.BinaryField(null=True, blank=True)
+    request_id = models.CharField(max_length=64, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='analysisjob_user_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"AnalysisJob({self.id}, user={self.user_id}, {self.status})"
+
+
+class TaskLock(models.Model):
+    """A named lock shared by every process through the database (see services/locks.py)."""
+    name = models.CharField(max_length=64, primary_key=True)
+    owner = models.CharField(max_length=32)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"TaskLock({self.name}, until {self.expires_at})"
+
+
 class Images(models.Model):
     title = models.CharField(max_length=200)
 
@@ -608,11 +634,91 @@ class Images(models.Model):
         return self.title
 
 
+@receiver(post_save, sender=GlucoseRecord)
+def _glucose_record_user_state(sender, instance: GlucoseRecord, created, **kwargs):
+    from .services import user_state
+    if created:
+        user_state.record_glucose([instance])  # applied on commit
+    else:
+        # an edit may change which reading is latest; drop it again once the edit is visible
+        user_state.invalidate(instance.user_id)
+        transaction.on_commit(lambda: user_state.invalidate(instance.user_id))
+
+
 @receiver(post_save, sender=GlucoseRecord)
 def _glucose_record_alert(sender, instance: GlucoseRecord, created, **kwargs):
+    # single saves only; bulk paths call Alert.ensure_for_glucose_batch themselves
     if not created:
         return
+    Alert.ensure_for_glucose(instance)
+
+
+@receiver(pre_save, sender=GlucoseRecord)
+def _glucose_record_previous_timestamp(sender, instance: GlucoseRecord, **kwargs):
+    # an edit may move a reading to another hour; remember where it was
+    if not instance._state.adding:
+        instance._rollup_previous_ts = (
+            sender.objects.filter(pk=instance.pk).values_list("timestamp", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=GlucoseRecord)
+def _glucose_record_rollups(sender, instance: GlucoseRecord, created, **kwargs):
+    from .services import rollups
+    rollups.record_glucose([instance])
+    previous = getattr(instance, "_rollup_previous_ts", None)
+    if previous is not None and rollups.floor_hour(previous) != rollups.floor_hour(instance.timestamp):
+        rollups.refresh_timestamps(instance.user, [previous])
+
+
+@receiver(post_delete, sender=GlucoseRecord)
+def _glucose_record_deleted_rollups(sender, instance: GlucoseRecord, origin=None, **kwargs):
+    # skip cascades (e.g. deleting the user); their rollups are deleted with them
+    if getattr(origin, "model", type(origin)) is not GlucoseRecord:
+        return
+    from .services import rollups, user_state
+    rollups.record_glucose([instance])
+    user_state.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=GlucoseRecord)
+def _glucose_record_features(sender, instance: GlucoseRecord, created, **kwargs):
     try:
-        Alert.ensure_for_glucose(instance)
+        from .services import feature_store
+        if created:
+            feature_store.record_glucose([instance])
+        else:
+            # the accumulator cannot take a reading back; rebuild from the rows on next read
+            feature_store.mark_dirty(instance.user_id)
     except Exception:
-        pass
\ No newline at end of file
+        logger.exception("feature store update failed for glucose record %s", instance.pk)
+
+
+@receiver(post_save, sender=FoodEntry)
+def _food_entry_features(sender, instance: FoodEntry, **kwargs):
+    try:
+        from .services import feature_store
+        feature_store.record_food(instance)
+    except Exception:
+        logger.exception("feature store update failed for food entry %s", instance.pk)
+
+
+@receiver(post_delete, sender=GlucoseRecord)
+@receiver(post_delete, sender=FoodEntry)
+def _deleted_row_features(sender, instance, origin=None, **kwargs):
+    # skip cascades (e.g. deleting the user); the feature state goes with them
+    if getattr(origin, "model", type(origin)) is not sender:
+        return
+    try:
+        from .services import feature_store
+        feature_store.mark_dirty(instance.user_id)
+    except Exception:
+        logger.exception("feature store invalidation failed for deleted %s %s", sender.__name__, instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _user_profile_state(sender, instance, **kwargs):
+    # thresholds and dosing parameters are cached per user (services/user_state.py)
+    from .services import user_state
+    user_state.invalidate(instance.pk)
@@ -1,6 +1,5 @@
 from rest_framework import serializers
 from .models import FoodEntry, GlucoseRecord, NutritionalInfo
-from .services.insulin import calculate_insulin
 
 class NutritionalInfoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,57 +13,26 @@ class NutritionalInfoSerializer(serializers.ModelSerializer):
 class FoodEntrySerializer(serializers.ModelSerializer):
     nutritional_info = NutritionalInfoSerializer(read_only=True)
     total_carbs_g = serializers.FloatField(write_only = True, required= False)
+    calories_estimate = serializers.FloatField(write_only=True, required=False)
 
     class Meta:
         model = FoodEntry
         fields = (
             'id', 'user', 'food_name', 'description', 'timestamp', 'meal_type',
             'image', 'nutritional_info', 'insulin_recommended', 'insulin_rounded','total_carbs_g', 
-            'total_carbs','total_calories', 'total_protein', 'total_fat',   
+            'total_carbs','total_calories', 'calories_estimate', 'total_protein', 'total_fat', 'client_id',
         )
         read_only_fields = ('insulin_recommended', 'insulin_rounded', 'user', 'id', 'timestamp')
     
     def create(self, validated_data):
-        total_carbs_g = validated_data.pop('total_carbs_g', None)
-        validated_data.pop('user', None)
+        from .services.food_entries import create_food_entry, nutrition_payload
 
-        #build foodentry for user
-        user = self.context['request'].user
-        instance = FoodEntry.objects.create(user=user, **validated_data)
-
-
-        ni_payload = self.initial_data.get('nutritional_info')
-        if isinstance(ni_payload, dict):
-            ni_serializer = NutritionalInfoSerializer(data= ni_payload)
+        nutrition = nutrition_payload(self.initial_data.get('nutritional_info'))
+        if nutrition is not None:
+            ni_serializer = NutritionalInfoSerializer(data=nutrition)
             ni_serializer.is_valid(raise_exception=True)
-            ni = ni_serializer.save()
-            instance.nutritional_info=ni
-            instance.save(update_fields=['nutritional_info'])
-            if total_carbs_g is None and ni.carbs is not None:
-                total_carbs_g=ni.carbs
-        
-        if total_carbs_g is not None:
-            carb_ratio = getattr(user, 'insulin_to_carb_ratio', 0) or 0
-            correction_factor= getattr(user, 'correction_factor', None)
-            current_glucose = None
-            try:
-                latest = user.glucose_records.order_by('-timestamp').first()
-                if latest:
-                    current_glucose = latest.glucose_level
-            except Exception:
-                pass
-            
-            res = calculate_insulin(
-                total_carbs_g=float(total_carbs_g),
-                carb_ratio=float(carb_ratio),
-                current_glucose=current_glucose,
-                correction_factor=correction_factor,
-            )
-            instance.insulin_recommended = res.get('recommended_dose')
-            instance.insulin_rounded= res.get('rounded_dose')
-            instance.save(update_fields=['insulin_recommended','insulin_rounded'])
-        return instance
-     
+            nutrition = ni_serializer.validated_data
+        return create_food_entry(self.context['request'].user, validated_data, nutrition)
 
 
 class GlucoseRecordSerializer(serializers.ModelSerializer):
@@ -77,7 +45,7 @@ class GlucoseRecordSerializer(serializers.ModelSerializer):
         model = GlucoseRecord
         fields = [
             'id', 'user', 'timestamp', 'glucose_level', 'trend_arrow', 'source',
-            'value', 'meal_timing', 'mood', 'notes'
+            'value', 'meal_timing', 'mood', 'notes', 'client_id'
         ]
         read_only_fields = ['id', 'user']
 
@@ -157,4 +125,29 @@ class GlucoseRecordSerializer(serializers.ModelSerializer):
             if mood:
                 validated_data['mood'] = self.validate_mood(mood)
         
-        return super().update(instance, validated_data)
\ No newline at end of file
+        return super().update(instance, validated_data)
+
+
+class GlucoseRecordBatchItemSerializer(GlucoseRecordSerializer):
+    """One queued reading in a glucose-records/batch/ request (services/offline_sync.py)."""
+    client_id = serializers.CharField(max_length=64)
+    value = serializers.FloatField(write_only=True, required=False)
+    glucose_level = serializers.FloatField(required=False)
+
+    def validate(self, attrs):
+        if 'value' in attrs:
+            attrs['glucose_level'] = attrs.pop('value')
+        if attrs.get('glucose_level') is None:
+            raise serializers.ValidationError({'value': 'This field is required.'})
+        return attrs
+
+
+class FoodEntryBatchItemSerializer(FoodEntrySerializer):
+    """One queued meal in a food-entries/batch/ request; carries the time it was logged."""
+    client_id = serializers.CharField(max_length=64)
+    timestamp = serializers.DateTimeField(required=False)
+    nutritional_info = NutritionalInfoSerializer(required=False, allow_null=True)
+
+    class Meta(FoodEntrySerializer.Meta):
+        fields = tuple(f for f in FoodEntrySerializer.Meta.fields if f != 'image')
+        read_only_fields = ('insulin_recommended', 'insulin_rounded', 'user', 'id')
@@ -0,0 +1,171 @@
+"""Pluggable, non-blocking delivery for Alert notifications.
+
+`Alert.send()` hands the alert to a delivery *queue*, which calls a delivery
+*backend* (the push / SMS / email provider) off the request or ingest path.
+
+Queues (ALERT_DELIVERY_QUEUE):
+- 'thread' (default): bounded in-process queue drained by daemon worker
+  threads; when full, alerts are dropped and counted rather than blocking.
+- 'celery': enqueue `core.tasks.deliver_alert` by alert id.
+- 'sync':   deliver inline (tests, management commands).
+
+Backends (ALERT_DELIVERY_BACKEND) are dotted paths to a class with a
+`deliver(alert) -> bool` method; the default only logs.
+"""
+
+import logging
+import os
+import queue
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'core.services.alert_delivery.LogAlertBackend'
+
+
+class LogAlertBackend:
+    """Placeholder provider: records the alert in the log and reports success."""
+
+    def deliver(self, alert) -> bool:
+        logger.info(f"Alert {alert.alert_type} for user {alert.user_id}: {alert.message}")
+        return True
+
+
+class BaseAlertQueue:
+    def __init__(self, backend=None):
+        self.backend = backend or import_string(getattr(settings, 'ALERT_DELIVERY_BACKEND', DEFAULT_BACKEND))()
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _deliver(self, alert) -> bool:
+        try:
+            ok = bool(self.backend.deliver(alert))
+        except Exception as e:
+            logger.warning(f"Alert delivery failed for {alert.pk}: {e}")
+            ok = False
+        if ok:
+            self.delivered += 1
+        else:
+            self.failed += 1
+        return ok
+
+    def enqueue(self, alert) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            'queue': type(self).__name__,
+            'enqueued': self.enqueued,
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }
+
+
+class SyncAlertQueue(BaseAlertQueue):
+    def enqueue(self, alert) -> bool:
+        self.enqueued += 1
+        return self._deliver(alert)
+
+
+class ThreadAlertQueue(BaseAlertQueue):
+    """Bounded queue drained by background threads (restarted after fork)."""
+
+    def __init__(self, backend=None, maxsize: int = 1000, workers: int = 1):
+        super().__init__(backend)
+        self.maxsize = maxsize
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.maxsize)
+                self._threads = []
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._run, name='alert-delivery', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def enqueue(self, alert) -> bool:
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Alert delivery queue full, dropping alert {alert.pk}")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            try:
+                self._deliver(alert)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Block until every queued alert has been handled (tests / shutdown)."""
+        self._queue.join()
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'queue_depth': self._queue.qsize()}
+
+
+class CeleryAlertQueue(BaseAlertQueue):
+    def enqueue(self, alert) -> bool:
+        from ..tasks import deliver_alert
+        try:
+            deliver_alert.delay(str(alert.pk))
+        except Exception as e:
+            self.dropped += 1
+            logger.warning(f"Could not enqueue alert {alert.pk} on Celery: {e}")
+            return False
+        self.enqueued += 1
+        return True
+
+
+QUEUES = {
+    'sync': SyncAlertQueue,
+    'thread': ThreadAlertQueue,
+    'celery': CeleryAlertQueue,
+}
+
+_queue: Optional[BaseAlertQueue] = None
+_queue_key = None
+_queue_lock = threading.Lock()
+
+
+def get_alert_queue() -> BaseAlertQueue:
+    """Process-wide delivery queue for the configured queue kind and backend."""
+    global _queue, _queue_key
+    kind = getattr(settings, 'ALERT_DELIVERY_QUEUE', 'thread')
+    key = (kind, getattr(settings, 'ALERT_DELIVERY_BACKEND', DEFAULT_BACKEND))
+    if _queue is None or _queue_key != key:
+        with _queue_lock:
+            if _queue is None or _queue_key != key:
+                cls = QUEUES.get(kind) or import_string(kind)
+                if cls is ThreadAlertQueue:
+                    _queue = cls(maxsize=getattr(settings, 'ALERT_DELIVERY_QUEUE_SIZE', 1000),
+                                 workers=getattr(settings, 'ALERT_DELIVERY_WORKERS', 1))
+                else:
+                    _queue = cls()
+                _queue_key = key
+    return _queue
@@ -0,0 +1,140 @@
+"""Batched glucose alert evaluation.
+
+`AlertEngine.evaluate(records)` takes any number of new GlucoseRecords
+(one or many users), and per user:
+
+- reads the low/high thresholds once, from the per-user hot state (`user_state`);
+- loads the most recent alert of each type once (one query for the batch);
+- applies the low/high and dedupe rules in memory;
+- creates the resulting alerts with one `bulk_create` and, once the
+  surrounding transaction commits, hands them to the delivery queue
+  (`Alert.send`), which never blocks on the provider. A rolled-back write
+  never notifies anyone.
+
+The rules match the original per-row `Alert.ensure_for_glucose`: a reading
+below/above the user's range raises `low_glucose`/`high_glucose` unless an
+alert of that type was raised in the last ALERT_DEDUPE_MINUTES. A batch is
+processed "now", so it raises at most one alert per type, using the latest
+out-of-range reading of that type for the message.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LOW_GLUCOSE = 'low_glucose'
+HIGH_GLUCOSE = 'high_glucose'
+ALERT_TYPES = (LOW_GLUCOSE, HIGH_GLUCOSE)
+
+
+def classify(level: float, low: float, high: float) -> Optional[Tuple[str, str]]:
+    """Return (alert_type, message) for an out-of-range level, else None."""
+    level = float(level)
+    if level < low:
+        return LOW_GLUCOSE, f"Low glucose {level:.0f} mg/dl"
+    if level > high:
+        return HIGH_GLUCOSE, f"High glucose {level:.0f} mg/dl"
+    return None
+
+
+class AlertEngine:
+    def __init__(self, dedupe_minutes: Optional[float] = None):
+        self.dedupe_minutes = dedupe_minutes
+
+    @property
+    def dedupe(self) -> timedelta:
+        minutes = self.dedupe_minutes
+        if minutes is None:
+            minutes = getattr(settings, 'ALERT_DEDUPE_MINUTES', 15)
+        return timedelta(minutes=minutes)
+
+    def last_alerts(self, user_ids, since) -> dict:
+        """{(user_id, alert_type): last alert timestamp} since `since`, in one query."""
+        from ..models import Alert
+        rows = (
+            Alert.objects.filter(user_id__in=user_ids, alert_type__in=ALERT_TYPES, timestamp__gte=since)
+            .values('user_id', 'alert_type')
+            .annotate(last=Max('timestamp'))
+        )
+        return {(r['user_id'], r['alert_type']): r['last'] for r in rows}
+
+    def candidates(self, records: Iterable) -> dict:
+        """{(user_id, alert_type): message} of the latest out-of-range reading of each type."""
+        from . import user_state
+
+        by_user = defaultdict(list)
+        for record in records:
+            by_user[record.user_id].append(record)
+
+        # latest out-of-range message per (user, type), thresholds read once per user
+        candidates = {}
+        for user_id, user_records in by_user.items():
+            # cached per user; an already loaded user object saves the fetch on a miss
+            first = user_records[0]
+            low, high = user_state.thresholds(first.user if type(first).user.is_cached(first) else user_id)
+            for record in sorted(user_records, key=lambda r: r.timestamp):
+                hit = classify(record.glucose_level, low, high)
+                if hit:
+                    candidates[(user_id, hit[0])] = hit[1]
+        return candidates
+
+    def pending(self, records: Iterable, now=None) -> List:
+        """Unsaved Alert objects the batch should raise (no writes)."""
+        return self._not_deduped(self.candidates(records), now)
+
+    def _not_deduped(self, candidates: dict, now=None) -> List:
+        from ..models import Alert
+
+        if not candidates:
+            return []
+        since = (now or timezone.now()) - self.dedupe
+        recent = self.last_alerts({user_id for user_id, _ in candidates}, since)
+        return [
+            Alert(user_id=user_id, alert_type=a_type, message=msg)
+            for (user_id, a_type), msg in candidates.items()
+            if (user_id, a_type) not in recent
+        ]
+
+    def evaluate(self, records: Iterable) -> List:
+        """Create and dispatch the alerts raised by `records`."""
+        from ..models import Alert
+
+        candidates = self.candidates(records)
+        if not candidates:
+            return []
+        # a savepoint: a failed read or insert is rolled back on its own and
+        # leaves the caller's transaction (e.g. the ingest that saved the readings) usable
+        with transaction.atomic():
+            alerts = self._not_deduped(candidates)
+            if alerts:
+                Alert.objects.bulk_create(alerts)
+                transaction.on_commit(lambda: [alert.send() for alert in alerts])
+        return alerts
+
+
+_engine: Optional[AlertEngine] = None
+
+
+def get_alert_engine() -> AlertEngine:
+    global _engine
+    if _engine is None:
+        _engine = AlertEngine()
+    return _engine
+
+
+def evaluate_records(records: Iterable) -> List:
+    """Evaluate alerts for a batch of new GlucoseRecords; never raises."""
+    records = list(records)
+    try:
+        return get_alert_engine().evaluate(records)
+    except Exception:
+        logger.exception(f"Alert evaluation failed for {len(records)} glucose records")
+        return []
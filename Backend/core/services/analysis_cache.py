@@ -0,0 +1,215 @@
+"""Content-addressed cache for food-image analysis results.
+
+`openai_service.analyze_image` looks results up by a key built from a hash
+of the image content plus the vision model and prompt version, so a user
+re-uploading the same photo (or retrying after a client timeout) gets the
+stored `OpenAIImageResponse` without another PIL pass or model call.
+Results are shared across users: they describe the image only.
+
+Two keys are stored per result: one over the uploaded bytes (an exact
+re-upload skips image processing entirely) and one over the normalized
+JPEG (the same photo re-encoded by the client still hits).
+
+Backends (OPENAI_IMAGE_CACHE_BACKEND):
+- 'memory' (default): per-process LRU bounded by OPENAI_IMAGE_CACHE_MAX_ENTRIES
+  with a TTL of OPENAI_IMAGE_CACHE_TTL seconds.
+- 'django': the Django cache named by OPENAI_IMAGE_CACHE_ALIAS, shared
+  between workers; size is bounded by that cache's own eviction.
+
+Hit/miss counters and the upstream latency saved by hits are kept per
+process and exposed through `stats()`.
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'food-image-analysis'
+
+
+def analysis_key(content: bytes, model: str, prompt_version: str) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    return f"{KEY_PREFIX}:{model}:{prompt_version}:{digest}"
+
+
+class BaseAnalysisCache:
+    def __init__(self, ttl: float = 86400):
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        # upstream seconds spent producing the results that were later served from cache
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, key: str):
+        raise NotImplementedError
+
+    def _store(self, key: str, entry: tuple):
+        raise NotImplementedError
+
+    def _safe_load(self, key: str):
+        try:
+            return self._load(key)
+        except Exception as e:
+            logger.warning(f"Analysis cache read failed: {e}")
+            return None
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[dict]:
+        """A copy of the cached result, or None.
+
+        `count_miss=False` is for a first, cheaper lookup that is followed by
+        another one for the same request, so a request counts one miss.
+        """
+        entry = self._safe_load(key)
+        with self._lock:
+            if entry is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry[1]
+        return copy.deepcopy(entry[0])
+
+    def set(self, key: str, result: dict, cost: float = 0.0):
+        """Store `result`; `cost` is the upstream latency a later hit saves."""
+        try:
+            self._store(key, (copy.deepcopy(result), float(cost)))
+        except Exception as e:
+            logger.warning(f"Analysis cache write failed: {e}")
+            return
+        with self._lock:
+            self.stores += 1
+
+    def alias(self, key: str, existing_key: str):
+        """Store the entry under `existing_key` under `key` too (keeps its cost)."""
+        entry = self._safe_load(existing_key)
+        if entry is not None:
+            try:
+                self._store(key, entry)
+            except Exception as e:
+                logger.warning(f"Analysis cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'stores': self.stores,
+            'saved_seconds': round(self.saved_seconds, 3),
+            'ttl_seconds': self.ttl,
+        }
+
+
+class MemoryAnalysisCache(BaseAnalysisCache):
+    """Per-process LRU with TTL; the least recently used entry is evicted when full."""
+
+    def __init__(self, ttl: float = 86400, max_entries: int = 1024):
+        super().__init__(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self.evictions = 0
+        self.expired = 0
+        self._entries = OrderedDict()
+
+    def _load(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expired': self.expired,
+        }
+
+
+class DjangoAnalysisCache(BaseAnalysisCache):
+    """Shared across workers through a configured Django cache."""
+
+    def __init__(self, ttl: float = 86400, alias: str = 'default'):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _load(self, key):
+        return self._cache.get(key)
+
+    def _store(self, key, entry):
+        self._cache.set(key, entry, timeout=self.ttl)
+
+
+BACKENDS = {
+    'memory': MemoryAnalysisCache,
+    'django': DjangoAnalysisCache,
+}
+
+_cache: Optional[BaseAnalysisCache] = None
+_cache_key = None
+_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> Optional[BaseAnalysisCache]:
+    """Process-wide analysis cache, or None when OPENAI_IMAGE_CACHE_ENABLED is off."""
+    global _cache, _cache_key
+    if not getattr(settings, 'OPENAI_IMAGE_CACHE_ENABLED', True):
+        return None
+    kind = getattr(settings, 'OPENAI_IMAGE_CACHE_BACKEND', 'memory')
+    ttl = getattr(settings, 'OPENAI_IMAGE_CACHE_TTL', 86400)
+    max_entries = getattr(settings, 'OPENAI_IMAGE_CACHE_MAX_ENTRIES', 1024)
+    alias = getattr(settings, 'OPENAI_IMAGE_CACHE_ALIAS', 'default')
+    key = (kind, ttl, max_entries, alias)
+    if _cache is None or _cache_key != key:
+        with _cache_lock:
+            if _cache is None or _cache_key != key:
+                cls = BACKENDS.get(kind) or import_string(kind)
+                if cls is MemoryAnalysisCache:
+                    _cache = cls(ttl=ttl, max_entries=max_entries)
+                elif cls is DjangoAnalysisCache:
+                    _cache = cls(ttl=ttl, alias=alias)
+                else:
+                    _cache = cls(ttl=ttl)
+                _cache_key = key
+    return _cache
+
+
+def analysis_cache_stats() -> Optional[dict]:
+    cache = get_analysis_cache()
+    return cache.stats() if cache else None
@@ -0,0 +1,396 @@
+"""Food-image analysis as background jobs.
+
+`OpenAIAnalyzeImageView` holds a web worker for the whole vision-model
+round-trip, retries included. The job endpoints take the upload, store it
+on an `AnalysisJob` row and return 202 with the job id; a worker runs
+`analyze_image` and the client polls the job until it has succeeded or
+failed. Jobs may name a food entry, which is updated with the result the
+same way `FoodEntry.analyze_food` does it.
+
+Admission (`submit`):
+- a user may have at most ANALYSIS_JOB_USER_MAX_ACTIVE queued or running
+  jobs (`UserJobLimit`, 429). Jobs older than ANALYSIS_JOB_STALE_SECONDS
+  do not count, so a worker that died mid-job cannot lock a user out;
+- the queue is bounded; when it is full the job is marked failed and
+  `QueueFull` is raised (503) instead of piling up work.
+
+The job is handed to the queue once the transaction that created it has
+committed, so a worker never looks for a row it cannot see yet. Should the
+queue fill up between the admission check and the commit, the job is failed
+with `queue_full` and the client sees that when it polls.
+
+Jobs still queued or running ANALYSIS_JOB_STALE_SECONDS after they were
+created were lost with their worker (a restarted process, a dropped Celery
+message). `reap_stale_jobs` - the reap-analysis-jobs beat task - fails them
+with `timed_out`, and they never count towards the Celery queue depth.
+
+Queues (ANALYSIS_JOB_QUEUE), as for alert delivery:
+- 'thread' (default): bounded in-process queue (ANALYSIS_JOB_QUEUE_SIZE)
+  drained by ANALYSIS_JOB_WORKERS daemon threads;
+- 'celery': enqueue `core.tasks.run_analysis_job` by job id; the bound is
+  checked against the number of queued jobs in the database;
+- 'sync': run inline (tests, management commands).
+
+`analysis_job_stats()` reports the queue counters, queue depth, running
+jobs and wait / run latencies (mean and p95 over recent jobs).
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .openai_service import OpenAIServiceError, OpenAITimeout, OpenAITooManyRequests, analyze_image
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisJobRejected(Exception):
+    status = 503
+    code = 'queue_full'
+
+
+class QueueFull(AnalysisJobRejected):
+    pass
+
+
+class UserJobLimit(AnalysisJobRejected):
+    status = 429
+    code = 'too_many_active_jobs'
+
+
+def _error_code(exc: Exception) -> str:
+    from .openai_outbound import CircuitOpen
+
+    # same codes the synchronous endpoint answers with
+    if isinstance(exc, CircuitOpen):
+        return 'upstream_unavailable'
+    if isinstance(exc, OpenAITimeout):
+        return 'upstream_timeout'
+    if isinstance(exc, OpenAITooManyRequests):
+        return 'rate_limited'
+    if isinstance(exc, OpenAIServiceError):
+        return 'upstream_model_error'
+    return 'internal_error'
+
+
+class JobMetrics:
+    """Per-process counters and recent wait / run latencies."""
+
+    def __init__(self, window: int = 500):
+        self.enqueued = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.rejected_user_limit = 0
+        self.running = 0
+        self._wait = deque(maxlen=window)
+        self._run = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def observe(self, wait_seconds: float, run_seconds: float, ok: bool):
+        with self._lock:
+            self._wait.append(wait_seconds)
+            self._run.append(run_seconds)
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    @staticmethod
+    def _summary(values) -> dict:
+        if not values:
+            return {'mean': None, 'p95': None, 'max': None}
+        ordered = sorted(values)
+        p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+        return {'mean': round(sum(ordered) / len(ordered), 3), 'p95': round(p95, 3), 'max': round(ordered[-1], 3)}
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            wait, run = list(self._wait), list(self._run)
+            return {
+                'enqueued': self.enqueued,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'rejected_queue_full': self.rejected,
+                'rejected_user_limit': self.rejected_user_limit,
+                'running': self.running,
+                'wait_seconds': self._summary(wait),
+                'run_seconds': self._summary(run),
+            }
+
+
+metrics = JobMetrics()
+
+
+def run_job(job_id) -> Optional[str]:
+    """Run one queued job; returns its final status (None if it was not queued)."""
+    from ..models import AnalysisJob
+    from .food_entries import apply_analysis
+
+    started = timezone.now()
+    # claim it: a job handed to two workers runs once
+    claimed = AnalysisJob.objects.filter(pk=job_id, status=AnalysisJob.STATUS_QUEUED).update(
+        status=AnalysisJob.STATUS_RUNNING, started_at=started)
+    if not claimed:
+        return None
+    job = AnalysisJob.objects.select_related('food_entry').get(pk=job_id)
+    wait = (started - job.created_at).total_seconds()
+    metrics.count('running')
+    t0 = time.monotonic()
+    try:
+        result = analyze_image(image_bytes=bytes(job.image or b''), user_id=job.user_id,
+                               request_id=job.request_id or str(job.pk))
+        if job.food_entry is not None:
+            info = apply_analysis(job.food_entry, result)
+            result = {**result, 'nutritional_info_id': info.pk, 'food_entry_id': str(job.food_entry_id)}
+        job.status, job.result, job.error = AnalysisJob.STATUS_SUCCEEDED, result, ''
+    except Exception as exc:
+        if not isinstance(exc, OpenAIServiceError):
+            logger.exception(f"Analysis job {job_id} failed")
+        else:
+            logger.warning(f"Analysis job {job_id} failed: {exc}")
+        job.status, job.error = AnalysisJob.STATUS_FAILED, _error_code(exc)
+    finally:
+        metrics.count('running', -1)
+    job.image = None
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'error', 'image', 'finished_at'])
+    metrics.observe(wait, time.monotonic() - t0, job.status == AnalysisJob.STATUS_SUCCEEDED)
+    return job.status
+
+
+class BaseAnalysisJobQueue:
+    def __init__(self, runner: Optional[Callable] = None):
+        self.runner = runner or run_job
+
+    def enqueue(self, job_id) -> bool:
+        raise NotImplementedError
+
+    def has_room(self) -> bool:
+        """Whether one more job would be accepted right now."""
+        return True
+
+    def depth(self) -> int:
+        from ..models import AnalysisJob
+        return AnalysisJob.objects.filter(status=AnalysisJob.STATUS_QUEUED, created_at__gte=stale_before()).count()
+
+    def stats(self) -> dict:
+        return {'queue': type(self).__name__, 'queue_depth': self.depth(), **metrics.as_dict()}
+
+
+class SyncAnalysisJobQueue(BaseAnalysisJobQueue):
+    def enqueue(self, job_id) -> bool:
+        metrics.count('enqueued')
+        self.runner(job_id)
+        return True
+
+    def depth(self) -> int:
+        return 0
+
+
+class ThreadAnalysisJobQueue(BaseAnalysisJobQueue):
+    """Bounded queue drained by a pool of background threads (restarted after fork)."""
+
+    def __init__(self, runner=None, maxsize: int = 100, workers: int = 4):
+        super().__init__(runner)
+        self.maxsize = max(1, int(maxsize))
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.maxsize)
+                self._threads = []
+            self._pid = os.getpid()
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                t = threading.Thread(target=self._run, name='analysis-job', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def enqueue(self, job_id) -> bool:
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            return False
+        metrics.count('enqueued')
+        return True
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                close_old_connections()
+                self.runner(job_id)
+            except Exception:
+                logger.exception(f"Analysis job worker failed on {job_id}")
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        """Block until every queued job has been handled (tests / shutdown)."""
+        self._queue.join()
+
+    def has_room(self) -> bool:
+        return self._queue.qsize() < self.maxsize
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'max_queue': self.maxsize, 'workers': self.workers}
+
+
+class CeleryAnalysisJobQueue(BaseAnalysisJobQueue):
+    def __init__(self, runner=None, maxsize: int = 100):
+        super().__init__(runner)
+        self.maxsize = max(1, int(maxsize))
+
+    def enqueue(self, job_id) -> bool:
+        from ..tasks import run_analysis_job
+        # the broker is unbounded; queued rows (this one included) stand in for its depth
+        if self.depth() > self.maxsize:
+            return False
+        try:
+            run_analysis_job.delay(str(job_id))
+        except Exception as e:
+            logger.warning(f"Could not enqueue analysis job {job_id} on Celery: {e}")
+            return False
+        metrics.count('enqueued')
+        return True
+
+    def has_room(self) -> bool:
+        return self.depth() < self.maxsize
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'max_queue': self.maxsize}
+
+
+QUEUES = {
+    'sync': SyncAnalysisJobQueue,
+    'thread': ThreadAnalysisJobQueue,
+    'celery': CeleryAnalysisJobQueue,
+}
+
+_queue: Optional[BaseAnalysisJobQueue] = None
+_queue_key = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> BaseAnalysisJobQueue:
+    """Process-wide analysis job queue for the configured kind."""
+    global _queue, _queue_key
+    kind = getattr(settings, 'ANALYSIS_JOB_QUEUE', 'thread')
+    maxsize = getattr(settings, 'ANALYSIS_JOB_QUEUE_SIZE', 100)
+    workers = getattr(settings, 'ANALYSIS_JOB_WORKERS', 4)
+    key = (kind, maxsize, workers)
+    if _queue is None or _queue_key != key:
+        with _queue_lock:
+            if _queue is None or _queue_key != key:
+                cls = QUEUES.get(kind) or import_string(kind)
+                if cls is ThreadAnalysisJobQueue:
+                    _queue = cls(maxsize=maxsize, workers=workers)
+                elif cls is CeleryAnalysisJobQueue:
+                    _queue = cls(maxsize=maxsize)
+                else:
+                    _queue = cls()
+                _queue_key = key
+    return _queue
+
+
+def analysis_job_stats() -> dict:
+    return get_job_queue().stats()
+
+
+def stale_before(now=None):
+    """Jobs created before this and still queued or running were lost with their worker."""
+    return (now or timezone.now()) - timedelta(seconds=getattr(settings, 'ANALYSIS_JOB_STALE_SECONDS', 600))
+
+
+def active_jobs(user):
+    from ..models import AnalysisJob
+
+    return AnalysisJob.objects.filter(user=user, status__in=AnalysisJob.ACTIVE_STATUSES, created_at__gte=stale_before())
+
+
+def reap_stale_jobs(now=None) -> int:
+    """Fail the queued/running jobs older than ANALYSIS_JOB_STALE_SECONDS; returns how many."""
+    from ..models import AnalysisJob
+
+    now = now or timezone.now()
+    reaped = AnalysisJob.objects.filter(status__in=AnalysisJob.ACTIVE_STATUSES, created_at__lt=stale_before(now)).update(
+        status=AnalysisJob.STATUS_FAILED, error='timed_out', image=None, finished_at=now)
+    if reaped:
+        logger.warning(f"Failed {reaped} analysis jobs that never finished")
+    return reaped
+
+
+def _reject(job_id):
+    from ..models import AnalysisJob
+
+    metrics.count('rejected')
+    AnalysisJob.objects.filter(pk=job_id).update(
+        status=AnalysisJob.STATUS_FAILED, error=QueueFull.code, image=None, finished_at=timezone.now())
+
+
+def _enqueue(job_id):
+    if not get_job_queue().enqueue(job_id):
+        _reject(job_id)
+
+
+def submit(user, image_bytes: bytes, food_entry=None, request_id: str = ''):
+    """Store and enqueue an analysis job; raises UserJobLimit or QueueFull."""
+    from ..models import AnalysisJob
+
+    limit = getattr(settings, 'ANALYSIS_JOB_USER_MAX_ACTIVE', 2)
+    if active_jobs(user).count() >= limit:
+        metrics.count('rejected_user_limit')
+        raise UserJobLimit(f"at most {limit} analysis jobs may be pending")
+
+    job = AnalysisJob.objects.create(user=user, food_entry=food_entry, image=image_bytes,
+                                     request_id=request_id[:64])
+    if not get_job_queue().has_room():
+        _reject(job.pk)
+        raise QueueFull('analysis queue is full, retry later')
+    transaction.on_commit(lambda: _enqueue(job.pk))
+    return job
+
+
+def job_payload(job) -> dict:
+    body = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'food_entry_id': str(job.food_entry_id) if job.food_entry_id else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+    if job.status == job.STATUS_SUCCEEDED:
+        body['result'] = job.result
+    elif job.status == job.STATUS_FAILED:
+        body['error'] = job.error
+    return body
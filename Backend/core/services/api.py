@@ -1,16 +1,16 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from ..serializers import FoodEntrySerializer, GlucoseRecordSerializer
 from datetime import datetime
-import math
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.throttling import UserRateThrottle
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.settings import api_settings
 from django.conf import settings
 from django.core.cache import cache
 from django.utils import timezone
-from datetime import timezone as dt_timezone
 from django.utils.dateparse import parse_datetime
 from ..models import (
     LibreConnection, NutritionalInfo,
@@ -20,13 +20,21 @@ from ..utils import estimate_components_carbs
 from .insulin import calculate_insulin
 from .libre import (
     build_authorize_url, exchange_code_for_token,
-    login_with_password,
+    login_with_password, get_libreview_connection, region_from_base_url,
 )
+from .libre_ingest import device_utc_offset, extract_readings, ingest_payload, ingest_readings
+from .glucose_stats import stats_thresholds
+from .pagination import TimestampCursorPagination, filter_timestamp_range, parse_query_timestamp
+from .columnar import ColumnarJSONRenderer, glucose_columns
+from . import bulk_import, downsample, export, offline_sync, rollups
 import requests
 from .openai_service import (
     analyze_image, OpenAIServiceError, 
     OpenAITimeout, OpenAITooManyRequests
 )
+from .analysis_cache import analysis_cache_stats
+from .openai_outbound import CircuitOpen, outbound_stats
+from . import analysis_jobs
 import uuid
 import logging
 import time
@@ -35,9 +43,10 @@ import os, hmac
 from hashlib import sha256
 import base64
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from typing import Optional
-from ..services.prediction import prediction_service, TORCH_AVAILABLE, LIGHTGBM_AVAILABLE
+from ..services.prediction import prediction_service
+from ..services.inference import TORCH_AVAILABLE, LIGHTGBM_AVAILABLE
 
 @csrf_exempt
 def csrf_token_view(request):
@@ -61,95 +70,162 @@ class FoodEntryViewSet(viewsets.ModelViewSet):
     queryset = FoodEntry.objects.none()
     serializer_class = FoodEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimestampCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         if user and user.is_authenticated:
-            return FoodEntry.objects.filter(user=user)
+            return FoodEntry.objects.filter(user=user).select_related('nutritional_info')
         return FoodEntry.objects.none()
 
-    def perform_create(self, serializer):
-        # Save the instance first
-        instance = serializer.save(user=self.request.user)
-        print("perform_create triggered")
+    def filter_queryset(self, queryset):
+        # ?start=&end= (ISO datetime or date) and ?meal_type=
+        queryset = filter_timestamp_range(queryset, self.request.query_params)
+        meal_type = self.request.query_params.get('meal_type')
+        if meal_type:
+            queryset = queryset.filter(meal_type=meal_type)
+        return queryset
 
-        # Extract carbs from request data
-        total_carbs = None
-        
-        # Try to get from direct field
-        if 'total_carbs' in self.request.data:
-            try:
-                total_carbs = float(self.request.data['total_carbs'])
-            except (ValueError, TypeError):
-                pass
-        
-        # Try alternative field names
-        if total_carbs is None and 'total_carbs_g' in self.request.data:
-            try:
-                total_carbs = float(self.request.data['total_carbs_g'])
-            except (ValueError, TypeError):
-                pass
-        
-        # Try from nutritional_info if present
-        if total_carbs is None and instance.nutritional_info:
-            try:
-                total_carbs = float(instance.nutritional_info.carbs)
-            except (ValueError, TypeError, AttributeError):
-                pass
-        
-        # Save carbs to instance if found
-        if total_carbs is not None:
-            instance.total_carbs = total_carbs
-            
-            # Also save other nutrition if available
-            if 'total_calories' in self.request.data or 'calories_estimate' in self.request.data:
-                try:
-                    instance.total_calories = float(
-                        self.request.data.get('total_calories') or 
-                        self.request.data.get('calories_estimate', 0)
-                    )
-                except (ValueError, TypeError):
-                    pass
-            
-            instance.save()
-        
-        # Calculate insulin recommendation
-        if total_carbs and total_carbs > 0:
-            carb_ratio = getattr(self.request.user, 'insulin_to_carb_ratio', None) or 0
-            correction_factor = getattr(self.request.user, 'correction_factor', None)
+    def perform_create(self, serializer):
+        # carbs, nutrition and the insulin dose are resolved before the single insert
+        # (services/food_entries.py)
+        serializer.save(user=self.request.user)
 
-            current_glucose = None
-            try:
-                latest = self.request.user.glucose_records.order_by('-timestamp').first()
-                if latest:
-                    current_glucose = latest.glucose_level
-            except Exception:
-                current_glucose = None
-
-            res = calculate_insulin(
-                total_carbs_g=total_carbs,
-                carb_ratio=carb_ratio,
-                current_glucose=current_glucose,
-                correction_factor=correction_factor,
-            )
-            instance.insulin_recommended = res.get('recommended_dose')
-            instance.insulin_rounded = res.get('rounded_dose')
-            instance.save()
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """POST food-entries/batch/: replay meals queued offline (services/offline_sync.py)."""
+        items = offline_sync.batch_items(request.data)
+        result = offline_sync.save_food_batch(request.user, items, self.get_serializer_context())
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
 
 
 class GlucoseRecordViewSet(viewsets.ModelViewSet):
     queryset = GlucoseRecord.objects.all()
     serializer_class = GlucoseRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimestampCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
 
     def get_queryset(self):
         return GlucoseRecord.objects.filter(user=self.request.user)
-        
+
+    def list(self, request, *args, **kwargs):
+        # ?format=columnar: parallel arrays for charts, built without serializers
+        if request.accepted_renderer.format == ColumnarJSONRenderer.format:
+            return Response(glucose_columns(self.filter_queryset(self.get_queryset()), request))
+        return super().list(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # ?start=&end= (ISO datetime or date) and ?source=libre|manual|...
+        queryset = filter_timestamp_range(queryset, self.request.query_params)
+        source = self.request.query_params.get('source')
+        if source:
+            queryset = queryset.filter(source=source)
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
         print("perform_create triggered")
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """POST glucose-records/batch/: replay readings queued offline (services/offline_sync.py)."""
+        items = offline_sync.batch_items(request.data)
+        result = offline_sync.save_glucose_batch(request.user, items, self.get_serializer_context())
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+class GlucoseDownsampleView(APIView):
+    """
+    Long-range chart series reduced to a point budget.
+
+    GET /glugo/v1/glucose/downsample/?start=&end=&points=300&method=lttb|minmax
+    Without start/end the last `days` (default 30) are used.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        method = params.get('method', 'lttb')
+        if method not in downsample.METHODS:
+            return Response({'error': f"method must be one of {', '.join(downsample.METHODS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            points = int(params.get('points', 300))
+            days = float(params.get('days', 30))
+        except (TypeError, ValueError):
+            return Response({'error': 'points and days must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        points = max(3, min(points, getattr(settings, 'DOWNSAMPLE_MAX_POINTS', 2000)))
+
+        if params.get('end'):
+            end = parse_query_timestamp(params['end'], 'end', end_of_day=True)
+        else:
+            # whole 5-minute steps keep the default range cacheable between refreshes
+            now = timezone.now()
+            end = now.replace(second=0, microsecond=0) + timezone.timedelta(minutes=5 - now.minute % 5)
+        if params.get('start'):
+            start = parse_query_timestamp(params['start'], 'start')
+        else:
+            start = end - timezone.timedelta(days=days)
+
+        return Response(downsample.downsample(request.user, start, end, points, method))
+
+
+class HistoryExportView(APIView):
+    """
+    Stream the user's glucose and food history.
+
+    GET /glugo/v1/export/csv/     timestamp,glucose,insulin,carbs (model/*.csv schema)
+    GET /glugo/v1/export/ndjson/  one JSON object per glucose reading / food entry
+    Optional ?start=&end= limit the range.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+    def get(self, request, fmt):
+        if fmt not in export.FORMATS:
+            return Response({'error': f"format must be one of {', '.join(export.FORMATS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        start = parse_query_timestamp(params['start'], 'start') if params.get('start') else None
+        end = parse_query_timestamp(params['end'], 'end', end_of_day=True) if params.get('end') else None
+
+        response = StreamingHttpResponse(
+            export.iter_export(request.user, fmt, start, end), content_type=self.CONTENT_TYPES[fmt],
+        )
+        filename = f"glugo-history-{timezone.now():%Y%m%d}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class HistoryImportView(APIView):
+    """
+    Bulk-import a glucose / food history file (multipart field `file`).
+
+    POST /glugo/v1/import/csv/     timestamp,glucose,insulin,carbs (model/*.csv schema)
+    POST /glugo/v1/import/ndjson/  the format written by export/ndjson/
+    Optional `source` (default "libre") tags the imported readings.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request, fmt):
+        if fmt not in bulk_import.FORMATS:
+            return Response({'error': f"format must be one of {', '.join(bulk_import.FORMATS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        source = request.data.get('source') or 'libre'
+        try:
+            result = bulk_import.import_history(request.user, upload, fmt, source=source)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(f"Imported {result.glucose_created} glucose / {result.food_created} food rows "
+                    f"for user {request.user.pk} ({result.rejected} rejected)")
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
+
 class GlucoseStatisticsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -157,9 +233,6 @@ class GlucoseStatisticsView(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
 
-        # Filter user’s glucose records
-        records = GlucoseRecord.objects.filter(user=request.user)
-
         # If frontend sends a date range, apply it
         if start_date and end_date:
             start_date = parse_datetime(start_date)
@@ -169,17 +242,17 @@ class GlucoseStatisticsView(APIView):
             if not start_date or not end_date:
                 end_date = timezone.now()
                 start_date = end_date - timezone.timedelta(days=7)
-
-            records = records.filter(timestamp__range=[start_date, end_date])
         else:
             # Default: last 7 days
             end_date = timezone.now()
             start_date = end_date - timezone.timedelta(days=7)
-            records = records.filter(timestamp__range=[start_date, end_date])
 
+        # Served from hourly/daily rollups; thresholds follow the user's targets
+        low, high = stats_thresholds(request.user)
+        summary = rollups.summary(request.user, start_date, end_date, low, high)
 
         # If no data found, return default zeros
-        if not records.exists():
+        if not summary.count:
             return Response({
                 "time_in_range": 0,
                 "avg_glucose": 0,
@@ -189,26 +262,14 @@ class GlucoseStatisticsView(APIView):
                 "period": "No data"
             })
 
-        values = [r.glucose_level for r in records]
-
-        # Compute averages
-        avg_glucose = sum(values) / len(values)
-        above_range = sum(1 for v in values if v > 180) / len(values) * 100
-        below_range = sum(1 for v in values if v < 70) / len(values) * 100
-        in_range = 100 - above_range - below_range
-
-        # Compute coefficient of variation
-        mean = avg_glucose
-        variance = sum((v - mean) ** 2 for v in values) / len(values)
-        std_dev = math.sqrt(variance)
-        cv = (std_dev / mean) * 100 if mean != 0 else 0
-
         return Response({
-            "time_in_range": round(in_range, 1),
-            "avg_glucose": round(avg_glucose, 1),
-            "above_range": round(above_range, 1),
-            "below_range": round(below_range, 1),
-            "coefficient_of_variation": round(cv, 1),
+            "time_in_range": round(summary.pct_in_range, 1),
+            "avg_glucose": round(summary.mean, 1),
+            "above_range": round(summary.pct_above, 1),
+            "below_range": round(summary.pct_below, 1),
+            "coefficient_of_variation": round(summary.cv, 1),
+            "low_threshold": low,
+            "high_threshold": high,
             "period": "Last 7 days"
         })
 
@@ -315,28 +376,18 @@ class LibreWebhookView(APIView):
         except:
             return Response({'error': 'user not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        glucose_level = data.get('glucose_level')
-        timestamp_str = data.get('timestamp')
-        
-        if glucose_level is None or not timestamp_str:
-            return Response({'error': 'glucose_level and timestamp required'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        timestamp = parse_datetime(timestamp_str)
-        if not timestamp:
+        readings = extract_readings(data)
+        if not readings:
+            glucose_level = data.get('glucose_level')
+            timestamp_str = data.get('timestamp')
+            if glucose_level is None or not timestamp_str:
+                return Response({'error': 'glucose_level and timestamp required'}, status=status.HTTP_400_BAD_REQUEST)
             return Response({'error': 'invalid timestamp format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = ingest_readings(user, readings, source='libre_webhook',
+                                 device_offset_minutes=device_utc_offset(data))
         
-        # Create glucose record
-        GlucoseRecord.objects.get_or_create(
-            user=user,
-            timestamp=timestamp,
-            source='libre_webhook',
-            defaults={
-                'glucose_level': glucose_level,
-                'trend_arrow': data.get('trend_arrow', '')
-            }
-        )
-        
-        return Response({'status': 'received'}, status=status.HTTP_200_OK)
+        return Response({'status': 'received', **result.as_dict()}, status=status.HTTP_200_OK)
 
 
 class InsulinCalculateView(APIView):
@@ -428,7 +479,7 @@ class LibrePasswordLoginView(APIView):
             lc.token = token_response.get('access_token')
             lc.account_id = token_response.get('account_id')
             lc.connected = True
-            lc.region = base_url.split('//api-')[1].split('.')[0] if 'api-' in base_url else None
+            lc.region = region_from_base_url(base_url)
             lc.save()
             
             return Response({
@@ -487,78 +538,22 @@ class LibreSyncNowView(APIView):
                     "token": token,
                     "account_id": account_id,
                     "connected": True if token else False,
-                    "region": (base_url.split('//api-')[1].split('.')[0]
-                    if "api-" in base_url
-                    else None),
+                    "region": region_from_base_url(base_url),
 
                 },
             )
 
         # 3) Call LLU /connections
         try:
-            from .libre import get_libreview_connections
-            payload = get_libreview_connections(base_url, token, account_id)
-        except ImportError:
-            from .libre import _llu_headers_base
-            headers= _llu_headers_base()
-            headers.update({
-                "authorization": f"Bearer {token}",
-                "account-id": hashlib.sha256(account_id.encode()).hexdigest(),
-            })
-            r = requests.get(f"{base_url}/llu/connections", headers=headers, timeout=20)
-            r.raise_for_status()
-            payload = r.json()
+            payload = get_libreview_connection(base_url, token, account_id)
         except Exception as e:
             return Response({"error": f"llu_request_failed: {e}"}, status=502)
 
-        # 4) Extract readings and save idempotently
-        data = payload.get("data") or []
-        fetched = 0
-        created = 0
+        # 4) Extract readings and save idempotently in one bulk write
+        result = ingest_payload(user, payload, source="libre")
+        fetched, created = result.fetched, result.created
 
-        for item in data:
-            gm = (item or {}).get("glucoseMeasurement") or {}
-            # Some entries may not have a current measurement
-            if not gm:
-                continue
-
-            value = gm.get("Value")
-            trend = gm.get("TrendArrow")
-            ts_str = gm.get("Timestamp") or gm.get("timestamp")
-            if value is None or not ts_str:
-                continue
-
-            fetched += 1
-            
-            try:
-                ts = datetime.strptime(ts_str, "%m/%d/%Y %I:%M:%S %p")
-                ts = timezone.make_aware(ts, dt_timezone.utc)
-            except ValueError:
-
-                ts = parse_datetime(ts_str)
-                if ts is None:
-                    # If Libre sends naive string like "2025-10-30T12:00:00", make it UTC
-                    try:
-                        ts = timezone.make_aware(datetime.fromisoformat(ts_str))
-                    except Exception:
-                        continue
-                if timezone.is_naive(ts):
-                    ts = timezone.make_aware(ts, dt_timezone.utc)
-
-
-            obj, was_created = GlucoseRecord.objects.get_or_create(
-                user=user,
-                timestamp=ts,
-                source="libre",
-                defaults={
-                    'glucose_level': value,
-                    'trend_arrow': trend
-                }
-            )
-            if was_created:
-                created += 1
-
-                # Get the latest glucose record after sync
+        # Get the latest glucose record after sync
         latest_record = GlucoseRecord.objects.filter(
             user=user,
             source="libre"
@@ -621,14 +616,25 @@ class LibreConnectionStatusView(APIView):
         "email": "user@example.com",
         "account_id": "abc123",
         "region": "eu",
-        "last_synced": "2025-11-15T10:30:00Z"
+        "last_synced": "2025-11-15T10:30:00Z",
+        "last_sync_status": "ok",
+        "next_sync_at": "2025-11-15T10:35:00Z",
+        "sync_interval": 300,
+        "poll_after_seconds": 305
     }
+
+    poll_after_seconds: when it is worth asking again, i.e. just after the
+    server's next scheduled sync (see services/libre_scheduler.py).
     """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
         try:
             connection = LibreConnection.objects.get(user=request.user)
+            if connection.next_sync_at:
+                poll_after = int((connection.next_sync_at - timezone.now()).total_seconds()) + 5
+            else:
+                poll_after = connection.sync_interval
             
             return Response({
                 'connected': connection.connected,
@@ -636,7 +642,11 @@ class LibreConnectionStatusView(APIView):
                 'account_id': connection.account_id,
                 'region': connection.region,
                 'last_synced': connection.last_synced,
-                'api_endpoint': connection.api_endpoint
+                'api_endpoint': connection.api_endpoint,
+                'last_sync_status': connection.last_sync_status,
+                'next_sync_at': connection.next_sync_at,
+                'sync_interval': connection.sync_interval,
+                'poll_after_seconds': max(poll_after, 5),
             })
         except LibreConnection.DoesNotExist:
             return Response({
@@ -685,14 +695,20 @@ class OpenAIAnalyzeImageView(APIView):
     - JWT (SimpleJWT) required via global REST_FRAMEWORK setting
     - Per-user rate limit (throttle_scope='ai_image')
     - Accept only image/jpeg or image/png, max 4 MB
-    - Timeout and simple retries handled in service
+    - Timeout, retries, concurrency cap, rate limit and circuit breaker in
+      openai_outbound (while the breaker is open: 503 at once)
     - Strict JSON validated via Pydantic in `openai_service`
     - EXIF stripping performed server-side
+    - Results cached by image content (GET returns the cache hit/miss counters)
     """
     parser_classes = [MultiPartParser, FormParser]
     throttle_classes = [UserRateThrottle]
     throttle_scope = 'ai_image'
 
+    def get(self, request, *args, **kwargs):
+        return Response({'cache': analysis_cache_stats(), 'jobs': analysis_jobs.analysis_job_stats(),
+                         'upstream': outbound_stats()})
+
     def post(self, request, *args, **kwargs):
         f = request.FILES.get('image') or request.FILES.get('file')
         if not f:
@@ -730,6 +746,12 @@ class OpenAIAnalyzeImageView(APIView):
             user_hash = hashlib.sha256(str(getattr(user, 'id', None)).encode('utf-8')).hexdigest()[:16]
             logger.warning('ai_request rate_limited user=%s request_id=%s', user_hash, request_id)
             return Response({'error': 'rate_limited'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        except CircuitOpen:
+            user_hash = hashlib.sha256(str(getattr(user, 'id', None)).encode('utf-8')).hexdigest()[:16]
+            logger.warning('ai_request circuit_open user=%s request_id=%s', user_hash, request_id)
+            retry_after = int(outbound_stats()['breaker']['retry_in_seconds']) + 1
+            return Response({'error': 'upstream_unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(retry_after)})
         except OpenAIServiceError as se:
             user_hash = hashlib.sha256(str(getattr(user, 'id', None)).encode('utf-8')).hexdigest()[:16]
             logger.error('ai_request upstream_fail user=%s request_id=%s error=%s', user_hash, request_id, str(se))
@@ -738,6 +760,78 @@ class OpenAIAnalyzeImageView(APIView):
             user_hash = hashlib.sha256(str(getattr(user, 'id', None)).encode('utf-8')).hexdigest()[:16]
             logger.exception('ai_request unexpected user=%s request_id=%s', user_hash, request_id)
             return Response({'error': 'internal_error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _validated_image(request):
+    """The uploaded image bytes, or an error Response (same checks as the synchronous endpoint)."""
+    f = request.FILES.get('image') or request.FILES.get('file')
+    if not f:
+        return None, Response({"details": "No image provided (use field 'image')."}, status=400)
+    if f.content_type not in ('image/jpeg', 'image/png'):
+        return None, Response({'error': 'unsupported_media_type'}, status=status.HTTP_400_BAD_REQUEST)
+    if f.size > 4 * 1024 * 1024:
+        return None, Response({'error': 'file_too_large'}, status=status.HTTP_400_BAD_REQUEST)
+    return f.read(), None
+
+
+class AnalysisJobListView(APIView):
+    """
+    Image analysis without holding the request open (services/analysis_jobs.py).
+
+    POST /glugo/v1/ai/analyze-image/jobs/  multipart 'image', optional 'food_entry' id
+      -> 202 {job_id, status, status_url}; poll status_url until succeeded/failed.
+      429 when the user already has too many jobs pending, 503 when the queue is full.
+    GET  -> the user's recent jobs, plus queue metrics.
+    """
+    parser_classes = [MultiPartParser, FormParser]
+    throttle_classes = [UserRateThrottle]
+    throttle_scope = 'ai_image'
+
+    def get(self, request):
+        jobs = request.user.analysis_jobs.defer('image').order_by('-created_at')[:20]
+        return Response({'jobs': [analysis_jobs.job_payload(j) for j in jobs],
+                         'queue': analysis_jobs.analysis_job_stats()})
+
+    def post(self, request):
+        image_bytes, error = _validated_image(request)
+        if error is not None:
+            return error
+        entry = None
+        entry_id = request.data.get('food_entry')
+        if entry_id:
+            entry = FoodEntry.objects.filter(pk=entry_id, user=request.user).first() if _is_uuid(entry_id) else None
+            if entry is None:
+                return Response({'error': 'food_entry not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            job = analysis_jobs.submit(request.user, image_bytes, food_entry=entry,
+                                       request_id=request.headers.get('X-Request-Id') or '')
+        except analysis_jobs.AnalysisJobRejected as e:
+            return Response({'error': e.code, 'details': str(e)}, status=e.status, headers={'Retry-After': '5'})
+        job.refresh_from_db(fields=['status', 'result', 'error', 'started_at', 'finished_at'])
+        body = analysis_jobs.job_payload(job)
+        body['status_url'] = request.build_absolute_uri(f"{request.path.rstrip('/')}/{job.pk}/")
+        return Response(body, status=status.HTTP_202_ACCEPTED, headers={'Location': body['status_url']})
+
+
+class AnalysisJobDetailView(APIView):
+    """GET /glugo/v1/ai/analyze-image/jobs/<job_id>/: a job's status, and its result once done."""
+    # polling is a single indexed read; keep it out of the daily request budget
+    throttle_classes = []
+
+    def get(self, request, job_id):
+        job = request.user.analysis_jobs.defer('image').filter(pk=job_id).first()
+        if job is None:
+            return Response({'error': 'job not found'}, status=status.HTTP_404_NOT_FOUND)
+        headers = {'Retry-After': '2'} if job.status in job.ACTIVE_STATUSES else {}
+        return Response(analysis_jobs.job_payload(job), headers=headers)
+
+
+def _is_uuid(value) -> bool:
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
         
 
 class GlucosePredictionView(APIView):
@@ -898,13 +992,16 @@ class PredictionStatusView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        from core.services.prediction import prediction_service, TORCH_AVAILABLE, LIGHTGBM_AVAILABLE
+        from core.services.prediction import prediction_service
+        from core.services.inference import TORCH_AVAILABLE, LIGHTGBM_AVAILABLE
+        from core.services.batching import get_cnn_lstm_batcher
         
+        batcher = get_cnn_lstm_batcher()
         return Response({
             'success': True,
             'service_loaded': prediction_service.loaded,
             'available_models': {
-                'cnn_lstm': TORCH_AVAILABLE and hasattr(prediction_service, 'cnn_lstm_path'),
+                'cnn_lstm': TORCH_AVAILABLE and prediction_service.cnn_lstm_model is not None,
                 'lgb': LIGHTGBM_AVAILABLE and prediction_service.lgb_model is not None,
                 'simple': True,
                 'ensemble': prediction_service.loaded
@@ -913,6 +1010,7 @@ class PredictionStatusView(APIView):
                 'pytorch': TORCH_AVAILABLE,
                 'lightgbm': LIGHTGBM_AVAILABLE,
             },
+            'batching': batcher.stats() if batcher else None,
             'message': 'Prediction service ready' if prediction_service.loaded 
                       else 'No ML models loaded, using baseline only'
         })
\ No newline at end of file
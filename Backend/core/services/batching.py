@@ -0,0 +1,203 @@
+"""Request-coalescing inference queue for the CNN-LSTM model.
+
+Concurrent `/glucose/predict/` requests each need one forward pass over a
+48 x F window. Instead of running a batch of one per request, callers submit
+their window to a `MicroBatcher`; a single worker thread collects whatever
+arrives within `max_wait_ms` (up to `max_batch_size` windows), stacks them
+into one tensor, runs one forward pass and hands each caller its own result.
+When nothing is queued or running, a blocking `predict` skips the queue and
+runs its batch of one on the caller's thread: a lone client pays neither the
+wait nor the thread handoff. Requests arriving meanwhile queue up and go out
+together once that pass finishes, as only one forward pass runs at a time.
+
+The queue is plain `threading`/`concurrent.futures`, so it works the same for
+WSGI worker threads (`predict`) and for coroutines under ASGI
+(`predict_async`, which awaits the future without blocking the event loop).
+Under ASGI, Django runs sync views such as the DRF prediction views on one
+shared thread (`sync_to_async(thread_sensitive=True)`), which would
+serialize them and leave nothing to coalesce; `concurrent_view` wraps such
+a view so each request runs on the default executor instead.
+The worker thread is started lazily and restarted after a fork, so preloading
+the app in a pre-fork server is safe.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesce single-window predictions into batched forward passes."""
+
+    def __init__(self, predict_batch: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, timeout: float = 10.0):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()  # held for the duration of each forward pass
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+        self._last_batch_size = 0
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                # queued items and a pass in flight belong to the parent process after a fork
+                self._queue = queue.Queue()
+                self._busy = threading.Lock()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, window: np.ndarray) -> Future:
+        """Queue one window and return a Future for its prediction."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((np.asarray(window, dtype=np.float32), future))
+        return future
+
+    def predict(self, window: np.ndarray) -> float:
+        """Blocking prediction for one window (WSGI / sync views)."""
+        self._ensure_worker()
+        if self._queue.empty() and self._busy.acquire(blocking=False):
+            # idle: nobody to coalesce with, run on this thread
+            try:
+                output = self._forward([np.asarray(window, dtype=np.float32)])
+            finally:
+                self._busy.release()
+            return float(output[0])
+        return self.submit(window).result(timeout=self.timeout)
+
+    async def predict_async(self, window: np.ndarray) -> float:
+        """Awaitable prediction for one window (ASGI / async views)."""
+        future = self.submit(window)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        if self._last_batch_size <= 1 and self._queue.empty():
+            # idle: nobody to coalesce with, don't make a lone request wait
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _forward(self, windows) -> np.ndarray:
+        """One forward pass over `windows`; the caller holds `_busy`."""
+        self._last_batch_size = len(windows)
+        try:
+            outputs = self.predict_batch(np.stack(windows))
+        except Exception as e:
+            logger.warning(f"Batched prediction failed for {len(windows)} requests: {e}")
+            raise
+        self.batches += 1
+        self.items += len(windows)
+        self.max_seen_batch = max(self.max_seen_batch, len(windows))
+        return outputs
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(w, f) for w, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                with self._busy:
+                    outputs = self._forward([w for w, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), value in zip(batch, outputs):
+                future.set_result(float(value))
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'requests': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'max_batch_size_seen': self.max_seen_batch,
+            'queue_depth': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+        }
+
+
+def concurrent_view(view):
+    """Async wrapper running a blocking view off Django's single thread-sensitive thread.
+
+    Under ASGI concurrent requests then reach the batcher together; under
+    WSGI Django runs the wrapper through async_to_sync, which works the
+    same. The view must not rely on thread-local state set by middleware.
+    """
+    def run(request, *args, **kwargs):
+        # executor threads sit outside the request_started/finished signals that manage connections
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()  # DRF renders lazily, possibly from the event loop thread otherwise
+            return response
+        finally:
+            close_old_connections()
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False)(request, *args, **kwargs)
+
+    return wrapper
+
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_cnn_lstm_batcher() -> Optional[MicroBatcher]:
+    """Process-wide batcher over the shared CNN-LSTM runtime, or None if disabled."""
+    global _batcher
+    if not getattr(settings, 'PREDICTION_BATCHING_ENABLED', True):
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                from .inference import get_runtime
+                runtime = get_runtime()
+                if not runtime.cnn_lstm_ready:
+                    return None
+                _batcher = MicroBatcher(
+                    runtime.predict_cnn_lstm_batch,
+                    max_batch_size=getattr(settings, 'PREDICTION_BATCH_MAX_SIZE', 32),
+                    max_wait_ms=getattr(settings, 'PREDICTION_BATCH_MAX_WAIT_MS', 5),
+                )
+    return _batcher
@@ -0,0 +1,109 @@
+"""Compact columnar representation of glucose readings for charts.
+
+`GET glucose-records/?format=columnar` returns parallel arrays instead of
+one serialized dict per reading:
+
+    {
+      "count": 3,
+      "t": [1718000000, 1718000060, ...],     # epoch seconds, ascending
+      "glucose": [112, 115, ...],            # integer mg/dL
+      "trend": [0, 0, 1, ...], "trend_labels": ["3", "4"],
+      "source": [0, 0, 0, ...], "source_labels": ["libre"],
+      "next": null
+    }
+
+`trend` / `source` hold indexes into their `*_labels` dictionaries (a label
+may be null). Rows are read with `values_list` and the epoch is computed by
+the database, so no model instances, datetime parsing, UUIDs or ISO
+strings are involved. At most COLUMNAR_MAX_POINTS are returned; when a
+range holds more, `next` is the URL of the continuation. It carries
+`after=<timestamp>,<id>` of the last row sent (rows are ordered by
+timestamp, then id), so a page always advances even when more than
+COLUMNAR_MAX_POINTS readings share one second. Responses are
+gzip-compressed by GZipMiddleware when the client accepts it.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.db.models import BigIntegerField, Func, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+
+from .pagination import parse_query_timestamp
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """Selected with ?format=columnar; the payload itself is built by `glucose_columns`."""
+    format = 'columnar'
+
+
+class EpochSeconds(Func):
+    """Whole seconds since the Unix epoch of a datetime column, computed in SQL."""
+    template = 'CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s)) AS BIGINT)'
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+                           **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(UNIX_TIMESTAMP(%(expressions)s) AS SIGNED)',
+                           **extra_context)
+
+
+def _encode(values):
+    """Dictionary-encode `values`: (codes, labels)."""
+    index = {}
+    codes = [index.setdefault(v, len(index)) for v in values]
+    return codes, list(index)
+
+
+def _after(queryset, value: str):
+    """Rows strictly after the `<timestamp>,<id>` cursor in (timestamp, id) order."""
+    ts, _, pk = value.rpartition(',')
+    try:
+        pk = uuid.UUID(pk)
+    except ValueError:
+        raise ValidationError({'after': f"Invalid cursor: {value!r}"})
+    ts = parse_query_timestamp(ts, 'after')
+    return queryset.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, pk__gt=pk))
+
+
+def glucose_columns(queryset, request=None, max_points=None) -> dict:
+    """Columnar payload for a (filtered) GlucoseRecord queryset, oldest first."""
+    if max_points is None:
+        max_points = getattr(settings, 'COLUMNAR_MAX_POINTS', 200000)
+    if request is not None and request.query_params.get('after'):
+        queryset = _after(queryset, request.query_params['after'])
+    queryset = queryset.order_by('timestamp', 'pk')
+    rows = list(
+        queryset.annotate(epoch=EpochSeconds('timestamp'))
+        .values_list('epoch', 'glucose_level', 'trend_arrow', 'source')[:max_points + 1]
+    )
+    next_url = None
+    if len(rows) > max_points:
+        rows = rows[:max_points]
+        if request is not None:
+            # the exact key of the last row sent; only fetched when there is a next page
+            last_ts, last_pk = queryset.values_list('timestamp', 'pk')[max_points - 1]
+            params = request.query_params.copy()
+            params['after'] = f"{last_ts.isoformat()},{last_pk}"
+            next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+
+    if rows:
+        timestamps, levels, trends, sources = zip(*rows)
+    else:
+        timestamps = levels = trends = sources = ()
+    trend_codes, trend_labels = _encode(trends)
+    source_codes, source_labels = _encode(sources)
+    return {
+        'count': len(rows),
+        't': list(timestamps),
+        'glucose': [int(round(level)) for level in levels],
+        'trend': trend_codes,
+        'trend_labels': trend_labels,
+        'source': source_codes,
+        'source_labels': source_labels,
+        'next': next_url,
+    }
@@ -0,0 +1,161 @@
+"""Server-side downsampling of glucose readings for long-range charts.
+
+`downsample(user, start, end, budget)` reduces a range of readings to at most
+`budget` points:
+
+- 'lttb' (default): Largest-Triangle-Three-Buckets. The first and last
+  readings are kept and the rest are split into budget - 2 equal-count
+  buckets, each contributing the reading that forms the largest triangle
+  with the previously selected point and the next bucket's average. A
+  bucket that contains hypo/hyper readings (outside the user's
+  `stats_thresholds`) contributes its most extreme one instead, so
+  excursions never disappear from the chart.
+- 'minmax': budget // 2 buckets, each contributing its min and max in time
+  order.
+
+Readings are streamed from the database in timestamp order with
+`.iterator()` and only the current and next bucket are held in memory, so
+a 90-day 1-minute range costs O(n) time and O(n / budget) memory.
+
+Results are cached (Django cache, DOWNSAMPLE_CACHE_TTL seconds) per user,
+range, budget and method. The key also holds a fingerprint of the range
+taken from the hourly rollups it overlaps (rows, readings and newest
+`updated_at`), one small aggregate per request instead of a scan of the
+readings. Every write refreshes its hour's rollup, so new, edited and
+deleted readings are picked up immediately.
+"""
+
+import hashlib
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from .columnar import EpochSeconds
+from .glucose_stats import stats_thresholds
+from .rollups import floor_hour
+
+METHODS = ('lttb', 'minmax')
+STREAM_CHUNK_SIZE = 2000
+
+Point = Tuple[int, float]  # (epoch seconds, mg/dL)
+
+
+def _excursion(level: float, low: float, high: float) -> float:
+    """How far a reading lies outside [low, high] (0 when in range)."""
+    return max(low - level, level - high, 0.0)
+
+
+def _take(points: Iterator[Point], count: int) -> List[Point]:
+    return list(islice(points, count))
+
+
+def lttb(points: Iterable[Point], n: int, budget: int,
+         low: Optional[float] = None, high: Optional[float] = None) -> Iterator[Point]:
+    """Stream LTTB over `n` time-ordered points, yielding at most `budget` of them."""
+    if budget < 3:
+        raise ValueError("LTTB needs a budget of at least 3 points")
+    points = iter(points)
+    if n <= budget:
+        yield from islice(points, n)
+        return
+
+    every = (n - 2) / (budget - 2)
+    bounds = [int(i * every) + 1 for i in range(budget - 2)] + [n - 1]
+
+    previous = next(points)
+    yield previous
+    bucket = _take(points, bounds[1] - bounds[0])
+    for i in range(budget - 2):
+        following = _take(points, bounds[i + 2] - bounds[i + 1]) if i + 2 < len(bounds) else _take(points, 1)
+        if not bucket or not following:
+            # rows deleted since `n` was counted; emit what is left
+            yield from bucket + following
+            return
+        if low is not None and high is not None:
+            extreme = max(bucket, key=lambda p: _excursion(p[1], low, high))
+            if _excursion(extreme[1], low, high) > 0:
+                previous = extreme
+                yield extreme
+                bucket = following
+                continue
+        avg_t = sum(p[0] for p in following) / len(following)
+        avg_v = sum(p[1] for p in following) / len(following)
+        at, av = previous
+        previous = max(
+            bucket,
+            key=lambda p: abs((at - avg_t) * (p[1] - av) - (at - p[0]) * (avg_v - av)),
+        )
+        yield previous
+        bucket = following
+    # `following` of the last bucket is the final point
+    yield bucket[-1]
+
+
+def minmax(points: Iterable[Point], n: int, budget: int) -> Iterator[Point]:
+    """Min and max (in time order) of budget // 2 equal-count buckets."""
+    points = iter(points)
+    buckets = max(1, budget // 2)
+    if n <= budget:
+        yield from islice(points, n)
+        return
+    every = n / buckets
+    for i in range(buckets):
+        bucket = _take(points, int((i + 1) * every) - int(i * every))
+        if not bucket:
+            continue
+        lo = min(bucket, key=lambda p: p[1])
+        hi = max(bucket, key=lambda p: p[1])
+        yield from sorted({lo, hi})
+
+
+def _fingerprint(user, start, end) -> dict:
+    """Summary of the hourly rollups overlapping [start, end]; changes whenever a reading in it does."""
+    from ..models import GlucoseHourlyRollup
+    return GlucoseHourlyRollup.objects.filter(user=user, bucket__gte=floor_hour(start), bucket__lte=end).aggregate(
+        hours=Count('id'), count=Sum('count'), updated=Max('updated_at'))
+
+
+def _cache_key(user, start, end, budget, method, low, high, fp) -> str:
+    raw = f"{user.pk}:{start.isoformat()}:{end.isoformat()}:{budget}:{method}:{low}:{high}:" \
+          f"{fp['hours']}:{fp['count']}:{fp['updated']}"
+    return f"glucose-downsample:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def downsample(user, start, end, budget: int, method: str = 'lttb') -> dict:
+    """Downsampled readings with start <= timestamp <= end as parallel arrays."""
+    from ..models import GlucoseRecord
+
+    low, high = stats_thresholds(user)
+    qs = GlucoseRecord.objects.filter(user=user, timestamp__range=[start, end])
+    fp = _fingerprint(user, start, end)
+    key = _cache_key(user, start, end, budget, method, low, high, fp)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    n = qs.count()
+    rows = (
+        qs.order_by('timestamp')
+        .annotate(epoch=EpochSeconds('timestamp'))
+        .values_list('epoch', 'glucose_level')
+        .iterator(chunk_size=STREAM_CHUNK_SIZE)
+    )
+    if method == 'minmax':
+        selected = list(minmax(rows, n, budget))
+    else:
+        selected = list(lttb(rows, n, budget, low, high))
+    result = {
+        'method': method,
+        'budget': budget,
+        'raw_count': n,
+        'count': len(selected),
+        'low_threshold': low,
+        'high_threshold': high,
+        't': [t for t, _ in selected],
+        'glucose': [int(round(v)) for _, v in selected],
+    }
+    cache.set(key, result, getattr(settings, 'DOWNSAMPLE_CACHE_TTL', 300))
+    return result
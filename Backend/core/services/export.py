@@ -0,0 +1,155 @@
+"""Streaming export of a user's glucose and food history.
+
+Both formats merge `GlucoseRecord` and `FoodEntry` rows in timestamp order
+straight from two `.iterator(chunk_size=EXPORT_CHUNK_SIZE)` cursors and
+yield text in blocks, so memory stays flat however long the history is.
+
+- CSV uses the `timestamp,glucose,insulin,carbs` schema of `model/*.csv`,
+  so an export feeds `feature_utils.create_features_from_csv` and the model
+  scripts directly. Timestamps are naive local times in TIME_ZONE, as in
+  the training files. Following the feature store's slot rule, a food
+  entry's insulin units (`insulin_rounded`) and carbs (`total_carbs`) ride
+  on the first reading of its 5-minute slot at or after the entry. When
+  that slot has no later reading, the entry gets its own row with an empty
+  glucose.
+- NDJSON writes one object per row with a `type` of "glucose" or "food"
+  and the full record fields.
+"""
+
+import csv
+import heapq
+import json
+from typing import Iterator, Optional
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+from .resample import SLOT_SECONDS
+
+FORMATS = ('csv', 'ndjson')
+CSV_HEADER = ('timestamp', 'glucose', 'insulin', 'carbs')
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# rows per yielded block of text
+BLOCK_ROWS = 500
+
+GLUCOSE, FOOD = 1, 0  # food sorts first at equal timestamps
+
+
+def _chunk_size() -> int:
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def _range(qs, start, end):
+    if start is not None:
+        qs = qs.filter(timestamp__gte=start)
+    if end is not None:
+        qs = qs.filter(timestamp__lte=end)
+    return qs.order_by('timestamp')
+
+
+def _glucose_rows(user, start, end, fields):
+    from ..models import GlucoseRecord
+    qs = _range(GlucoseRecord.objects.filter(user=user), start, end)
+    return qs.values_list('timestamp', *fields).iterator(chunk_size=_chunk_size())
+
+
+def _food_rows(user, start, end, fields):
+    from ..models import FoodEntry
+    qs = _range(FoodEntry.objects.filter(user=user), start, end)
+    return qs.values_list('timestamp', *fields).iterator(chunk_size=_chunk_size())
+
+
+def _merged(glucose, food):
+    """(timestamp, kind, row) in timestamp order from two sorted cursors."""
+    return heapq.merge(
+        ((row[0], GLUCOSE, row) for row in glucose),
+        ((row[0], FOOD, row) for row in food),
+        key=lambda e: (e[0], e[1]),
+    )
+
+
+class _Echo:
+    """File-like object whose write() returns the line (csv.writer target)."""
+
+    def write(self, value):
+        return value
+
+
+def _blocks(lines: Iterator[str]) -> Iterator[str]:
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= BLOCK_ROWS:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def _fmt(value: Optional[float]):
+    if value is None:
+        return ''
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 6)
+
+
+def _csv_lines(user, start, end, tz) -> Iterator[str]:
+    writer = csv.writer(_Echo(), lineterminator='\n')
+    yield writer.writerow(CSV_HEADER)
+
+    def stamp(ts):
+        return ts.astimezone(tz).strftime(CSV_TIMESTAMP_FORMAT)
+
+    pending = None  # [slot, first timestamp, insulin, carbs] of food not yet written
+    events = _merged(
+        _glucose_rows(user, start, end, ('glucose_level',)),
+        _food_rows(user, start, end, ('insulin_rounded', 'total_carbs')),
+    )
+    for ts, kind, row in events:
+        slot = int(ts.timestamp()) // SLOT_SECONDS
+        if pending is not None and pending[0] != slot:
+            yield writer.writerow((stamp(pending[1]), '', _fmt(pending[2]), _fmt(pending[3])))
+            pending = None
+        if kind == FOOD:
+            if pending is None:
+                pending = [slot, ts, 0.0, 0.0]
+            pending[2] += float(row[1] or 0.0)
+            pending[3] += float(row[2] or 0.0)
+            continue
+        insulin = carbs = 0.0
+        if pending is not None:
+            insulin, carbs = pending[2], pending[3]
+            pending = None
+        yield writer.writerow((stamp(ts), _fmt(row[1]), _fmt(insulin), _fmt(carbs)))
+    if pending is not None:
+        yield writer.writerow((stamp(pending[1]), '', _fmt(pending[2]), _fmt(pending[3])))
+
+
+GLUCOSE_FIELDS = ('id', 'glucose_level', 'trend_arrow', 'source', 'meal_timing', 'mood', 'notes')
+FOOD_FIELDS = (
+    'id', 'food_name', 'description', 'meal_type', 'total_carbs', 'total_calories',
+    'total_protein', 'total_fat', 'insulin_recommended', 'insulin_rounded',
+)
+
+
+def _ndjson_lines(user, start, end) -> Iterator[str]:
+    events = _merged(
+        _glucose_rows(user, start, end, GLUCOSE_FIELDS),
+        _food_rows(user, start, end, FOOD_FIELDS),
+    )
+    for ts, kind, row in events:
+        fields = GLUCOSE_FIELDS if kind == GLUCOSE else FOOD_FIELDS
+        record = {'type': 'glucose' if kind == GLUCOSE else 'food', 'timestamp': ts.isoformat()}
+        record.update(zip(fields, row[1:]))
+        record['id'] = str(record['id'])
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def iter_export(user, fmt: str = 'csv', start=None, end=None) -> Iterator[str]:
+    """Yield the user's history as blocks of CSV or NDJSON text."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'csv':
+        tz = ZoneInfo(getattr(settings, 'TIME_ZONE', 'UTC') or 'UTC')
+        return _blocks(_csv_lines(user, start, end, tz))
+    return _blocks(_ndjson_lines(user, start, end))
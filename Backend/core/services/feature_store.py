@@ -0,0 +1,371 @@
+"""Per-user incremental store for the model features in `model/feature_utils.py`.
+
+`create_features` recomputes lags, rolling statistics and the IOB/COB decay
+recurrence over the whole history on every call. `FeatureAccumulator` keeps
+just the state those features depend on - the last 12 glucose slots, the
+decayed insulin/carb accumulators and the latest 48 feature rows - and
+advances it one 5-minute slot at a time, so each new reading or food entry is
+O(1) work and a prediction can read a ready-made 48-step window.
+
+Slot semantics follow the training data: one row per 5-minute slot, the slot
+glucose is the latest reading inside the slot, gaps of up to
+`MAX_INTERPOLATE_SLOTS` are linearly interpolated and longer gaps restart the
+glucose history (IOB/COB keep decaying across them). Insulin and carbs are
+summed into the slot they were logged in; late food entries are folded into
+the accumulators and the stored rows in closed form.
+
+The state is persisted as JSON in `UserFeatureState`. Readings older than the
+current slot, edited readings and deleted readings or food entries cannot be
+applied incrementally; they mark the state dirty and it is rebuilt from the
+DB on the next read (or via `rebuild_feature_store`).
+"""
+
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .inference import MAX_INTERPOLATE_SLOTS, SEQ_LEN
+from .resample import SLOT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LAGS = (1, 2, 3, 6, 12)
+ROLLS = (3, 6, 12)
+GLUCOSE_HISTORY = max(LAGS) + 1  # current slot + 12 lags
+IOB_DECAY = math.exp(-1 / 48)
+COB_DECAY = math.exp(-1 / 24)
+# Food entries are remembered this long so edits can be applied as deltas
+FOOD_MEMORY_SLOTS = 24 * 60 * 60 // SLOT_SECONDS
+
+FEATURE_ORDER = [
+    'glucose', 'insulin', 'carbs', 'hour', 'minute', 'dayofweek', 'hour_sin', 'hour_cos',
+    'glucose_lag1', 'glucose_lag2', 'glucose_lag3', 'glucose_lag6', 'glucose_lag12',
+    'glucose_rollmean3', 'glucose_rollstd3', 'glucose_rollmean6', 'glucose_rollstd6',
+    'glucose_rollmean12', 'glucose_rollstd12', 'glucose_diff1', 'IOB', 'COB',
+]
+
+
+def slot_of(ts) -> int:
+    """5-minute slot index of an aware datetime."""
+    return int(ts.timestamp()) // SLOT_SECONDS
+
+
+class FeatureAccumulator:
+    """O(1)-per-slot equivalent of `create_features` over a 5-minute series."""
+
+    def __init__(self, tz: str = 'UTC'):
+        self.tz = tz
+        self.slot = None          # current (open) slot index
+        self.glucose = []         # up to 13 slot values, last one is the current slot
+        self.reading_ts = None    # epoch seconds of the reading behind the current slot value
+        self.insulin = 0.0        # amounts logged in the current slot
+        self.carbs = 0.0
+        self.iob_prev = 0.0       # IOB/COB at the previous slot
+        self.cob_prev = 0.0
+        self.first = True         # compute_decay_feature leaves the first row at 0
+        self.rows = []            # [slot, vector] for closed slots, at most SEQ_LEN - 1
+        self.pending = {}         # food logged for slots that are not open yet
+        self.food = {}            # entry id -> [slot, insulin, carbs] already applied
+
+    # -- serialisation -------------------------------------------------
+    def to_dict(self) -> dict:
+        return {
+            'tz': self.tz, 'slot': self.slot, 'glucose': self.glucose, 'reading_ts': self.reading_ts,
+            'insulin': self.insulin, 'carbs': self.carbs,
+            'iob_prev': self.iob_prev, 'cob_prev': self.cob_prev, 'first': self.first,
+            'rows': self.rows, 'pending': {str(k): v for k, v in self.pending.items()},
+            'food': self.food,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FeatureAccumulator':
+        acc = cls(tz=data.get('tz', 'UTC'))
+        acc.slot = data.get('slot')
+        acc.glucose = list(data.get('glucose') or [])
+        acc.reading_ts = data.get('reading_ts')
+        acc.insulin = data.get('insulin', 0.0)
+        acc.carbs = data.get('carbs', 0.0)
+        acc.iob_prev = data.get('iob_prev', 0.0)
+        acc.cob_prev = data.get('cob_prev', 0.0)
+        acc.first = data.get('first', True)
+        acc.rows = [list(r) for r in data.get('rows') or []]
+        acc.pending = {int(k): list(v) for k, v in (data.get('pending') or {}).items()}
+        acc.food = dict(data.get('food') or {})
+        return acc
+
+    # -- feature rows --------------------------------------------------
+    @property
+    def iob(self) -> float:
+        return 0.0 if self.first else self.insulin + self.iob_prev * IOB_DECAY
+
+    @property
+    def cob(self) -> float:
+        return 0.0 if self.first else self.carbs + self.cob_prev * COB_DECAY
+
+    @property
+    def ready(self) -> bool:
+        return len(self.glucose) >= GLUCOSE_HISTORY
+
+    def current_row(self) -> Optional[list]:
+        """Feature vector of the open slot, or None until 12 lags exist."""
+        if not self.ready:
+            return None
+        g = self.glucose
+        local = datetime.fromtimestamp(self.slot * SLOT_SECONDS, tz=ZoneInfo(self.tz))
+        hour = local.hour
+        row = [
+            g[-1], self.insulin, self.carbs,
+            hour, local.minute, local.weekday(),
+            math.sin(2 * math.pi * hour / 24), math.cos(2 * math.pi * hour / 24),
+        ]
+        row += [g[-1 - lag] for lag in LAGS]
+        for w in ROLLS:
+            window = g[-w:]
+            mean = math.fsum(window) / w
+            row.append(mean)
+            row.append(math.sqrt(math.fsum((v - mean) ** 2 for v in window) / (w - 1)))
+        row.append(g[-1] - g[-2])
+        row += [self.iob, self.cob]
+        return row
+
+    def window(self) -> Optional[np.ndarray]:
+        """Latest SEQ_LEN contiguous rows (closed rows + open slot) or None."""
+        current = self.current_row()
+        if current is None or len(self.rows) < SEQ_LEN - 1:
+            return None
+        if self.rows[0][0] != self.slot - (SEQ_LEN - 1):
+            return None
+        return np.array([r[1] for r in self.rows] + [current], dtype=np.float32)
+
+    # -- slot transitions ----------------------------------------------
+    def _open(self, slot: int, glucose: Optional[float]):
+        self.slot = slot
+        if glucose is not None:
+            self.glucose = (self.glucose + [float(glucose)])[-GLUCOSE_HISTORY:]
+        insulin, carbs = self.pending.pop(slot, (0.0, 0.0))
+        self.insulin, self.carbs = float(insulin), float(carbs)
+
+    def _close(self):
+        row = self.current_row()
+        if row is not None:
+            self.rows = (self.rows + [[self.slot, row]])[-(SEQ_LEN - 1):]
+        self.iob_prev, self.cob_prev = self.iob, self.cob
+        self.first = False
+
+    def _skip_empty(self, count: int):
+        """Decay the accumulators over `count` slots that have no glucose row."""
+        end = self.slot + count
+        for slot in sorted(s for s in self.pending if s <= end):
+            insulin, carbs = self.pending.pop(slot)
+            self.iob_prev += insulin * IOB_DECAY ** -(slot - self.slot)
+            self.cob_prev += carbs * COB_DECAY ** -(slot - self.slot)
+        self.iob_prev *= IOB_DECAY ** count
+        self.cob_prev *= COB_DECAY ** count
+        self.slot = end
+
+    def add_reading(self, slot: int, glucose: float, ts: Optional[float] = None) -> bool:
+        """Apply a reading taken at epoch seconds `ts`; returns False if it is older than the open slot.
+
+        Within the open slot the latest reading wins, whatever order they arrive in.
+        """
+        glucose = float(glucose)
+        if self.slot is None:
+            self._open(slot, glucose)
+            self.reading_ts = ts
+            return True
+        if slot == self.slot:
+            if ts is not None and self.reading_ts is not None and ts < self.reading_ts:
+                return True
+            self.reading_ts = ts
+            if self.glucose:
+                self.glucose[-1] = glucose
+            else:
+                self.glucose = [glucose]
+            return True
+        if slot < self.slot:
+            return False
+
+        gap = slot - self.slot
+        previous = self.glucose[-1] if self.glucose else None
+        self._close()
+        if previous is not None and gap - 1 <= MAX_INTERPOLATE_SLOTS:
+            for k in range(1, gap):
+                self._open(self.slot + 1, previous + (glucose - previous) * k / gap)
+                self._close()
+        else:
+            # the batch pipeline drops these rows, so lags restart after the gap
+            self.glucose = []
+            self.rows = []
+            self._skip_empty(gap - 1)
+        self._open(slot, glucose)
+        self.reading_ts = ts
+        return True
+
+    def add_food(self, slot: int, insulin: float = 0.0, carbs: float = 0.0, entry_id: Optional[str] = None):
+        """Apply (a change in) insulin units / carb grams logged in `slot`."""
+        if entry_id is not None:
+            old_slot, old_insulin, old_carbs = self.food.get(entry_id, (slot, 0.0, 0.0))
+            if old_slot != slot:
+                self._apply_food(old_slot, -old_insulin, -old_carbs)
+                old_insulin = old_carbs = 0.0
+            self.food[entry_id] = [slot, float(insulin), float(carbs)]
+            insulin, carbs = insulin - old_insulin, carbs - old_carbs
+            if self.slot is not None:
+                horizon = self.slot - FOOD_MEMORY_SLOTS
+                self.food = {k: v for k, v in self.food.items() if v[0] >= horizon}
+        self._apply_food(slot, float(insulin), float(carbs))
+
+    def _apply_food(self, slot: int, insulin: float, carbs: float):
+        if not insulin and not carbs:
+            return
+        if self.slot is None or slot > self.slot:
+            pending = self.pending.setdefault(slot, [0.0, 0.0])
+            pending[0] += insulin
+            pending[1] += carbs
+            return
+        if slot == self.slot:
+            self.insulin += insulin
+            self.carbs += carbs
+            return
+        # late entry: shift the accumulators and every stored row after it
+        self.iob_prev += insulin * IOB_DECAY ** (self.slot - 1 - slot)
+        self.cob_prev += carbs * COB_DECAY ** (self.slot - 1 - slot)
+        iob_col, cob_col = FEATURE_ORDER.index('IOB'), FEATURE_ORDER.index('COB')
+        for row_slot, row in self.rows:
+            if row_slot == slot:
+                row[1] += insulin
+                row[2] += carbs
+            if row_slot >= slot:
+                row[iob_col] += insulin * IOB_DECAY ** (row_slot - slot)
+                row[cob_col] += carbs * COB_DECAY ** (row_slot - slot)
+
+
+# -- persistence -----------------------------------------------------------
+
+def _history_minutes() -> int:
+    return getattr(settings, 'PREDICTION_FEATURE_HISTORY_MINUTES', 720)
+
+
+def _tz() -> str:
+    return getattr(settings, 'TIME_ZONE', 'UTC') or 'UTC'
+
+
+def _food_amounts(entry) -> tuple:
+    return float(entry.insulin_rounded or 0.0), float(entry.total_carbs or 0.0)
+
+
+def replay(glucose_rows, food_rows, tz: Optional[str] = None) -> FeatureAccumulator:
+    """Build an accumulator from (timestamp, level) and (id, timestamp, insulin, carbs) rows."""
+    acc = FeatureAccumulator(tz=tz or _tz())
+    events = [(slot_of(ts), 1, (level, ts.timestamp())) for ts, level in glucose_rows]
+    events += [(slot_of(ts), 0, (str(pk), insulin or 0.0, carbs or 0.0)) for pk, ts, insulin, carbs in food_rows]
+    # food first within a slot so it lands in the slot it was logged in
+    for slot, kind, payload in sorted(events, key=lambda e: (e[0], e[1])):
+        if kind == 1:
+            acc.add_reading(slot, *payload)
+        else:
+            entry_id, insulin, carbs = payload
+            acc.add_food(slot, insulin, carbs, entry_id=entry_id)
+    return acc
+
+
+def rebuild(user):
+    """Recompute the user's feature state from the last PREDICTION_FEATURE_HISTORY_MINUTES of rows."""
+    from core.models import UserFeatureState
+
+    since = timezone.now() - timedelta(minutes=_history_minutes())
+    glucose_rows = (
+        user.glucose_records.filter(timestamp__gte=since, glucose_level__gte=40, glucose_level__lte=400)
+        .order_by('timestamp')
+        .values_list('timestamp', 'glucose_level')
+    )
+    food_rows = (
+        user.food_entries.filter(timestamp__gte=since)
+        .order_by('timestamp')
+        .values_list('id', 'timestamp', 'insulin_rounded', 'total_carbs')
+    )
+    acc = replay(glucose_rows, food_rows)
+    UserFeatureState.objects.update_or_create(user=user, defaults={'state': acc.to_dict(), 'dirty': False})
+    return acc
+
+
+def _update(user, apply):
+    from core.models import UserFeatureState
+
+    with transaction.atomic():
+        fs, _ = UserFeatureState.objects.select_for_update().get_or_create(user=user, defaults={'state': {}})
+        if fs.dirty:
+            return
+        acc = FeatureAccumulator.from_dict(fs.state) if fs.state else FeatureAccumulator(tz=_tz())
+        if apply(acc) is False:
+            fs.dirty = True
+            fs.save(update_fields=['dirty', 'updated_at'])
+            return
+        fs.state = acc.to_dict()
+        fs.save(update_fields=['state', 'updated_at'])
+
+
+def record_glucose(records):
+    """Apply newly created GlucoseRecords (one user, any order) to the store."""
+    records = sorted(
+        (r for r in records if 40 <= float(r.glucose_level) <= 400),
+        key=lambda r: r.timestamp,
+    )
+    if not records:
+        return
+
+    def apply(acc):
+        ok = True
+        for r in records:
+            ok = acc.add_reading(slot_of(r.timestamp), r.glucose_level, r.timestamp.timestamp()) and ok
+        return ok
+
+    _update(records[0].user, apply)
+
+
+def record_food(entry):
+    """Apply a created or edited FoodEntry to the store."""
+    record_foods([entry])
+
+
+def record_foods(entries):
+    """Apply several FoodEntries (one user) under a single state update."""
+    entries = [e for e in entries if e.timestamp is not None]
+    if not entries:
+        return
+
+    def apply(acc):
+        for entry in entries:
+            insulin, carbs = _food_amounts(entry)
+            acc.add_food(slot_of(entry.timestamp), insulin, carbs, entry_id=str(entry.pk))
+
+    _update(entries[0].user, apply)
+
+
+def mark_dirty(user):
+    """Force a rebuild on the next read (edits, deletes and writes that bypass the signals, e.g. bulk imports)."""
+    from core.models import UserFeatureState
+    UserFeatureState.objects.filter(user=user).update(dirty=True)
+
+
+def get_window(user) -> Optional[np.ndarray]:
+    """Precomputed 48 x F feature window for the user, rebuilding a dirty state."""
+    from core.models import UserFeatureState
+
+    fs = UserFeatureState.objects.filter(user=user).first()
+    if fs is None or fs.dirty or not fs.state:
+        acc = rebuild(user)
+    else:
+        acc = FeatureAccumulator.from_dict(fs.state)
+    if acc.slot is None:
+        return None
+    if acc.slot * SLOT_SECONDS < (timezone.now() - timedelta(minutes=_history_minutes())).timestamp():
+        return None
+    return acc.window()
@@ -0,0 +1,131 @@
+"""Creating FoodEntry rows in one write.
+
+Creating an entry used to take a chain of saves:
+- `FoodEntrySerializer.create` inserted the entry, inserted its
+  NutritionalInfo and saved the entry again;
+- it then queried the latest reading and saved the insulin fields;
+- `FoodEntryViewSet.perform_create` derived carbs and calories again,
+  queried the latest reading again and saved twice more.
+
+Now everything is resolved in memory before anything is written:
+- carbs (`resolve_carbs`) come from `total_carbs`, then `total_carbs_g`,
+  then the nutritional info's carbs;
+- calories come from `total_calories`, then `calories_estimate`;
+- the insulin recommendation (`dose_for`) takes the latest reading and
+  dosing parameters from the per-user hot state (`user_state`), so it
+  usually needs no query at all.
+
+`create_food_entry` then inserts NutritionalInfo and FoodEntry once each,
+in one transaction. `apply_analysis` does the same for an existing entry
+after image analysis (`FoodEntry.analyze_food`). The offline batch path
+(`offline_sync`) reuses `resolve_carbs` and `dose_for`.
+"""
+
+import json
+from typing import Optional
+
+from django.db import transaction
+
+from . import user_state
+from .insulin import calculate_insulin
+
+
+def nutrition_payload(value) -> Optional[dict]:
+    """A nutritional_info payload as a dict; multipart forms send it as JSON text."""
+    if isinstance(value, str) and value.strip():
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, dict) else None
+
+
+def resolve_carbs(total_carbs=None, total_carbs_g=None, nutrition: Optional[dict] = None) -> Optional[float]:
+    """Meal carbs in grams: the entry's own total, the `total_carbs_g` alias, then its nutritional info."""
+    for value in (total_carbs, total_carbs_g, (nutrition or {}).get('carbs')):
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def latest_glucose(user) -> Optional[float]:
+    return user_state.latest_glucose(user)
+
+
+def dose_for(user, total_carbs: Optional[float], current_glucose: Optional[float]) -> Optional[dict]:
+    """The insulin recommendation for a meal (None when it has no carbs)."""
+    if not total_carbs or total_carbs <= 0:
+        return None
+    carb_ratio, correction_factor = user_state.dosing(user)
+    return calculate_insulin(
+        total_carbs_g=total_carbs,
+        carb_ratio=carb_ratio or 0,
+        current_glucose=current_glucose,
+        correction_factor=correction_factor,
+    )
+
+
+def apply_dose(entry, dose: Optional[dict]):
+    if dose is not None:
+        entry.insulin_recommended = dose.get('recommended_dose')
+        entry.insulin_rounded = dose.get('rounded_dose')
+
+
+def build_food_entry(user, data: dict, nutrition: Optional[dict] = None):
+    """An unsaved FoodEntry (and NutritionalInfo) with carbs and calories resolved; no queries."""
+    from ..models import FoodEntry, NutritionalInfo
+
+    data = dict(data)
+    total_carbs_g = data.pop('total_carbs_g', None)
+    calories_estimate = data.pop('calories_estimate', None)
+    data.pop('nutritional_info', None)
+    data.pop('user', None)
+
+    entry = FoodEntry(user=user, **data)
+    entry.total_carbs = resolve_carbs(data.get('total_carbs'), total_carbs_g, nutrition)
+    if entry.total_calories is None and calories_estimate is not None:
+        entry.total_calories = calories_estimate
+    info = NutritionalInfo(**nutrition) if nutrition else None
+    return entry, info
+
+
+def create_food_entry(user, data: dict, nutrition: Optional[dict] = None):
+    """Create a FoodEntry with its nutritional info and insulin recommendation: one INSERT each."""
+    entry, info = build_food_entry(user, data, nutrition)
+    if entry.total_carbs and entry.total_carbs > 0:
+        apply_dose(entry, dose_for(user, entry.total_carbs, latest_glucose(user)))
+    with transaction.atomic():
+        if info is not None:
+            info.save()
+            entry.nutritional_info = info
+        entry.save(force_insert=True)
+    return entry
+
+
+def apply_analysis(entry, result: dict):
+    """Store an image analysis on an existing entry: its nutritional info, name and dose."""
+    from ..models import NutritionalInfo
+
+    total_carbs = resolve_carbs(result.get('total_carbs_g'))
+    info = entry.nutritional_info or NutritionalInfo()
+    info.carbs = total_carbs
+    fields = ['nutritional_info']
+    name = result.get('name')
+    if name and not entry.food_name:
+        entry.food_name = name
+        fields.append('food_name')
+    dose = None
+    if total_carbs and total_carbs > 0:
+        dose = dose_for(entry.user_id, total_carbs, latest_glucose(entry.user_id))
+    if dose is not None:
+        apply_dose(entry, dose)
+        fields += ['insulin_recommended', 'insulin_rounded']
+    with transaction.atomic():
+        info.save()
+        entry.nutritional_info = info
+        entry.save(update_fields=fields)
+    return info
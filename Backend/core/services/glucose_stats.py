@@ -0,0 +1,117 @@
+"""Range statistics for glucose readings computed inside the database.
+
+`summarize(user, start, end)` returns a `GlucoseSummary` from one aggregate
+query (count, sum, sum of squares, min/max and conditional low/high counts)
+instead of loading every GlucoseRecord into Python. Mean, population
+standard deviation, CV and time-in-range are derived from those sums.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from django.db.models import Count, F, Max, Min, Q, Sum
+
+# Consensus time-in-range targets (mg/dL) used when the user has not set their own
+STATS_DEFAULT_LOW = 70.0
+STATS_DEFAULT_HIGH = 180.0
+
+
+def stats_thresholds(user) -> Tuple[float, float]:
+    """The user's target_glucose_min/max when both are set and sane, else 70/180."""
+    low = getattr(user, 'target_glucose_min', None)
+    high = getattr(user, 'target_glucose_max', None)
+    try:
+        if low is not None and high is not None and float(low) < float(high):
+            return float(low), float(high)
+    except (TypeError, ValueError):
+        pass
+    return STATS_DEFAULT_LOW, STATS_DEFAULT_HIGH
+
+
+@dataclass
+class GlucoseSummary:
+    count: int = 0
+    total: float = 0.0
+    sumsq: float = 0.0
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    below: int = 0
+    above: int = 0
+
+    def __add__(self, other: 'GlucoseSummary') -> 'GlucoseSummary':
+        if not other.count:
+            return self
+        if not self.count:
+            return other
+        return GlucoseSummary(
+            count=self.count + other.count,
+            total=self.total + other.total,
+            sumsq=self.sumsq + other.sumsq,
+            minimum=min(self.minimum, other.minimum),
+            maximum=max(self.maximum, other.maximum),
+            below=self.below + other.below,
+            above=self.above + other.above,
+        )
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        if not self.count:
+            return 0.0
+        # population variance, as the per-row implementation used
+        return math.sqrt(max(self.sumsq / self.count - self.mean ** 2, 0.0))
+
+    @property
+    def cv(self) -> float:
+        return self.std / self.mean * 100 if self.mean else 0.0
+
+    @property
+    def pct_below(self) -> float:
+        return self.below / self.count * 100 if self.count else 0.0
+
+    @property
+    def pct_above(self) -> float:
+        return self.above / self.count * 100 if self.count else 0.0
+
+    @property
+    def pct_in_range(self) -> float:
+        return 100 - self.pct_above - self.pct_below if self.count else 0.0
+
+
+def summary_aggregates(low: float, high: float) -> dict:
+    """Aggregate expressions producing the GlucoseSummary fields (usable with annotate)."""
+    return {
+        'count': Count('id'),
+        'total': Sum('glucose_level'),
+        'sumsq': Sum(F('glucose_level') * F('glucose_level')),
+        'minimum': Min('glucose_level'),
+        'maximum': Max('glucose_level'),
+        'below': Count('id', filter=Q(glucose_level__lt=low)),
+        'above': Count('id', filter=Q(glucose_level__gt=high)),
+    }
+
+
+def summary_from_row(row: dict) -> GlucoseSummary:
+    if not row['count']:
+        return GlucoseSummary()
+    return GlucoseSummary(
+        count=row['count'], total=float(row['total']), sumsq=float(row['sumsq']),
+        minimum=row['minimum'], maximum=row['maximum'], below=row['below'], above=row['above'],
+    )
+
+
+def summarize_queryset(qs, low: float, high: float) -> GlucoseSummary:
+    return summary_from_row(qs.aggregate(**summary_aggregates(low, high)))
+
+
+def summarize(user, start, end, low: Optional[float] = None, high: Optional[float] = None) -> GlucoseSummary:
+    """Aggregate the user's readings with start <= timestamp <= end."""
+    from ..models import GlucoseRecord
+    if low is None or high is None:
+        low, high = stats_thresholds(user)
+    qs = GlucoseRecord.objects.filter(user=user, timestamp__range=[start, end])
+    return summarize_queryset(qs, low, high)
@@ -0,0 +1,128 @@
+"""Shrinking food photos before they are sent to the vision model.
+
+Phone photos arrive at 12+ megapixels. The model reads them in 512 px
+tiles, so pixels beyond about 1024 px on the long edge cost payload,
+base64 and upload time without improving the carb estimate. `prepare`
+does the least work that gets an upload down to a size tier
+(OPENAI_IMAGE_MAX_EDGE, one of TIERS):
+
+- JPEGs are decoded in draft mode. libjpeg scales by 1/2, 1/4 or 1/8
+  while decoding, so a 4032x3024 photo bound for 1024 px is decoded at
+  1008x756 or 2016x1512 instead of full size;
+- the remaining resize is one `thumbnail` pass. EXIF orientation is
+  applied first, then dropped together with the rest of the metadata
+  (GPS, camera);
+- one JPEG encode at OPENAI_IMAGE_JPEG_QUALITY into a per-thread buffer
+  that is reused between calls, with no `optimize` second pass;
+- a JPEG that already fits the tier and carries no EXIF/XMP/IPTC
+  segments is sent as uploaded, with no decode or re-encode at all.
+
+Undecodable uploads raise `ImageError`. They are not forwarded to the
+model, which would reject them anyway after a full round-trip.
+
+`scripts/bench_image_preprocess.py` reports CPU time and payload size per
+tier.
+"""
+
+import threading
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+TIERS = (512, 768, 1024)
+DEFAULT_MAX_EDGE = 1024
+DEFAULT_QUALITY = 85
+
+# APP1 holds EXIF and XMP, APP13 holds Photoshop/IPTC metadata
+_METADATA_MARKERS = ('APP1', 'APP13')
+
+
+class ImageError(ValueError):
+    pass
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    width: int
+    height: int
+    # False when the upload was sent as is
+    reencoded: bool
+    media_type: str = 'jpeg'
+
+    @property
+    def detail(self) -> str:
+        """OpenAI image detail level: one 512 px tile is all 'low' ever sends."""
+        return 'low' if max(self.width, self.height) <= 512 else 'high'
+
+
+def max_edge_setting() -> int:
+    return int(getattr(settings, 'OPENAI_IMAGE_MAX_EDGE', DEFAULT_MAX_EDGE))
+
+
+def quality_setting() -> int:
+    return int(getattr(settings, 'OPENAI_IMAGE_JPEG_QUALITY', DEFAULT_QUALITY))
+
+
+def fitted_size(size: Tuple[int, int], max_edge: int) -> Tuple[int, int]:
+    """`size` scaled down (never up) so its long edge is at most `max_edge`."""
+    width, height = size
+    scale = min(1.0, max_edge / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+_local = threading.local()
+
+
+def _encode(img: Image.Image, quality: int) -> bytes:
+    buf = getattr(_local, 'buffer', None)
+    if buf is None:
+        buf = _local.buffer = BytesIO()
+    # overwrite from the start instead of truncating, so the buffer keeps its capacity
+    buf.seek(0)
+    img.save(buf, format='JPEG', quality=quality)
+    size = buf.tell()
+    with buf.getbuffer() as view:
+        return view[:size].tobytes()
+
+
+def _has_metadata(img: Image.Image) -> bool:
+    return 'comment' in img.info or any(marker in _METADATA_MARKERS for marker, _ in getattr(img, 'applist', ()))
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode in ('RGB', 'L'):
+        return img
+    if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+        # flatten transparency onto white
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+
+def prepare(image_bytes: bytes, max_edge: Optional[int] = None, quality: Optional[int] = None) -> PreparedImage:
+    """The upload as a JPEG whose long edge is at most `max_edge` (default OPENAI_IMAGE_MAX_EDGE)."""
+    max_edge = int(max_edge or max_edge_setting())
+    quality = int(quality or quality_setting())
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        if (img.format == 'JPEG' and img.mode in ('RGB', 'L') and max(img.size) <= max_edge
+                and not _has_metadata(img)):
+            return PreparedImage(image_bytes, img.width, img.height, reencoded=False)
+
+        if img.format == 'JPEG':
+            # a rotated photo's stored size is the transposed one; the draft size works either way
+            img.draft('RGB', fitted_size(img.size, max_edge))
+        img = ImageOps.exif_transpose(img)
+        img = _to_rgb(img)
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        data = _encode(img, quality)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageError(f"unreadable image: {e}") from e
+    return PreparedImage(data, img.width, img.height, reencoded=True)
@@ -0,0 +1,180 @@
+"""In-process inference runtime for the CNN-LSTM and LightGBM glucose models.
+
+Artifacts are loaded once per worker process and shared by every request:
+
+- `cnn_lstm_30min_win48.pt.best`  CNN-LSTM state dict (48-step window)
+- `lgb_noSteps30min.pkl`          LightGBM regressor
+- `standard_scaler.pkl`           StandardScaler used for the CNN-LSTM inputs
+- `lgb_feature_order.txt`         feature column order used at training time
+
+The torch model is kept in `eval()` mode, run under `torch.inference_mode()`
+and pinned to a fixed number of intra-op threads so concurrent workers do not
+oversubscribe the CPU. Feature windows are built from DB rows by
+`build_feature_window` using the same feature code as the offline scripts
+(`model/feature_utils.py`), without writing a CSV.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from model.feature_utils import create_features
+from .resample import NS_PER_SECOND, SLOT_SECONDS, bucket_last, bucket_sum, build_grid, interpolate_gaps
+
+logger = logging.getLogger(__name__)
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    import joblib
+    import lightgbm  # noqa: F401  (needed to unpickle the regressor)
+    LIGHTGBM_AVAILABLE = True
+except ImportError:
+    LIGHTGBM_AVAILABLE = False
+
+
+SEQ_LEN = 48  # 4 hours of 5-minute slots
+CNN_LSTM_FILE = "cnn_lstm_30min_win48.pt.best"
+LGB_FILE = "lgb_noSteps30min.pkl"
+SCALER_FILE = "standard_scaler.pkl"
+FEATURE_ORDER_FILE = "lgb_feature_order.txt"
+
+# Gaps up to this many slots are linearly interpolated before feature creation,
+# mirroring the interpolated 5-minute series the models were trained on.
+MAX_INTERPOLATE_SLOTS = 6
+
+
+class InferenceRuntime:
+    """Holds the loaded model artifacts for one worker process."""
+
+    def __init__(self, model_dir: str, num_threads: int = 1):
+        self.model_dir = model_dir
+        self.num_threads = max(1, int(num_threads))
+        self.cnn_lstm_model = None
+        self.lgb_booster = None
+        self.feature_order = None
+        self.scaler_mean = None
+        self.scaler_scale = None
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.model_dir, name)
+
+    def load(self):
+        """Load every available artifact; safe to call repeatedly."""
+        if self.loaded:
+            return self
+        with self._lock:
+            if self.loaded:
+                return self
+
+            order_path = self._path(FEATURE_ORDER_FILE)
+            if os.path.exists(order_path):
+                with open(order_path, 'r') as f:
+                    self.feature_order = [line.strip() for line in f if line.strip()]
+
+            if LIGHTGBM_AVAILABLE and os.path.exists(self._path(SCALER_FILE)):
+                scaler = joblib.load(self._path(SCALER_FILE))
+                self.scaler_mean = np.asarray(scaler.mean_, dtype=np.float32)
+                self.scaler_scale = np.asarray(scaler.scale_, dtype=np.float32)
+
+            if LIGHTGBM_AVAILABLE and os.path.exists(self._path(LGB_FILE)):
+                # Keep only the booster: predicting through it skips the
+                # sklearn wrapper's per-call input validation.
+                self.lgb_booster = joblib.load(self._path(LGB_FILE)).booster_
+                logger.info("LightGBM model loaded from %s", self._path(LGB_FILE))
+
+            if TORCH_AVAILABLE and self.feature_order and os.path.exists(self._path(CNN_LSTM_FILE)):
+                from core.services.ml_models import CNNLSTMModel
+                torch.set_num_threads(self.num_threads)
+                model = CNNLSTMModel(input_dim=len(self.feature_order))
+                state = torch.load(self._path(CNN_LSTM_FILE), map_location='cpu', weights_only=True)
+                model.load_state_dict(state)
+                model.eval()
+                self.cnn_lstm_model = model
+                logger.info("CNN-LSTM model loaded from %s", self._path(CNN_LSTM_FILE))
+
+            self.loaded = True
+        return self
+
+    @property
+    def cnn_lstm_ready(self) -> bool:
+        return self.cnn_lstm_model is not None and self.scaler_mean is not None
+
+    @property
+    def lgb_ready(self) -> bool:
+        return self.lgb_booster is not None
+
+    def scale(self, window: np.ndarray) -> np.ndarray:
+        return (np.asarray(window, dtype=np.float32) - self.scaler_mean) / self.scaler_scale
+
+    def predict_cnn_lstm_batch(self, windows: np.ndarray) -> np.ndarray:
+        """Run the CNN-LSTM on unscaled windows of shape (batch, SEQ_LEN, features)."""
+        x = torch.from_numpy(np.ascontiguousarray(self.scale(windows)))
+        with torch.inference_mode():
+            return self.cnn_lstm_model(x).numpy().astype(float)
+
+    def predict_cnn_lstm(self, window: np.ndarray) -> float:
+        return float(self.predict_cnn_lstm_batch(window[np.newaxis, ...])[0])
+
+    def predict_lightgbm(self, window: np.ndarray) -> float:
+        """Predict from the latest row of an unscaled feature window."""
+        return float(self.lgb_booster.predict(np.asarray(window[-1:], dtype=float))[0])
+
+    def build_feature_window(self, glucose_ts, glucose_values, food_ts, food_carbs, food_insulin,
+                             end_ns: int, history_minutes: int) -> np.ndarray:
+        """Return the latest SEQ_LEN x features window built from raw DB samples.
+
+        Timestamps are int64 epoch nanoseconds sorted ascending. The grid is
+        aligned to 5-minute boundaries and ends at the slot holding `end_ns`.
+        Slots follow `feature_store.FeatureAccumulator`: the slot glucose is
+        the latest reading inside it, gaps of up to MAX_INTERPOLATE_SLOTS are
+        interpolated and longer ones are left empty; carbs and insulin are
+        bucketed into the slot they were logged in.
+        """
+        step = SLOT_SECONDS * NS_PER_SECOND
+        end_ns = int(end_ns) - int(end_ns) % step
+        grid = build_grid(end_ns - int(history_minutes) * 60 * NS_PER_SECOND, end_ns)
+
+        glucose = interpolate_gaps(bucket_last(glucose_ts, glucose_values, grid), MAX_INTERPOLATE_SLOTS)
+        tz = getattr(settings, 'TIME_ZONE', 'UTC') or 'UTC'
+        frame = pd.DataFrame({
+            'timestamp': pd.to_datetime(grid, utc=True).tz_convert(tz).tz_localize(None),
+            'glucose': glucose,
+            'insulin': bucket_sum(food_ts, food_insulin, grid),
+            'carbs': bucket_sum(food_ts, food_carbs, grid),
+        })
+        features = create_features(frame).iloc[-SEQ_LEN:]
+        span = features['timestamp'].iloc[-1] - features['timestamp'].iloc[0] if len(features) else None
+        if (len(features) < SEQ_LEN
+                or features['timestamp'].iloc[-1] != frame['timestamp'].iloc[-1]
+                or span != pd.Timedelta(seconds=(SEQ_LEN - 1) * SLOT_SECONDS)):
+            raise ValueError(f"Not enough continuous glucose history for a {SEQ_LEN}-step window")
+        return features[self.feature_order].to_numpy(dtype=np.float32)
+
+
+_runtime: Optional[InferenceRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> InferenceRuntime:
+    """Return the process-wide runtime, loading artifacts on first use."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = InferenceRuntime(
+                    model_dir=getattr(settings, 'PREDICTION_MODEL_DIR', os.path.join(settings.BASE_DIR, 'model')),
+                    num_threads=getattr(settings, 'PREDICTION_TORCH_THREADS', 1),
+                )
+    return _runtime.load()
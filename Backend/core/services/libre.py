@@ -20,6 +20,7 @@ import base64
 import os
 from django.conf import settings
 import hashlib
+import re
 from typing import Tuple, Optional, Dict
 from urllib.parse import urlencode
 from requests.adapters import HTTPAdapter
@@ -29,17 +30,21 @@ from urllib3.util.retry import Retry
 _DEFAULT_TIMEOUT = 15
 
 _SESSION = requests.Session()
-_SESSION.mount(
-    "https://",
-    HTTPAdapter(
-        max_retries=Retry(
-            total=3,
-            backoff_factor=0.5,
-            status_forcelist=[429,500, 502, 503, 504],  
-            allowed_methods=["GET", "POST"],
-        )
-    ),
+_ADAPTER = HTTPAdapter(
+    # one pooled connection per fan-out sync worker (services/libre_sync.py)
+    pool_maxsize=getattr(settings, 'LIBRE_SYNC_CONCURRENCY', 16),
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429,500, 502, 503, 504],  
+        allowed_methods=["GET", "POST"],
+    )
 )
+_SESSION.mount("https://", _ADAPTER)
+# plain http only reaches local stand-ins (scripts/fake_libre_server.py); same retries
+_SESSION.mount("http://", _ADAPTER)
+
+_REGION_RE = re.compile(r'api-([A-Za-z0-9]+)')
 
 def make_code_verifier() -> str:
     """Generate a secure code verifier for PKCE."""
@@ -105,6 +110,16 @@ def uuid_to_sha256(uuid_str: str) -> str:
 def _llu_base_url() -> str:
     return getattr(settings, 'LIBRE_PASSWORD_BASE_URL', 'https://api.libreview.io').rstrip("/") 
 
+def region_base_url(region: str) -> str:
+    """Regional LLU host a login redirect points at (LIBRE_REGION_URL_TEMPLATE)."""
+    template = getattr(settings, 'LIBRE_REGION_URL_TEMPLATE', 'https://api-{region}.libreview.io')
+    return template.format(region=region).rstrip("/")
+
+def region_from_base_url(base_url: Optional[str]) -> Optional[str]:
+    """'eu' for https://api-eu.libreview.io (or a stand-in's .../api-eu); None for the global host."""
+    match = _REGION_RE.search(base_url or '')
+    return match.group(1) if match else None
+
 def _llu_headers_base() -> Dict[str, str]:
     product = getattr(settings, "LIBRE_LLU_PRODUCT", "llu.android") 
     version = getattr(settings, "LIBRE_LLU_VERSION", "4.16.0")
@@ -117,15 +132,34 @@ def _llu_headers_base() -> Dict[str, str]:
         "version": version,
     }
 
-def get_libreview_connection(base_url: str, access_token: str, account_id: str):
-    from .libre import _llu_headers_base
-    account_id_hashed = hashlib.sha256(account_id.encode()).hexdigest()
+def _llu_auth_headers(access_token: str, account_id: str) -> Dict[str, str]:
     headers = _llu_headers_base()
     headers.update({
         'authorization': f'Bearer {access_token}',
-        'account-id': account_id_hashed,    
+        'account-id': uuid_to_sha256(account_id),
     })
-    resp = requests.request.get(f"{base_url}/llu/connections", headers=headers, timeout= 20)
+    return headers
+
+
+def get_libreview_connection(base_url: str, access_token: str, account_id: str, timeout: int = 20):
+    """GET /llu/connections: every followed patient with their latest glucoseMeasurement."""
+    resp = _SESSION.get(f"{base_url}/llu/connections", headers=_llu_auth_headers(access_token, account_id), timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def get_libreview_graph(base_url: str, access_token: str, account_id: str, patient_id: str, timeout: int = 20):
+    """GET /llu/connections/<patientId>/graph: the last ~12h of readings in data.graphData."""
+    resp = _SESSION.get(f"{base_url}/llu/connections/{patient_id}/graph",
+                        headers=_llu_auth_headers(access_token, account_id), timeout=timeout)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def get_libreview_logbook(base_url: str, access_token: str, account_id: str, patient_id: str, timeout: int = 20):
+    """GET /llu/connections/<patientId>/logbook: scanned / alarm readings as a list in data."""
+    resp = _SESSION.get(f"{base_url}/llu/connections/{patient_id}/logbook",
+                        headers=_llu_auth_headers(access_token, account_id), timeout=timeout)
     resp.raise_for_status()
     return resp.json()
 
@@ -154,7 +188,7 @@ def login_with_password(email: str, password: str, timeout: int = _DEFAULT_TIMEO
         if data.get('data', {}).get('redirect') is True:
             region = data['data'].get('region')
             if region:
-                base_url = f"https://api-{region}.libreview.io"
+                base_url = region_base_url(region)
                 login_url = f"{base_url}/llu/auth/login"
                 r = _SESSION.post(login_url, headers=headers, json=payload, timeout=timeout)
                 r.raise_for_status()
@@ -181,6 +215,10 @@ def login_with_password(email: str, password: str, timeout: int = _DEFAULT_TIMEO
         'access_token': JWT_token,
         'account_id': libre_user_id,
     }
+    expires = data['data']['authTicket'].get('expires')
+    if expires:
+        # epoch seconds; lets the sync log in again before the ticket runs out
+        token_response['expires'] = int(expires)
 
     return base_url, token_response, auth_headers
 
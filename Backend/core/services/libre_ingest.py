@@ -0,0 +1,237 @@
+"""Shared ingest path for LibreLinkUp glucose readings.
+
+Every Libre entry point (sync-now, live monitoring, the webhook and the
+periodic Celery task) hands its payload to `ingest_payload`, which:
+
+1. extracts readings from any LLU response shape: `/llu/connections`
+   (`data[].glucoseMeasurement`), `/graph` (`data.connection.glucoseMeasurement`
+   plus the `data.graphData` history) and `/logbook` (`data[]` entries);
+2. normalizes timestamps to aware UTC datetimes (LLU's `FactoryTimestamp` is
+   UTC; the device-local `Timestamp` is only used as a fallback);
+3. writes all new rows with one `bulk_create(..., ignore_conflicts=True)`
+   against the `uniq_glucose_row` constraint, so re-syncing the same history
+   is a no-op, then keeps only the rows that were really inserted (a
+   concurrent sync may have written some of them first);
+4. runs alert evaluation, the rollup refresh and the feature-store update
+   once over the rows that were actually created (`bulk_create` does not
+   send `post_save`).
+
+Readings stored before this path existed used the device-local `Timestamp`
+read as UTC, i.e. shifted by the sensor's UTC offset. Those rows are left
+as they are; `LibreConnection.local_timestamps_before` (set by migration
+0019 for the connections that existed then) marks them, and a reading taken
+before that instant also counts as present when a row exists at its time
+plus the device offset with the same level, so re-syncing the old history
+does not store every reading a second time.
+"""
+
+import logging
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import rollups, user_state
+
+logger = logging.getLogger(__name__)
+
+LLU_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+INGEST_BATCH_SIZE = 1000
+
+LibreReading = namedtuple('LibreReading', ['timestamp', 'glucose_level', 'trend_arrow'])
+
+
+@dataclass
+class IngestResult:
+    fetched: int = 0
+    created: int = 0
+    records: List = field(default_factory=list)
+
+    def as_dict(self):
+        return {'fetched': self.fetched, 'created': self.created}
+
+
+def _parse_llu_format(value: str) -> datetime:
+    # hand-rolled LLU_TIMESTAMP_FORMAT; strptime dominates ingest of long histories
+    date_part, time_part, meridiem = value.split(' ')
+    month, day, year = date_part.split('/')
+    hour, minute, second = time_part.split(':')
+    meridiem = meridiem.upper()
+    if meridiem not in ('AM', 'PM'):
+        raise ValueError(value)
+    hour = int(hour) % 12 + (12 if meridiem == 'PM' else 0)
+    return datetime(int(year), int(month), int(day), hour, int(minute), int(second))
+
+
+def parse_libre_timestamp(value) -> Optional[datetime]:
+    """Parse an LLU / ISO timestamp into an aware UTC datetime (None if unparseable)."""
+    if isinstance(value, datetime):
+        ts = value
+    elif isinstance(value, str) and value:
+        try:
+            ts = _parse_llu_format(value)
+        except ValueError:
+            ts = parse_datetime(value)
+            if ts is None:
+                return None
+    else:
+        return None
+    if timezone.is_naive(ts):
+        return ts.replace(tzinfo=dt_timezone.utc)
+    return ts.astimezone(dt_timezone.utc)
+
+
+def device_utc_offset(payload) -> Optional[int]:
+    """Minutes the sensor's local clock is ahead of UTC (LLU `Timestamp` vs `FactoryTimestamp`)."""
+    data = payload.get('data', payload) if isinstance(payload, dict) else None
+    for item in (data if isinstance(data, list) else [data]):
+        if not isinstance(item, dict):
+            continue
+        gm = item.get('glucoseMeasurement') or (item.get('connection') or {}).get('glucoseMeasurement')
+        if not isinstance(gm, dict):
+            continue
+        try:
+            local = _parse_llu_format(gm['Timestamp'])
+            factory = _parse_llu_format(gm['FactoryTimestamp'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        offset = round((local - factory).total_seconds() / 900) * 15
+        if abs(offset) <= 14 * 60:
+            return offset
+    return None
+
+
+def _measurement_to_reading(gm) -> Optional[LibreReading]:
+    if not isinstance(gm, dict) or not gm:
+        return None
+    value = gm.get('ValueInMgPerDl')
+    if value is None:
+        value = gm.get('Value', gm.get('value', gm.get('glucose_level')))
+    ts = parse_libre_timestamp(
+        gm.get('FactoryTimestamp') or gm.get('Timestamp') or gm.get('timestamp')
+    )
+    if value is None or ts is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    trend = gm.get('TrendArrow', gm.get('trend_arrow'))
+    return LibreReading(ts, value, None if trend in (None, '') else str(trend))
+
+
+def extract_readings(payload) -> List[LibreReading]:
+    """Collect every glucose measurement in an LLU response (connections, graph or logbook)."""
+    if not isinstance(payload, dict):
+        return []
+    data = payload.get('data', payload)
+    readings = []
+
+    def add(gm):
+        reading = _measurement_to_reading(gm)
+        if reading is not None:
+            readings.append(reading)
+
+    items = data if isinstance(data, list) else [data]
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        if 'glucoseMeasurement' in item:
+            add(item['glucoseMeasurement'])
+        connection = item.get('connection')
+        if isinstance(connection, dict):
+            add(connection.get('glucoseMeasurement'))
+        for key in ('graphData', 'graph', 'logbook'):
+            for gm in item.get(key) or []:
+                add(gm)
+        # logbook entries / webhook readings are bare measurements
+        if 'glucoseMeasurement' not in item and 'connection' not in item:
+            add(item)
+    return readings
+
+
+def _local_timestamps_before(user) -> Optional[datetime]:
+    from ..models import LibreConnection
+    return LibreConnection.objects.filter(user=user).values_list('local_timestamps_before', flat=True).first()
+
+
+def ingest_readings(user, readings: Iterable[LibreReading], source: str = 'libre',
+                    device_offset_minutes: Optional[int] = None) -> IngestResult:
+    """Insert readings for one user in bulk, skipping rows that already exist.
+
+    `device_offset_minutes` (see `device_utc_offset`) lets readings from
+    before `local_timestamps_before` match rows stored at device-local time.
+    """
+    from ..models import Alert, GlucoseRecord
+
+    unique = {}
+    for r in readings:
+        unique.setdefault((r.timestamp, float(r.glucose_level)), r)
+    result = IngestResult(fetched=len(unique))
+    if not unique:
+        return result
+
+    timestamps = [ts for ts, _ in unique]
+    first, last = min(timestamps), max(timestamps)
+    shift = before = None
+    if device_offset_minutes:
+        before = _local_timestamps_before(user)
+        if before is not None and first < before:
+            shift = timedelta(minutes=device_offset_minutes)
+    lookup_first, lookup_last = first, last
+    if shift is not None:
+        lookup_first, lookup_last = min(first, first + shift), max(last, last + shift)
+    existing = set(
+        GlucoseRecord.objects.filter(
+            user=user, source=source, timestamp__gte=lookup_first, timestamp__lte=lookup_last,
+        ).values_list('timestamp', 'glucose_level')
+    )
+
+    def stored(key):
+        ts, level = key
+        return key in existing or (shift is not None and ts < before and (ts + shift, level) in existing)
+
+    new_rows = [
+        GlucoseRecord(user=user, timestamp=r.timestamp, glucose_level=r.glucose_level,
+                      trend_arrow=r.trend_arrow, source=source)
+        for key, r in sorted(unique.items(), key=lambda kv: kv[0][0])
+        if not stored(key)
+    ]
+    if not new_rows:
+        return result
+
+    # ignore_conflicts covers a concurrent sync inserting the same rows; those
+    # keep the other sync's ids, so only rows with our ids were created here
+    GlucoseRecord.objects.bulk_create(new_rows, batch_size=INGEST_BATCH_SIZE, ignore_conflicts=True)
+    inserted = set(
+        GlucoseRecord.objects.filter(
+            user=user, source=source, timestamp__gte=new_rows[0].timestamp, timestamp__lte=new_rows[-1].timestamp,
+        ).values_list('pk', flat=True)
+    )
+    new_rows = [r for r in new_rows if r.pk in inserted]
+    result.created = len(new_rows)
+    result.records = new_rows
+    if not new_rows:
+        return result
+
+    Alert.ensure_for_glucose_batch(new_rows)
+    rollups.record_glucose(new_rows)
+    user_state.record_glucose(new_rows)
+    try:
+        from . import feature_store
+        feature_store.record_glucose(new_rows)
+    except Exception:
+        logger.exception(f"Feature store update failed after ingesting {len(new_rows)} rows for user {user.pk}")
+    return result
+
+
+def ingest_payload(user, payload, source: str = 'libre') -> IngestResult:
+    """Parse any LLU payload (or list of payloads) and ingest its readings."""
+    payloads = payload if isinstance(payload, list) else [payload]
+    readings = [r for p in payloads for r in extract_readings(p)]
+    offset = next((o for o in map(device_utc_offset, payloads) if o is not None), None)
+    return ingest_readings(user, readings, source=source, device_offset_minutes=offset)
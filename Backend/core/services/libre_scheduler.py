@@ -0,0 +1,413 @@
+"""Adaptive per-connection LibreLinkUp polling.
+
+The periodic task used to sync every connected user every
+LIBRE_SYNC_INTERVAL_SECONDS, whether their glucose was flat at 110 mg/dL
+at 3 am or falling 3 mg/dL a minute towards a hypo. Each connection now
+carries its own `sync_interval` and `next_sync_at`, and only connections
+that are due are synced. After every sync `PollPolicy` picks the next
+interval from the result (first matching rule wins):
+
+  failing       the sync failed: LIBRE_POLL_BASE_SECONDS doubled per
+                consecutive failure
+  no_data       no reading, or the latest one is older than
+                STALE_READING_MINUTES (sensor off, phone not uploading):
+                the previous interval times `stale_factor`
+  near_low      the latest reading is within LIBRE_POLL_THRESHOLD_MARGIN
+                of the user's low target (or below it), or the trend gets
+                there within PROJECTION_MINUTES: LIBRE_POLL_MIN_SECONDS
+  falling_fast  rate <= -`fast_rate` mg/dL/min: LIBRE_POLL_MIN_SECONDS
+  near_high     on the way up to the high target (within the margin and
+                rising, or projected to cross it): half the base. A high is
+                worth knowing about soon, not within the minute
+  above_high    at or above the high target (or within the margin below
+                it, as near_high): the base, or half of it while changing;
+                never backed off while the user is at or near a high
+  changing      |rate| >= `changing_rate` mg/dL/min: half the base
+  unchanged     nothing new since `last_synced`: the previous interval
+                times `stale_factor`
+  flat          |rate| < `flat_rate`: the base times `stale_factor`
+  steady        the base interval
+
+`steady`, `flat` and `unchanged` are multiplied by `night_factor` during the
+sensor's local night (LIBRE_POLL_NIGHT_HOURS, from the LLU timestamp
+offset; skipped while the offset is unknown). The result is clamped to
+[LIBRE_POLL_MIN_SECONDS, LIBRE_POLL_MAX_SECONDS] and jittered so that
+connections synced together drift apart.
+
+Two ways to drive it, both through `libre_sync.sync_connections`:
+
+- `sync_due` (the `sync_due_libre` beat task, every
+  LIBRE_SCHEDULER_TICK_SECONDS): the indexed `next_sync_at` column is the
+  queue; takes up to LIBRE_SCHEDULER_BATCH_SIZE due connections, most
+  overdue first, under the database lock `libre_sync.sync_all` also takes
+  (`locks.task_lock`), so ticks handled by different worker processes
+  never overlap with each other or with a full sync;
+- `LibrePollScheduler` (the `run_libre_scheduler` command): a heap of
+  (next due, pk) in memory, reloaded from the database now and then to
+  pick up new or disconnected connections; sleeps until the next one is
+  due. Each batch takes the same lock and is postponed while it is held.
+
+`metrics` counts, per process, syncs by reason, queue lag (how late a
+sync started against its `next_sync_at`) and polls / LLU calls saved
+against fixed polling every LIBRE_POLL_BASELINE_SECONDS. `scheduler_stats`
+adds the queue as the database sees it (overdue connections, the oldest
+one's lag, projected polls per hour against the baseline).
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import user_state
+from .locks import task_lock
+from .libre_sync import LOCK_KEY, ConnectionResult, SyncReport, sync_connections
+
+logger = logging.getLogger(__name__)
+
+STALE_READING_MINUTES = 30
+LOCK_RETRY_SECONDS = 15
+PROJECTION_MINUTES = 15
+MAX_BACKOFF_DOUBLINGS = 5
+
+
+class PollPolicy:
+    """Picks a connection's next polling interval from its latest sync."""
+
+    def __init__(self, min_seconds: int = 60, base_seconds: int = 300, max_seconds: int = 1800,
+                 fast_rate: float = 2.0, changing_rate: float = 1.0, flat_rate: float = 0.5,
+                 threshold_margin: float = 20.0,
+                 night_hours: Tuple[int, int] = (0, 6), night_factor: float = 2.0, stale_factor: float = 2.0,
+                 jitter: float = 0.1, rng: random.Random = None):
+        self.min_seconds = min_seconds
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.fast_rate = fast_rate
+        self.changing_rate = changing_rate
+        self.flat_rate = flat_rate
+        self.threshold_margin = threshold_margin
+        self.night_hours = night_hours
+        self.night_factor = night_factor
+        self.stale_factor = stale_factor
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def from_settings(cls) -> 'PollPolicy':
+        return cls(
+            min_seconds=getattr(settings, 'LIBRE_POLL_MIN_SECONDS', 60),
+            base_seconds=getattr(settings, 'LIBRE_POLL_BASE_SECONDS', 300),
+            max_seconds=getattr(settings, 'LIBRE_POLL_MAX_SECONDS', 1800),
+            fast_rate=getattr(settings, 'LIBRE_POLL_FAST_RATE', 2.0),
+            changing_rate=getattr(settings, 'LIBRE_POLL_CHANGING_RATE', 1.0),
+            flat_rate=getattr(settings, 'LIBRE_POLL_FLAT_RATE', 0.5),
+            threshold_margin=getattr(settings, 'LIBRE_POLL_THRESHOLD_MARGIN', 20.0),
+            night_hours=tuple(getattr(settings, 'LIBRE_POLL_NIGHT_HOURS', (0, 6))),
+            night_factor=getattr(settings, 'LIBRE_POLL_NIGHT_FACTOR', 2.0),
+            stale_factor=getattr(settings, 'LIBRE_POLL_STALE_FACTOR', 2.0),
+            jitter=getattr(settings, 'LIBRE_POLL_JITTER', 0.1),
+        )
+
+    def _is_night(self, utc_offset_minutes: Optional[int], now: datetime) -> bool:
+        if utc_offset_minutes is None:
+            return False
+        start, end = self.night_hours
+        hour = (now + timedelta(minutes=utc_offset_minutes)).hour
+        return start <= hour < end if start <= end else (hour >= start or hour < end)
+
+    def _near_low(self, glucose: float, rate: Optional[float], low: float) -> bool:
+        projected = glucose + (rate or 0) * PROJECTION_MINUTES
+        return glucose <= low + self.threshold_margin or projected <= low
+
+    def _near_high(self, glucose: float, rate: Optional[float], high: float) -> bool:
+        if glucose >= high or not rate or rate <= 0:
+            return False
+        return glucose >= high - self.threshold_margin or glucose + rate * PROJECTION_MINUTES >= high
+
+    def interval(self, conn, result: ConnectionResult, low: float, high: float,
+                 now: datetime = None) -> Tuple[int, str]:
+        """(seconds until the next sync, reason)."""
+        now = now or timezone.now()
+        previous = conn.sync_interval or self.base_seconds
+        latest = result.latest
+        rate = result.rate or 0.0
+        if result.status != 'ok':
+            doublings = min(max(conn.sync_failures - 1, 0), MAX_BACKOFF_DOUBLINGS)
+            seconds, reason = self.base_seconds * 2 ** doublings, 'failing'
+        elif latest is None or (now - latest.timestamp).total_seconds() > STALE_READING_MINUTES * 60:
+            seconds, reason = previous * self.stale_factor, 'no_data'
+        elif self._near_low(latest.glucose_level, result.rate, low):
+            seconds, reason = self.min_seconds, 'near_low'
+        elif rate <= -self.fast_rate:
+            seconds, reason = self.min_seconds, 'falling_fast'
+        elif self._near_high(latest.glucose_level, result.rate, high):
+            seconds, reason = self.base_seconds / 2, 'near_high'
+        elif latest.glucose_level >= high - self.threshold_margin:
+            seconds = self.base_seconds / 2 if abs(rate) >= self.changing_rate else self.base_seconds
+            reason = 'above_high' if latest.glucose_level >= high else 'near_high'
+        elif abs(rate) >= self.changing_rate:
+            seconds, reason = self.base_seconds / 2, 'changing'
+        elif result.created == 0:
+            seconds, reason = previous * self.stale_factor, 'unchanged'
+        elif result.rate is not None and abs(rate) < self.flat_rate:
+            seconds, reason = self.base_seconds * self.stale_factor, 'flat'
+        else:
+            seconds, reason = self.base_seconds, 'steady'
+        if reason in ('steady', 'flat', 'unchanged') and self._is_night(conn.utc_offset_minutes, now):
+            seconds, reason = seconds * self.night_factor, f'{reason}_night'
+        if self.jitter:
+            seconds *= self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        return int(min(max(seconds, self.min_seconds), self.max_seconds)), reason
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 3)
+
+
+class SchedulerMetrics:
+    """Per-process counters: syncs by reason, queue lag and calls saved against fixed polling."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._window = window
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.ticks = 0
+            self.synced = 0
+            self.requests = 0
+            self.polls_saved = 0.0
+            self.calls_saved = 0.0
+            self.reasons = Counter()
+            self.statuses = Counter()
+            self.lags = deque(maxlen=self._window)
+
+    def tick(self):
+        with self._lock:
+            self.ticks += 1
+
+    def record(self, result: ConnectionResult, interval: int, reason: str, lag: Optional[float]):
+        baseline = getattr(settings, 'LIBRE_POLL_BASELINE_SECONDS', 300)
+        # fixed polling would have synced interval / baseline times until our next sync
+        saved = interval / baseline - 1
+        with self._lock:
+            self.synced += 1
+            self.requests += result.requests
+            self.polls_saved += saved
+            self.calls_saved += saved * result.requests
+            self.reasons[reason] += 1
+            self.statuses[result.status] += 1
+            if lag is not None:
+                self.lags.append(max(lag, 0.0))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lags = sorted(self.lags)
+            return {
+                'ticks': self.ticks,
+                'synced': self.synced,
+                'llu_requests': self.requests,
+                'polls_saved': round(self.polls_saved, 1),
+                'calls_saved': round(self.calls_saved, 1),
+                'reasons': dict(self.reasons),
+                'statuses': dict(self.statuses),
+                'lag_seconds': {'p50': _percentile(lags, 0.5), 'p95': _percentile(lags, 0.95),
+                                'max': round(lags[-1], 3) if lags else None},
+            }
+
+
+metrics = SchedulerMetrics()
+
+
+def plan_next(conn, result: ConnectionResult, policy: PollPolicy = None, started: datetime = None,
+              now: datetime = None) -> Tuple[int, str]:
+    """Set conn.sync_interval / next_sync_at from a sync result (a `sync_connections` on_result hook)."""
+    policy = policy or PollPolicy.from_settings()
+    now = now or timezone.now()
+    low, high = user_state.thresholds(conn.user)
+    lag = (started - conn.next_sync_at).total_seconds() if started and conn.next_sync_at else None
+    seconds, reason = policy.interval(conn, result, low, high, now)
+    conn.sync_interval = seconds
+    conn.next_sync_at = now + timedelta(seconds=seconds)
+    metrics.record(result, seconds, reason, lag)
+    return seconds, reason
+
+
+def sync_batch(connections, policy: PollPolicy = None, **kwargs) -> SyncReport:
+    """Sync the given connections and schedule each one's next poll."""
+    policy = policy or PollPolicy.from_settings()
+    started = timezone.now()
+    metrics.tick()
+    return sync_connections(connections, on_result=lambda conn, result: plan_next(conn, result, policy, started),
+                            **kwargs)
+
+
+def due_connections(now: datetime = None, limit: int = None):
+    """Connected LibreConnections due by `now`, never-scheduled first, then most overdue."""
+    from ..models import LibreConnection
+
+    now = now or timezone.now()
+    limit = limit or getattr(settings, 'LIBRE_SCHEDULER_BATCH_SIZE', 500)
+    return (LibreConnection.objects
+            .filter(connected=True)
+            .filter(Q(next_sync_at__isnull=True) | Q(next_sync_at__lte=now))
+            .order_by(F('next_sync_at').asc(nulls_first=True), 'pk')[:limit])
+
+
+def sync_due(now: datetime = None, limit: int = None, **kwargs) -> Optional[SyncReport]:
+    """Sync the connections that are due; None if another batch still holds the lock."""
+    from ..models import LibreConnection
+
+    with task_lock(LOCK_KEY, getattr(settings, 'LIBRE_SYNC_LOCK_SECONDS', 1800)) as acquired:
+        if not acquired:
+            logger.info('Libre sync already running; due sync skipped')
+            return None
+        pks = list(due_connections(now, limit).values_list('pk', flat=True))
+        if not pks:
+            metrics.tick()
+            return SyncReport()
+        return sync_batch(LibreConnection.objects.filter(pk__in=pks), **kwargs)
+
+
+class LibrePollScheduler:
+    """In-memory priority queue of connections by next due time, for a dedicated scheduler process.
+
+    Entries are (due timestamp, pk); rescheduling pushes a new entry and
+    the stale one is skipped when popped (`_due` holds the live time).
+    """
+
+    def __init__(self, policy: PollPolicy = None, batch_size: int = None, reload_seconds: float = 300,
+                 **sync_kwargs):
+        self.policy = policy or PollPolicy.from_settings()
+        self.batch_size = batch_size or getattr(settings, 'LIBRE_SCHEDULER_BATCH_SIZE', 500)
+        self.reload_seconds = reload_seconds
+        self.sync_kwargs = sync_kwargs
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._due)
+
+    def push(self, pk: int, due: datetime):
+        ts = due.timestamp()
+        self._due[pk] = ts
+        heapq.heappush(self._heap, (ts, pk))
+
+    def discard(self, pk: int):
+        self._due.pop(pk, None)
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return datetime.fromtimestamp(self._heap[0][0], tz=dt_timezone.utc)
+
+    def pop_due(self, now: datetime = None, limit: int = None) -> List[Tuple[int, datetime]]:
+        """Remove and return up to `limit` (pk, due) entries due by `now`, earliest first."""
+        now_ts = (now or timezone.now()).timestamp()
+        limit = limit or self.batch_size
+        due = []
+        while self._heap and len(due) < limit:
+            ts, pk = self._heap[0]
+            if self._due.get(pk) != ts:
+                heapq.heappop(self._heap)
+                continue
+            if ts > now_ts:
+                break
+            heapq.heappop(self._heap)
+            del self._due[pk]
+            due.append((pk, datetime.fromtimestamp(ts, tz=dt_timezone.utc)))
+        return due
+
+    def load(self, now: datetime = None):
+        """Rebuild the queue from every connected LibreConnection."""
+        from ..models import LibreConnection
+
+        now = now or timezone.now()
+        self._heap, self._due = [], {}
+        rows = LibreConnection.objects.filter(connected=True).values_list(
+            'pk', 'next_sync_at', 'last_synced', 'sync_interval')
+        for pk, next_sync_at, last_synced, interval in rows.iterator():
+            if next_sync_at is None and last_synced is not None:
+                next_sync_at = last_synced + timedelta(seconds=interval or self.policy.base_seconds)
+            self._due[pk] = (next_sync_at or now).timestamp()
+        self._heap = [(ts, pk) for pk, ts in self._due.items()]
+        heapq.heapify(self._heap)
+        self._loaded_at = time.monotonic()
+
+    def run_due(self, now: datetime = None) -> Optional[SyncReport]:
+        """Sync one batch of due connections and push them back at their new due times."""
+        from ..models import LibreConnection
+
+        due = self.pop_due(now)
+        if not due:
+            return None
+        with task_lock(LOCK_KEY, getattr(settings, 'LIBRE_SYNC_LOCK_SECONDS', 1800)) as acquired:
+            if not acquired:
+                # a full sync is polling everyone; look again shortly
+                retry = (now or timezone.now()) + timedelta(seconds=LOCK_RETRY_SECONDS)
+                for pk, _ in due:
+                    self.push(pk, retry)
+                logger.info('Libre sync already running; scheduler batch postponed')
+                return None
+            report = sync_batch(LibreConnection.objects.filter(pk__in=[pk for pk, _ in due]), self.policy,
+                                **self.sync_kwargs)
+        rows = LibreConnection.objects.filter(pk__in=[pk for pk, _ in due], connected=True).values_list(
+            'pk', 'next_sync_at')
+        for pk, next_sync_at in rows:
+            if next_sync_at is not None:
+                self.push(pk, next_sync_at)
+        return report
+
+    def run_forever(self, stop: threading.Event = None, max_sleep: float = 30, on_report=None):
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_seconds:
+                self.load()
+            report = self.run_due()
+            if report is not None:
+                if on_report is not None:
+                    on_report(report)
+                continue
+            next_due = self.next_due()
+            delay = max_sleep if next_due is None else (next_due - timezone.now()).total_seconds()
+            stop.wait(min(max(delay, 0.05), max_sleep))
+
+
+def scheduler_stats(now: datetime = None) -> dict:
+    """`metrics` plus the queue as stored: overdue connections, oldest lag, projected polls per hour."""
+    from ..models import LibreConnection
+
+    now = now or timezone.now()
+    rows = list(LibreConnection.objects.filter(connected=True).values_list('next_sync_at', 'sync_interval'))
+    overdue = [now - due for due, _ in rows if due is not None and due <= now]
+    unscheduled = sum(1 for due, _ in rows if due is None)
+    upcoming = [due for due, _ in rows if due is not None and due > now]
+    baseline = getattr(settings, 'LIBRE_POLL_BASELINE_SECONDS', 300)
+    polls_per_hour = sum(3600 / max(interval or baseline, 1) for _, interval in rows)
+    return {
+        **metrics.stats(),
+        'queue': {
+            'connections': len(rows),
+            'overdue': len(overdue) + unscheduled,
+            'unscheduled': unscheduled,
+            'oldest_overdue_seconds': round(max(overdue).total_seconds(), 1) if overdue else 0.0,
+            'next_due_in_seconds': round((min(upcoming) - now).total_seconds(), 1) if upcoming else None,
+            'polls_per_hour': round(polls_per_hour, 1),
+            'baseline_polls_per_hour': round(len(rows) * 3600 / baseline, 1),
+        },
+    }
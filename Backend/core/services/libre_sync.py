@@ -0,0 +1,413 @@
+"""Fan-out LibreLinkUp sync for every connected user.
+
+`core.tasks.sync_libre_for_user` used to sync one user at a time:
+`/connections`, a `/graph` per patient, then the ingest, all serially and
+with no way back from an expired ticket. Looped over every connection
+that does not get past a few hundred patients per sync interval.
+`sync_connections` splits the work in two:
+
+1. fetch (thread pool, LIBRE_SYNC_CONCURRENCY workers): per connection,
+   log in again if the ticket is missing or about to expire, call
+   `/connections` and `/graph` per patient, re-login once on a 401 and
+   parse the readings. Workers only do HTTP and parsing; they never touch
+   the database, so they cannot contend for it;
+2. ingest (calling thread): each parsed result goes to the bulk ingest
+   (`libre_ingest.ingest_readings`) as it completes, and the connections'
+   sync outcome is written back with `bulk_update` in batches.
+
+Connections are fed to the pool through a window of a few times the
+concurrency, so parsed payloads never pile up ahead of the ingest.
+
+LLU rate-limits per account and per regional host, so every request
+first takes a token from its region's bucket
+(LIBRE_SYNC_REGION_RATE_PER_MINUTE, LIBRE_SYNC_REGION_BURST; 'local' or
+'django' buckets as for the OpenAI layer, LIBRE_SYNC_RATE_LIMIT_BACKEND).
+A 429 that survives the session's retries pauses the whole region for
+its Retry-After. A request that cannot get a token within
+LIBRE_SYNC_MAX_WAIT seconds is skipped and reported as rate_limited.
+
+Per connection the outcome is stored on `LibreConnection`:
+last_sync_status ('ok', 'auth_failed', 'unauthorized', 'rate_limited',
+'error'), last_sync_error, sync_failures (consecutive) and last_synced
+(on success). A run can take minutes, so only those outcome fields are
+written back in bulk; a new ticket from a re-login is written on its own
+and only while the connection is still connected, so a user who
+disconnects mid-run stays disconnected. Disconnected connections are
+never synced (or logged in again). `sync_all` is the entry point of the `sync_libre` management
+command; a database lock (`locks.task_lock`, shared by every worker
+process and by the scheduler's batches) keeps runs from overlapping. The
+schedule columns (next_sync_at, sync_interval) are written back only when
+an `on_result` hook planned them. The periodic sync goes
+through `libre_scheduler`, which syncs only the connections that are due
+and uses the `on_result` hook to plan each one's next poll from the
+result's latest reading and rate of change.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from . import libre
+from .locks import task_lock
+from .libre_ingest import LibreReading, device_utc_offset, extract_readings, ingest_readings
+from .openai_outbound import BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# written back in bulk from the rows loaded at the start of the run
+UPDATE_FIELDS = ['last_synced', 'last_sync_status', 'last_sync_error', 'sync_failures',
+                 'utc_offset_minutes']
+# only written when an on_result hook planned them; otherwise a run would put back the schedule it loaded
+SCHEDULE_FIELDS = ['next_sync_at', 'sync_interval']
+UPDATE_BATCH_SIZE = 500
+EXPIRY_MARGIN_SECONDS = 60
+# held by every bulk run (`sync_all` and the scheduler's batches) so they never poll the same accounts at once
+LOCK_KEY = 'libre-sync'
+# the rate of change is taken against the reading closest to 15 min before the latest, within these bounds
+RATE_WINDOW_MINUTES = (5, 30)
+
+
+class SyncFailed(Exception):
+    def __init__(self, status: str, message: str = ''):
+        super().__init__(message or status)
+        self.status = status
+
+
+class RegionLimiter:
+    """One token bucket per LLU region, plus a pause after a region answers 429."""
+
+    def __init__(self, rate_per_minute: float = 600, burst: int = 20, backend: str = 'local'):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.backend = backend
+        self._buckets = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, region: str):
+        with self._lock:
+            bucket = self._buckets.get(region)
+            if bucket is None:
+                cls = BUCKETS[self.backend]
+                if self.backend == 'django':
+                    bucket = cls(self.rate_per_minute, self.burst, key=f"libre-region-bucket:{region}")
+                else:
+                    bucket = cls(self.rate_per_minute, self.burst)
+                self._buckets[region] = bucket
+            return bucket
+
+    def acquire(self, region: str, max_wait: float) -> bool:
+        """Block until `region` may take a request; False if that takes longer than max_wait."""
+        deadline = time.monotonic() + max_wait
+        bucket = self._bucket(region)
+        while True:
+            now = time.monotonic()
+            pause = self._paused_until.get(region, 0) - now
+            delay = pause if pause > 0 else bucket.take()
+            if delay <= 0:
+                return True
+            if now + delay > deadline:
+                return False
+            time.sleep(delay)
+
+    def pause(self, region: str, seconds: float):
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._paused_until[region] = max(self._paused_until.get(region, 0), until)
+
+
+@dataclass
+class ConnectionResult:
+    connection_id: int
+    user_id: int
+    status: str = 'ok'
+    readings: List = field(default_factory=list, repr=False)
+    fetched: int = 0
+    created: int = 0
+    requests: int = 0
+    logins: int = 0
+    credentials: Optional[dict] = None  # set when the worker logged in again
+    error: str = ''
+    seconds: float = 0.0
+    latest: Optional[LibreReading] = None
+    rate: Optional[float] = None  # mg/dL per minute around the latest reading
+    utc_offset: Optional[int] = None
+
+
+@dataclass
+class SyncReport:
+    connections: int = 0
+    statuses: Counter = field(default_factory=Counter)
+    fetched: int = 0
+    created: int = 0
+    requests: int = 0
+    logins: int = 0
+    wall_seconds: float = 0.0
+    ingest_seconds: float = 0.0
+    latencies: List[float] = field(default_factory=list, repr=False)
+
+    def add(self, result: ConnectionResult):
+        self.statuses[result.status] += 1
+        self.fetched += result.fetched
+        self.created += result.created
+        self.requests += result.requests
+        self.logins += result.logins
+        self.latencies.append(result.seconds)
+
+    def as_dict(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(q):
+            return round(ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))], 3) if ordered else None
+
+        return {
+            'connections': self.connections,
+            'statuses': dict(self.statuses),
+            'fetched': self.fetched,
+            'created': self.created,
+            'requests': self.requests,
+            'logins': self.logins,
+            'wall_seconds': round(self.wall_seconds, 3),
+            'ingest_seconds': round(self.ingest_seconds, 3),
+            'fetch_seconds': {'p50': pct(0.5), 'p95': pct(0.95), 'p99': pct(0.99)},
+        }
+
+
+def glucose_trend(readings) -> Tuple[Optional[LibreReading], Optional[float]]:
+    """(latest reading, mg/dL per minute against the reading ~15 min before it)."""
+    if not readings:
+        return None, None
+    latest = max(readings, key=lambda r: r.timestamp)
+    low, high = RATE_WINDOW_MINUTES
+    best = None
+    for reading in readings:
+        minutes = (latest.timestamp - reading.timestamp).total_seconds() / 60
+        if low <= minutes <= high and (best is None or abs(minutes - 15) < abs(best[0] - 15)):
+            best = (minutes, reading)
+    if best is None:
+        return latest, None
+    minutes, earlier = best
+    return latest, (latest.glucose_level - earlier.glucose_level) / minutes
+
+
+def _region(base_url: Optional[str]) -> str:
+    return libre.region_from_base_url(base_url) or 'global'
+
+
+def _retry_after(exc: Exception, default: float = 30.0) -> float:
+    response = getattr(exc, 'response', None)
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+class _Fetcher:
+    """Fetch one connection's payloads; runs on a worker thread and never touches the database."""
+
+    def __init__(self, conn, limiter: RegionLimiter, include_history: bool, max_wait: float, timeout: float):
+        self.conn = conn
+        self.limiter = limiter
+        self.include_history = include_history
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.result = ConnectionResult(connection_id=conn.pk, user_id=conn.user_id)
+        self.creds = {
+            'token': conn.token, 'account_id': conn.account_id, 'api_endpoint': conn.api_endpoint,
+            'region': conn.region, 'token_expires_at': conn.token_expires_at,
+        }
+
+    def _call(self, fn, *args):
+        region = _region(self.creds['api_endpoint'])
+        if not self.limiter.acquire(region, self.max_wait):
+            raise SyncFailed('rate_limited', f"no {region} request slot within {self.max_wait:.0f}s")
+        self.result.requests += 1
+        try:
+            return fn(*args, timeout=self.timeout)
+        except (requests.HTTPError, requests.exceptions.RetryError) as exc:
+            status = getattr(getattr(exc, 'response', None), 'status_code', None)
+            if status == 401:
+                raise SyncFailed('unauthorized', str(exc)[:255])
+            if status == 429 or isinstance(exc, requests.exceptions.RetryError):
+                self.limiter.pause(region, _retry_after(exc))
+                raise SyncFailed('rate_limited', str(exc)[:255])
+            raise
+
+    def _login(self):
+        password = self.conn.get_password_decrypted() or self.conn.password
+        if not self.conn.email or not password:
+            raise SyncFailed('auth_failed', 'no stored credentials')
+        self.result.logins += 1
+        base_url, token_response, _ = self._call(lambda timeout: libre.login_with_password(
+            self.conn.email, password, timeout=timeout))
+        if not token_response:
+            raise SyncFailed('auth_failed', 'login failed')
+        expires = token_response.get('expires')
+        self.creds = {
+            'token': token_response.get('access_token'),
+            'account_id': token_response.get('account_id'),
+            'api_endpoint': base_url,
+            'region': libre.region_from_base_url(base_url),
+            'token_expires_at': datetime.fromtimestamp(expires, tz=dt_timezone.utc) if expires else None,
+        }
+        self.result.credentials = self.creds
+
+    def _needs_login(self) -> bool:
+        creds = self.creds
+        if not (creds['token'] and creds['account_id'] and creds['api_endpoint']):
+            return True
+        expires = creds['token_expires_at']
+        return bool(expires and (expires - timezone.now()).total_seconds() < EXPIRY_MARGIN_SECONDS)
+
+    def _connections(self):
+        c = self.creds
+        return self._call(libre.get_libreview_connection, c['api_endpoint'], c['token'], c['account_id'])
+
+    def run(self) -> ConnectionResult:
+        t0 = time.monotonic()
+        try:
+            if self._needs_login():
+                self._login()
+            try:
+                payloads = [self._connections()]
+            except SyncFailed as exc:
+                if exc.status != 'unauthorized' or self.result.credentials is not None:
+                    raise
+                self._login()  # the ticket was revoked or expired early
+                payloads = [self._connections()]
+            if self.include_history:
+                c = self.creds
+                for item in payloads[0].get('data') or []:
+                    patient_id = (item or {}).get('patientId')
+                    if patient_id:
+                        # graphData carries the last ~12h, so a missed run is backfilled
+                        payloads.append(self._call(libre.get_libreview_graph, c['api_endpoint'], c['token'],
+                                                   c['account_id'], patient_id))
+            self.result.readings = [r for payload in payloads for r in extract_readings(payload)]
+            self.result.latest, self.result.rate = glucose_trend(self.result.readings)
+            self.result.utc_offset = device_utc_offset(payloads[0])
+        except SyncFailed as exc:
+            self.result.status, self.result.error = exc.status, str(exc)[:255]
+        except Exception as exc:
+            self.result.status, self.result.error = 'error', f"{type(exc).__name__}: {exc}"[:255]
+        self.result.seconds = time.monotonic() - t0
+        return self.result
+
+
+def _store_credentials(model, conn, credentials: dict):
+    """Save a re-login's ticket unless the user disconnected while it was in flight."""
+    if model.objects.filter(pk=conn.pk, connected=True).update(**credentials):
+        for name, value in credentials.items():
+            setattr(conn, name, value)
+
+
+def _apply(conn, result: ConnectionResult, now):
+    conn.last_sync_status = result.status
+    conn.last_sync_error = result.error
+    if result.utc_offset is not None:
+        conn.utc_offset_minutes = result.utc_offset
+    if result.status == 'ok':
+        conn.last_synced = now
+        conn.sync_failures = 0
+    else:
+        conn.sync_failures += 1
+
+
+def _flush(model, dirty: list, fields: list):
+    if dirty:
+        model.objects.bulk_update(dirty, fields, batch_size=UPDATE_BATCH_SIZE)
+        dirty.clear()
+
+
+def limiter_from_settings() -> RegionLimiter:
+    return RegionLimiter(
+        rate_per_minute=getattr(settings, 'LIBRE_SYNC_REGION_RATE_PER_MINUTE', 600),
+        burst=getattr(settings, 'LIBRE_SYNC_REGION_BURST', 20),
+        backend=getattr(settings, 'LIBRE_SYNC_RATE_LIMIT_BACKEND', 'local'),
+    )
+
+
+def sync_connections(connections=None, include_history: bool = True, concurrency: int = None,
+                     limiter: RegionLimiter = None, source: str = 'libre', on_result=None) -> SyncReport:
+    """Fetch every given LibreConnection concurrently and bulk-ingest the readings.
+
+    on_result(conn, result), if given, runs in the calling thread after each
+    connection's outcome is applied and before it is written back.
+    """
+    from ..models import LibreConnection
+
+    if connections is None:
+        connections = LibreConnection.objects.all()
+    conns = list(connections.filter(connected=True).select_related('user').order_by('pk'))
+    concurrency = max(1, int(concurrency or getattr(settings, 'LIBRE_SYNC_CONCURRENCY', 16)))
+    limiter = limiter or limiter_from_settings()
+    max_wait = getattr(settings, 'LIBRE_SYNC_MAX_WAIT', 60)
+    timeout = getattr(settings, 'LIBRE_SYNC_TIMEOUT', 15)
+
+    report = SyncReport(connections=len(conns))
+    by_pk = {conn.pk: conn for conn in conns}
+    fields = UPDATE_FIELDS + SCHEDULE_FIELDS if on_result is not None else UPDATE_FIELDS
+    dirty = []
+    t0 = time.monotonic()
+    queued = iter(conns)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='libre-sync') as pool:
+        pending = set()
+
+        def fill():
+            while len(pending) < concurrency * 4:
+                conn = next(queued, None)
+                if conn is None:
+                    return
+                pending.add(pool.submit(_Fetcher(conn, limiter, include_history, max_wait, timeout).run))
+
+        fill()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            fill()
+            for future in done:
+                result = future.result()
+                conn = by_pk[result.connection_id]
+                if result.status == 'ok':
+                    started = time.monotonic()
+                    try:
+                        ingested = ingest_readings(conn.user, result.readings, source=source,
+                                                   device_offset_minutes=result.utc_offset)
+                        result.fetched, result.created = ingested.fetched, ingested.created
+                    except Exception as exc:
+                        logger.exception(f"Libre ingest failed for user {conn.user_id}")
+                        result.status, result.error = 'error', f"ingest: {exc}"[:255]
+                    report.ingest_seconds += time.monotonic() - started
+                result.readings = []
+                if result.credentials:
+                    _store_credentials(LibreConnection, conn, result.credentials)
+                _apply(conn, result, timezone.now())
+                if on_result is not None:
+                    on_result(conn, result)
+                report.add(result)
+                dirty.append(conn)
+                if len(dirty) >= UPDATE_BATCH_SIZE:
+                    _flush(LibreConnection, dirty, fields)
+    _flush(LibreConnection, dirty, fields)
+    report.wall_seconds = time.monotonic() - t0
+    logger.info(f"Libre sync: {report.connections} connections in {report.wall_seconds:.1f}s, "
+                f"{dict(report.statuses)}, {report.created} new readings")
+    return report
+
+
+def sync_all(include_history: bool = True, concurrency: int = None) -> Optional[SyncReport]:
+    """Sync every connected user; None if another run still holds the lock."""
+    with task_lock(LOCK_KEY, getattr(settings, 'LIBRE_SYNC_LOCK_SECONDS', 1800)) as acquired:
+        if not acquired:
+            logger.info('Libre sync already running; skipped')
+            return None
+        return sync_connections(include_history=include_history, concurrency=concurrency)
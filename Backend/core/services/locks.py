@@ -0,0 +1,47 @@
+"""Cross-process locks for periodic jobs.
+
+Celery runs prefork workers, and the default cache is per-process
+LocMem unless CACHES says otherwise, so `cache.add` does not keep two
+workers from running the same beat task at once. `task_lock` takes a row
+in `TaskLock` instead: the name is the primary key, so of two processes
+inserting it only one succeeds, whatever the database. A lock expires
+after `ttl` seconds in case its holder died without releasing it.
+"""
+
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+
+def acquire(name: str, ttl: float, owner: str) -> bool:
+    from ..models import TaskLock
+
+    now = timezone.now()
+    TaskLock.objects.filter(name=name, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            TaskLock.objects.create(name=name, owner=owner, expires_at=now + timedelta(seconds=ttl))
+    except IntegrityError:
+        return False
+    return True
+
+
+def release(name: str, owner: str):
+    from ..models import TaskLock
+
+    TaskLock.objects.filter(name=name, owner=owner).delete()
+
+
+@contextmanager
+def task_lock(name: str, ttl: float):
+    """Yield True while holding `name`, False if another process holds it."""
+    owner = uuid.uuid4().hex
+    acquired = acquire(name, ttl, owner)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release(name, owner)
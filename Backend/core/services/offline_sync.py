@@ -0,0 +1,251 @@
+"""Batch writes for entries the mobile app queued while offline.
+
+The app replays its offline queue as one POST to `glucose-records/batch/`
+or `food-entries/batch/`, with a body of `{"items": [...]}` or a bare
+array. Each item carries a client-generated `client_id`; the server treats
+it as an idempotency key, unique per user. Replaying a batch after a
+dropped response therefore creates nothing twice.
+
+For one batch:
+
+1. every item is validated by the batch item serializer. An invalid item
+   is reported and does not block the valid ones;
+2. the existing rows for the batch's `client_id`s are read in one query.
+   Glucose items that repeat a reading already stored (for example one
+   that Libre sync has since written) are matched in a second query;
+3. new rows are inserted with `bulk_create` in one transaction. Food
+   entries are built as in `food_entries` and get their insulin
+   recommendation in memory, from the latest reading at or before each
+   entry's timestamp. All of those lookups come
+   from one range read (`latest_glucose_at`), not one query per entry;
+4. `bulk_create` sends no `post_save`, so alerts, rollups and the feature
+   store run once over the created rows, as in `libre_ingest`.
+
+The response lists a result per item, in request order. The status is
+"created", "duplicate" (with the stored record) or "invalid" (with
+errors).
+"""
+
+import bisect
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import food_entries, rollups, user_state
+
+logger = logging.getLogger(__name__)
+
+CREATED, DUPLICATE, INVALID = 'created', 'duplicate', 'invalid'
+
+
+@dataclass
+class BatchResult:
+    results: List[dict] = field(default_factory=list)
+
+    def count(self, status: str) -> int:
+        return sum(1 for r in self.results if r['status'] == status)
+
+    def as_dict(self):
+        return {
+            'created': self.count(CREATED),
+            'duplicates': self.count(DUPLICATE),
+            'invalid': self.count(INVALID),
+            'results': self.results,
+        }
+
+
+def batch_items(data) -> list:
+    """The item list of a batch body (`[...]` or `{"items": [...]}`)."""
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise ValidationError({'items': 'Expected a non-empty list of entries.'})
+    limit = getattr(settings, 'OFFLINE_BATCH_MAX_ITEMS', 500)
+    if len(items) > limit:
+        raise ValidationError({'items': f'At most {limit} entries per batch.'})
+    return items
+
+
+def _validate(serializer, items):
+    """[(index, validated_data or None, errors)] in one pass of the item serializer."""
+    out = []
+    for index, item in enumerate(items):
+        try:
+            out.append((index, serializer.run_validation(item), None))
+        except ValidationError as e:
+            out.append((index, None, e.detail))
+    return out
+
+
+def _split(serializer, items, existing: Dict[str, object]):
+    """Validate and sort items into results, duplicates of stored rows, and new ones."""
+    results = [None] * len(items)
+    new = {}  # client_id -> (index, validated_data); first occurrence wins
+    for index, data, errors in _validate(serializer, items):
+        client_id = items[index].get('client_id') if isinstance(items[index], dict) else None
+        if errors is not None:
+            results[index] = {'index': index, 'client_id': client_id, 'status': INVALID, 'errors': errors}
+        elif data['client_id'] in existing or data['client_id'] in new:
+            results[index] = {'index': index, 'client_id': data['client_id'], 'status': DUPLICATE}
+        else:
+            new[data['client_id']] = (index, data)
+    return results, new
+
+
+def _client_ids(items) -> set:
+    return {str(item['client_id']) for item in items if isinstance(item, dict) and item.get('client_id')}
+
+
+def _finish(results, by_client_id: Dict[str, object], represent) -> BatchResult:
+    for r in results:
+        obj = by_client_id.get(r['client_id']) if r['status'] != INVALID else None
+        if obj is not None:
+            r['id'] = str(obj.pk)
+            r['record'] = represent(obj)
+    return BatchResult(results=results)
+
+
+def _after_glucose_created(user, records):
+    from ..models import Alert
+
+    Alert.ensure_for_glucose_batch(records)
+    rollups.record_glucose(records)
+    user_state.record_glucose(records)
+    try:
+        from . import feature_store
+        feature_store.record_glucose(records)
+    except Exception:
+        logger.exception(f"Feature store update failed after a {len(records)}-reading batch for user {user.pk}")
+
+
+def save_glucose_batch(user, items: list, context=None) -> BatchResult:
+    """Validate and insert a batch of queued glucose readings."""
+    from ..models import GlucoseRecord
+    from ..serializers import GlucoseRecordBatchItemSerializer, GlucoseRecordSerializer
+
+    existing = {r.client_id: r for r in GlucoseRecord.objects.filter(user=user, client_id__in=_client_ids(items))}
+    serializer = GlucoseRecordBatchItemSerializer(context=context)
+    results, new = _split(serializer, items, existing)
+
+    # a reading already stored under another key (e.g. synced from Libre) is a duplicate too
+    records = {cid: GlucoseRecord(user=user, **data) for cid, (_, data) in new.items()}
+    if records:
+        same_reading = {
+            (r.timestamp, r.glucose_level, r.source): r
+            for r in GlucoseRecord.objects.filter(user=user, timestamp__in={r.timestamp for r in records.values()})
+        }
+        for cid, record in list(records.items()):
+            match = same_reading.get((record.timestamp, record.glucose_level, record.source))
+            if match is not None:
+                existing[cid] = match
+                index = new.pop(cid)[0]
+                results[index] = {'index': index, 'client_id': cid, 'status': DUPLICATE}
+                del records[cid]
+
+    created = []
+    if records:
+        with transaction.atomic():
+            # ignore_conflicts: a concurrent replay of the same batch loses the race quietly
+            GlucoseRecord.objects.bulk_create(list(records.values()), ignore_conflicts=True)
+            stored = dict(GlucoseRecord.objects.filter(user=user, client_id__in=list(records))
+                          .values_list('client_id', 'pk'))
+        for cid, record in records.items():
+            index = new[cid][0]
+            if stored.get(cid) == record.pk:
+                created.append(record)
+                existing[cid] = record
+                results[index] = {'index': index, 'client_id': cid, 'status': CREATED}
+            else:
+                # lost a race to a replay of this batch, or to a sync storing the same reading
+                same = (GlucoseRecord.objects.filter(pk=stored[cid]) if cid in stored else
+                        GlucoseRecord.objects.filter(user=user, timestamp=record.timestamp,
+                                                     glucose_level=record.glucose_level, source=record.source))
+                existing[cid] = same.first()
+                results[index] = {'index': index, 'client_id': cid, 'status': DUPLICATE}
+    if created:
+        _after_glucose_created(user, created)
+    return _finish(results, existing, GlucoseRecordSerializer(context=context).to_representation)
+
+
+def latest_glucose_at(user, timestamps: Iterable) -> dict:
+    """{timestamp: latest glucose level at or before it}, from one range read plus one seed row."""
+    from ..models import GlucoseRecord
+
+    timestamps = sorted(set(timestamps))
+    if not timestamps:
+        return {}
+    qs = GlucoseRecord.objects.filter(user=user)
+    seed = list(qs.filter(timestamp__lt=timestamps[0]).order_by('-timestamp')
+                .values_list('timestamp', 'glucose_level')[:1])
+    rows = seed + list(qs.filter(timestamp__gte=timestamps[0], timestamp__lte=timestamps[-1])
+                       .order_by('timestamp').values_list('timestamp', 'glucose_level'))
+    stamps = [ts for ts, _ in rows]
+    out = {}
+    for ts in timestamps:
+        i = bisect.bisect_right(stamps, ts)
+        out[ts] = rows[i - 1][1] if i else None
+    return out
+
+
+def save_food_batch(user, items: list, context=None) -> BatchResult:
+    """Validate and insert a batch of queued food entries with their insulin recommendations."""
+    from django.utils import timezone
+
+    from ..models import FoodEntry, NutritionalInfo
+    from ..serializers import FoodEntryBatchItemSerializer, FoodEntrySerializer
+
+    existing = {
+        e.client_id: e for e in
+        FoodEntry.objects.filter(user=user, client_id__in=_client_ids(items)).select_related('nutritional_info')
+    }
+    serializer = FoodEntryBatchItemSerializer(context=context)
+    results, new = _split(serializer, items, existing)
+
+    now = timezone.now()
+    entries, infos = {}, {}
+    for cid, (_, data) in new.items():
+        entry, info = food_entries.build_food_entry(user, {'timestamp': now, **data}, data.get('nutritional_info'))
+        entries[cid] = entry
+        if info is not None:
+            infos[cid] = info
+
+    dosing = [e for e in entries.values() if e.total_carbs and e.total_carbs > 0]
+    if dosing:
+        glucose = latest_glucose_at(user, (e.timestamp for e in dosing))
+        for entry in dosing:
+            food_entries.apply_dose(entry, food_entries.dose_for(user, entry.total_carbs, glucose[entry.timestamp]))
+
+    created = []
+    if entries:
+        with transaction.atomic():
+            NutritionalInfo.objects.bulk_create(list(infos.values()))
+            for cid, ni in infos.items():
+                entries[cid].nutritional_info = ni
+            FoodEntry.objects.bulk_create(list(entries.values()), ignore_conflicts=True)
+            stored = dict(FoodEntry.objects.filter(user=user, client_id__in=list(entries))
+                          .values_list('client_id', 'pk'))
+        lost = []
+        for cid, entry in entries.items():
+            index = new[cid][0]
+            if stored.get(cid) == entry.pk:
+                created.append(entry)
+                existing[cid] = entry
+                results[index] = {'index': index, 'client_id': cid, 'status': CREATED}
+            else:
+                lost.append(cid)
+                results[index] = {'index': index, 'client_id': cid, 'status': DUPLICATE}
+        if lost:
+            existing.update((e.client_id, e) for e in FoodEntry.objects.filter(
+                user=user, client_id__in=lost).select_related('nutritional_info'))
+            NutritionalInfo.objects.filter(pk__in=[infos[cid].pk for cid in lost if cid in infos]).delete()
+
+    if created:
+        try:
+            from . import feature_store
+            feature_store.record_foods(created)
+        except Exception:
+            logger.exception(f"Feature store update failed after a {len(created)}-entry batch for user {user.pk}")
+    return _finish(results, existing, FoodEntrySerializer(context=context).to_representation)
@@ -0,0 +1,463 @@
+"""Outbound layer for OpenAI vision calls: shared client, limits and circuit breaker.
+
+`openai_service` used to build a new `OpenAI` client per call, let any
+number of workers call the provider at once, and retry by sleeping two
+seconds per attempt. When the provider slowed down, every worker ended up
+parked in those sleeps. Every model call now goes through `call()`
+(`acall()` for asyncio code), which applies, in order:
+
+- circuit breaker: after OPENAI_BREAKER_FAILURES consecutive upstream
+  failures (timeouts, 429s, connection errors, 5xx) calls fail fast with
+  `CircuitOpen` (an `OpenAIServiceError`) for OPENAI_BREAKER_RESET_SECONDS.
+  Then one probe call is let through and its outcome closes or re-opens
+  the breaker. Invalid-image and schema errors do not count;
+- token bucket: OPENAI_RATE_PER_MINUTE requests with bursts of up to
+  OPENAI_RATE_BURST. Backends (OPENAI_RATE_LIMIT_BACKEND) are 'local'
+  (per process, the stand-in for development and tests) and 'django'
+  (the Django cache named by OPENAI_RATE_LIMIT_ALIAS, e.g. Redis, so the
+  budget is shared by every worker and host);
+- concurrency: at most OPENAI_MAX_CONCURRENCY calls in flight per process.
+
+Waiting for a token and then a slot is bounded by OPENAI_QUEUE_TIMEOUT.
+A caller that cannot get through in time gets `OpenAITooManyRequests`,
+the same error as a provider 429.
+
+The clients are long-lived: one `OpenAI` / `AsyncOpenAI` per process,
+rebuilt after fork or when the key, base URL or timeout changes. They
+keep their connection pool between calls, and the SDK's own retries are
+off so that retries pass through the limits above.
+
+`outbound_stats()` reports queue time (mean/p95), in-flight calls,
+rejections, rate-limit waits and the breaker state.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import openai
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .openai_service import OpenAIServiceError, OpenAITimeout, OpenAITooManyRequests
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(OpenAIServiceError):
+    status = 503
+
+
+def translate(exc: Exception) -> OpenAIServiceError:
+    """The service error for an SDK exception."""
+    if isinstance(exc, OpenAIServiceError):
+        return exc
+    if isinstance(exc, openai.APITimeoutError):
+        return OpenAITimeout('timeout')
+    if isinstance(exc, openai.RateLimitError):
+        return OpenAITooManyRequests('rate_limited')
+    if isinstance(exc, openai.BadRequestError):
+        return OpenAIServiceError(f"invalid_image_request: {exc}")
+    if isinstance(exc, openai.APIConnectionError):
+        return OpenAIServiceError(f"upstream_unavailable: {exc}")
+    if isinstance(exc, openai.APIStatusError) and exc.status_code >= 500:
+        return OpenAIServiceError(f"upstream_unavailable: {exc.status_code}")
+    return OpenAIServiceError(f"unexpected_error: {exc}")
+
+
+def is_upstream_failure(error: OpenAIServiceError) -> bool:
+    """Errors that say the provider is degraded (and trip the breaker)."""
+    return isinstance(error, (OpenAITimeout, OpenAITooManyRequests)) or str(error).startswith('upstream_unavailable')
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True  # one probe at a time
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("OpenAI circuit closed")
+            self.state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                    logger.warning(f"OpenAI circuit opened after {self.failures} failures")
+                self.state, self.opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+    def record_neutral(self):
+        """The call finished without saying anything about provider health."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opens': self.opens,
+                'rejected': self.rejected,
+                'retry_in_seconds': round(retry_in, 1),
+            }
+
+
+class BaseTokenBucket:
+    def __init__(self, rate_per_minute: float = 500, burst: int = 20):
+        self.rate = float(rate_per_minute) / 60.0
+        self.burst = max(1, int(burst))
+
+    def take(self) -> float:
+        """Take a token: 0.0 on success, otherwise seconds until one is available."""
+        raise NotImplementedError
+
+    def _refill(self, tokens: float, updated: float, now: float):
+        tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate if self.rate > 0 else float('inf')
+
+
+class LocalTokenBucket(BaseTokenBucket):
+    """Per-process bucket: the stand-in for the shared one in development and tests."""
+
+    def __init__(self, rate_per_minute=500, burst=20):
+        super().__init__(rate_per_minute, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens, wait = self._refill(self._tokens, self._updated, now)
+            self._updated = now
+            return wait
+
+
+class DjangoCacheTokenBucket(BaseTokenBucket):
+    """Bucket kept in a shared Django cache; updates are serialized with an add()-based lock."""
+
+    KEY = 'openai-token-bucket'
+
+    def __init__(self, rate_per_minute=500, burst=20, alias: str = 'default', key: str = None):
+        super().__init__(rate_per_minute, burst)
+        self.alias = alias
+        self.KEY = key or self.KEY
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def take(self) -> float:
+        cache = self._cache
+        lock_key = f"{self.KEY}:lock"
+        deadline = time.monotonic() + 0.5
+        while not cache.add(lock_key, 1, timeout=2):
+            if time.monotonic() > deadline:
+                return 0.05  # contended: ask the caller to retry shortly
+            time.sleep(0.002)
+        try:
+            now = time.time()
+            tokens, updated = cache.get(self.KEY) or (float(self.burst), now)
+            tokens, wait = self._refill(tokens, updated, now)
+            cache.set(self.KEY, (tokens, now), timeout=max(60, int(self.burst / self.rate) + 60) if self.rate else None)
+            return wait
+        finally:
+            cache.delete(lock_key)
+
+
+BUCKETS = {
+    'local': LocalTokenBucket,
+    'django': DjangoCacheTokenBucket,
+}
+
+
+class _Latencies:
+    def __init__(self, window: int = 500):
+        self._values = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        with self._lock:
+            self._values.append(value)
+
+    def summary(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._values)
+        if not ordered:
+            return {'mean': None, 'p95': None, 'max': None}
+        p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+        return {'mean': round(sum(ordered) / len(ordered), 4), 'p95': round(p95, 4), 'max': round(ordered[-1], 4)}
+
+
+class OpenAIOutbound:
+    def __init__(self, max_concurrency: int = 8, queue_timeout: float = 10, bucket: Optional[BaseTokenBucket] = None,
+                 breaker: Optional[CircuitBreaker] = None, client_factory: Optional[Callable] = None,
+                 async_client_factory: Optional[Callable] = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.queue_timeout = float(queue_timeout)
+        self.bucket = bucket or LocalTokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self._client_factory = client_factory or _default_client
+        self._async_client_factory = async_client_factory or _default_async_client
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._client = None
+        self._async_client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.queue_seconds = _Latencies()
+        self.call_seconds = _Latencies()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.rejected_queue_timeout = 0
+        self.rate_limited_waits = 0
+
+    def get_client(self):
+        self._check_fork()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def get_async_client(self):
+        self._check_fork()
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = self._async_client_factory()
+        return self._async_client
+
+    def _check_fork(self):
+        # connection pools and semaphores must not be shared with a forked parent
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._client = self._async_client = None
+                    self._slots = threading.BoundedSemaphore(self.max_concurrency)
+                    self._pid = os.getpid()
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+            if name == 'in_flight':
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _reject(self, reason: str):
+        self._count('rejected_queue_timeout')
+        raise OpenAITooManyRequests(reason)
+
+    def _admit(self, deadline: float):
+        """Rate-limit waits before a call the breaker let through: yields each wait for the caller to sleep."""
+        while True:
+            wait = self.bucket.take()
+            if wait <= 0:
+                return
+            self._count('rate_limited_waits')
+            if time.monotonic() + wait > deadline:
+                self._reject('local_rate_limit')
+            yield wait
+
+    def _finish(self, error: Optional[OpenAIServiceError]):
+        if error is None:
+            self.breaker.record_success()
+        elif is_upstream_failure(error):
+            self._count('failures')
+            self.breaker.record_failure()
+        else:
+            self._count('failures')
+            self.breaker.record_neutral()
+
+    @contextmanager
+    def _in_flight(self, queued: float):
+        self.queue_seconds.add(queued)
+        self._count('in_flight')
+        self._count('calls')
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.call_seconds.add(time.monotonic() - started)
+            self._count('in_flight', -1)
+
+    @contextmanager
+    def _outcome(self):
+        """Yield a dict; the breaker hears `error` (None for success) only if the call set it."""
+        outcome = {}
+        try:
+            yield outcome
+        finally:
+            # rejected, interrupted or cancelled before the provider answered (e.g. a
+            # cancelled half-open probe): say nothing about its health, but free the probe
+            if 'error' in outcome:
+                self._finish(outcome['error'])
+            else:
+                self.breaker.record_neutral()
+
+    def call(self, fn: Callable):
+        """Run `fn(client)` under the breaker, rate limit and concurrency cap; SDK errors become service errors."""
+        client = self.get_client()
+        deadline = time.monotonic() + self.queue_timeout
+        started = time.monotonic()
+        if not self.breaker.allow():
+            raise CircuitOpen('circuit_open')
+        with self._outcome() as outcome:
+            for wait in self._admit(deadline):
+                time.sleep(wait)
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._reject('local_concurrency_limit')
+            try:
+                with self._in_flight(time.monotonic() - started):
+                    try:
+                        result = fn(client)
+                    except Exception as exc:
+                        outcome['error'] = translate(exc)
+                        raise outcome['error'] from exc
+                    outcome['error'] = None
+                    return result
+            finally:
+                self._slots.release()
+
+    async def acall(self, fn: Callable):
+        """Async counterpart of call(): `await fn(async_client)`, waiting without blocking the loop."""
+        client = self.get_async_client()
+        deadline = time.monotonic() + self.queue_timeout
+        started = time.monotonic()
+        if not self.breaker.allow():
+            raise CircuitOpen('circuit_open')
+        with self._outcome() as outcome:
+            for wait in self._admit(deadline):
+                await asyncio.sleep(wait)
+            while not self._slots.acquire(blocking=False):
+                if time.monotonic() > deadline:
+                    self._reject('local_concurrency_limit')
+                await asyncio.sleep(0.005)
+            try:
+                with self._in_flight(time.monotonic() - started):
+                    try:
+                        result = await fn(client)
+                    except Exception as exc:
+                        outcome['error'] = translate(exc)
+                        raise outcome['error'] from exc
+                    outcome['error'] = None
+                    return result
+            finally:
+                self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {
+                'calls': self.calls,
+                'failures': self.failures,
+                'in_flight': self.in_flight,
+                'peak_in_flight': self.peak_in_flight,
+                'max_concurrency': self.max_concurrency,
+                'rejected_queue_timeout': self.rejected_queue_timeout,
+                'rate_limited_waits': self.rate_limited_waits,
+            }
+        return {
+            **counters,
+            'rate_limit': {'backend': type(self.bucket).__name__, 'per_minute': round(self.bucket.rate * 60, 2),
+                           'burst': self.bucket.burst},
+            'queue_seconds': self.queue_seconds.summary(),
+            'call_seconds': self.call_seconds.summary(),
+            'breaker': self.breaker.stats(),
+        }
+
+
+def _client_kwargs() -> dict:
+    api_key = getattr(settings, 'OPENAI_API_KEY', None)
+    if not api_key:
+        raise OpenAIServiceError("missing OPENAI_API_KEY in settings")
+    kwargs = {'api_key': api_key, 'timeout': getattr(settings, 'OPENAI_TIMEOUT', 30), 'max_retries': 0}
+    base_url = getattr(settings, 'OPENAI_BASE_URL', None)
+    if base_url:
+        kwargs['base_url'] = base_url
+    return kwargs
+
+
+def _default_client():
+    return openai.OpenAI(**_client_kwargs())
+
+
+def _default_async_client():
+    return openai.AsyncOpenAI(**_client_kwargs())
+
+
+_outbound: Optional[OpenAIOutbound] = None
+_outbound_key = None
+_outbound_lock = threading.Lock()
+
+
+def get_outbound() -> OpenAIOutbound:
+    """Process-wide outbound layer for the current settings."""
+    global _outbound, _outbound_key
+    key = tuple(getattr(settings, name, None) for name in (
+        'OPENAI_API_KEY', 'OPENAI_BASE_URL', 'OPENAI_TIMEOUT', 'OPENAI_MAX_CONCURRENCY', 'OPENAI_QUEUE_TIMEOUT',
+        'OPENAI_RATE_LIMIT_BACKEND', 'OPENAI_RATE_LIMIT_ALIAS', 'OPENAI_RATE_PER_MINUTE', 'OPENAI_RATE_BURST',
+        'OPENAI_BREAKER_FAILURES', 'OPENAI_BREAKER_RESET_SECONDS',
+    ))
+    if _outbound is None or _outbound_key != key:
+        with _outbound_lock:
+            if _outbound is None or _outbound_key != key:
+                kind = getattr(settings, 'OPENAI_RATE_LIMIT_BACKEND', 'local')
+                cls = BUCKETS.get(kind) or import_string(kind)
+                rate = getattr(settings, 'OPENAI_RATE_PER_MINUTE', 500)
+                burst = getattr(settings, 'OPENAI_RATE_BURST', 20)
+                if cls is DjangoCacheTokenBucket:
+                    bucket = cls(rate, burst, alias=getattr(settings, 'OPENAI_RATE_LIMIT_ALIAS', 'default'))
+                else:
+                    bucket = cls(rate, burst)
+                _outbound = OpenAIOutbound(
+                    max_concurrency=getattr(settings, 'OPENAI_MAX_CONCURRENCY', 8),
+                    queue_timeout=getattr(settings, 'OPENAI_QUEUE_TIMEOUT', 10),
+                    bucket=bucket,
+                    breaker=CircuitBreaker(getattr(settings, 'OPENAI_BREAKER_FAILURES', 5),
+                                           getattr(settings, 'OPENAI_BREAKER_RESET_SECONDS', 30)),
+                )
+                _outbound_key = key
+    return _outbound
+
+
+def outbound_stats() -> dict:
+    return get_outbound().stats()
@@ -0,0 +1,65 @@
+"""Keyset pagination and time-range filters for per-user timestamped lists.
+
+`TimestampCursorPagination` pages newest-first on `timestamp` with DRF's
+opaque cursors, so every page is one `user = ? AND timestamp < ?` range scan
+on the `(user, timestamp)` index followed by a LIMIT. Fetching page 500 of
+a year of 1-minute readings costs the same as page 1, unlike offset paging.
+The page size comes from `?limit=` (the mobile client's existing parameter),
+capped at API_MAX_PAGE_SIZE.
+
+`filter_timestamp_range` applies the `start`/`end` query parameters
+(`start_date`/`end_date` are accepted as aliases) as an inclusive range.
+"""
+
+from datetime import datetime, time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+
+
+class TimestampCursorPagination(CursorPagination):
+    ordering = '-timestamp'
+    page_size_query_param = 'limit'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'API_PAGE_SIZE', 500)
+        self.max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 2000)
+
+
+def parse_query_timestamp(value: str, name: str, end_of_day: bool = False) -> datetime:
+    """Parse an ISO datetime or date query parameter into an aware datetime (400 on bad input)."""
+    try:
+        ts = parse_datetime(value)
+        if ts is None:
+            day = parse_date(value)
+            if day is not None:
+                ts = datetime.combine(day, time.max if end_of_day else time.min)
+    except ValueError:
+        ts = None
+    if ts is None:
+        raise ValidationError({name: f"Invalid datetime: {value!r}"})
+    if timezone.is_naive(ts):
+        ts = timezone.make_aware(ts, timezone.get_default_timezone())
+    return ts
+
+
+def _param(params, *names):
+    for name in names:
+        value = params.get(name)
+        if value:
+            return name, value
+    return None, None
+
+
+def filter_timestamp_range(queryset, params, field: str = 'timestamp'):
+    """Limit `queryset` to start <= field <= end from the request's query params."""
+    name, value = _param(params, 'start', 'start_date')
+    if value:
+        queryset = queryset.filter(**{f'{field}__gte': parse_query_timestamp(value, name)})
+    name, value = _param(params, 'end', 'end_date')
+    if value:
+        queryset = queryset.filter(**{f'{field}__lte': parse_query_timestamp(value, name, end_of_day=True)})
+    return queryset
@@ -2,41 +2,34 @@ import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
 import logging
-import joblib
-import torch
-import tempfile
-from django.core.files.base import ContentFile
+from core.services.resample import resample, to_epoch_ns
+from core.services.inference import get_runtime
+from core.services.batching import get_cnn_lstm_batcher
+from core.services import feature_store
 
 logger = logging.getLogger(__name__)
 
-# Check dependencies
-try:
-    import torch
-    TORCH_AVAILABLE = True
-except ImportError:
-    TORCH_AVAILABLE = False
-
-try:
-    import lightgbm as lgb
-    LIGHTGBM_AVAILABLE = True
-except ImportError:
-    LIGHTGBM_AVAILABLE = False
-
 class GlucosePredictionService:
     def __init__(self):
         self.loaded = False
+        self.runtime = None
         self.cnn_lstm_model = None
         self.lgb_model = None
-        self.scaler = None
         self.feature_order = None
         
-        # Model paths - adjust these to your actual model file locations
-        self.cnn_lstm_path = "models/cnn_lstm_30min_win48.pt.best"
-        self.lgb_path = "models/lgb_noSteps30min.pkl"
-        self.scaler_path = "models/standard_scaler.pkl"
-        self.feature_order_path = "models/lgb_feature_order.txt"
+        # Model artifacts live in PREDICTION_MODEL_DIR (Backend/model by default)
+        model_dir = getattr(settings, 'PREDICTION_MODEL_DIR', os.path.join(settings.BASE_DIR, 'model'))
+        self.cnn_lstm_path = os.path.join(model_dir, "cnn_lstm_30min_win48.pt.best")
+        self.lgb_path = os.path.join(model_dir, "lgb_noSteps30min.pkl")
+        self.scaler_path = os.path.join(model_dir, "standard_scaler.pkl")
+        self.feature_order_path = os.path.join(model_dir, "lgb_feature_order.txt")
+        
+        # Minutes of raw history used to build the model feature window; long
+        # enough for the lag/rolling features and for IOB/COB to settle.
+        self.feature_history_minutes = getattr(settings, 'PREDICTION_FEATURE_HISTORY_MINUTES', 720)
         
         # Physiological constraints
         self.MIN_GLUCOSE = 40.0   # Near-fatal level
@@ -47,31 +40,12 @@ class GlucosePredictionService:
         self._load_models()
     
     def _load_models(self):
-        """Load all available prediction models"""
+        """Load all available prediction models into the shared runtime"""
         try:
-            # Load CNN-LSTM model if available
-            if TORCH_AVAILABLE and os.path.exists(self.cnn_lstm_path):
-                from core.services.ml_models import CNNLSTMModel
-                self.cnn_lstm_model = CNNLSTMModel(input_dim=1)
-                self.cnn_lstm_model.load_state_dict(torch.load(self.cnn_lstm_path))
-                self.cnn_lstm_model.eval()
-                logger.info("CNN-LSTM model loaded successfully")
-            
-            # Load LightGBM model if available
-            if LIGHTGBM_AVAILABLE and os.path.exists(self.lgb_path):
-                self.lgb_model = joblib.load(self.lgb_path)
-                logger.info("LightGBM model loaded successfully")
-            
-            # Load scaler if available
-            if os.path.exists(self.scaler_path):
-                self.scaler = joblib.load(self.scaler_path)
-                logger.info("Scaler loaded successfully")
-            
-            # Load feature order if available
-            if os.path.exists(self.feature_order_path):
-                with open(self.feature_order_path, 'r') as f:
-                    self.feature_order = [line.strip() for line in f.readlines()]
-                logger.info("Feature order loaded successfully")
+            self.runtime = get_runtime()
+            self.cnn_lstm_model = self.runtime.cnn_lstm_model if self.runtime.cnn_lstm_ready else None
+            self.lgb_model = self.runtime.lgb_booster
+            self.feature_order = self.runtime.feature_order
             
             self.loaded = True
             logger.info("Prediction service initialized successfully")
@@ -142,84 +116,108 @@ class GlucosePredictionService:
         return timeline
 
     def prepare_user_data(self, user, lookback_minutes=240):
-        """Prepare user data for prediction"""
+        """Prepare user data for prediction.
+
+        Returns a `ResampledSeries` on a 5-minute grid covering the lookback
+        window: nearest valid reading within +/-5 min and carbs logged within
+        +/-30 min of each slot.
+        """
         try:
-            # Get recent glucose records
             end_time = timezone.now()
             start_time = end_time - timedelta(minutes=lookback_minutes)
-            
-            glucose_records = user.glucose_records.filter(
-                timestamp__range=[start_time, end_time]
-            ).order_by('timestamp')
-            
-            if not glucose_records.exists():
+
+            glucose_rows = list(
+                user.glucose_records.filter(timestamp__range=[start_time, end_time])
+                .order_by('timestamp')
+                .values_list('timestamp', 'glucose_level')
+            )
+            if not glucose_rows:
                 raise ValueError("Not enough glucose data for prediction")
-            
+
+            glucose_ts = to_epoch_ns(row[0] for row in glucose_rows)
+            glucose_values = np.fromiter((row[1] for row in glucose_rows), dtype=float, count=len(glucose_rows))
+
             # Validate glucose readings are reasonable
-            valid_records = []
-            for record in glucose_records:
-                if self.MIN_GLUCOSE <= record.glucose_level <= self.MAX_GLUCOSE:
-                    valid_records.append(record)
-                else:
-                    logger.warning(f"Invalid glucose reading skipped: {record.glucose_level}")
-            
-            if not valid_records:
+            valid = (glucose_values >= self.MIN_GLUCOSE) & (glucose_values <= self.MAX_GLUCOSE)
+            if not valid.all():
+                logger.warning(f"Invalid glucose readings skipped: {glucose_values[~valid].tolist()}")
+            if not valid.any():
                 raise ValueError("No valid glucose readings available")
-            
-            # Get recent food entries (last 4 hours)
-            food_entries = user.food_entries.filter(
-                timestamp__range=[start_time, end_time]
-            ).order_by('timestamp')
-            
-            # Create time series data
-            data = []
-            current_time = start_time
-            
-            while current_time <= end_time:
-                # Find closest glucose reading
-                closest_glucose = None
-                min_diff = float('inf')
-                
-                for record in valid_records:
-                    time_diff = abs((record.timestamp - current_time).total_seconds())
-                    if time_diff <= 300 and time_diff < min_diff:  # 5 min window, closest match
-                        closest_glucose = record.glucose_level
-                        min_diff = time_diff
-                
-                # Find carbs from food entries in this time window
-                current_carbs = 0
-                for food in food_entries:
-                    if abs((food.timestamp - current_time).total_seconds()) <= 1800:  # 30 min window
-                        current_carbs += food.total_carbs or 0
-                
-                data.append({
-                    'timestamp': current_time,
-                    'glucose': closest_glucose,
-                    'carbs': current_carbs
-                })
-                
-                current_time += timedelta(minutes=5)  # 5-minute intervals
-            
-            return data
-            
+
+            food_rows = list(
+                user.food_entries.filter(timestamp__range=[start_time, end_time])
+                .order_by('timestamp')
+                .values_list('timestamp', 'total_carbs')
+            )
+            food_ts = to_epoch_ns(row[0] for row in food_rows)
+            food_carbs = np.fromiter((row[1] or 0 for row in food_rows), dtype=float, count=len(food_rows))
+
+            start_ns, end_ns = to_epoch_ns([start_time, end_time])
+            return resample(
+                glucose_ts[valid], glucose_values[valid],
+                food_ts, food_carbs,
+                start_ns, end_ns,
+            )
+
         except Exception as e:
             logger.error(f"Error preparing user data: {e}")
             raise
     
+    def prepare_model_window(self, user):
+        """Return the 48-step model feature window for a user.
+
+        Reads the precomputed window from the incremental feature store and
+        falls back to building it from DB rows with the same features as
+        `model/feature_utils.py`; insulin comes from the doses recorded on
+        food entries.
+        """
+        if self.feature_order == feature_store.FEATURE_ORDER:
+            try:
+                window = feature_store.get_window(user)
+                if window is not None:
+                    return window
+            except Exception as e:
+                logger.warning(f"Feature store unavailable: {e}")
+
+        end_time = timezone.now()
+        start_time = end_time - timedelta(minutes=self.feature_history_minutes)
+
+        glucose_rows = list(
+            user.glucose_records.filter(timestamp__range=[start_time, end_time])
+            .order_by('timestamp')
+            .values_list('timestamp', 'glucose_level')
+        )
+        glucose_ts = to_epoch_ns(row[0] for row in glucose_rows)
+        glucose_values = np.fromiter((row[1] for row in glucose_rows), dtype=float, count=len(glucose_rows))
+        valid = (glucose_values >= self.MIN_GLUCOSE) & (glucose_values <= self.MAX_GLUCOSE)
+        glucose_ts, glucose_values = glucose_ts[valid], glucose_values[valid]
+        if not glucose_ts.size:
+            raise ValueError("No valid glucose readings available")
+
+        food_rows = list(
+            user.food_entries.filter(timestamp__range=[start_time, end_time])
+            .order_by('timestamp')
+            .values_list('timestamp', 'total_carbs', 'insulin_rounded')
+        )
+        food_ts = to_epoch_ns(row[0] for row in food_rows)
+        food_carbs = np.fromiter((row[1] or 0 for row in food_rows), dtype=float, count=len(food_rows))
+        food_insulin = np.fromiter((row[2] or 0 for row in food_rows), dtype=float, count=len(food_rows))
+
+        return self.runtime.build_feature_window(
+            glucose_ts, glucose_values, food_ts, food_carbs, food_insulin,
+            end_ns=glucose_ts[-1], history_minutes=self.feature_history_minutes,
+        )
+
     def predict_for_user(self, user, model_type='ensemble', lookback_minutes=240):
         """Predict glucose 30 minutes ahead for a user"""
         try:
             user_data = self.prepare_user_data(user, lookback_minutes)
             
-            if not user_data:
+            if not len(user_data):
                 raise ValueError("No data available for prediction")
             
             # Get current glucose (most recent non-null value)
-            current_glucose = None
-            for data_point in reversed(user_data):
-                if data_point['glucose'] is not None:
-                    current_glucose = data_point['glucose']
-                    break
+            current_glucose = user_data.latest_glucose()
             
             if current_glucose is None:
                 raise ValueError("No recent glucose readings available")
@@ -230,23 +228,34 @@ class GlucosePredictionService:
             predictions = {}
             
             # Simple baseline prediction (average of last few readings)
-            recent_readings = [d['glucose'] for d in user_data[-6:] if d['glucose'] is not None]
-            if recent_readings:
+            recent_readings = user_data.glucose[-6:]
+            recent_readings = recent_readings[~np.isnan(recent_readings)]
+            if recent_readings.size:
                 baseline_pred = np.mean(recent_readings)
                 predictions['simple'] = self._constrain_prediction(baseline_pred)
             
+            # Feature window shared by both learned models
+            model_window = None
+            if model_type in ['cnn_lstm', 'lgb', 'ensemble'] and (
+                self.cnn_lstm_model is not None or self.lgb_model is not None
+            ):
+                try:
+                    model_window = self.prepare_model_window(user)
+                except Exception as e:
+                    logger.warning(f"Model feature window unavailable: {e}")
+            
             # CNN-LSTM prediction if available
-            if model_type in ['cnn_lstm', 'ensemble'] and self.cnn_lstm_model and TORCH_AVAILABLE:
+            if model_type in ['cnn_lstm', 'ensemble'] and self.cnn_lstm_model is not None and model_window is not None:
                 try:
-                    cnn_lstm_pred = self._predict_cnn_lstm(user_data)
+                    cnn_lstm_pred = self._predict_cnn_lstm(model_window)
                     predictions['cnn_lstm'] = self._constrain_prediction(cnn_lstm_pred)
                 except Exception as e:
                     logger.warning(f"CNN-LSTM prediction failed: {e}")
             
             # LightGBM prediction if available
-            if model_type in ['lgb', 'ensemble'] and self.lgb_model and LIGHTGBM_AVAILABLE:
+            if model_type in ['lgb', 'ensemble'] and self.lgb_model is not None and model_window is not None:
                 try:
-                    lgb_pred = self._predict_lightgbm(user_data)
+                    lgb_pred = self._predict_lightgbm(model_window)
                     predictions['lgb'] = self._constrain_prediction(lgb_pred)
                 except Exception as e:
                     logger.warning(f"LightGBM prediction failed: {e}")
@@ -295,7 +304,7 @@ class GlucosePredictionService:
                 'metadata': {
                     'model_used': model_type,
                     'available_models': list(predictions.keys()),
-                    'data_points_used': len([d for d in user_data if d['glucose'] is not None])
+                    'data_points_used': int(user_data.valid_glucose.size)
                 }
             }
             
@@ -379,19 +388,20 @@ class GlucosePredictionService:
                 'error': str(e)
             }
     
-    def _predict_cnn_lstm(self, user_data):
-        """CNN-LSTM model prediction"""
-        # This would integrate with your existing CNN_LSTM_Predict.py
-        # For now, return a simple prediction
-        recent_readings = [d['glucose'] for d in user_data[-10:] if d['glucose'] is not None]
-        return np.mean(recent_readings) if recent_readings else 120
+    def _predict_cnn_lstm(self, model_window):
+        """CNN-LSTM model prediction from an unscaled 48-step feature window.
+
+        Goes through the shared micro-batcher so concurrent requests share
+        one forward pass; falls back to a batch of one when it is disabled.
+        """
+        batcher = get_cnn_lstm_batcher()
+        if batcher is not None:
+            return batcher.predict(model_window)
+        return self.runtime.predict_cnn_lstm(model_window)
     
-    def _predict_lightgbm(self, user_data):
-        """LightGBM model prediction"""
-        # This would integrate with your existing lgb_predicts.py
-        # For now, return a simple prediction
-        recent_readings = [d['glucose'] for d in user_data[-10:] if d['glucose'] is not None]
-        return np.mean(recent_readings) if recent_readings else 120
+    def _predict_lightgbm(self, model_window):
+        """LightGBM model prediction from the latest row of the feature window"""
+        return self.runtime.predict_lightgbm(model_window)
     
     def _get_risk_message(self, risk_level, glucose):
         messages = {
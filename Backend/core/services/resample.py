@@ -0,0 +1,171 @@
+"""Vectorised resampling of glucose/food history onto a fixed time grid.
+
+The prediction service works on a regular 5-minute grid. Readings are
+aligned to each slot by nearest-neighbour search within a tolerance (or, for
+the model features, as the latest reading inside the slot) and
+carbohydrates are summed over a symmetric window around each slot. Both are
+done with sorted-array searches (`np.searchsorted`) so the cost is
+O((slots + records) log records) instead of O(slots x records).
+
+All timestamps are handled as int64 nanoseconds since the epoch (UTC).
+"""
+
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+
+NS_PER_SECOND = 1_000_000_000
+
+SLOT_SECONDS = 300
+GLUCOSE_TOLERANCE_SECONDS = 300
+CARB_WINDOW_SECONDS = 1800
+
+
+def to_epoch_ns(timestamps: Iterable) -> np.ndarray:
+    """Convert an iterable of (aware) datetimes to int64 epoch nanoseconds."""
+    timestamps = list(timestamps)
+    if not timestamps:
+        return np.empty(0, dtype=np.int64)
+    return pd.to_datetime(timestamps, utc=True).as_unit('ns').asi8.astype(np.int64, copy=False)
+
+
+def build_grid(start_ns: int, end_ns: int, step_seconds: int = SLOT_SECONDS) -> np.ndarray:
+    """Return slot timestamps start, start+step, ... up to and including end."""
+    step = int(step_seconds) * NS_PER_SECOND
+    if end_ns < start_ns:
+        return np.empty(0, dtype=np.int64)
+    count = (int(end_ns) - int(start_ns)) // step + 1
+    return int(start_ns) + np.arange(count, dtype=np.int64) * step
+
+
+def nearest_within(sample_ts: np.ndarray, sample_values: np.ndarray, grid: np.ndarray,
+                   tolerance_seconds: int = GLUCOSE_TOLERANCE_SECONDS) -> np.ndarray:
+    """Value of the closest sample to each grid point, NaN if none is within tolerance.
+
+    `sample_ts` must be sorted ascending. On equal distance the earlier sample
+    wins, and among duplicate timestamps the first one wins.
+    """
+    out = np.full(grid.shape, np.nan, dtype=float)
+    n = len(sample_ts)
+    if n == 0 or len(grid) == 0:
+        return out
+
+    idx = np.searchsorted(sample_ts, grid, side='left')
+    right = np.minimum(idx, n - 1)
+    left = np.maximum(idx - 1, 0)
+    # collapse runs of identical timestamps onto their first element
+    left = np.searchsorted(sample_ts, sample_ts[left], side='left')
+
+    d_left = np.abs(grid - sample_ts[left])
+    d_right = np.abs(sample_ts[right] - grid)
+    use_right = d_right < d_left
+    pick = np.where(use_right, right, left)
+    dist = np.where(use_right, d_right, d_left)
+
+    hit = dist <= int(tolerance_seconds) * NS_PER_SECOND
+    out[hit] = np.asarray(sample_values, dtype=float)[pick[hit]]
+    return out
+
+
+def bucket_last(sample_ts: np.ndarray, sample_values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Latest sample falling in [slot, next slot) for each slot of a regular grid, NaN if none.
+
+    `sample_ts` must be sorted ascending; among duplicate timestamps the last
+    one wins. This is the slot rule of `feature_store.FeatureAccumulator`.
+    """
+    out = np.full(grid.shape, np.nan, dtype=float)
+    if len(sample_ts) == 0 or len(grid) == 0:
+        return out
+    step = int(grid[1] - grid[0]) if len(grid) > 1 else SLOT_SECONDS * NS_PER_SECOND
+    idx = (np.asarray(sample_ts, dtype=np.int64) - int(grid[0])) // step
+    inside = (idx >= 0) & (idx < len(grid))
+    # later samples overwrite earlier ones in the same slot
+    out[idx[inside]] = np.asarray(sample_values, dtype=float)[inside]
+    return out
+
+
+def interpolate_gaps(values: np.ndarray, max_gap: int) -> np.ndarray:
+    """Linearly fill interior NaN runs of at most `max_gap` slots; longer runs stay NaN."""
+    values = np.asarray(values, dtype=float)
+    known = np.flatnonzero(~np.isnan(values))
+    if len(known) < 2:
+        return values.copy()
+    out = values.copy()
+    missing = np.flatnonzero(np.isnan(values[known[0]:known[-1]])) + known[0]
+    if len(missing):
+        # a missing slot lies between known[after - 1] and known[after]
+        after = np.searchsorted(known, missing)
+        short = known[after] - known[after - 1] - 1 <= max_gap
+        out[missing[short]] = np.interp(missing[short], known, values[known])
+    return out
+
+
+def window_sum(sample_ts: np.ndarray, sample_values: np.ndarray, grid: np.ndarray,
+               window_seconds: int = CARB_WINDOW_SECONDS) -> np.ndarray:
+    """Sum of samples within +/- window (inclusive) of each grid point."""
+    if len(sample_ts) == 0 or len(grid) == 0:
+        return np.zeros(grid.shape, dtype=float)
+    window = int(window_seconds) * NS_PER_SECOND
+    csum = np.concatenate(([0.0], np.cumsum(np.asarray(sample_values, dtype=float))))
+    lo = np.searchsorted(sample_ts, grid - window, side='left')
+    hi = np.searchsorted(sample_ts, grid + window, side='right')
+    return csum[hi] - csum[lo]
+
+
+def bucket_sum(sample_ts: np.ndarray, sample_values: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Sum of samples falling in [slot, next slot) for each slot of a regular grid."""
+    out = np.zeros(grid.shape, dtype=float)
+    if len(sample_ts) == 0 or len(grid) == 0:
+        return out
+    step = int(grid[1] - grid[0]) if len(grid) > 1 else SLOT_SECONDS * NS_PER_SECOND
+    idx = (np.asarray(sample_ts, dtype=np.int64) - int(grid[0])) // step
+    inside = (idx >= 0) & (idx < len(grid))
+    values = np.nan_to_num(np.asarray(sample_values, dtype=float))
+    return np.bincount(idx[inside], weights=values[inside], minlength=len(grid)).astype(float)
+
+
+class ResampledSeries:
+    """Columnar view of a user's history on a regular grid.
+
+    - timestamps: int64 epoch nanoseconds, one per slot
+    - glucose: float64 mg/dL, NaN where no reading was close enough
+    - carbs: float64 grams within the carb window of the slot
+    """
+
+    __slots__ = ('timestamps', 'glucose', 'carbs')
+
+    def __init__(self, timestamps: np.ndarray, glucose: np.ndarray, carbs: np.ndarray):
+        self.timestamps = timestamps
+        self.glucose = glucose
+        self.carbs = carbs
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def valid_glucose(self) -> np.ndarray:
+        """Non-missing glucose values in time order."""
+        return self.glucose[~np.isnan(self.glucose)]
+
+    def latest_glucose(self) -> Optional[float]:
+        valid = self.valid_glucose
+        return float(valid[-1]) if valid.size else None
+
+    def as_array(self) -> np.ndarray:
+        """Return a (slots, 3) float array: epoch seconds, glucose, carbs."""
+        return np.column_stack((self.timestamps / NS_PER_SECOND, self.glucose, self.carbs))
+
+
+def resample(glucose_ts: np.ndarray, glucose_values: np.ndarray,
+             food_ts: np.ndarray, food_carbs: np.ndarray,
+             start_ns: int, end_ns: int,
+             step_seconds: int = SLOT_SECONDS,
+             tolerance_seconds: int = GLUCOSE_TOLERANCE_SECONDS,
+             carb_window_seconds: int = CARB_WINDOW_SECONDS) -> ResampledSeries:
+    """Align sorted glucose and food samples onto a regular grid."""
+    grid = build_grid(start_ns, end_ns, step_seconds)
+    glucose = nearest_within(glucose_ts, glucose_values, grid, tolerance_seconds)
+    carbs = window_sum(food_ts, food_carbs, grid, carb_window_seconds)
+    return ResampledSeries(grid, glucose, carbs)
@@ -0,0 +1,279 @@
+"""Hourly / daily glucose rollups.
+
+GlucoseHourlyRollup and GlucoseDailyRollup hold count, sum, sum of squares,
+min/max and low/high counts per user per UTC hour / day, so range
+statistics, TIR, GMI, daily means and spike hours cost O(days) instead of a
+rescan of every raw reading.
+
+Maintenance is incremental: whenever readings are created, edited or
+deleted, only the touched span of hours is re-aggregated from raw rows (one
+grouped query), upserted, and the affected days are re-summed from their
+hourly rows. This keeps rollups exact under duplicates, edits and
+concurrent ingests.
+The low/high counts are tied to the user's range (`stats_thresholds`) and
+stored on each row; rows computed against an older range are refreshed on
+read. Migration 0021 builds them for the readings that existed before;
+`manage.py backfill_glucose_rollups` rebuilds them on demand.
+
+Reads split a range into raw edges (partial hours), hourly rows (partial
+days) and daily rows (whole days) -- see `collect`.
+"""
+
+import logging
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncHour
+
+from .glucose_stats import (
+    GlucoseSummary, stats_thresholds, summarize_queryset, summary_aggregates, summary_from_row,
+)
+
+logger = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# One piece of a range: `start` is the UTC hour (or day) it covers and
+# `high_by_hour` the per-hour high counts of a daily piece (None otherwise).
+Piece = namedtuple('Piece', ['start', 'summary', 'high_by_hour'])
+
+
+def floor_hour(ts: datetime) -> datetime:
+    return ts.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(ts: datetime) -> datetime:
+    floored = floor_hour(ts)
+    return floored if floored == ts else floored + HOUR
+
+
+def floor_day(ts: datetime) -> datetime:
+    return floor_hour(ts).replace(hour=0)
+
+
+def ceil_day(ts: datetime) -> datetime:
+    floored = floor_day(ts)
+    return floored if floored == ts else floored + DAY
+
+
+def _row_summary(row) -> GlucoseSummary:
+    return GlucoseSummary(
+        count=row.count, total=row.total, sumsq=row.sumsq, minimum=row.minimum,
+        maximum=row.maximum, below=row.low_count, above=row.high_count,
+    )
+
+
+# -- maintenance -------------------------------------------------------
+
+SUMMARY_FIELDS = ['count', 'total', 'sumsq', 'minimum', 'maximum', 'low_count', 'high_count',
+                  'low_threshold', 'high_threshold']
+HOURLY_FIELDS = SUMMARY_FIELDS + ['updated_at']
+DAILY_FIELDS = SUMMARY_FIELDS + ['high_by_hour']
+
+
+def refresh_range(user, start: datetime, end: datetime):
+    """Recompute every hourly rollup in [floor_hour(start), floor_hour(end)] and the days they touch.
+
+    Rows are upserted, so concurrent refreshes of the same hour never collide
+    on the unique constraints; hours and days left without readings are
+    deleted. The day re-sum locks the day's hourly rows, so of two refreshes
+    touching one day the later one sees the other's hours.
+    """
+    from ..models import GlucoseDailyRollup, GlucoseHourlyRollup, GlucoseRecord
+
+    first, last = floor_hour(start), floor_hour(end) + HOUR
+    low, high = stats_thresholds(user)
+    rows = (
+        GlucoseRecord.objects.filter(user=user, timestamp__gte=first, timestamp__lt=last)
+        .annotate(bucket=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .values('bucket')
+        .annotate(**summary_aggregates(low, high))
+    )
+    hourly = []
+    for row in rows:
+        s = summary_from_row(row)
+        hourly.append(GlucoseHourlyRollup(
+            user=user, bucket=row['bucket'], count=s.count, total=s.total, sumsq=s.sumsq,
+            minimum=s.minimum, maximum=s.maximum, low_count=s.below, high_count=s.above,
+            low_threshold=low, high_threshold=high,
+        ))
+
+    day_first, day_last = floor_day(first), floor_day(last - HOUR) + DAY
+    with transaction.atomic():
+        GlucoseHourlyRollup.objects.bulk_create(
+            hourly, batch_size=500, update_conflicts=True,
+            unique_fields=['user', 'bucket'], update_fields=HOURLY_FIELDS,
+        )
+        # a create never empties an hour; only edits and deletes leave some behind
+        if len(hourly) < (last - first) // HOUR:
+            (GlucoseHourlyRollup.objects.filter(user=user, bucket__gte=first, bucket__lt=last)
+             .exclude(bucket__in=[h.bucket for h in hourly]).delete())
+
+        days = defaultdict(lambda: [GlucoseSummary(), [0] * 24, None])
+        hour_rows = GlucoseHourlyRollup.objects.select_for_update().filter(
+            user=user, bucket__gte=day_first, bucket__lt=day_last)
+        for row in hour_rows:
+            entry = days[row.bucket.date()]
+            entry[0] = entry[0] + _row_summary(row)
+            entry[1][row.bucket.hour] += row.high_count
+            # a day mixes thresholds only while its other hours await a refresh
+            if (row.low_threshold, row.high_threshold) != (low, high):
+                entry[2] = (row.low_threshold, row.high_threshold)
+        daily = [
+            GlucoseDailyRollup(
+                user=user, day=day, count=s.count, total=s.total, sumsq=s.sumsq,
+                minimum=s.minimum, maximum=s.maximum, low_count=s.below, high_count=s.above,
+                high_by_hour=by_hour,
+                low_threshold=(stale or (low, high))[0], high_threshold=(stale or (low, high))[1],
+            )
+            for day, (s, by_hour, stale) in days.items()
+        ]
+        GlucoseDailyRollup.objects.bulk_create(
+            daily, batch_size=500, update_conflicts=True,
+            unique_fields=['user', 'day'], update_fields=DAILY_FIELDS,
+        )
+        if len(daily) < (day_last - day_first) // DAY:
+            (GlucoseDailyRollup.objects.filter(user=user, day__gte=day_first.date(), day__lt=day_last.date())
+             .exclude(day__in=list(days)).delete())
+
+
+def refresh_timestamps(user, timestamps: Iterable[datetime]):
+    """Refresh the span of hours covering `timestamps` for one user; never raises."""
+    timestamps = list(timestamps)
+    if not timestamps:
+        return
+    try:
+        refresh_range(user, min(timestamps), max(timestamps))
+    except Exception:
+        logger.exception(f"Glucose rollup refresh failed for user {user.pk}")
+
+
+def record_glucose(records: Iterable):
+    """Refresh rollups for created, edited or deleted GlucoseRecords (any users)."""
+    by_user = defaultdict(list)
+    users = {}
+    for r in records:
+        by_user[r.user_id].append(r.timestamp)
+        users.setdefault(r.user_id, r.user)
+    for user_id, timestamps in by_user.items():
+        refresh_timestamps(users[user_id], timestamps)
+
+
+def backfill(user, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """Rebuild all rollups for a user (optionally limited to a range); returns hours written."""
+    from ..models import GlucoseHourlyRollup, GlucoseRecord
+
+    qs = GlucoseRecord.objects.filter(user=user)
+    if start is not None:
+        qs = qs.filter(timestamp__gte=start)
+    if end is not None:
+        qs = qs.filter(timestamp__lte=end)
+    first = qs.order_by('timestamp').values_list('timestamp', flat=True).first()
+    last = qs.order_by('-timestamp').values_list('timestamp', flat=True).first()
+    if first is None:
+        return 0
+    # chunk by month so one refresh never holds a huge transaction
+    cursor = floor_day(first)
+    while cursor <= last:
+        chunk_end = min(cursor + 30 * DAY - HOUR, floor_hour(last))
+        refresh_range(user, cursor, chunk_end)
+        cursor = chunk_end + HOUR
+    return GlucoseHourlyRollup.objects.filter(user=user, bucket__gte=floor_hour(first),
+                                              bucket__lte=floor_hour(last)).count()
+
+
+# -- reads -------------------------------------------------------------
+
+def _raw_piece(user, start, end, inclusive_end, low, high) -> Optional[Piece]:
+    from ..models import GlucoseRecord
+    qs = GlucoseRecord.objects.filter(user=user, timestamp__gte=start)
+    qs = qs.filter(timestamp__lte=end) if inclusive_end else qs.filter(timestamp__lt=end)
+    s = summarize_queryset(qs, low, high)
+    return Piece(floor_hour(start), s, None) if s.count else None
+
+
+def _fetch_rows(user, h0, h1):
+    """Hourly/daily rows covering [h0, h1) (both hour-aligned)."""
+    from ..models import GlucoseDailyRollup, GlucoseHourlyRollup
+
+    d0, d1 = ceil_day(h0), floor_day(h1)
+    if d0 < d1:
+        daily = list(GlucoseDailyRollup.objects.filter(user=user, day__gte=d0.date(), day__lt=d1.date()))
+        hour_filter = Q(bucket__gte=h0, bucket__lt=d0) | Q(bucket__gte=d1, bucket__lt=h1)
+    else:
+        daily = []
+        hour_filter = Q(bucket__gte=h0, bucket__lt=h1)
+    hourly = list(GlucoseHourlyRollup.objects.filter(hour_filter, user=user))
+    return hourly, daily
+
+
+def collect(user, start: datetime, end: datetime, low: Optional[float] = None,
+            high: Optional[float] = None) -> List[Piece]:
+    """Pieces exactly covering readings with start <= timestamp <= end, in time order."""
+    current = stats_thresholds(user)
+    if low is None or high is None:
+        low, high = current
+    h0, h1 = ceil_hour(start), floor_hour(end)
+    if h0 > h1:
+        piece = _raw_piece(user, start, end, True, low, high)
+        return [piece] if piece else []
+
+    pieces = []
+    if start < h0:
+        pieces.append(_raw_piece(user, start, h0, False, low, high))
+    if h0 < h1:
+        if (low, high) != current:
+            # rollups only hold counts for the user's own range
+            pieces.append(_raw_piece(user, h0, h1, False, low, high))
+        else:
+            hourly, daily = _fetch_rows(user, h0, h1)
+            if any((r.low_threshold, r.high_threshold) != current for r in hourly + daily):
+                refresh_range(user, h0, h1 - HOUR)
+                hourly, daily = _fetch_rows(user, h0, h1)
+            pieces.extend(Piece(r.bucket, _row_summary(r), None) for r in hourly)
+            pieces.extend(
+                Piece(datetime(r.day.year, r.day.month, r.day.day, tzinfo=dt_timezone.utc),
+                      _row_summary(r), r.high_by_hour)
+                for r in daily
+            )
+    pieces.append(_raw_piece(user, h1, end, True, low, high))
+    return sorted((p for p in pieces if p is not None), key=lambda p: p.start)
+
+
+def combine(pieces: List[Piece]) -> GlucoseSummary:
+    total = GlucoseSummary()
+    for piece in pieces:
+        total = total + piece.summary
+    return total
+
+
+def summary(user, start: datetime, end: datetime, low: Optional[float] = None,
+            high: Optional[float] = None) -> GlucoseSummary:
+    """Rollup-backed equivalent of glucose_stats.summarize."""
+    return combine(collect(user, start, end, low, high))
+
+
+def daily_summaries(pieces: List[Piece]) -> dict:
+    """{UTC date: GlucoseSummary} for the days covered by `pieces`."""
+    days = defaultdict(GlucoseSummary)
+    for piece in pieces:
+        day = piece.start.date()
+        days[day] = days[day] + piece.summary
+    return dict(sorted(days.items()))
+
+
+def highs_by_hour(pieces: List[Piece]) -> List[int]:
+    """High-reading counts per UTC hour of day (0-23) over `pieces`."""
+    counts = [0] * 24
+    for piece in pieces:
+        if piece.high_by_hour is not None:
+            for hour, n in enumerate(piece.high_by_hour):
+                counts[hour] += n
+        else:
+            counts[piece.start.hour] += piece.summary.above
+    return counts
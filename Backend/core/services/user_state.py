@@ -0,0 +1,340 @@
+"""Per-user hot state: latest reading, glucose thresholds and dosing parameters.
+
+Food entries, insulin doses, alert evaluation and `GlucoseRecord.is_abnormal`
+all need some of these values. Reading them costs a latest-reading query
+and, when the caller holds a GlucoseRecord rather than the user, a user
+fetch. `get_state(user)` serves them from a small cache entry per user:
+
+- latest glucose level, timestamp and trend arrow;
+- `target_glucose_min/max` as effective (low, high) thresholds;
+- `insulin_to_carb_ratio` and `correction_factor`.
+
+On a miss the profile part is built from the user, which is fetched only
+when the caller passes an id. The latest reading is loaded with one query
+the first time it is asked for, so threshold-only callers such as alert
+evaluation never pay for it. After that the entry is kept current without
+re-reading:
+
+- write-through: `record_glucose(records)` moves the latest reading
+  forward when a newer one is created, once the transaction that saved it
+  commits. The post_save signal, Libre ingest and the offline batch path
+  call it;
+- invalidation: profile saves (post_save on the user model, which covers
+  `UserProfileView`), edits and deletes of readings, and bulk imports
+  drop the entry. The next read rebuilds it.
+
+Dosing parameters decide an insulin dose, so they are only served from a
+shared cache, where a profile save in one worker invalidates the entry for
+every worker. With a per-process cache `dosing()` reads them from the user
+instance the caller holds, or with one query.
+
+Backends (USER_STATE_CACHE_BACKEND):
+- 'memory' (default): per-process dict with a USER_STATE_CACHE_TTL
+  expiry, for development and single-process deployments. Writes in one
+  process are not seen by another, so the TTL bounds staleness.
+- 'django': the Django cache named by USER_STATE_CACHE_ALIAS (e.g. Redis),
+  shared by every worker unless that cache is itself a LocMemCache.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'user-hot-state'
+
+
+@dataclass
+class HotState:
+    low: float
+    high: float
+    carb_ratio: Optional[float] = None
+    correction_factor: Optional[float] = None
+    latest_loaded: bool = False
+    latest_glucose: Optional[float] = None
+    latest_timestamp: Optional[datetime] = None
+    latest_trend: Optional[str] = None
+
+    @property
+    def thresholds(self) -> Tuple[float, float]:
+        return self.low, self.high
+
+    @property
+    def dosing(self) -> Tuple[Optional[float], Optional[float]]:
+        return self.carb_ratio, self.correction_factor
+
+
+class BaseUserStateCache:
+    # whether every worker sees the same entries (and the same invalidations)
+    shared = False
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = float(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _load(self, user_id: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def _store(self, user_id: int, state: dict):
+        raise NotImplementedError
+
+    def _drop(self, user_id: int):
+        raise NotImplementedError
+
+    def get(self, user_id: int) -> Optional[HotState]:
+        try:
+            data = self._load(user_id)
+        except Exception as e:
+            logger.warning(f"User state cache read failed: {e}")
+            data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return HotState(**data)
+
+    def peek(self, user_id: int) -> Optional[HotState]:
+        """Like get() without touching the hit/miss counters (for write-through)."""
+        try:
+            data = self._load(user_id)
+        except Exception:
+            return None
+        return HotState(**data) if data is not None else None
+
+    def set(self, user_id: int, state: HotState, write_through: bool = False):
+        try:
+            self._store(user_id, asdict(state))
+        except Exception as e:
+            logger.warning(f"User state cache write failed: {e}")
+            return
+        if write_through:
+            with self._lock:
+                self.writes += 1
+
+    def invalidate(self, user_id: int):
+        try:
+            self._drop(user_id)
+        except Exception as e:
+            logger.warning(f"User state cache invalidation failed: {e}")
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'writes': self.writes,
+            'invalidations': self.invalidations,
+            'ttl_seconds': self.ttl,
+        }
+
+
+class MemoryUserStateCache(BaseUserStateCache):
+    """Per-process dict with TTL; the least recently used user is evicted when full."""
+
+    def __init__(self, ttl: float = 300, max_entries: int = 10000):
+        super().__init__(ttl)
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+
+    def _load(self, user_id):
+        with self._lock:
+            item = self._entries.get(user_id)
+            if item is None:
+                return None
+            expires_at, data = item
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return dict(data)
+
+    def _store(self, user_id, state):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, state)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _drop(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {**super().stats(), 'entries': len(self._entries), 'max_entries': self.max_entries}
+
+
+class DjangoUserStateCache(BaseUserStateCache):
+    """Shared across workers through a configured Django cache."""
+
+    def __init__(self, ttl: float = 300, alias: str = 'default'):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @property
+    def shared(self) -> bool:
+        from django.core.cache.backends.locmem import LocMemCache
+        return not isinstance(self._cache, LocMemCache)
+
+    def _load(self, user_id):
+        return self._cache.get(f"{KEY_PREFIX}:{user_id}")
+
+    def _store(self, user_id, state):
+        self._cache.set(f"{KEY_PREFIX}:{user_id}", state, timeout=self.ttl)
+
+    def _drop(self, user_id):
+        self._cache.delete(f"{KEY_PREFIX}:{user_id}")
+
+
+BACKENDS = {
+    'memory': MemoryUserStateCache,
+    'django': DjangoUserStateCache,
+}
+
+_cache: Optional[BaseUserStateCache] = None
+_cache_key = None
+_cache_lock = threading.Lock()
+
+
+def get_user_state_cache() -> BaseUserStateCache:
+    """Process-wide hot-state cache for the configured backend."""
+    global _cache, _cache_key
+    kind = getattr(settings, 'USER_STATE_CACHE_BACKEND', 'memory')
+    ttl = getattr(settings, 'USER_STATE_CACHE_TTL', 300)
+    max_entries = getattr(settings, 'USER_STATE_CACHE_MAX_ENTRIES', 10000)
+    alias = getattr(settings, 'USER_STATE_CACHE_ALIAS', 'default')
+    key = (kind, ttl, max_entries, alias)
+    if _cache is None or _cache_key != key:
+        with _cache_lock:
+            if _cache is None or _cache_key != key:
+                cls = BACKENDS.get(kind) or import_string(kind)
+                if cls is MemoryUserStateCache:
+                    _cache = cls(ttl=ttl, max_entries=max_entries)
+                elif cls is DjangoUserStateCache:
+                    _cache = cls(ttl=ttl, alias=alias)
+                else:
+                    _cache = cls(ttl=ttl)
+                _cache_key = key
+    return _cache
+
+
+def user_state_stats() -> dict:
+    return get_user_state_cache().stats()
+
+
+def _user_id(user) -> int:
+    return user if isinstance(user, int) else user.pk
+
+
+def _load_profile(user) -> HotState:
+    from django.contrib.auth import get_user_model
+
+    from ..models import _user_glucose_thresholds
+
+    if isinstance(user, int):
+        user = get_user_model().objects.get(pk=user)
+    low, high = _user_glucose_thresholds(user)
+    return HotState(
+        low=low, high=high,
+        carb_ratio=getattr(user, 'insulin_to_carb_ratio', None),
+        correction_factor=getattr(user, 'correction_factor', None),
+    )
+
+
+def _load_latest(user_id: int, state: HotState):
+    from ..models import GlucoseRecord
+
+    latest = (GlucoseRecord.objects.filter(user_id=user_id).order_by('-timestamp')
+              .values_list('glucose_level', 'timestamp', 'trend_arrow').first())
+    state.latest_loaded = True
+    if latest is not None:
+        state.latest_glucose, state.latest_timestamp, state.latest_trend = latest
+
+
+def get_state(user, with_latest: bool = False) -> HotState:
+    """Hot state for a user instance or id; the missing parts are loaded and cached."""
+    cache = get_user_state_cache()
+    user_id = _user_id(user)
+    state = cache.get(user_id)
+    changed = state is None
+    if state is None:
+        state = _load_profile(user)
+    if with_latest and not state.latest_loaded:
+        _load_latest(user_id, state)
+        changed = True
+    if changed:
+        cache.set(user_id, state)
+    return state
+
+
+def latest_glucose(user) -> Optional[float]:
+    return get_state(user, with_latest=True).latest_glucose
+
+
+def thresholds(user) -> Tuple[float, float]:
+    return get_state(user).thresholds
+
+
+def dosing(user) -> Tuple[Optional[float], Optional[float]]:
+    """(insulin_to_carb_ratio, correction_factor); cached only when the cache is shared."""
+    if get_user_state_cache().shared:
+        return get_state(user).dosing
+    if not isinstance(user, int):
+        return getattr(user, 'insulin_to_carb_ratio', None), getattr(user, 'correction_factor', None)
+    from django.contrib.auth import get_user_model
+    return get_user_model().objects.values_list('insulin_to_carb_ratio', 'correction_factor').get(pk=user)
+
+
+def record_glucose(records: Iterable):
+    """Write-through for newly created GlucoseRecords (any users), applied once they are committed."""
+    newest = {}
+    for r in records:
+        if r.user_id not in newest or r.timestamp > newest[r.user_id].timestamp:
+            newest[r.user_id] = r
+    if newest:
+        transaction.on_commit(lambda: _advance_latest(newest))
+
+
+def _advance_latest(newest: dict):
+    """Advance the cached latest reading of each user to `newest[user_id]` if it is newer."""
+    cache = get_user_state_cache()
+    for user_id, record in newest.items():
+        state = cache.peek(user_id)
+        if state is None or not state.latest_loaded:
+            continue  # the next read that needs it loads it
+        if state.latest_timestamp is not None and record.timestamp < state.latest_timestamp:
+            continue
+        state.latest_glucose = float(record.glucose_level)
+        state.latest_timestamp = record.timestamp
+        state.latest_trend = record.trend_arrow
+        cache.set(user_id, state, write_through=True)
+
+
+def invalidate(user):
+    get_user_state_cache().invalidate(_user_id(user))
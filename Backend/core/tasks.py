@@ -1,43 +1,56 @@
 from celery import shared_task
 import logging
-from typing import Dict, Any, List
-from .models import GlucoseRecord, LibreConnection
-from django.utils.dateparse import parse_datetime
-from django.utils import timezone
-from django.contrib/auth import get_user_model
-from .services.libre import get_libreview_connection
+from .models import Alert, LibreConnection
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def sync_libre_for_user(user_id: int, include_history: bool = True):
+    from .services.libre_scheduler import plan_next
+    from .services.libre_sync import sync_connections
+
+    # never log a disconnected user back in
+    conns = LibreConnection.objects.filter(user_id=user_id, connected=True)
+    if not conns.exists():
+        return {'error': 'no connection'}
+    report = sync_connections(conns, include_history=include_history, concurrency=1, on_result=plan_next)
+    if report.statuses.get('ok') != 1:
+        conn = conns.first()
+        return {'error': conn.last_sync_status, 'detail': conn.last_sync_error}
+    return {'fetched': report.fetched, 'created': report.created}
+
+
+@shared_task
+def sync_all_libre(include_history: bool = True):
+    from .services.libre_sync import sync_all
+    report = sync_all(include_history=include_history)
+    return report.as_dict() if report is not None else {'skipped': 'already running'}
+
+
+@shared_task
+def sync_due_libre(include_history: bool = True):
+    from .services.libre_scheduler import sync_due
+    report = sync_due(include_history=include_history)
+    return report.as_dict() if report is not None else {'skipped': 'already running'}
+
+
+@shared_task
+def deliver_alert(alert_id: str):
+    from .services.alert_delivery import SyncAlertQueue
+    alert = Alert.objects.filter(pk=alert_id).first()
+    if alert is None:
+        return {'error': 'alert not found'}
+    return {'delivered': SyncAlertQueue().enqueue(alert)}
+
+
+@shared_task
+def run_analysis_job(job_id: str):
+    from .services.analysis_jobs import run_job
+    return {'status': run_job(job_id)}
+
 
 @shared_task
-def sync_libre_for_user(user_id: int):
-    from django.db import transaction
-    User = get_user_model()
-    user = User.objects.get(pk=user_id)
-
-    conn = LibreConnection.objects.filter(user=user, token__isnull = False, api_endpoint__isnull=False).first()
-    if not conn:
-        return {'error':'no connection'}
-
-    payload = get_libreview_connections(conn.api_endpoint, conn.token, conn.account_id)
-    data = payload.get('data') or []
-    created = 0
-    for item in data:
-        gm = (item or {}).get("glucoseMeasurements") or {}
-        value = gm.get("values") 
-        ts_str = gm.get("Timestamp") or gm.get("timestamp")
-        if value is None or not ts_str:
-            continue
-        ts = parse_datetime(ts_str)
-        if ts is None:
-            continue
-
-        GlucoseRecord.objects.create(
-            user=user,
-            timestamp=ts,
-            glucose_level=value,
-            source='libre_webhook',
-            trend_arrow= None,
-        )
-        creates +=1
-
-    return {'created': created}
-   
\ No newline at end of file
+def reap_analysis_jobs():
+    from .services.analysis_jobs import reap_stale_jobs
+    return {'failed': reap_stale_jobs()}
@@ -0,0 +1,113 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .models import Alert, GlucoseRecord
+from .services.alert_delivery import ThreadAlertQueue
+from .services.alerts import AlertEngine, evaluate_records
+
+
+class RecordingBackend:
+    delivered = []
+
+    def deliver(self, alert):
+        RecordingBackend.delivered.append(alert.alert_type)
+        return True
+
+
+@override_settings(ALERT_DELIVERY_QUEUE='sync', ALERT_DELIVERY_BACKEND='core.tests_alerts.RecordingBackend')
+class AlertEngineTests(TestCase):
+    def setUp(self):
+        RecordingBackend.delivered = []
+        User = get_user_model()
+        self.user = User.objects.create_user(username='alerts', password='pass123')
+        self.other = User.objects.create_user(username='alerts2', password='pass123')
+        self.now = timezone.now()
+
+    def _records(self, user, levels):
+        return [
+            GlucoseRecord(user=user, timestamp=self.now - timedelta(minutes=5 * (len(levels) - i)), glucose_level=v)
+            for i, v in enumerate(levels)
+        ]
+
+    def test_batch_queries_are_constant(self):
+        records = self._records(self.user, [55, 60, 250, 120] * 50) + self._records(self.other, [300] * 100)
+        with self.assertNumQueries(4), self.captureOnCommitCallbacks(execute=True):
+            # savepoint, one last-alert query, one bulk insert for 300 readings / 2 users, release
+            alerts = evaluate_records(records)
+        self.assertEqual(sorted((a.user_id, a.alert_type) for a in alerts), sorted([
+            (self.user.id, 'low_glucose'), (self.user.id, 'high_glucose'), (self.other.id, 'high_glucose'),
+        ]))
+        self.assertEqual(sorted(RecordingBackend.delivered), ['high_glucose', 'high_glucose', 'low_glucose'])
+
+    def test_message_uses_latest_reading_and_dedupes(self):
+        alerts = evaluate_records(self._records(self.user, [50, 60]))
+        self.assertEqual(alerts[0].message, 'Low glucose 60 mg/dl')
+        self.assertEqual(evaluate_records(self._records(self.user, [40])), [])
+
+        Alert.objects.update(timestamp=self.now - timedelta(minutes=20))
+        self.assertEqual(len(evaluate_records(self._records(self.user, [40]))), 1)
+
+    def test_in_range_batch_does_no_queries(self):
+        records = self._records(self.user, [100, 110, 120])
+        with self.assertNumQueries(0):
+            self.assertEqual(AlertEngine().evaluate(records), [])
+
+    def test_user_thresholds_respected(self):
+        self.user.target_glucose_min = 90
+        self.user.target_glucose_max = 140
+        self.user.save()
+        alerts = evaluate_records(self._records(self.user, [85, 150]))
+        self.assertEqual(sorted(a.alert_type for a in alerts), ['high_glucose', 'low_glucose'])
+
+    def test_delivery_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            alerts = evaluate_records(self._records(self.user, [50]))
+            self.assertEqual(RecordingBackend.delivered, [])
+        self.assertEqual(len(alerts), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(RecordingBackend.delivered, ['low_glucose'])
+
+    def test_failure_leaves_callers_transaction_usable(self):
+        with mock.patch.object(AlertEngine, 'last_alerts', side_effect=DatabaseError('boom')):
+            with transaction.atomic():
+                self.assertEqual(evaluate_records(self._records(self.user, [50])), [])
+                # the caller's transaction is still usable after the failure
+                GlucoseRecord.objects.create(user=self.user, timestamp=self.now, glucose_level=100)
+        self.assertTrue(GlucoseRecord.objects.filter(user=self.user, glucose_level=100).exists())
+
+    def test_single_save_still_alerts(self):
+        GlucoseRecord.objects.create(user=self.user, timestamp=self.now, glucose_level=45)
+        GlucoseRecord.objects.create(user=self.user, timestamp=self.now + timedelta(minutes=1), glucose_level=44)
+        self.assertEqual(Alert.objects.filter(user=self.user, alert_type='low_glucose').count(), 1)
+
+
+class SlowBackend:
+    def __init__(self):
+        self.release = threading.Event()
+        self.delivered = 0
+
+    def deliver(self, alert):
+        self.release.wait(5)
+        self.delivered += 1
+        return True
+
+
+class ThreadAlertQueueTests(SimpleTestCase):
+    def test_slow_provider_does_not_block_and_overflow_is_dropped(self):
+        backend = SlowBackend()
+        q = ThreadAlertQueue(backend=backend, maxsize=2)
+        alerts = [Alert(alert_type='low_glucose', message='m') for _ in range(5)]
+        results = [q.enqueue(a) for a in alerts]
+        # one in flight on the worker (maybe), two queued, the rest dropped
+        self.assertGreaterEqual(results.count(False), 2)
+        backend.release.set()
+        q.join()
+        self.assertEqual(backend.delivered, results.count(True))
+        self.assertEqual(q.stats()['dropped'], results.count(False))
@@ -0,0 +1,136 @@
+from io import BytesIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .models import FoodEntry
+from .services import analysis_cache
+from .services.analysis_cache import MemoryAnalysisCache, analysis_key
+from .services.openai_service import OpenAIServiceError, analyze_image
+
+RESULT = {
+    'name': 'rice bowl',
+    'components': [{'name': 'rice', 'carbs_g': 45.0}],
+    'total_carbs_g': 45.0,
+    'confidence': 0.8,
+    'calories_estimate': 400.0,
+    'total_protein_g': 10.0,
+    'total_fat_g': 5.0,
+}
+
+
+def _png(compress_level=6, size=(64, 48)):
+    img = Image.new('RGB', size)
+    img.putdata([((x * 7) % 256, (y * 5) % 256, (x + y) % 256) for y in range(size[1]) for x in range(size[0])])
+    out = BytesIO()
+    img.save(out, format='PNG', compress_level=compress_level)
+    return out.getvalue()
+
+
+class MemoryAnalysisCacheTests(SimpleTestCase):
+    def test_lru_eviction_is_size_bounded(self):
+        cache = MemoryAnalysisCache(ttl=60, max_entries=2)
+        cache.set('a', {'v': 1})
+        cache.set('b', {'v': 2})
+        self.assertEqual(cache.get('a'), {'v': 1})  # 'b' is now least recently used
+        cache.set('c', {'v': 3})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'v': 1})
+        self.assertEqual(cache.get('c'), {'v': 3})
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (2, 1))
+        self.assertEqual((stats['hits'], stats['misses']), (3, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = MemoryAnalysisCache(ttl=10, max_entries=5)
+        with patch('core.services.analysis_cache.time.monotonic', return_value=100.0):
+            cache.set('a', {'v': 1}, cost=2.5)
+        with patch('core.services.analysis_cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get('a'), {'v': 1})
+        with patch('core.services.analysis_cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get('a'))
+        stats = cache.stats()
+        self.assertEqual((stats['expired'], stats['entries']), (1, 0))
+        self.assertEqual(stats['saved_seconds'], 2.5)
+
+    def test_returned_results_are_copies(self):
+        cache = MemoryAnalysisCache()
+        cache.set('a', RESULT)
+        cache.get('a')['components'].clear()
+        self.assertEqual(len(cache.get('a')['components']), 1)
+
+    def test_key_depends_on_model_and_prompt_version(self):
+        keys = {
+            analysis_key(b'img', 'm1', 'v1'), analysis_key(b'img', 'm2', 'v1'),
+            analysis_key(b'img', 'm1', 'v2'), analysis_key(b'other', 'm1', 'v1'),
+        }
+        self.assertEqual(len(keys), 4)
+
+
+@override_settings(OPENAI_IMAGE_CACHE_ENABLED=True, OPENAI_IMAGE_CACHE_BACKEND='memory',
+                   OPENAI_VISION_MODEL='vision-test')
+class AnalyzeImageCacheTests(TestCase):
+    def setUp(self):
+        analysis_cache._cache = None
+        patcher = patch('core.services.openai_service._request_analysis', return_value=RESULT)
+        self.upstream = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeat_upload_served_from_cache(self):
+        image = _png()
+        first = analyze_image(image, user_id=1)
+        with patch('core.services.openai_service._normalize_image') as normalize:
+            second = analyze_image(image, user_id=2)
+        self.assertEqual(first, second)
+        self.assertEqual(self.upstream.call_count, 1)
+        normalize.assert_not_called()  # exact re-upload skips PIL
+        stats = analysis_cache.analysis_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_reencoded_upload_hits_normalized_key(self):
+        analyze_image(_png(compress_level=1))
+        analyze_image(_png(compress_level=9))
+        self.assertEqual(self.upstream.call_count, 1)
+
+    def test_model_change_misses(self):
+        image = _png()
+        analyze_image(image)
+        with override_settings(OPENAI_VISION_MODEL='vision-other'):
+            analyze_image(image)
+        self.assertEqual(self.upstream.call_count, 2)
+
+    def test_use_cache_false_and_errors_are_not_cached(self):
+        image = _png()
+        analyze_image(image)
+        analyze_image(image, use_cache=False)
+        self.assertEqual(self.upstream.call_count, 2)
+
+        self.upstream.side_effect = OpenAIServiceError('model_returned_invalid_json')
+        other = _png(size=(32, 32))
+        for _ in range(2):
+            with self.assertRaises(OpenAIServiceError):
+                analyze_image(other)
+        self.assertEqual(self.upstream.call_count, 4)
+
+    def test_analyze_food_and_view_share_cache(self):
+        user = get_user_model().objects.create_user(username='cache', password='x')
+        image = _png()
+        entry = FoodEntry.objects.create(user=user, meal_type='lunch')
+        entry.analyze_food(image_file=BytesIO(image))
+        entry.refresh_from_db()
+        self.assertEqual(entry.food_name, 'rice bowl')
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        upload = BytesIO(image)
+        upload.name = 'meal.png'
+        resp = client.post('/glugo/v1/ai/analyze-image/', {'image': upload}, format='multipart')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['total_carbs_g'], 45.0)
+        self.assertEqual(self.upstream.call_count, 1)
+
+        stats = client.get('/glugo/v1/ai/analyze-image/').json()['cache']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
@@ -0,0 +1,146 @@
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import AnalysisJob, FoodEntry, GlucoseRecord
+from .services.analysis_jobs import CeleryAnalysisJobQueue, ThreadAnalysisJobQueue, metrics, reap_stale_jobs
+from .services.openai_service import OpenAITimeout
+from .tests_analysis_cache import RESULT
+
+URL = '/glugo/v1/ai/analyze-image/jobs/'
+
+
+def _upload(name='meal.jpg'):
+    return SimpleUploadedFile(name, b'\xff\xd8\xff' + b'0' * 256, content_type='image/jpeg')
+
+
+@override_settings(ANALYSIS_JOB_QUEUE='sync')
+class AnalysisJobApiTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='cook', password='x', insulin_to_carb_ratio=10, correction_factor=50)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _submit(self, data):
+        # the job is queued once the request's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(URL, data, format='multipart')
+        if resp.status_code != 202:
+            return resp, None
+        return resp, self.client.get(f"{URL}{resp.json()['job_id']}/").json()
+
+    @patch('core.services.analysis_jobs.analyze_image', return_value=RESULT)
+    def test_submit_returns_202_and_poll_returns_result(self, analyze):
+        with self.captureOnCommitCallbacks() as callbacks:
+            resp = self.client.post(URL, {'image': _upload()}, format='multipart')
+        self.assertEqual(resp.status_code, 202, resp.content)
+        body = resp.json()
+        self.assertEqual(body['status'], 'queued')
+        analyze.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.assertTrue(body['status_url'].endswith(f"{URL}{body['job_id']}/"))
+
+        polled = self.client.get(f"{URL}{body['job_id']}/").json()
+        self.assertEqual((polled['status'], polled['result']['name']), ('succeeded', 'rice bowl'))
+        self.assertIsNone(AnalysisJob.objects.get(pk=body['job_id']).image)  # upload dropped after the run
+        self.assertEqual(analyze.call_args.kwargs['user_id'], self.user.pk)
+
+    @patch('core.services.analysis_jobs.analyze_image', return_value=RESULT)
+    def test_result_is_stored_on_the_food_entry(self, analyze):
+        GlucoseRecord.objects.create(user=self.user, timestamp=timezone.now(), glucose_level=200)
+        entry = FoodEntry.objects.create(user=self.user, meal_type='lunch')
+        _, body = self._submit({'image': _upload(), 'food_entry': str(entry.pk)})
+        self.assertEqual(body['status'], 'succeeded')
+        entry.refresh_from_db()
+        self.assertEqual((entry.food_name, entry.nutritional_info.carbs), ('rice bowl', 45))
+        self.assertEqual(entry.insulin_rounded, 6.5)
+
+        other = get_user_model().objects.create_user(username='other', password='x')
+        foreign = FoodEntry.objects.create(user=other, meal_type='lunch')
+        resp = self.client.post(URL, {'image': _upload(), 'food_entry': str(foreign.pk)}, format='multipart')
+        self.assertEqual(resp.status_code, 404)
+
+    @patch('core.services.analysis_jobs.analyze_image', side_effect=OpenAITimeout('timeout'))
+    def test_upstream_failure_is_reported_on_the_job(self, analyze):
+        _, body = self._submit({'image': _upload()})
+        self.assertEqual((body['status'], body['error']), ('failed', 'upstream_timeout'))
+
+    def test_upload_is_validated_before_queueing(self):
+        resp = self.client.post(URL, {'image': SimpleUploadedFile('a.gif', b'GIF89a', content_type='image/gif')},
+                                format='multipart')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    @override_settings(ANALYSIS_JOB_USER_MAX_ACTIVE=1)
+    def test_per_user_cap(self):
+        AnalysisJob.objects.create(user=self.user, status=AnalysisJob.STATUS_RUNNING)
+        resp = self.client.post(URL, {'image': _upload()}, format='multipart')
+        self.assertEqual((resp.status_code, resp.json()['error']), (429, 'too_many_active_jobs'))
+
+    def test_jobs_are_private(self):
+        other = get_user_model().objects.create_user(username='other', password='x')
+        job = AnalysisJob.objects.create(user=other)
+        self.assertEqual(self.client.get(f"{URL}{job.pk}/").status_code, 404)
+
+    def test_full_queue_rejects_with_503(self):
+        with patch('core.services.analysis_jobs.SyncAnalysisJobQueue.has_room', return_value=False):
+            resp, _ = self._submit({'image': _upload()})
+        self.assertEqual((resp.status_code, resp.headers['Retry-After']), (503, '5'))
+        job = AnalysisJob.objects.get(user=self.user)
+        self.assertEqual((job.status, job.error), ('failed', 'queue_full'))
+        stats = self.client.get(URL).json()['queue']
+        self.assertEqual(stats['queue'], 'SyncAnalysisJobQueue')
+        self.assertGreaterEqual(stats['rejected_queue_full'], 1)
+
+        # filled up between the check and the commit: failed when it is handed over
+        with patch('core.services.analysis_jobs.SyncAnalysisJobQueue.enqueue', return_value=False):
+            resp, body = self._submit({'image': _upload()})
+        self.assertEqual((resp.status_code, body['status'], body['error']), (202, 'failed', 'queue_full'))
+
+    @override_settings(ANALYSIS_JOB_STALE_SECONDS=600)
+    def test_stale_jobs_are_reaped_and_not_counted(self):
+        old = timezone.now() - timedelta(minutes=11)
+        lost = [AnalysisJob.objects.create(user=self.user, status=status, image=b'x')
+                for status in (AnalysisJob.STATUS_QUEUED, AnalysisJob.STATUS_RUNNING)]
+        AnalysisJob.objects.filter(pk__in=[j.pk for j in lost]).update(created_at=old)
+        fresh = AnalysisJob.objects.create(user=self.user)
+        done = AnalysisJob.objects.create(user=self.user, status=AnalysisJob.STATUS_SUCCEEDED)
+        AnalysisJob.objects.filter(pk=done.pk).update(created_at=old)
+        self.assertEqual(CeleryAnalysisJobQueue().depth(), 1)
+
+        self.assertEqual(reap_stale_jobs(), 2)
+        for job in lost:
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.error, job.image), ('failed', 'timed_out', None))
+        self.assertEqual(AnalysisJob.objects.get(pk=fresh.pk).status, 'queued')
+        self.assertEqual(AnalysisJob.objects.get(pk=done.pk).status, 'succeeded')
+        self.assertEqual(reap_stale_jobs(), 0)
+
+
+class ThreadAnalysisJobQueueTests(SimpleTestCase):
+    def test_pool_is_bounded_and_does_not_block(self):
+        release = threading.Event()
+        ran = []
+
+        def runner(job_id):
+            release.wait(5)
+            ran.append(job_id)
+
+        q = ThreadAnalysisJobQueue(runner=runner, maxsize=2, workers=1)
+        enqueued = metrics.enqueued
+        results = [q.enqueue(i) for i in range(6)]
+        # at most one in flight on the worker and two queued; the rest are refused
+        self.assertGreaterEqual(results.count(False), 3)
+        release.set()
+        q.join()
+        self.assertEqual(sorted(ran), [i for i, ok in enumerate(results) if ok])
+        self.assertEqual(metrics.enqueued - enqueued, results.count(True))
+        self.assertEqual(q.depth(), 0)
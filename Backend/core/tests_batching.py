@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import time
+
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import AsyncClient, Client, SimpleTestCase, TransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .services.batching import MicroBatcher
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def _batcher(self, delay=0.0, **kwargs):
+        calls = []
+
+        def predict_batch(windows):
+            calls.append(len(windows))
+            time.sleep(delay)  # a forward pass takes time; requests arriving meanwhile queue up
+            return windows[:, -1, 0] * 2.0
+
+        return MicroBatcher(predict_batch, **kwargs), calls
+
+    def test_concurrent_requests_share_a_forward_pass(self):
+        batcher, calls = self._batcher(delay=0.05, max_batch_size=16, max_wait_ms=200)
+        results = {}
+        start = threading.Barrier(8)
+
+        def worker(i):
+            start.wait()
+            results[i] = batcher.predict(np.full((48, 3), float(i)))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, {i: 2.0 * i for i in range(8)})
+        self.assertLess(len(calls), 8)
+        self.assertEqual(sum(calls), 8)
+
+    def test_idle_request_runs_on_the_callers_thread(self):
+        threads = []
+        batcher = MicroBatcher(lambda w: threads.append(threading.current_thread()) or w[:, -1, 0], max_wait_ms=200)
+        self.assertEqual(batcher.predict(np.full((48, 3), 4.0)), 4.0)
+        self.assertEqual(threads, [threading.current_thread()])
+        self.assertEqual(batcher.stats()['batches'], 1)
+
+    def test_respects_max_batch_size(self):
+        batcher, calls = self._batcher(max_batch_size=3, max_wait_ms=100)
+        futures = [batcher.submit(np.full((48, 3), float(i))) for i in range(7)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [2.0 * i for i in range(7)])
+        self.assertTrue(all(n <= 3 for n in calls))
+
+    def test_errors_fan_out_to_every_caller(self):
+        def boom(windows):
+            raise RuntimeError('model failed')
+
+        batcher = MicroBatcher(boom, max_wait_ms=1)
+        with self.assertRaises(RuntimeError):
+            batcher.predict(np.zeros((48, 3)))
+
+    def test_async_callers(self):
+        batcher, calls = self._batcher(max_batch_size=8, max_wait_ms=50)
+
+        async def run():
+            return await asyncio.gather(*(batcher.predict_async(np.full((48, 3), float(i))) for i in range(4)))
+
+        self.assertEqual(asyncio.run(run()), [0.0, 2.0, 4.0, 6.0])
+        self.assertEqual(sum(calls), 4)
+
+
+class ConcurrentPredictionViewTests(TransactionTestCase):
+    """Through Django's ASGI request path: concurrent prediction requests must reach the batcher together."""
+
+    def test_asgi_requests_share_a_forward_pass(self):
+        calls = []
+
+        def predict_batch(windows):
+            calls.append(len(windows))
+            time.sleep(0.05)
+            return windows[:, -1, 0]
+
+        batcher = MicroBatcher(predict_batch, max_batch_size=16, max_wait_ms=20)
+        user = get_user_model().objects.create_user(username='asgi', password='x')
+        token = str(RefreshToken.for_user(user).access_token)
+
+        def predict_for_user(user, model_type, lookback_minutes):
+            return {'success': True, 'predicted_glucose': batcher.predict(np.full((48, 3), 120.0))}
+
+        async def run():
+            client = AsyncClient()
+            return await asyncio.gather(*(
+                client.get('/glugo/v1/glucose/predict/', headers={'Authorization': f'Bearer {token}'})
+                for _ in range(8)
+            ))
+
+        with patch('core.services.prediction.prediction_service.predict_for_user', side_effect=predict_for_user):
+            responses = asyncio.run(run())
+            self.assertEqual([r.status_code for r in responses], [200] * 8)
+            self.assertEqual(responses[0].json()['predicted_glucose'], 120.0)
+            self.assertEqual(sum(calls), 8)
+            self.assertLess(len(calls), 8)
+            # the wrapped view still serves WSGI requests
+            wsgi = Client().get('/glugo/v1/glucose/predict/', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(wsgi.status_code, 200)
@@ -0,0 +1,147 @@
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Alert, FoodEntry, GlucoseHourlyRollup, GlucoseRecord
+from .services import bulk_import, export
+
+CSV_PATH = os.path.join(settings.PREDICTION_MODEL_DIR, '37.csv')
+
+
+def head_csv(rows):
+    with open(CSV_PATH) as f:
+        return ''.join(f.readline() for _ in range(rows + 1))
+
+
+@override_settings(ALERT_DELIVERY_QUEUE='sync', ALERT_DELIVERY_BACKEND='core.tests_alerts.RecordingBackend',
+                   IMPORT_CHUNK_ROWS=250)
+class BulkImportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='importer', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _post(self, fmt, body, **data):
+        upload = SimpleUploadedFile(f'history.{fmt}', body.encode())
+        return self.client.post(f'/glugo/v1/import/{fmt}/', {'file': upload, **data}, format='multipart')
+
+    def test_csv_import_bulk_writes_and_catches_up_once(self):
+        body = head_csv(1000)
+        resp = self._post('csv', body)
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertEqual(resp.data['rows'], 1000)
+        self.assertEqual(resp.data['glucose_created'], 1000)
+        self.assertEqual(resp.data['rejected'], 0)
+        food_rows = sum(1 for line in body.splitlines()[1:] if line.split(',')[2] != '0' or line.split(',')[3] != '0')
+        self.assertEqual(resp.data['food_created'], food_rows)
+
+        first = GlucoseRecord.objects.filter(user=self.user).earliest('timestamp')
+        self.assertEqual(first.timestamp.isoformat(), '2024-01-14T00:30:00+00:00')  # naive CSV time in TIME_ZONE
+        self.assertEqual(first.source, 'libre')
+        # history is too old to page anyone; rollups are rebuilt over the span
+        self.assertFalse(Alert.objects.filter(user=self.user).exists())
+        self.assertEqual(GlucoseHourlyRollup.objects.filter(user=self.user).count(),
+                         len({r.replace(minute=0) for r in GlucoseRecord.objects.filter(
+                             user=self.user).values_list('timestamp', flat=True)}))
+
+        again = self._post('csv', body)
+        self.assertEqual((again.data['glucose_created'], again.data['food_created']), (0, 0))
+        self.assertEqual(GlucoseRecord.objects.filter(user=self.user).count(), 1000)
+
+    def test_vectorized_validation_rejects_bad_rows(self):
+        future = (timezone.localtime() + timedelta(days=2)).strftime('%Y-%m-%d %H:%M')
+        body = ('timestamp,glucose,insulin,carbs\n'
+                '2024-03-01 08:00,110,0,0\n'
+                'not a date,110,0,0\n'
+                '2024-03-01 08:10,900,0,0\n'
+                '2024-03-01 08:15,120,-1,0\n'
+                f'{future},120,0,0\n'
+                '2024-03-01 08:25,,0,0\n'
+                '2024-03-01 08:30,,2,30\n')
+        resp = self._post('csv', body)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual((resp.data['rows'], resp.data['rejected']), (7, 5))
+        self.assertEqual((resp.data['glucose_created'], resp.data['food_created']), (1, 1))
+        self.assertEqual(resp.data['errors'], [
+            'line 3: unparseable timestamp',
+            'line 6: timestamp in the future',
+            'line 4: glucose outside 20-600 mg/dL',
+            'line 5: negative insulin or carbs',
+            'line 7: no glucose, insulin or carbs',
+        ])
+
+    def test_recent_readings_raise_alerts(self):
+        now = timezone.localtime()
+        rows = [(now - timedelta(days=3), 45), (now - timedelta(minutes=10), 50)]
+        body = 'timestamp,glucose,insulin,carbs\n' + ''.join(
+            f"{ts:%Y-%m-%d %H:%M:%S},{g},0,0\n" for ts, g in rows)
+        self.assertEqual(self._post('csv', body).status_code, 201)
+        self.assertEqual(list(Alert.objects.filter(user=self.user).values_list('message', flat=True)),
+                         ['Low glucose 50 mg/dl'])
+
+    def test_only_inserted_rows_are_counted_and_alerted(self):
+        now = timezone.localtime().replace(second=0, microsecond=0)
+        stored = now - timedelta(minutes=10)
+        # already stored (an earlier import, or the live sync) without raising an alert
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=stored, glucose_level=50, source='libre')])
+        rows = [(stored, 50), (now - timedelta(minutes=5), 120), (now, 130)]
+        body = 'timestamp,glucose,insulin,carbs\n' + ''.join(
+            f"{ts:%Y-%m-%d %H:%M:%S},{g},0,0\n" for ts, g in rows)
+        real_bulk_create = GlucoseRecord.objects.bulk_create
+
+        def racing_bulk_create(records, **kwargs):
+            # a concurrent ingest stores the newest reading first
+            GlucoseRecord.objects.create(user=self.user, timestamp=now, glucose_level=130, source='libre')
+            return real_bulk_create(records, **kwargs)
+
+        with mock.patch.object(GlucoseRecord.objects, 'bulk_create', side_effect=racing_bulk_create):
+            result = bulk_import.import_history(self.user, io.StringIO(body), 'csv')
+        self.assertEqual((result.rows, result.glucose_created), (3, 1))
+        self.assertEqual(GlucoseRecord.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(Alert.objects.filter(user=self.user).exists())
+
+    def test_ndjson_round_trips_export(self):
+        self._post('csv', head_csv(600))
+        FoodEntry.objects.filter(user=self.user).update(food_name='oats', meal_type='breakfast')
+        ndjson = ''.join(export.iter_export(self.user, 'ndjson'))
+
+        other = get_user_model().objects.create_user(username='restored', password='x')
+        result = bulk_import.import_history(other, io.BytesIO(ndjson.encode()), 'ndjson', source='manual')
+        self.assertEqual(result.rejected, 0)
+        self.assertEqual(result.glucose_created, 600)
+        self.assertEqual(result.food_created, FoodEntry.objects.filter(user=self.user).count())
+        self.assertEqual(
+            list(GlucoseRecord.objects.filter(user=other).order_by('timestamp').values_list('timestamp', 'glucose_level')),
+            list(GlucoseRecord.objects.filter(user=self.user).order_by('timestamp').values_list('timestamp', 'glucose_level')),
+        )
+        self.assertEqual(set(FoodEntry.objects.filter(user=other).values_list('food_name', 'meal_type')),
+                         {('oats', 'breakfast')})
+        self.assertEqual(set(GlucoseRecord.objects.filter(user=other).values_list('source', flat=True)), {'manual'})
+
+    def test_errors_and_command(self):
+        self.assertEqual(self._post('xlsx', 'x').status_code, 404)
+        self.assertEqual(self.client.post('/glugo/v1/import/csv/', {}, format='multipart').status_code, 400)
+        self.assertEqual(self._post('csv', head_csv(5), source='fitbit').status_code, 400)
+        self.assertEqual(self._post('ndjson', '{"timestamp": oops}\n').status_code, 400)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.ndjson')
+            with open(path, 'w') as f:
+                f.write(json.dumps({'type': 'glucose', 'timestamp': '2024-03-01T08:00:00+00:00',
+                                    'glucose_level': 101}) + '\n')
+            out = io.StringIO()
+            call_command('import_history', path, user=self.user.pk, fmt='ndjson', stdout=out)
+        self.assertIn('1 glucose, 0 food, 0 rejected', out.getvalue())
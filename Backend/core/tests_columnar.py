@@ -0,0 +1,94 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import GlucoseRecord
+
+URL = '/glugo/v1/glucose-records/'
+
+
+class ColumnarGlucoseTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='charts', password='x')
+        self.end = timezone.now().replace(microsecond=0)
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.end - timedelta(minutes=i), glucose_level=100.4 + i % 7,
+                          trend_arrow=None if i % 5 == 0 else str(i % 3), source='libre' if i % 9 else 'manual')
+            for i in range(300)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _decode(self, body):
+        return [
+            (ts, g, body['trend_labels'][t], body['source_labels'][s])
+            for ts, g, t, s in zip(body['t'], body['glucose'], body['trend'], body['source'])
+        ]
+
+    def test_columns_match_records(self):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f'{URL}?format=columnar')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        body = resp.json()
+        self.assertEqual(body['count'], 300)
+        self.assertIsNone(body['next'])
+        expected = [
+            (int(r.timestamp.timestamp()), round(r.glucose_level), r.trend_arrow, r.source)
+            for r in GlucoseRecord.objects.filter(user=self.user).order_by('timestamp')
+        ]
+        self.assertEqual(self._decode(body), expected)
+        self.assertEqual(sorted(body['source_labels']), ['libre', 'manual'])
+        self.assertIn(None, body['trend_labels'])
+
+    def test_filters_apply(self):
+        start = (self.end - timedelta(minutes=59)).isoformat().replace('+', '%2B')
+        body = self.client.get(f'{URL}?format=columnar&source=libre&start={start}').json()
+        self.assertEqual(body['source_labels'], ['libre'])
+        self.assertEqual(body['count'], 60 - 7)
+
+    @override_settings(COLUMNAR_MAX_POINTS=120)
+    def test_large_ranges_continue_without_gaps_or_duplicates(self):
+        url, rows = f'{URL}?format=columnar', []
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(body['count'], 120)
+            rows.extend(self._decode(body))
+            url = body['next']
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(rows, sorted(rows))
+
+    @override_settings(COLUMNAR_MAX_POINTS=2)
+    def test_more_rows_in_one_second_than_a_page(self):
+        second = self.end + timedelta(minutes=5)
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=second, glucose_level=150 + i, source='libre') for i in range(5)
+        ])
+        start = second.isoformat().replace('+', '%2B')
+        url, levels, pages = f'{URL}?format=columnar&start={start}', [], 0
+        while url and pages < 10:
+            body = self.client.get(url).json()
+            self.assertGreater(body['count'], 0)
+            levels.extend(body['glucose'])
+            url, pages = body['next'], pages + 1
+        self.assertIsNone(url)
+        self.assertEqual(sorted(levels), [150, 151, 152, 153, 154])
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(f'{URL}?format=columnar&after=nope').status_code, 400)
+
+    def test_gzip_and_default_format(self):
+        resp = self.client.get(f'{URL}?format=columnar', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(resp.content))['count'], 300)
+
+        body = self.client.get(URL).json()
+        self.assertIn('results', body)
+        self.assertIn('id', body['results'][0])
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from model.feature_utils import compute_decay_feature, decay_kernel
+
+PATIENTS = ['37', '38', '64', '66']
+
+
+def _loop(values, tau, steps=None):
+    # reference: the original per-element recursion
+    vals = np.nan_to_num(np.asarray(values, dtype=float))
+    out = np.zeros_like(vals)
+    for t in range(1, len(vals)):
+        step = 1.0 if steps is None else steps[t]
+        out[t] = vals[t] + out[t - 1] * np.exp(-step / tau)
+    return out
+
+
+class DecayKernelTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.frames = {
+            p: pd.read_csv(os.path.join(settings.PREDICTION_MODEL_DIR, f'{p}.csv'), parse_dates=['timestamp'])
+            .sort_values('timestamp').reset_index(drop=True)
+            for p in PATIENTS
+        }
+
+    def test_matches_loop_on_bundled_csvs(self):
+        for patient, df in self.frames.items():
+            for col, tau in (('insulin', 48), ('carbs', 24)):
+                with self.subTest(patient=patient, col=col):
+                    np.testing.assert_allclose(decay_kernel(df[col].to_numpy(), tau), _loop(df[col], tau),
+                                               rtol=0, atol=1e-9)
+
+    def test_variable_gaps_decay_by_elapsed_time(self):
+        df = self.frames['37'].iloc[:5000].copy()
+        steps = df['timestamp'].diff().dt.total_seconds().fillna(0).to_numpy() / 300
+        self.assertGreater(steps.max(), 1)
+        compute_decay_feature(df, 'insulin', tau=48, new_col='IOB', time_col='timestamp')
+        np.testing.assert_allclose(df['IOB'].to_numpy(), _loop(df['insulin'], 48, steps), rtol=0, atol=1e-9)
+
+    def test_many_patients_in_one_call(self):
+        combined = pd.concat([df.assign(patient_id=p) for p, df in self.frames.items()], ignore_index=True)
+        compute_decay_feature(combined, 'carbs', tau=24, new_col='COB', group_col='patient_id')
+        for patient, df in self.frames.items():
+            got = combined.loc[combined['patient_id'] == patient, 'COB'].to_numpy()
+            np.testing.assert_allclose(got, _loop(df['carbs'], 24), rtol=0, atol=1e-9)
+
+    def test_nan_and_empty_inputs(self):
+        self.assertEqual(len(decay_kernel(np.array([]), 48)), 0)
+        np.testing.assert_allclose(decay_kernel([5.0, np.nan, 2.0], 48), _loop([5.0, np.nan, 2.0], 48))
@@ -0,0 +1,119 @@
+import math
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import GlucoseRecord
+from .services import rollups
+from .services.downsample import lttb, minmax
+
+URL = '/glugo/v1/glucose/downsample/'
+
+
+def _series(n, spike_at=None, spike=45.0):
+    points = [(60 * i, 140 + 30 * math.sin(i / 40.0) + (i % 7)) for i in range(n)]
+    if spike_at is not None:
+        points[spike_at] = (points[spike_at][0], spike)
+    return points
+
+
+def _reference_lttb(data, threshold):
+    """Textbook (non-streaming) LTTB."""
+    every = (len(data) - 2) / (threshold - 2)
+    sampled, a = [data[0]], 0
+    for i in range(threshold - 2):
+        avg_start, avg_end = int((i + 1) * every) + 1, min(int((i + 2) * every) + 1, len(data))
+        avg_t = sum(p[0] for p in data[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_v = sum(p[1] for p in data[avg_start:avg_end]) / (avg_end - avg_start)
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        at, av = data[a]
+        best, best_area = start, -1
+        for j in range(start, end):
+            area = abs((at - avg_t) * (data[j][1] - av) - (at - data[j][0]) * (avg_v - av))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(data[best])
+        a = best
+    sampled.append(data[-1])
+    return sampled
+
+
+class DownsampleAlgorithmTests(SimpleTestCase):
+    def test_streaming_lttb_matches_reference(self):
+        data = _series(5003)
+        for budget in (3, 10, 300, 1000):
+            self.assertEqual(list(lttb(iter(data), len(data), budget)), _reference_lttb(data, budget))
+
+    def test_lttb_keeps_out_of_range_extremes(self):
+        data = _series(20000, spike_at=12345)
+        plain = list(lttb(iter(data), len(data), 100))
+        kept = list(lttb(iter(data), len(data), 100, low=70, high=250))
+        self.assertEqual(len(kept), 100)
+        self.assertIn(data[12345], kept)
+        self.assertEqual(kept[0], data[0])
+        self.assertEqual(kept[-1], data[-1])
+        self.assertEqual([p[0] for p in kept], sorted(p[0] for p in kept))
+        self.assertEqual(len(plain), 100)
+
+    def test_short_series_passes_through(self):
+        data = _series(50)
+        self.assertEqual(list(lttb(iter(data), 50, 300)), data)
+        self.assertEqual(list(minmax(iter(data), 50, 300)), data)
+
+    def test_minmax_keeps_global_extremes(self):
+        data = _series(10000, spike_at=4321, spike=400.0)
+        out = list(minmax(iter(data), len(data), 200))
+        self.assertLessEqual(len(out), 200)
+        self.assertIn(max(data, key=lambda p: p[1]), out)
+        self.assertIn(min(data, key=lambda p: p[1]), out)
+        self.assertEqual(out, sorted(out))
+
+
+class DownsampleViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='trend', password='x')
+        self.now = timezone.now().replace(second=0, microsecond=0)
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(minutes=5 * i), source='libre',
+                          glucose_level=50.0 if i == 777 else 140 + 30 * math.sin(i / 40.0))
+            for i in range(3000)
+        ])
+        rollups.backfill(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_budget_extremes_and_cache(self):
+        body = self.client.get(f'{URL}?points=120&days=30').json()
+        self.assertEqual((body['raw_count'], body['count']), (3000, 120))
+        self.assertIn(50, body['glucose'])
+        self.assertEqual(body['t'], sorted(body['t']))
+
+        with self.assertNumQueries(1):  # fingerprint only
+            again = self.client.get(f'{URL}?points=120&days=30').json()
+        self.assertEqual(again, body)
+
+        GlucoseRecord.objects.create(user=self.user, timestamp=self.now + timedelta(minutes=1),
+                                     glucose_level=300, source='manual')
+        fresh = self.client.get(f'{URL}?points=120&days=30').json()
+        self.assertEqual(fresh['raw_count'], 3001)
+        self.assertEqual(fresh['glucose'][-1], 300)
+
+        # an edit keeps the count; its hour's rollup refresh still moves the key
+        low = GlucoseRecord.objects.get(user=self.user, glucose_level=50.0)
+        low.glucose_level = 40.0
+        low.save()
+        edited = self.client.get(f'{URL}?points=120&days=30').json()
+        self.assertIn(40, edited['glucose'])
+        self.assertNotIn(50, edited['glucose'])
+
+    def test_minmax_and_bad_params(self):
+        body = self.client.get(f'{URL}?points=100&method=minmax&days=30').json()
+        self.assertLessEqual(body['count'], 100)
+        self.assertEqual(body['method'], 'minmax')
+        self.assertEqual(self.client.get(f'{URL}?method=median').status_code, 400)
+        self.assertEqual(self.client.get(f'{URL}?start=soon').status_code, 400)
@@ -0,0 +1,98 @@
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from datetime import timezone as dt_timezone
+
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import TestCase
+
+from model.feature_utils import create_features
+from rest_framework.test import APIClient
+
+from .models import FoodEntry, GlucoseRecord
+
+CSV_PATH = os.path.join(settings.PREDICTION_MODEL_DIR, '37.csv')
+
+
+class HistoryExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='exporter', password='x')
+        frame = pd.read_csv(CSV_PATH, parse_dates=['timestamp']).head(2000)
+        cls.frame = frame
+        receivers = post_save.receivers
+        post_save.receivers = []  # fixture load only; skip alert/rollup/feature-store signals
+        try:
+            GlucoseRecord.objects.bulk_create([
+                GlucoseRecord(user=cls.user, timestamp=ts.to_pydatetime().replace(tzinfo=dt_timezone.utc),
+                              glucose_level=float(g), source='libre')
+                for ts, g in zip(frame['timestamp'], frame['glucose'])
+            ])
+            meals = frame[(frame['insulin'] > 0) | (frame['carbs'] > 0)]
+            entries = FoodEntry.objects.bulk_create([
+                FoodEntry(user=cls.user, food_name='meal', insulin_rounded=float(i), total_carbs=float(c))
+                for i, c in zip(meals['insulin'], meals['carbs'])
+            ])
+            # timestamp is auto_now_add; place each entry on its CSV row
+            for entry, ts in zip(entries, meals['timestamp']):
+                FoodEntry.objects.filter(pk=entry.pk).update(
+                    timestamp=ts.to_pydatetime().replace(tzinfo=dt_timezone.utc))
+        finally:
+            post_save.receivers = receivers
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content).decode()
+
+    def test_csv_round_trips_model_schema(self):
+        body = self._get('/glugo/v1/export/csv/')
+        exported = pd.read_csv(io.StringIO(body), parse_dates=['timestamp'])
+        self.assertEqual(list(exported.columns), ['timestamp', 'glucose', 'insulin', 'carbs'])
+        expected = self.frame.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        self.assertEqual(len(exported), len(expected))
+        pd.testing.assert_series_equal(exported['timestamp'], expected['timestamp'], check_dtype=False)
+        for col in ('glucose', 'insulin', 'carbs'):
+            pd.testing.assert_series_equal(exported[col].astype(float), expected[col].astype(float),
+                                           check_exact=False, atol=1e-6)
+        features = create_features(exported)
+        self.assertGreater(len(features), 0)
+
+    def test_food_without_reading_in_its_slot_gets_own_row(self):
+        last = GlucoseRecord.objects.filter(user=self.user).latest('timestamp').timestamp
+        entry = FoodEntry.objects.create(user=self.user, food_name='snack', total_carbs=12, insulin_rounded=1.5)
+        FoodEntry.objects.filter(pk=entry.pk).update(timestamp=last + timedelta(minutes=30))
+        body = self._get('/glugo/v1/export/csv/?start=' + last.date().isoformat())
+        self.assertTrue(body.rstrip().endswith(',,1.5,12'), body[-80:])
+
+    def test_ndjson_streams_both_kinds_in_order(self):
+        end = (self.frame['timestamp'].iloc[300]).isoformat()
+        lines = self._get(f'/glugo/v1/export/ndjson/?end={end}').splitlines()
+        records = [json.loads(line) for line in lines]
+        kinds = {r['type'] for r in records}
+        self.assertEqual(kinds, {'glucose', 'food'})
+        self.assertEqual(sum(r['type'] == 'glucose' for r in records), 301)
+        stamps = [r['timestamp'] for r in records]
+        self.assertEqual(stamps, sorted(stamps))
+
+    def test_unknown_format_and_command(self):
+        self.assertEqual(self.client.get('/glugo/v1/export/xlsx/').status_code, 404)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'out.csv')
+            call_command('export_history', user=self.user.pk, output=path, stderr=io.StringIO())
+            with open(path) as f:
+                self.assertEqual(f.read(), self._get('/glugo/v1/export/csv/'))
+        out = io.StringIO()
+        call_command('export_history', user=self.user.pk, fmt='ndjson', end='2024-01-14', stdout=out)
+        self.assertTrue(all(json.loads(line)['timestamp'].startswith('2024-01-14') for line in out.getvalue().splitlines()))
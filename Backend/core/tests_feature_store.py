@@ -0,0 +1,176 @@
+import os
+import random
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from model.feature_utils import create_features
+from .models import FoodEntry, GlucoseRecord, UserFeatureState
+from .services import feature_store
+from .services.feature_store import FEATURE_ORDER, FeatureAccumulator
+from .services.inference import MAX_INTERPOLATE_SLOTS, SEQ_LEN, InferenceRuntime
+from .services.prediction import GlucosePredictionService
+from .services.resample import SLOT_SECONDS
+
+CSV_PATH = os.path.join(settings.PREDICTION_MODEL_DIR, '37.csv')
+
+
+def _slot(ts):
+    return int(pd.Timestamp(ts).tz_localize('UTC').timestamp()) // SLOT_SECONDS
+
+
+# pandas' online rolling variance leaves ~1e-5 residue on flat windows where the
+# accumulator computes an exact zero
+ROLLING_ATOL = 1e-5
+
+
+class FeatureAccumulatorEquivalenceTests(SimpleTestCase):
+    """Feeding 5-minute rows one by one must reproduce create_features on the same grid."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        raw = pd.read_csv(CSV_PATH, parse_dates=['timestamp']).sort_values('timestamp').reset_index(drop=True)
+        # create_features shifts by row, so compare on the longest gap-free run
+        run_id = (raw['timestamp'].diff() != pd.Timedelta(minutes=5)).cumsum()
+        longest = run_id.value_counts().idxmax()
+        cls.raw = raw[run_id == longest].iloc[:2000].reset_index(drop=True)
+
+    def _feed(self, acc, rows):
+        produced = []
+        for row in rows.itertuples(index=False):
+            slot = _slot(row.timestamp)
+            acc.add_food(slot, row.insulin, row.carbs)
+            acc.add_reading(slot, row.glucose)
+            current = acc.current_row()
+            if current is not None:
+                produced.append(current)
+        return np.array(produced)
+
+    def test_rows_match_batch_features(self):
+        produced = self._feed(FeatureAccumulator(tz='UTC'), self.raw)
+        expected = create_features(self.raw.copy())[FEATURE_ORDER].to_numpy()
+        np.testing.assert_allclose(produced, expected, rtol=1e-9, atol=ROLLING_ATOL)
+
+    def test_short_gap_matches_interpolated_grid(self):
+        missing = self.raw.index[300:304]
+        produced = self._feed(FeatureAccumulator(tz='UTC'), self.raw.drop(missing))
+
+        grid = self.raw.copy()
+        grid.loc[missing, ['insulin', 'carbs']] = 0.0
+        grid.loc[missing, 'glucose'] = np.nan
+        grid['glucose'] = grid['glucose'].interpolate(limit=MAX_INTERPOLATE_SLOTS, limit_area='inside')
+        expected = create_features(grid)[FEATURE_ORDER].to_numpy()
+        # interpolated slots never become the open row, so only closed rows are compared
+        keep = np.ones(len(expected), dtype=bool)
+        keep[missing - 12] = False
+        np.testing.assert_allclose(produced, expected[keep], rtol=1e-9, atol=ROLLING_ATOL)
+
+    def test_window_and_round_trip(self):
+        acc = FeatureAccumulator(tz='UTC')
+        for i in range(0, 500, 50):
+            self._feed(acc, self.raw.iloc[i:i + 50])
+            acc = FeatureAccumulator.from_dict(acc.to_dict())
+        expected = create_features(self.raw.iloc[:500].copy())[FEATURE_ORDER].to_numpy(dtype=np.float32)
+        np.testing.assert_allclose(acc.window(), expected[-SEQ_LEN:], rtol=1e-6, atol=ROLLING_ATOL)
+
+    def test_late_food_matches_in_order_feed(self):
+        rows = self.raw.iloc[:300].copy()
+        in_order = rows.copy()
+        in_order.loc[280, 'carbs'] += 30.0
+        expected = FeatureAccumulator(tz='UTC')
+        self._feed(expected, in_order)
+
+        late = FeatureAccumulator(tz='UTC')
+        self._feed(late, rows)
+        late.add_food(_slot(rows.loc[280, 'timestamp']), 0.0, 30.0)
+        np.testing.assert_allclose(late.window(), expected.window(), rtol=1e-6, atol=ROLLING_ATOL)
+
+
+class FeatureStoreDbTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='features', password='pass123')
+        self.now = timezone.now()
+
+    def _readings(self, count, start_offset=0):
+        return [
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(minutes=5 * (count - i + start_offset)),
+                          glucose_level=120 + 30 * np.sin(i / 8.0), source='libre')
+            for i in range(count)
+        ]
+
+    def test_signals_keep_store_equal_to_rebuild(self):
+        for record in self._readings(70):
+            record.save()
+        FoodEntry.objects.create(user=self.user, food_name='toast', total_carbs=30, insulin_rounded=2)
+
+        incremental = feature_store.get_window(self.user)
+        self.assertIsNotNone(incremental)
+        rebuilt = feature_store.rebuild(self.user).window()
+        np.testing.assert_allclose(incremental, rebuilt, atol=1e-4)
+
+    def test_store_window_matches_db_fallback(self):
+        # readings 0-4.5 minutes into their slot, two in some slots, short gaps
+        rng = random.Random(5)
+        last_slot = feature_store.slot_of(self.now) - 1
+        for k in range(90):
+            if k % 23 in (4, 5, 6):
+                continue
+            for _ in range(2 if k % 7 == 0 else 1):
+                ts = datetime.fromtimestamp((last_slot - 89 + k) * SLOT_SECONDS + rng.randrange(0, 270), tz=dt_timezone.utc)
+                GlucoseRecord.objects.create(user=self.user, timestamp=ts, glucose_level=rng.uniform(80, 220),
+                                             source='libre')
+        FoodEntry.objects.create(user=self.user, food_name='toast', total_carbs=30, insulin_rounded=2,
+                                 timestamp=self.now - timedelta(minutes=50))
+
+        store = feature_store.get_window(self.user)
+        self.assertIsNotNone(store)
+        service = GlucosePredictionService()
+        service.runtime = InferenceRuntime(model_dir=settings.BASE_DIR)
+        service.runtime.feature_order = FEATURE_ORDER
+        service.feature_order = None  # skip the store and build the window from DB rows
+        np.testing.assert_allclose(service.prepare_model_window(self.user), store, rtol=1e-5, atol=1e-4)
+
+    def test_edits_and_deletes_keep_store_equal_to_rebuild(self):
+        for record in self._readings(70):
+            record.save()
+        meal = FoodEntry.objects.create(user=self.user, food_name='pasta', total_carbs=60, insulin_rounded=6,
+                                        timestamp=self.now - timedelta(minutes=30))
+        snack = FoodEntry.objects.create(user=self.user, food_name='toast', total_carbs=20, insulin_rounded=1,
+                                         timestamp=self.now - timedelta(minutes=20))
+        latest = GlucoseRecord.objects.filter(user=self.user).latest('timestamp')
+        oldest = GlucoseRecord.objects.filter(user=self.user).earliest('timestamp')
+
+        meal.delete()
+        latest.glucose_level = 300
+        latest.save()
+        oldest.delete()
+        snack.total_carbs = 40
+        snack.save()
+        self.assertTrue(UserFeatureState.objects.get(user=self.user).dirty)
+
+        window = feature_store.get_window(self.user)
+        np.testing.assert_allclose(window, feature_store.rebuild(self.user).window(), atol=1e-4)
+        self.assertEqual(window[-1, FEATURE_ORDER.index('glucose')], 300)
+        # only the snack's 1 U / 40 g remain, decayed over the four slots since it was logged
+        self.assertLess(window[-1, FEATURE_ORDER.index('IOB')], 1.0)
+        self.assertLess(window[-1, FEATURE_ORDER.index('COB')], 40.0)
+
+    def test_out_of_order_reading_marks_dirty_and_command_rebuilds(self):
+        records = self._readings(70)
+        random.Random(3).shuffle(records)
+        for record in records:
+            record.save()
+        self.assertTrue(UserFeatureState.objects.get(user=self.user).dirty)
+
+        call_command('rebuild_feature_store', dirty_only=True, stdout=open(os.devnull, 'w'))
+        state = UserFeatureState.objects.get(user=self.user)
+        self.assertFalse(state.dirty)
+        self.assertIsNotNone(FeatureAccumulator.from_dict(state.state).window())
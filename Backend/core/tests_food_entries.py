@@ -0,0 +1,87 @@
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import FoodEntry, GlucoseRecord, UserFeatureState
+from .services.feature_store import FeatureAccumulator
+
+# latest-glucose read, savepoint, NutritionalInfo + FoodEntry inserts, release,
+# then the feature-store post_save (savepoint, locked read, update, release)
+CREATE_QUERIES = 9
+
+
+def food_writes(queries):
+    return [q['sql'].split(' ')[0] + ' ' + q['sql'].split('"')[1] for q in queries
+            if q['sql'].startswith(('INSERT', 'UPDATE')) and 'userfeaturestate' not in q['sql']]
+
+
+class FoodEntryCreationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='eater', password='x', insulin_to_carb_ratio=10, correction_factor=50)
+        GlucoseRecord.objects.create(user=self.user, timestamp=timezone.now() - timedelta(hours=2), glucose_level=250)
+        GlucoseRecord.objects.create(user=self.user, timestamp=timezone.now(), glucose_level=200)
+        UserFeatureState.objects.update_or_create(user=self.user, defaults={'state': FeatureAccumulator().to_dict()})
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _create(self, url, payload, fmt='json'):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(url, payload, format=fmt)
+        self.assertEqual(resp.status_code, 201, resp.content)
+        return resp.json(), ctx.captured_queries
+
+    def test_viewset_create_is_one_write_per_row(self):
+        body, queries = self._create('/glugo/v1/food-entries/', {
+            'food_name': 'pasta', 'meal_type': 'dinner', 'total_carbs_g': 60, 'calories_estimate': 520,
+            'nutritional_info': {'carbs': 60, 'protein': 12},
+        })
+        self.assertEqual(len(queries), CREATE_QUERIES, '\n'.join(q['sql'] for q in queries))
+        self.assertEqual(food_writes(queries), ['INSERT core_nutritionalinfo', 'INSERT core_foodentry'])
+        # 60 g / 10 + (200 - 100) / 50 from the latest reading
+        self.assertEqual((body['total_carbs'], body['total_calories']), (60.0, 520.0))
+        self.assertEqual((body['insulin_recommended'], body['insulin_rounded']), (8.0, 8.0))
+        self.assertEqual(body['nutritional_info']['protein'], 12)
+
+    def test_list_create_view_accepts_multipart_nutrition(self):
+        body, queries = self._create('/glugo/v1/food/entries/', {
+            'food_name': 'toast', 'meal_type': 'breakfast', 'total_carbs': '25',
+            'nutritional_info': json.dumps({'carbs': 30, 'calories': 180}),
+        }, fmt='multipart')
+        self.assertEqual(len(queries), CREATE_QUERIES)
+        self.assertEqual(body['total_carbs'], 25.0)  # the entry's own total wins over its nutrition
+        self.assertEqual(body['insulin_rounded'], 4.5)
+        self.assertEqual(body['nutritional_info']['calories'], 180)
+
+    def test_entry_without_carbs_skips_the_glucose_read(self):
+        body, queries = self._create('/glugo/v1/food-entries/', {'food_name': 'water', 'meal_type': 'snack'})
+        self.assertEqual(food_writes(queries), ['INSERT core_foodentry'])
+        self.assertFalse(any('core_glucoserecord' in q['sql'] for q in queries))
+        self.assertIsNone(body['insulin_recommended'])
+
+    def test_client_timestamp_is_ignored(self):
+        # the column is writable for imports and offline sync, the regular endpoint still stamps creation time
+        before = timezone.now()
+        body, _ = self._create('/glugo/v1/food-entries/', {
+            'food_name': 'soup', 'meal_type': 'dinner', 'timestamp': '2024-01-01T12:00:00Z'})
+        self.assertGreaterEqual(FoodEntry.objects.get(pk=body['id']).timestamp, before)
+
+    def test_analyze_food_stores_analysis_in_one_update(self):
+        entry = FoodEntry.objects.create(user=self.user, meal_type='lunch')
+        image = SimpleUploadedFile('meal.jpg', b'\xff\xd8\xff' + b'0' * 64)
+        with patch('core.models.analyze_image', return_value={'name': 'rice bowl', 'total_carbs_g': 45}), \
+                CaptureQueriesContext(connection) as ctx:
+            result = entry.analyze_food(image)
+        self.assertEqual(food_writes(ctx.captured_queries), ['INSERT core_nutritionalinfo', 'UPDATE core_foodentry'])
+        entry.refresh_from_db()
+        self.assertEqual(result['nutritional_info_id'], entry.nutritional_info_id)
+        self.assertEqual((entry.food_name, entry.nutritional_info.carbs), ('rice bowl', 45))
+        self.assertEqual(entry.insulin_rounded, 6.5)  # 4.5 + 2.0 correction, rounded to 0.5
@@ -0,0 +1,73 @@
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import GlucoseRecord
+from .services import rollups
+from .services.glucose_stats import stats_thresholds, summarize
+
+
+class GlucoseStatisticsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='stats', password='pass123')
+        self.now = timezone.now()
+        rng = np.random.default_rng(1)
+        self.values = np.round(rng.normal(150, 45, size=2000).clip(40, 400), 1)
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(minutes=5 * i), glucose_level=float(v))
+            for i, v in enumerate(self.values)
+        ])
+        rollups.backfill(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _reference(self, values, low, high):
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        above = sum(1 for v in values if v > high) / len(values) * 100
+        below = sum(1 for v in values if v < low) / len(values) * 100
+        return mean, above, below, std / mean * 100
+
+    def test_single_query_matches_python(self):
+        start = self.now - timedelta(days=3)
+        window = [v for i, v in enumerate(self.values) if self.now - timedelta(minutes=5 * i) >= start]
+        with self.assertNumQueries(1):
+            summary = summarize(self.user, start, self.now)
+        mean, above, below, cv = self._reference(window, 70, 180)
+        self.assertEqual(summary.count, len(window))
+        self.assertAlmostEqual(summary.mean, mean, places=6)
+        self.assertAlmostEqual(summary.pct_above, above, places=6)
+        self.assertAlmostEqual(summary.pct_below, below, places=6)
+        self.assertAlmostEqual(summary.cv, cv, places=6)
+
+    def test_view_uses_user_targets(self):
+        self.user.target_glucose_min = 90
+        self.user.target_glucose_max = 140
+        self.user.save()
+        self.assertEqual(stats_thresholds(self.user), (90.0, 140.0))
+
+        resp = self.client.get('/glugo/v1/glucose-statistics/')
+        self.assertEqual(resp.status_code, 200)
+        window = [v for i, v in enumerate(self.values) if i * 5 <= 7 * 24 * 60]
+        mean, above, below, cv = self._reference(window, 90, 140)
+        data = resp.json()
+        self.assertEqual(data['avg_glucose'], round(mean, 1))
+        self.assertEqual(data['above_range'], round(above, 1))
+        self.assertEqual(data['below_range'], round(below, 1))
+        self.assertEqual(data['coefficient_of_variation'], round(cv, 1))
+        self.assertEqual(data['time_in_range'], round(100 - above - below, 1))
+
+    def test_invalid_targets_fall_back(self):
+        self.user.target_glucose_min = 200
+        self.user.target_glucose_max = 100
+        self.assertEqual(stats_thresholds(self.user), (70.0, 180.0))
+
+    def test_empty_range(self):
+        resp = self.client.get('/glugo/v1/glucose-statistics/', {
+            'start_date': '2001-01-01T00:00:00Z', 'end_date': '2001-01-02T00:00:00Z'})
+        self.assertEqual(resp.json()['period'], 'No data')
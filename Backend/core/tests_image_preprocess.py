@@ -0,0 +1,81 @@
+from io import BytesIO
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from .services.image_preprocess import ImageError, fitted_size, prepare
+from .services.openai_service import OpenAIServiceError, analyze_image
+
+
+def _jpeg(size, exif=None, color=(200, 120, 40)):
+    img = Image.new('RGB', size, color)
+    out = BytesIO()
+    kwargs = {'exif': exif} if exif is not None else {}
+    img.save(out, format='JPEG', quality=90, **kwargs)
+    return out.getvalue()
+
+
+def _exif(orientation=None, camera=False):
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    if camera:
+        exif[0x010F] = 'PhoneMaker'  # identifying metadata that must not be forwarded
+    return exif.tobytes()
+
+
+class ImagePreprocessTests(SimpleTestCase):
+    def test_large_photo_is_shrunk_to_the_tier(self):
+        for tier in (512, 768, 1024):
+            prepared = prepare(_jpeg((4032, 3024)), max_edge=tier)
+            self.assertEqual(max(prepared.width, prepared.height), tier)
+            self.assertTrue(prepared.reencoded)
+            with Image.open(BytesIO(prepared.data)) as img:
+                self.assertEqual((img.format, img.size), ('JPEG', (prepared.width, prepared.height)))
+        self.assertEqual(prepare(_jpeg((1000, 800)), max_edge=512).detail, 'low')
+        self.assertEqual(prepare(_jpeg((1000, 800)), max_edge=768).detail, 'high')
+
+    def test_fitting_jpeg_without_metadata_is_sent_as_is(self):
+        upload = _jpeg((800, 600))
+        prepared = prepare(upload, max_edge=1024)
+        self.assertFalse(prepared.reencoded)
+        self.assertIs(prepared.data, upload)
+
+    def test_metadata_is_stripped_and_orientation_applied(self):
+        prepared = prepare(_jpeg((800, 600), exif=_exif(orientation=6, camera=True)), max_edge=1024)
+        self.assertTrue(prepared.reencoded)
+        self.assertEqual((prepared.width, prepared.height), (600, 800))  # rotated upright
+        with Image.open(BytesIO(prepared.data)) as img:
+            self.assertNotIn('exif', img.info)
+
+    def test_transparent_png_is_flattened_to_jpeg(self):
+        img = Image.new('RGBA', (300, 200), (0, 0, 0, 0))
+        out = BytesIO()
+        img.save(out, format='PNG')
+        prepared = prepare(out.getvalue(), max_edge=1024)
+        with Image.open(BytesIO(prepared.data)) as result:
+            self.assertEqual((result.format, result.mode), ('JPEG', 'RGB'))
+            self.assertGreater(min(result.getpixel((10, 10))), 245)  # white, not black
+
+    def test_repeated_calls_reuse_the_buffer_safely(self):
+        big = prepare(_jpeg((3000, 2000), color=(10, 200, 10)), max_edge=1024).data
+        small = prepare(_jpeg((3000, 2000), color=(10, 10, 10)), max_edge=512).data
+        self.assertNotEqual(big, small)
+        with Image.open(BytesIO(big)) as img:
+            self.assertEqual(img.size, (1024, 683))
+        with Image.open(BytesIO(small)) as img:
+            img.load()  # no trailing bytes from the previous, larger encode
+
+    def test_fitted_size(self):
+        self.assertEqual(fitted_size((4032, 3024), 1024), (1024, 768))
+        self.assertEqual(fitted_size((300, 200), 1024), (300, 200))
+
+    def test_unreadable_upload_is_rejected_without_a_model_call(self):
+        with self.assertRaises(ImageError):
+            prepare(b'\xff\xd8\xff' + b'0' * 256)
+        with override_settings(OPENAI_IMAGE_CACHE_ENABLED=False), \
+                patch('core.services.openai_service._request_analysis') as upstream:
+            with self.assertRaises(OpenAIServiceError):
+                analyze_image(b'not an image' * 20, use_cache=False)
+        upstream.assert_not_called()
@@ -0,0 +1,65 @@
+import os
+from datetime import timedelta
+from unittest import skipUnless
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from model.feature_utils import create_features_from_csv
+from .models import GlucoseRecord
+from .services.inference import SEQ_LEN, get_runtime
+
+CSV_PATH = os.path.join(settings.PREDICTION_MODEL_DIR, '37.csv')
+
+
+@skipUnless(get_runtime().cnn_lstm_ready and get_runtime().lgb_ready, 'model artifacts not available')
+class InferenceRuntimeTests(SimpleTestCase):
+    def test_matches_offline_pipeline(self):
+        import torch
+        from .services.ml_models import CNNLSTMModel
+
+        runtime = get_runtime()
+        df = create_features_from_csv(CSV_PATH)
+        window = df[runtime.feature_order].to_numpy(dtype=np.float32)[-SEQ_LEN:]
+
+        # offline scripts: sklearn scaler + freshly loaded model / regressor
+        scaler = joblib.load(os.path.join(settings.PREDICTION_MODEL_DIR, 'standard_scaler.pkl'))
+        model = CNNLSTMModel(input_dim=len(runtime.feature_order))
+        model.load_state_dict(torch.load(
+            os.path.join(settings.PREDICTION_MODEL_DIR, 'cnn_lstm_30min_win48.pt.best'), map_location='cpu'))
+        model.eval()
+        with torch.no_grad():
+            x = torch.tensor(scaler.transform(df[runtime.feature_order].values[-SEQ_LEN:]), dtype=torch.float32)
+            expected_cnn = model(x.unsqueeze(0)).item()
+        regressor = joblib.load(os.path.join(settings.PREDICTION_MODEL_DIR, 'lgb_noSteps30min.pkl'))
+        expected_lgb = regressor.predict(df[runtime.feature_order].iloc[[-1]])[0]
+
+        self.assertAlmostEqual(runtime.predict_cnn_lstm(window), expected_cnn, places=3)
+        self.assertAlmostEqual(runtime.predict_lightgbm(window), expected_lgb, places=3)
+
+
+@skipUnless(get_runtime().cnn_lstm_ready and get_runtime().lgb_ready, 'model artifacts not available')
+class ModelPredictionFromDbTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='runtime', password='pass123')
+
+    def test_models_run_on_db_history(self):
+        from .services.prediction import prediction_service
+
+        now = timezone.now()
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=now - timedelta(minutes=5 * i),
+                          glucose_level=140 + 20 * np.sin(i / 10.0), source='libre')
+            for i in range(12 * 12)
+        ])
+        window = prediction_service.prepare_model_window(self.user)
+        self.assertEqual(window.shape, (SEQ_LEN, len(prediction_service.feature_order)))
+
+        result = prediction_service.predict_for_user(self.user, model_type='ensemble')
+        self.assertTrue(result['success'])
+        self.assertIn('cnn_lstm', result['prediction']['predictions_by_model'])
+        self.assertIn('lgb', result['prediction']['predictions_by_model'])
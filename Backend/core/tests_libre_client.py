@@ -0,0 +1,33 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from .services import libre
+
+
+def _response(payload):
+    resp = mock.Mock()
+    resp.json.return_value = payload
+    resp.raise_for_status.return_value = None
+    return resp
+
+
+class RegionTests(SimpleTestCase):
+    def test_region_from_base_url(self):
+        self.assertEqual(libre.region_from_base_url('https://api-eu.libreview.io'), 'eu')
+        self.assertEqual(libre.region_from_base_url('http://127.0.0.1:8766/api-ae'), 'ae')
+        self.assertIsNone(libre.region_from_base_url('https://api.libreview.io'))
+        self.assertIsNone(libre.region_from_base_url(None))
+
+    @override_settings(LIBRE_PASSWORD_BASE_URL='http://llu.test',
+                       LIBRE_REGION_URL_TEMPLATE='http://llu.test/api-{region}')
+    def test_login_follows_the_region_redirect_template(self):
+        redirect = _response({'status': 0, 'data': {'redirect': True, 'region': 'de'}})
+        ticket = _response({'status': 0, 'data': {'user': {'id': 'u-1'}, 'authTicket': {'token': 'jwt'}}})
+        with mock.patch.object(libre._SESSION, 'post', side_effect=[redirect, ticket]) as post:
+            base_url, token, headers = libre.login_with_password('a@example.com', 'pw')
+        self.assertEqual([c.args[0] for c in post.call_args_list],
+                         ['http://llu.test/llu/auth/login', 'http://llu.test/api-de/llu/auth/login'])
+        self.assertEqual(base_url, 'http://llu.test/api-de')
+        self.assertEqual(token, {'access_token': 'jwt', 'account_id': 'u-1'})
+        self.assertEqual(headers['account-id'], libre.uuid_to_sha256('u-1'))
@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import Alert, GlucoseMonitor, GlucoseRecord, LibreConnection, UserFeatureState
+from .services.libre_ingest import LLU_TIMESTAMP_FORMAT, extract_readings, ingest_payload
+
+
+def _measurement(ts, value, trend=3):
+    return {
+        'FactoryTimestamp': ts.strftime(LLU_TIMESTAMP_FORMAT),
+        # device-local time, deliberately offset from the UTC factory time
+        'Timestamp': (ts + timedelta(hours=4)).strftime(LLU_TIMESTAMP_FORMAT),
+        'ValueInMgPerDl': value,
+        'Value': value,
+        'TrendArrow': trend,
+    }
+
+
+def _graph_payload(end, count, step_minutes=5, level=lambda i: 120):
+    history = [_measurement(end - timedelta(minutes=step_minutes * (count - i)), level(i)) for i in range(count)]
+    return {
+        'status': 0,
+        'data': {
+            'connection': {'patientId': 'p1', 'glucoseMeasurement': _measurement(end, level(count))},
+            'graphData': history,
+        },
+    }
+
+
+class ExtractReadingsTests(TestCase):
+    def test_payload_shapes(self):
+        end = datetime(2025, 10, 30, 12, 0, tzinfo=dt_timezone.utc)
+        connections = {'data': [{'patientId': 'p1', 'glucoseMeasurement': _measurement(end, 140)}, {'patientId': 'p2'}]}
+        logbook = {'data': [_measurement(end - timedelta(hours=1), 65), {'type': 'note'}]}
+
+        self.assertEqual(extract_readings(connections), [(end, 140.0, '3')])
+        self.assertEqual(len(extract_readings(_graph_payload(end, 144))), 145)
+        self.assertEqual([r.glucose_level for r in extract_readings(logbook)], [65.0])
+
+    def test_timestamp_normalization(self):
+        readings = extract_readings({'data': [
+            {'Timestamp': '2025-10-30T12:00:00', 'Value': 100},
+            {'timestamp': '2025-10-30T14:00:00+02:00', 'glucose_level': 101},
+            {'Timestamp': 'not a date', 'Value': 102},
+        ]})
+        expected = datetime(2025, 10, 30, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual([r.timestamp for r in readings], [expected, expected])
+
+
+class IngestPayloadTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='ingest', password='pass123')
+        self.end = datetime.now(dt_timezone.utc).replace(microsecond=0)
+
+    def test_bulk_insert_is_idempotent(self):
+        payload = _graph_payload(self.end, 288)
+        with CaptureQueriesContext(connection) as ctx:
+            first = ingest_payload(self.user, payload)
+        self.assertEqual((first.fetched, first.created), (289, 289))
+        # one bulk insert (SQLite splits it by its parameter limit), not one per row
+        inserts = [q for q in ctx.captured_queries if 'INSERT' in q['sql'] and '"core_glucoserecord"' in q['sql']]
+        self.assertLessEqual(len(inserts), 3)
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        again = ingest_payload(self.user, [payload, _graph_payload(self.end + timedelta(minutes=5), 1)])
+        self.assertEqual(again.created, 1)
+        self.assertEqual(GlucoseRecord.objects.filter(user=self.user).count(), 290)
+        self.assertTrue(UserFeatureState.objects.filter(user=self.user).exists())
+
+    def test_rows_inserted_concurrently_are_not_counted(self):
+        payload = _graph_payload(self.end, 4)
+        real_bulk_create = GlucoseRecord.objects.bulk_create
+
+        def racing_bulk_create(rows, **kwargs):
+            # another sync stores the newest reading between our lookup and our insert
+            GlucoseRecord.objects.create(user=self.user, timestamp=self.end, glucose_level=120, source='libre')
+            return real_bulk_create(rows, **kwargs)
+
+        with mock.patch.object(GlucoseRecord.objects, 'bulk_create', side_effect=racing_bulk_create):
+            result = ingest_payload(self.user, payload)
+        self.assertEqual((result.fetched, result.created), (5, 4))
+        self.assertNotIn(self.end, [r.timestamp for r in result.records])
+        self.assertEqual(GlucoseRecord.objects.filter(user=self.user).count(), 5)
+
+    def test_rows_stored_at_device_local_time_are_not_duplicated(self):
+        LibreConnection.objects.create(user=self.user, token='t', local_timestamps_before=self.end)
+        # what the old parser stored: the 4-hours-ahead device clock read as UTC
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.end - timedelta(minutes=5 * i) + timedelta(hours=4),
+                          glucose_level=120, source='libre')
+            for i in range(1, 4)
+        ])
+        result = ingest_payload(self.user, _graph_payload(self.end, 4))
+        # readings from before the migration match the old rows; the one at the cut-off is new
+        self.assertEqual((result.fetched, result.created), (5, 2))
+        self.assertEqual(sorted(r.timestamp for r in result.records),
+                         [self.end - timedelta(minutes=20), self.end])
+
+    def test_alerts_evaluated_once_per_batch(self):
+        payload = _graph_payload(self.end, 24, level=lambda i: 55 if i % 2 else 250)
+        ingest_payload(self.user, payload)
+        alerts = Alert.objects.filter(user=self.user)
+        self.assertEqual(sorted(alerts.values_list('alert_type', flat=True)), ['high_glucose', 'low_glucose'])
+
+        ingest_payload(self.user, _graph_payload(self.end + timedelta(minutes=5), 0, level=lambda i: 50))
+        self.assertEqual(alerts.count(), 2)  # deduped within 15 minutes
+
+    def test_live_monitoring_uses_ingest(self):
+        conn = LibreConnection.objects.create(user=self.user, token='t', api_endpoint='https://api-eu.libreview.io',
+                                              account_id='acc')
+        monitor = GlucoseMonitor.objects.create(user=self.user, connection=conn)
+        payload = {'data': [{'patientId': 'p1', 'glucoseMeasurement': _measurement(self.end, 130)}]}
+        with mock.patch('core.models.get_libreview_connection', return_value=payload):
+            self.assertEqual(monitor.start_live_monitoring(), {'fetched': 1, 'created': 1})
+            self.assertEqual(monitor.start_live_monitoring(), {'fetched': 1, 'created': 0})
+        self.assertEqual(GlucoseRecord.objects.get(user=self.user).source, 'libre_live')
+
+
+class LibreEndpointsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='webhook', password='pass123')
+        self.client = APIClient()
+
+    def test_webhook_single_reading(self):
+        body = {'id': self.user.id, 'glucose_level': 180, 'timestamp': '2025-10-30T12:00:00Z', 'trend_arrow': 'up'}
+        for expected in (1, 0):
+            resp = self.client.post('/glugo/v1/libre/webhook/', body, format='json')
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json()['created'], expected)
+        bad = self.client.post('/glugo/v1/libre/webhook/', {**body, 'timestamp': 'nope'}, format='json')
+        self.assertEqual(bad.status_code, 400)
+
+    def test_sync_now_uses_saved_connection(self):
+        LibreConnection.objects.create(user=self.user, token='t', api_endpoint='https://api-eu.libreview.io',
+                                       account_id='acc')
+        self.client.force_authenticate(user=self.user)
+        end = datetime(2025, 10, 30, 12, 0, tzinfo=dt_timezone.utc)
+        with mock.patch('core.services.api.get_libreview_connection', return_value=_graph_payload(end, 10)):
+            resp = self.client.post('/glugo/v1/libre/sync-now/', {}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['created'], 11)
+        self.assertEqual(resp.json()['latest_reading']['timestamp'], end.isoformat())
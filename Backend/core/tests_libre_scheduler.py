@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import LibreConnection
+from .services import libre_scheduler, locks
+from .services.libre_ingest import LLU_TIMESTAMP_FORMAT, LibreReading, device_utc_offset
+from .services.libre_scheduler import LibrePollScheduler, PollPolicy, scheduler_stats, sync_due
+from .services.libre_sync import ConnectionResult, glucose_trend
+
+NOON = datetime(2026, 10, 17, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _result(glucose=None, rate=None, created=1, status='ok', minutes_ago=1, now=NOON):
+    latest = None if glucose is None else LibreReading(now - timedelta(minutes=minutes_ago), glucose, '3')
+    return ConnectionResult(connection_id=1, user_id=1, status=status, latest=latest, rate=rate, created=created)
+
+
+class PollPolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.policy = PollPolicy(min_seconds=60, base_seconds=300, max_seconds=1800, jitter=0)
+        self.conn = LibreConnection(sync_interval=300, sync_failures=0, utc_offset_minutes=0)
+
+    def interval(self, result, now=NOON):
+        return self.policy.interval(self.conn, result, 70, 180, now)
+
+    def test_rules(self):
+        self.assertEqual(self.interval(_result(120, rate=0.7)), (300, 'steady'))
+        self.assertEqual(self.interval(_result(120)), (300, 'steady'))  # no rate to go on
+        self.assertEqual(self.interval(_result(120, rate=0.2)), (600, 'flat'))
+        self.assertEqual(self.interval(_result(120, rate=-1.2)), (150, 'changing'))
+        self.assertEqual(self.interval(_result(140, rate=-2.5)), (60, 'falling_fast'))
+        self.assertEqual(self.interval(_result(85)), (60, 'near_low'))
+        self.assertEqual(self.interval(_result(60, rate=0.3)), (60, 'near_low'))
+        # 92 falling 1.5 mg/dL/min drops below 70 within 15 minutes, 100 does not
+        self.assertEqual(self.interval(_result(100, rate=-1.5))[1], 'changing')
+        self.assertEqual(self.interval(_result(92, rate=-1.5)), (60, 'near_low'))
+        # on the way up to 180, and above it
+        self.assertEqual(self.interval(_result(165, rate=0.6)), (150, 'near_high'))
+        self.assertEqual(self.interval(_result(140, rate=2.9)), (150, 'near_high'))
+        self.assertEqual(self.interval(_result(165, rate=-0.6)), (300, 'near_high'))
+        self.assertEqual(self.interval(_result(240, rate=0.1)), (300, 'above_high'))
+        self.assertEqual(self.interval(_result(240, rate=-1.4)), (150, 'above_high'))
+
+    def test_backs_off_when_nothing_changes(self):
+        self.assertEqual(self.interval(_result(120, created=0)), (600, 'unchanged'))
+        self.assertEqual(self.interval(_result(250, created=0)), (300, 'above_high'))  # a sustained high
+        self.conn.sync_interval = 1200
+        self.assertEqual(self.interval(_result(120, created=0)), (1800, 'unchanged'))
+        self.assertEqual(self.interval(_result()), (1800, 'no_data'))
+        self.conn.sync_interval = 300
+        self.assertEqual(self.interval(_result(120, minutes_ago=45)), (600, 'no_data'))
+
+    def test_failures_back_off_exponentially(self):
+        for failures, expected in ((1, 300), (2, 600), (3, 1200), (6, 1800)):
+            self.conn.sync_failures = failures
+            self.assertEqual(self.interval(_result(status='rate_limited')), (expected, 'failing'))
+
+    def test_overnight_in_sensor_local_time(self):
+        night = NOON.replace(hour=22)
+        self.assertEqual(self.interval(_result(120, now=night), now=night)[1], 'steady')
+        self.conn.utc_offset_minutes = 240  # 02:00 at the sensor
+        self.assertEqual(self.interval(_result(120, now=night), now=night), (600, 'steady_night'))
+        # never slower when it matters
+        self.assertEqual(self.interval(_result(75, now=night), now=night), (60, 'near_low'))
+        self.assertEqual(self.interval(_result(120, rate=0.1, now=night), now=night), (1200, 'flat_night'))
+        self.assertEqual(self.interval(_result(230, rate=0.1, now=night), now=night), (300, 'above_high'))
+        self.conn.utc_offset_minutes = None
+        self.assertEqual(self.interval(_result(120, now=night), now=night)[1], 'steady')
+
+    def test_trend_and_offset_from_payload(self):
+        readings = [LibreReading(NOON - timedelta(minutes=m), 100 + m, None) for m in (0, 5, 15, 45)]
+        latest, rate = glucose_trend(readings)
+        self.assertEqual(latest.timestamp, NOON)
+        self.assertAlmostEqual(rate, -1.0)
+        self.assertEqual(glucose_trend(readings[:1]), (readings[0], None))
+
+        gm = {'FactoryTimestamp': NOON.strftime(LLU_TIMESTAMP_FORMAT),
+              'Timestamp': (NOON + timedelta(hours=3, seconds=20)).strftime(LLU_TIMESTAMP_FORMAT)}
+        self.assertEqual(device_utc_offset({'data': [{'glucoseMeasurement': gm}]}), 180)
+        self.assertIsNone(device_utc_offset({'data': []}))
+
+
+class LibrePollSchedulerQueueTests(SimpleTestCase):
+    def test_pops_due_in_order_and_skips_rescheduled_entries(self):
+        scheduler = LibrePollScheduler(policy=PollPolicy(jitter=0), batch_size=10)
+        scheduler.push(1, NOON + timedelta(seconds=30))
+        scheduler.push(2, NOON - timedelta(seconds=60))
+        scheduler.push(3, NOON - timedelta(seconds=10))
+        scheduler.push(2, NOON + timedelta(seconds=90))  # rescheduled: the old entry is stale
+        scheduler.discard(3)
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.next_due(), NOON + timedelta(seconds=30))
+        self.assertEqual(scheduler.pop_due(NOON), [])
+        self.assertEqual(scheduler.pop_due(NOON + timedelta(minutes=2)),
+                         [(1, NOON + timedelta(seconds=30)), (2, NOON + timedelta(seconds=90))])
+        self.assertIsNone(scheduler.next_due())
+
+
+def _gm(ts, value):
+    return {'FactoryTimestamp': ts.strftime(LLU_TIMESTAMP_FORMAT), 'ValueInMgPerDl': value, 'TrendArrow': 3}
+
+
+@override_settings(LIBRE_POLL_JITTER=0, LIBRE_POLL_BASELINE_SECONDS=300,
+                   LIBRE_SYNC_REGION_RATE_PER_MINUTE=60000, LIBRE_SYNC_REGION_BURST=100)
+class SchedulerSyncTests(TestCase):
+    # per account: the latest reading and the one 15 minutes before it
+    SERIES = {'acct0': (120, 110), 'acct1': (120, 150), 'acct2': (80, 85)}
+
+    def setUp(self):
+        libre_scheduler.metrics.reset()
+        User = get_user_model()
+        self.conns = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'poll{i}', password='x')
+            self.conns.append(LibreConnection.objects.create(
+                user=user, email=f'poll{i}@example.com', token=f'tok{i}', account_id=f'acct{i}',
+                api_endpoint='https://api-eu.libreview.io', region='eu', connected=True))
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _patches(self):
+        def connection(base_url, token, account_id, timeout=None):
+            return {'data': [{'patientId': account_id, 'glucoseMeasurement': _gm(self.now, self.SERIES[account_id][0])}]}
+
+        def graph(base_url, token, account_id, patient_id, timeout=None):
+            return {'data': {'graphData': [_gm(self.now - timedelta(minutes=15), self.SERIES[account_id][1])]}}
+
+        return (mock.patch('core.services.libre.get_libreview_connection', side_effect=connection),
+                mock.patch('core.services.libre.get_libreview_graph', side_effect=graph))
+
+    def test_sync_due_schedules_each_connection(self):
+        overdue = self.conns[2]
+        overdue.next_sync_at = self.now - timedelta(seconds=40)
+        overdue.save()
+        p_conn, p_graph = self._patches()
+        with p_conn, p_graph:
+            report = sync_due()
+            self.assertEqual(report.statuses, {'ok': 3})
+            intervals = {c.account_id: c.sync_interval for c in LibreConnection.objects.all()}
+            # steady; falling 2 mg/dL/min; near the low target
+            self.assertEqual(intervals, {'acct0': 300, 'acct1': 60, 'acct2': 60})
+            for conn in LibreConnection.objects.all():
+                self.assertAlmostEqual((conn.next_sync_at - conn.last_synced).total_seconds(),
+                                       conn.sync_interval, places=1)
+
+            # nothing is due any more
+            self.assertEqual(sync_due().connections, 0)
+
+        stats = scheduler_stats()
+        self.assertEqual(stats['synced'], 3)
+        self.assertEqual(stats['reasons'], {'steady': 1, 'falling_fast': 1, 'near_low': 1})
+        # over their next minute the baseline would poll 0.2 times, so the two fast ones cost 0.8 each
+        self.assertEqual((stats['polls_saved'], stats['calls_saved']), (-1.6, -3.2))
+        self.assertGreaterEqual(stats['lag_seconds']['max'], 40)
+        self.assertEqual(stats['queue']['overdue'], 0)
+        self.assertEqual(stats['queue']['baseline_polls_per_hour'], 36.0)
+        self.assertEqual(stats['queue']['polls_per_hour'], 132.0)
+
+        self.assertTrue(locks.acquire(libre_scheduler.LOCK_KEY, 60, 'other-worker'))
+        self.assertIsNone(sync_due())
+        locks.release(libre_scheduler.LOCK_KEY, 'other-worker')
+
+    def test_heap_scheduler_requeues_at_the_new_due_time(self):
+        later = self.conns[0]
+        later.last_synced = self.now
+        later.sync_interval = 600
+        later.save()
+        scheduler = LibrePollScheduler()
+        scheduler.load(now=self.now)
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.next_due(), self.now)
+
+        p_conn, p_graph = self._patches()
+        with p_conn, p_graph:
+            report = scheduler.run_due(self.now)
+        self.assertEqual(report.connections, 2)
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.pop_due(self.now), [])
+        # acct1 and acct2 come back in a minute, before acct0's 10 minutes are up
+        due = dict(scheduler.pop_due(self.now + timedelta(minutes=10)))
+        self.assertEqual(due[later.pk], self.now + timedelta(seconds=600))
+        for conn in self.conns[1:]:
+            conn.refresh_from_db()
+            self.assertEqual(due[conn.pk], conn.next_sync_at)
+
+    def test_heap_scheduler_waits_for_a_running_full_sync(self):
+        scheduler = LibrePollScheduler()
+        scheduler.load(now=self.now)
+        self.assertTrue(locks.acquire(libre_scheduler.LOCK_KEY, 60, 'sync-all'))
+        self.assertIsNone(scheduler.run_due(self.now))
+        locks.release(libre_scheduler.LOCK_KEY, 'sync-all')
+        self.assertEqual(len(scheduler), 3)
+        self.assertEqual(scheduler.next_due(), self.now + timedelta(seconds=libre_scheduler.LOCK_RETRY_SECONDS))
+
+    def test_status_tells_the_app_when_to_ask_again(self):
+        conn = self.conns[0]
+        conn.next_sync_at = timezone.now() + timedelta(seconds=120)
+        conn.save()
+        client = APIClient()
+        client.force_authenticate(user=conn.user)
+        data = client.get('/glugo/v1/libre/status/').json()
+        self.assertEqual(data['sync_interval'], 300)
+        self.assertTrue(120 <= data['poll_after_seconds'] <= 125)
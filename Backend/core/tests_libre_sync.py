@@ -0,0 +1,227 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+import requests
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import GlucoseRecord, LibreConnection, TaskLock
+from .services import libre_sync, locks
+from .services.libre_ingest import LLU_TIMESTAMP_FORMAT
+from .services.libre_scheduler import sync_due
+from .services.libre_sync import RegionLimiter, sync_connections
+from .tasks import sync_libre_for_user
+
+END = datetime(2026, 10, 17, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def _gm(ts, value):
+    return {'FactoryTimestamp': ts.strftime(LLU_TIMESTAMP_FORMAT), 'ValueInMgPerDl': value, 'TrendArrow': 3}
+
+
+def _connections(account_id):
+    return {'data': [{'patientId': f'p-{account_id}', 'glucoseMeasurement': _gm(END, 150)}]}
+
+
+def _graph(base_url, token, account_id, patient_id, timeout=None):
+    return {'data': {'graphData': [_gm(END - timedelta(minutes=15 * i), 120 + i) for i in range(1, 5)]}}
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response.headers['Retry-After'] = '7'
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+@override_settings(LIBRE_SYNC_REGION_RATE_PER_MINUTE=60000, LIBRE_SYNC_REGION_BURST=100)
+class SyncConnectionsTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.conns = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'libre{i}', password='x')
+            self.conns.append(LibreConnection.objects.create(
+                user=user, email=f'libre{i}@example.com', token=f'tok{i}', account_id=f'acct{i}',
+                api_endpoint='https://api-eu.libreview.io', region='eu', connected=True))
+
+    def _patch(self, connection=None, graph=_graph, login=None):
+        def default_connection(base_url, token, account_id, timeout=None):
+            return _connections(account_id)
+        return (
+            mock.patch('core.services.libre.get_libreview_connection', side_effect=connection or default_connection),
+            mock.patch('core.services.libre.get_libreview_graph', side_effect=graph),
+            mock.patch('core.services.libre.login_with_password', side_effect=login),
+        )
+
+    def test_fans_out_and_ingests_every_connection(self):
+        p_conn, p_graph, p_login = self._patch()
+        with p_conn, p_graph as graph, p_login as login:
+            report = sync_connections(concurrency=4)
+        self.assertEqual(report.statuses, {'ok': 3})
+        self.assertEqual((report.requests, report.created, report.logins), (6, 15, 0))
+        self.assertEqual(graph.call_count, 3)
+        login.assert_not_called()
+        for conn in self.conns:
+            conn.refresh_from_db()
+            self.assertEqual((conn.last_sync_status, conn.sync_failures), ('ok', 0))
+            self.assertIsNotNone(conn.last_synced)
+            self.assertEqual(GlucoseRecord.objects.filter(user=conn.user, source='libre').count(), 5)
+        # a second run finds everything already stored
+        p_conn, p_graph, p_login = self._patch()
+        with p_conn, p_graph, p_login:
+            self.assertEqual(sync_connections().created, 0)
+
+    def test_logs_in_again_on_401_and_before_expiry(self):
+        expiring = self.conns[1]
+        expiring.token_expires_at = timezone.now() + timedelta(seconds=10)
+        expiring.save()
+        expires = int((timezone.now() + timedelta(hours=1)).timestamp())
+
+        def connection(base_url, token, account_id, timeout=None):
+            if token == 'tok0':
+                raise _http_error(401)
+            return _connections(account_id)
+
+        def login(email, password, timeout=None):
+            return ('https://api-de.libreview.io', {'access_token': f'new-{email}', 'account_id': 'acct-new',
+                                                    'expires': expires}, {})
+
+        self.conns[0].set_password_encrypted('secret')
+        expiring.set_password_encrypted('secret')
+        p_conn, p_graph, p_login = self._patch(connection=connection, login=login)
+        with p_conn, p_graph, p_login as login_mock:
+            report = sync_connections(include_history=False)
+        self.assertEqual(report.statuses, {'ok': 3})
+        self.assertEqual(report.logins, 2)
+        self.assertEqual(login_mock.call_count, 2)
+        for conn in self.conns[:2]:
+            conn.refresh_from_db()
+            self.assertEqual((conn.token, conn.region), (f'new-{conn.email}', 'de'))
+            self.assertEqual(int(conn.token_expires_at.timestamp()), expires)
+
+    def test_disconnect_during_a_run_is_kept(self):
+        def connection(base_url, token, account_id, timeout=None):
+            if token == 'tok0':
+                raise _http_error(401)
+            return _connections(account_id)
+
+        def login(email, password, timeout=None):
+            return ('https://api-eu.libreview.io', {'access_token': 'new', 'account_id': 'acct0'}, {})
+
+        def disconnect_first(conn, result):
+            # the user disconnects after the fetch, before the run writes back
+            if conn.pk == self.conns[0].pk:
+                LibreConnection.objects.get(pk=conn.pk).disconnect()
+
+        self.conns[0].set_password_encrypted('secret')
+        p_conn, p_graph, p_login = self._patch(connection=connection, login=login)
+        with p_conn, p_graph, p_login as login_mock:
+            report = sync_connections(on_result=disconnect_first, concurrency=1)
+        self.assertEqual(report.statuses, {'ok': 3})
+        login_mock.assert_called_once()
+        conn = LibreConnection.objects.get(pk=self.conns[0].pk)
+        self.assertEqual((conn.connected, conn.token, conn.last_sync_status), (False, None, 'ok'))
+
+        # a re-login that lands after the disconnect is dropped
+        stale = self.conns[1]
+        LibreConnection.objects.get(pk=stale.pk).disconnect()
+        libre_sync._store_credentials(LibreConnection, stale, {'token': 'late', 'account_id': 'acct1'})
+        stale.refresh_from_db()
+        self.assertEqual((stale.connected, stale.token), (False, None))
+
+    def test_disconnected_users_are_not_logged_back_in(self):
+        conn = self.conns[0]
+        conn.set_password_encrypted('secret')
+        conn.disconnect()
+        p_conn, p_graph, p_login = self._patch(login=lambda *a, **k: ('https://api-eu.libreview.io',
+                                                                       {'access_token': 'new'}, {}))
+        with p_conn, p_graph, p_login as login_mock:
+            self.assertEqual(sync_libre_for_user(conn.user_id), {'error': 'no connection'})
+            self.assertEqual(sync_connections(LibreConnection.objects.filter(pk=conn.pk)).connections, 0)
+        login_mock.assert_not_called()
+        conn.refresh_from_db()
+        self.assertEqual((conn.connected, conn.token), (False, None))
+
+    def test_failures_are_recorded_per_connection(self):
+        def connection(base_url, token, account_id, timeout=None):
+            if token == 'tok1':
+                raise _http_error(401)
+            if token == 'tok2':
+                raise _http_error(429)
+            return _connections(account_id)
+
+        limiter = RegionLimiter(rate_per_minute=60000, burst=100)
+        p_conn, p_graph, p_login = self._patch(connection=connection)
+        with p_conn, p_graph, p_login:
+            report = sync_connections(limiter=limiter, concurrency=1)
+        self.assertEqual(report.statuses, {'rate_limited': 1, 'auth_failed': 1, 'ok': 1})
+        unauthorized, limited = (LibreConnection.objects.get(pk=c.pk) for c in self.conns[1:])
+        self.assertEqual(unauthorized.last_sync_status, 'auth_failed')  # no stored password to log in again with
+        self.assertEqual((limited.last_sync_status, limited.sync_failures, limited.last_synced),
+                         ('rate_limited', 1, None))
+        # the 429 paused the region for its Retry-After
+        self.assertFalse(limiter.acquire('eu', max_wait=0.05))
+        self.assertTrue(limiter.acquire('us', max_wait=0.05))
+
+    def test_task_and_command(self):
+        p_conn, p_graph, p_login = self._patch()
+        with p_conn, p_graph, p_login:
+            self.assertEqual(sync_libre_for_user(self.conns[0].user_id), {'fetched': 5, 'created': 5})
+            out = StringIO()
+            call_command('sync_libre', stdout=out)
+        self.assertIn('Synced 3 connections', out.getvalue())
+        self.assertEqual(sync_libre_for_user(10 ** 6), {'error': 'no connection'})
+
+        # held by another worker process
+        self.assertTrue(locks.acquire(libre_sync.LOCK_KEY, 60, 'other-worker'))
+        self.assertIsNone(libre_sync.sync_all())
+        locks.release(libre_sync.LOCK_KEY, 'other-worker')
+        p_conn, p_graph, p_login = self._patch()
+        with p_conn, p_graph, p_login:
+            self.assertIsNotNone(libre_sync.sync_all())
+        self.assertFalse(TaskLock.objects.exists())
+
+    def test_full_sync_keeps_the_schedule_and_shares_the_due_lock(self):
+        planned = timezone.now() + timedelta(minutes=7)
+
+        real_ingest = libre_sync.ingest_readings
+
+        def reschedule(user, readings, **kwargs):
+            # the scheduler plans the next poll while this run is still going
+            LibreConnection.objects.filter(pk=self.conns[0].pk).update(next_sync_at=planned, sync_interval=420)
+            return real_ingest(user, readings, **kwargs)
+
+        p_conn, p_graph, p_login = self._patch()
+        with p_conn, p_graph, p_login, mock.patch('core.services.libre_sync.ingest_readings', side_effect=reschedule):
+            self.assertEqual(libre_sync.sync_all(concurrency=1).statuses, {'ok': 3})
+        conn = LibreConnection.objects.get(pk=self.conns[0].pk)
+        self.assertEqual((conn.next_sync_at, conn.sync_interval), (planned, 420))
+        self.assertEqual(conn.last_sync_status, 'ok')
+
+        self.assertTrue(locks.acquire(libre_sync.LOCK_KEY, 60, 'sync-all'))
+        self.assertIsNone(sync_due())
+        locks.release(libre_sync.LOCK_KEY, 'sync-all')
+
+
+class RegionLimiterTests(TestCase):
+    def test_bucket_per_region(self):
+        limiter = RegionLimiter(rate_per_minute=60, burst=1)
+        self.assertTrue(limiter.acquire('eu', max_wait=0))
+        self.assertFalse(limiter.acquire('eu', max_wait=0.1))  # the next token is a second away
+        self.assertTrue(limiter.acquire('us', max_wait=0))
+
+
+class TaskLockTests(TestCase):
+    def test_one_holder_until_released_or_expired(self):
+        with locks.task_lock('job', ttl=60) as first:
+            self.assertTrue(first)
+            with locks.task_lock('job', ttl=60) as second:
+                self.assertFalse(second)
+        self.assertTrue(locks.acquire('job', ttl=-1, owner='crashed'))  # already expired
+        with locks.task_lock('job', ttl=60) as taken_over:
+            self.assertTrue(taken_over)
@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Alert, FoodEntry, GlucoseHourlyRollup, GlucoseRecord, NutritionalInfo
+from .services.offline_sync import latest_glucose_at
+
+GLUCOSE_URL = '/glugo/v1/glucose-records/batch/'
+FOOD_URL = '/glugo/v1/food-entries/batch/'
+
+
+@override_settings(ALERT_DELIVERY_QUEUE='sync', ALERT_DELIVERY_BACKEND='core.tests_alerts.RecordingBackend')
+class OfflineBatchTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='offline', password='x', insulin_to_carb_ratio=10, correction_factor=50)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def _readings(self, n, start=0):
+        return [{'client_id': f'g-{i}', 'timestamp': (self.now - timedelta(minutes=5 * (n - i))).isoformat(),
+                 'value': 100 + i % 50, 'source': 'manual', 'mood': 'Good'} for i in range(start, start + n)]
+
+    def test_glucose_batch_creates_reports_and_is_idempotent(self):
+        items = self._readings(3) + [
+            {'client_id': 'low', 'timestamp': self.now.isoformat(), 'value': 50},
+            {'client_id': 'g-0', 'timestamp': self.now.isoformat(), 'value': 200},  # repeated key
+            {'client_id': 'bad', 'value': 120},
+        ]
+        body = self.client.post(GLUCOSE_URL, {'items': items}, format='json').json()
+        self.assertEqual((body['created'], body['duplicates'], body['invalid']), (4, 1, 1))
+        self.assertEqual([r['status'] for r in body['results']],
+                         ['created'] * 4 + ['duplicate', 'invalid'])
+        self.assertIn('timestamp', body['results'][5]['errors'])
+        self.assertEqual(body['results'][0]['record']['mood'], 'good')
+        self.assertEqual(body['results'][4]['id'], body['results'][0]['id'])
+
+        # post_save never ran; the batch hooks did, once
+        self.assertEqual(list(Alert.objects.filter(user=self.user).values_list('alert_type', flat=True)),
+                         ['low_glucose'])
+        self.assertTrue(GlucoseHourlyRollup.objects.filter(user=self.user).exists())
+
+        replay = self.client.post(GLUCOSE_URL, items, format='json').json()
+        self.assertEqual((replay['created'], replay['duplicates']), (0, 5))
+        self.assertEqual([r['id'] for r in replay['results'][:5]], [r['id'] for r in body['results'][:5]])
+        self.assertEqual(GlucoseRecord.objects.filter(user=self.user).count(), 4)
+
+    def test_reading_already_synced_is_a_duplicate(self):
+        synced = GlucoseRecord.objects.create(user=self.user, timestamp=self.now, glucose_level=140, source='libre')
+        body = self.client.post(GLUCOSE_URL, [
+            {'client_id': 'a', 'timestamp': self.now.isoformat(), 'value': 140, 'source': 'libre'},
+        ], format='json').json()
+        self.assertEqual(body['results'][0]['status'], 'duplicate')
+        self.assertEqual(body['results'][0]['id'], str(synced.pk))
+
+    def test_glucose_batch_queries_do_not_grow_with_size(self):
+        self.client.post(GLUCOSE_URL, self._readings(1, 1000), format='json')  # creates the feature state
+        for n, start in ((5, 0), (200, 100)):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(GLUCOSE_URL, self._readings(n, start), format='json')
+            self.assertEqual(resp.json()['created'], n)
+            # lookups, insert, rollup upserts (at most two days) and one feature-state update, whatever the size
+            self.assertLessEqual(len(ctx.captured_queries), 20)
+
+    def test_food_batch_doses_from_glucose_at_each_entry_time(self):
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(hours=3), glucose_level=200),
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(hours=1), glucose_level=100),
+        ])
+        items = [
+            {'client_id': 'breakfast', 'food_name': 'oats', 'meal_type': 'breakfast', 'total_carbs': 40,
+             'timestamp': (self.now - timedelta(hours=2)).isoformat()},
+            {'client_id': 'lunch', 'food_name': 'rice', 'total_carbs_g': 60,
+             'nutritional_info': {'carbs': 60, 'calories': 400}, 'timestamp': self.now.isoformat()},
+            {'client_id': 'early', 'food_name': 'toast', 'total_carbs': 20,
+             'timestamp': (self.now - timedelta(hours=5)).isoformat()},
+            {'client_id': 'water', 'food_name': 'water', 'meal_type': 'brunch'},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.client.post(FOOD_URL, {'items': items}, format='json').json()
+        self.assertEqual((body['created'], body['invalid']), (3, 1))
+        self.assertIn('meal_type', body['results'][3]['errors'])
+        # 40 g / 10 + (200 - 100) / 50 correction from the 3 h-old reading
+        self.assertEqual(body['results'][0]['record']['insulin_recommended'], 6.0)
+        self.assertEqual(body['results'][1]['record']['insulin_rounded'], 6.0)
+        self.assertEqual(body['results'][1]['record']['nutritional_info']['calories'], 400)
+        self.assertEqual(body['results'][2]['record']['insulin_recommended'], 2.0)  # no earlier reading
+        entry = FoodEntry.objects.get(user=self.user, client_id='breakfast')
+        self.assertEqual(entry.timestamp, self.now - timedelta(hours=2))
+        self.assertEqual(sum('glucoserecord' in q['sql'].lower() for q in ctx.captured_queries), 2)
+
+        replay = self.client.post(FOOD_URL, {'items': items[:3]}, format='json').json()
+        self.assertEqual(replay['duplicates'], 3)
+        self.assertEqual(FoodEntry.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(NutritionalInfo.objects.count(), 1)
+
+    def test_latest_glucose_at(self):
+        GlucoseRecord.objects.bulk_create([
+            GlucoseRecord(user=self.user, timestamp=self.now - timedelta(minutes=m), glucose_level=m)
+            for m in (60, 30, 10)
+        ])
+        at = latest_glucose_at(self.user, [self.now - timedelta(minutes=m) for m in (90, 60, 45, 0)])
+        self.assertEqual(list(at.values()), [None, 60, 60, 10])
+
+    @override_settings(OFFLINE_BATCH_MAX_ITEMS=2)
+    def test_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.client.post(GLUCOSE_URL, {'items': []}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(FOOD_URL, self._readings(3), format='json').status_code, 400)
@@ -0,0 +1,209 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+import openai
+from django.test import SimpleTestCase, override_settings
+
+from .services import openai_outbound
+from .services.openai_outbound import (
+    CircuitBreaker, CircuitOpen, DjangoCacheTokenBucket, LocalTokenBucket, OpenAIOutbound,
+)
+from .services.openai_service import OpenAIServiceError, OpenAITimeout, OpenAITooManyRequests, _request_analysis
+
+GOOD_JSON = '{"name":"burger","components":[{"name":"bun","carbs_g":30}],"total_carbs_g":30,' \
+            '"total_protein_g":12,"total_fat_g":9}'
+
+
+def sdk_timeout():
+    return openai.APITimeoutError(request=MagicMock())
+
+
+def sdk_rate_limited():
+    return openai.RateLimitError('rate limited', response=MagicMock(status_code=429), body=None)
+
+
+def completion(content=GOOD_JSON):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
+def outbound_with(client, **kwargs):
+    kwargs.setdefault('bucket', LocalTokenBucket(rate_per_minute=6000, burst=100))
+    return OpenAIOutbound(client_factory=lambda: client, **kwargs)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures_then_probes(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+        with patch('core.services.openai_outbound.time.monotonic', return_value=100.0):
+            breaker.record_failure()
+            breaker.record_success()  # a success resets the count
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertFalse(breaker.allow())
+        with patch('core.services.openai_outbound.time.monotonic', return_value=131.0):
+            self.assertTrue(breaker.allow())   # the probe
+            self.assertFalse(breaker.allow())  # only one at a time
+            breaker.record_failure()
+            self.assertEqual(breaker.stats()['state'], 'open')
+        with patch('core.services.openai_outbound.time.monotonic', return_value=162.0):
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+            self.assertTrue(breaker.allow())
+        stats = breaker.stats()
+        self.assertEqual((stats['state'], stats['opens'], stats['rejected']), ('closed', 2, 2))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_paced(self):
+        with patch('core.services.openai_outbound.time.monotonic', return_value=10.0):
+            bucket = LocalTokenBucket(rate_per_minute=60, burst=3)
+            self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+            self.assertAlmostEqual(bucket.take(), 1.0)
+        with patch('core.services.openai_outbound.time.monotonic', return_value=11.0):
+            self.assertEqual(bucket.take(), 0.0)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'LOCATION': 'openai-bucket'}})
+    def test_django_bucket_is_shared_between_instances(self):
+        first, second = DjangoCacheTokenBucket(60, burst=2), DjangoCacheTokenBucket(60, burst=2)
+        self.assertEqual((first.take(), second.take()), (0.0, 0.0))
+        self.assertGreater(first.take(), 0.5)
+
+
+class OutboundCallTests(SimpleTestCase):
+    def test_sdk_errors_are_translated_and_trip_the_breaker(self):
+        client = MagicMock()
+        client.chat.completions.create.side_effect = sdk_timeout()
+        outbound = outbound_with(client, breaker=CircuitBreaker(failure_threshold=2))
+        call = lambda c: c.chat.completions.create()  # noqa: E731
+        for _ in range(2):
+            with self.assertRaises(OpenAITimeout):
+                outbound.call(call)
+        with self.assertRaises(CircuitOpen):
+            outbound.call(call)
+        self.assertEqual(client.chat.completions.create.call_count, 2)
+
+        client.chat.completions.create.side_effect = openai.BadRequestError(
+            'bad image', response=MagicMock(status_code=400), body=None)
+        healthy = outbound_with(client, breaker=CircuitBreaker(failure_threshold=1))
+        with self.assertRaises(OpenAIServiceError):
+            healthy.call(call)
+        self.assertEqual(healthy.breaker.stats()['state'], 'closed')  # not a provider problem
+
+    def test_concurrency_is_capped(self):
+        release, entered = threading.Event(), threading.Semaphore(0)
+
+        def slow(client):
+            entered.release()
+            release.wait(5)
+            return 'ok'
+
+        outbound = outbound_with(MagicMock(), max_concurrency=2, queue_timeout=0.05)
+        threads = [threading.Thread(target=outbound.call, args=(slow,)) for _ in range(2)]
+        for t in threads:
+            t.start()
+        entered.acquire(timeout=5)
+        entered.acquire(timeout=5)
+        with self.assertRaises(OpenAITooManyRequests):
+            outbound.call(slow)
+        release.set()
+        for t in threads:
+            t.join()
+        stats = outbound.stats()
+        self.assertEqual((stats['peak_in_flight'], stats['in_flight'], stats['rejected_queue_timeout']), (2, 0, 1))
+        self.assertEqual(stats['breaker']['state'], 'closed')
+
+    def test_rate_limit_wait_beyond_the_queue_timeout_is_rejected(self):
+        outbound = outbound_with(MagicMock(), bucket=LocalTokenBucket(rate_per_minute=1, burst=1), queue_timeout=1)
+        outbound.call(lambda c: None)
+        with self.assertRaises(OpenAITooManyRequests):
+            outbound.call(lambda c: None)
+
+    def test_acall_shares_the_limits(self):
+        async_client = MagicMock()
+
+        async def create(client):
+            return 'done'
+
+        outbound = OpenAIOutbound(client_factory=MagicMock, async_client_factory=lambda: async_client)
+
+        async def run():
+            return await asyncio.gather(*(outbound.acall(create) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ['done'] * 5)
+        self.assertEqual(outbound.stats()['calls'], 5)
+
+    def test_cancelled_probe_frees_the_half_open_breaker(self):
+        started = None
+
+        async def hang(client):
+            started.set()
+            await asyncio.sleep(60)
+
+        async def done(client):
+            return 'done'
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        breaker.record_failure()
+        outbound = OpenAIOutbound(client_factory=MagicMock, async_client_factory=MagicMock, breaker=breaker,
+                                  bucket=LocalTokenBucket(rate_per_minute=6000, burst=100))
+
+        async def run():
+            nonlocal started
+            started = asyncio.Event()
+            probe = asyncio.ensure_future(outbound.acall(hang))
+            await started.wait()
+            probe.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await probe
+            return await outbound.acall(done)
+
+        self.assertEqual(asyncio.run(run()), 'done')  # the next call is let through as a probe
+        self.assertEqual(breaker.stats()['state'], 'closed')
+        self.assertEqual(outbound.stats()['in_flight'], 0)
+
+
+@override_settings(OPENAI_MAX_RETRIES=1, OPENAI_RETRY_BACKOFF=0)
+class RequestAnalysisTests(SimpleTestCase):
+    def _run(self, outbound):
+        with patch('core.services.openai_outbound.get_outbound', return_value=outbound):
+            return _request_analysis('b64', 'jpeg', 'vision-test', 'anon', 'rid')
+
+    def test_client_is_long_lived(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value = completion()
+        factory = MagicMock(return_value=client)
+        outbound = OpenAIOutbound(client_factory=factory)
+        self.assertEqual(self._run(outbound)['name'], 'burger')
+        self._run(outbound)
+        factory.assert_called_once()
+
+    def test_timeout_is_retried_once_and_429_is_not(self):
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [sdk_timeout(), completion()]
+        self.assertEqual(self._run(outbound_with(client))['total_carbs_g'], 30)
+
+        client.chat.completions.create.side_effect = [sdk_rate_limited(), completion()]
+        with self.assertRaises(OpenAITooManyRequests):
+            self._run(outbound_with(client))
+        self.assertEqual(client.chat.completions.create.call_count, 3)
+
+    def test_invalid_json_does_not_count_as_an_outage(self):
+        client = MagicMock()
+        client.chat.completions.create.return_value = completion('not json')
+        outbound = outbound_with(client, breaker=CircuitBreaker(failure_threshold=1))
+        with self.assertRaises(OpenAIServiceError):
+            self._run(outbound)
+        self.assertEqual(outbound.breaker.stats()['state'], 'closed')
+
+    def test_settings_build_one_shared_layer(self):
+        with override_settings(OPENAI_API_KEY='sk-test', OPENAI_MAX_CONCURRENCY=3, OPENAI_RATE_PER_MINUTE=120):
+            outbound = openai_outbound.get_outbound()
+            self.assertIs(openai_outbound.get_outbound(), outbound)
+            stats = openai_outbound.outbound_stats()
+            self.assertEqual((stats['max_concurrency'], stats['rate_limit']['per_minute']), (3, 120))
+        with override_settings(OPENAI_API_KEY=None):
+            with self.assertRaises(OpenAIServiceError):
+                openai_outbound.get_outbound().get_client()
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import FoodEntry, GlucoseRecord, NutritionalInfo
+
+URL = '/glugo/v1/glucose-records/'
+
+
+class GlucoseRecordPaginationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pager', password='x')
+        other = User.objects.create_user(username='other', password='x')
+        self.end = timezone.now().replace(microsecond=0)
+        GlucoseRecord.objects.bulk_create(
+            [GlucoseRecord(user=self.user, timestamp=self.end - timedelta(minutes=i), glucose_level=100 + i % 50,
+                           source='libre' if i % 4 else 'manual') for i in range(1250)]
+            + [GlucoseRecord(user=other, timestamp=self.end, glucose_level=90, source='libre')]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _pages(self, url):
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append(body['results'])
+            url = body['next']
+        return pages
+
+    def test_cursor_pages_cover_history_newest_first(self):
+        pages = self._pages(f'{URL}?limit=500')
+        self.assertEqual([len(p) for p in pages], [500, 500, 250])
+        rows = [r for p in pages for r in p]
+        self.assertEqual(len({r['id'] for r in rows}), 1250)
+        timestamps = [r['timestamp'] for r in rows]
+        self.assertEqual(timestamps, sorted(timestamps, reverse=True))
+
+    def test_page_cost_does_not_grow_with_depth(self):
+        body = self.client.get(f'{URL}?limit=100').json()
+        for _ in range(10):
+            with CaptureQueriesContext(connection) as ctx:
+                body = self.client.get(body['next']).json()
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn('OFFSET 9', ctx.captured_queries[0]['sql'])
+
+    @override_settings(API_MAX_PAGE_SIZE=100)
+    def test_page_size_is_capped(self):
+        body = self.client.get(f'{URL}?limit=100000').json()
+        self.assertEqual(len(body['results']), 100)
+
+    def test_range_and_source_filters(self):
+        start = (self.end - timedelta(minutes=99)).isoformat()
+        rows = [r for p in self._pages(f'{URL}?source=manual&start={start.replace("+", "%2B")}') for r in p]
+        self.assertEqual(len(rows), 25)
+        self.assertTrue(all(r['source'] == 'manual' for r in rows))
+
+        end = (self.end - timedelta(minutes=1000)).isoformat()
+        rows = [r for p in self._pages(f'{URL}?end_date={end.replace("+", "%2B")}') for r in p]
+        self.assertEqual(len(rows), 250)
+
+    def test_invalid_range_is_rejected(self):
+        resp = self.client.get(f'{URL}?start=yesterday')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('start', resp.json())
+
+
+class FoodEntryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='eater', password='x')
+        for i in range(30):
+            FoodEntry.objects.create(user=self.user, food_name=f'meal {i}', meal_type='lunch' if i % 2 else 'dinner',
+                                     nutritional_info=NutritionalInfo.objects.create(carbs=i))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_food_entries_are_paginated_without_per_row_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            body = self.client.get('/glugo/v1/food-entries/?limit=20&meal_type=lunch').json()
+        self.assertEqual(len(body['results']), 15)
+        self.assertIsNone(body['next'])
+        self.assertTrue(all(r['nutritional_info'] is not None for r in body['results']))
+        self.assertEqual(len(ctx.captured_queries), 1)
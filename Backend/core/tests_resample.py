@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from .models import GlucoseRecord
+from .services.resample import NS_PER_SECOND, resample
+
+
+def _legacy_resample(glucose_ts, glucose_values, food_ts, food_carbs, start_ns, end_ns):
+    """Slot-by-slot loop equivalent to the original prepare_user_data."""
+    glucose, carbs = [], []
+    slot = start_ns
+    while slot <= end_ns:
+        closest, min_diff = None, float('inf')
+        for ts, value in zip(glucose_ts, glucose_values):
+            diff = abs(ts - slot) / NS_PER_SECOND
+            if diff <= 300 and diff < min_diff:
+                closest, min_diff = value, diff
+        glucose.append(np.nan if closest is None else closest)
+        carbs.append(sum(c for ts, c in zip(food_ts, food_carbs) if abs(ts - slot) / NS_PER_SECOND <= 1800))
+        slot += 300 * NS_PER_SECOND
+    return np.array(glucose), np.array(carbs)
+
+
+class ResampleEquivalenceTests(SimpleTestCase):
+    def test_matches_slot_loop(self):
+        rng = np.random.default_rng(7)
+        start_ns = 1_700_000_000 * NS_PER_SECOND
+        end_ns = start_ns + 6 * 3600 * NS_PER_SECOND
+        # irregular readings with gaps, duplicates and exact slot hits
+        offsets = rng.integers(0, 6 * 3600, size=180)
+        offsets[10] = offsets[11]
+        offsets[20] = 600
+        glucose_ts = start_ns + np.sort(offsets) * NS_PER_SECOND
+        glucose_values = rng.uniform(60, 250, size=glucose_ts.size)
+        food_ts = start_ns + np.sort(rng.integers(0, 6 * 3600, size=8)) * NS_PER_SECOND
+        food_carbs = rng.uniform(5, 80, size=food_ts.size)
+
+        series = resample(glucose_ts, glucose_values, food_ts, food_carbs, start_ns, end_ns)
+        expected_glucose, expected_carbs = _legacy_resample(
+            glucose_ts, glucose_values, food_ts, food_carbs, start_ns, end_ns)
+
+        self.assertEqual(len(series), expected_glucose.size)
+        np.testing.assert_array_equal(np.isnan(series.glucose), np.isnan(expected_glucose))
+        np.testing.assert_allclose(series.glucose, expected_glucose, equal_nan=True)
+        np.testing.assert_allclose(series.carbs, expected_carbs, atol=1e-9)
+
+    def test_empty_inputs(self):
+        series = resample(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64), np.empty(0),
+                          0, 3600 * NS_PER_SECOND)
+        self.assertEqual(len(series), 13)
+        self.assertTrue(np.isnan(series.glucose).all())
+        self.assertIsNone(series.latest_glucose())
+
+
+class PrepareUserDataTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='resample', password='pass123')
+
+    def test_skips_out_of_range_readings(self):
+        from .services.prediction import prediction_service
+
+        now = timezone.now()
+        for minutes, level in ((30, 110.0), (20, 500.0), (10, 130.0)):
+            GlucoseRecord.objects.create(user=self.user, timestamp=now - timedelta(minutes=minutes),
+                                         glucose_level=level, source='manual')
+        series = prediction_service.prepare_user_data(self.user, lookback_minutes=60)
+        self.assertEqual(len(series), 13)
+        self.assertNotIn(500.0, series.valid_glucose.tolist())
+        self.assertEqual(series.latest_glucose(), 130.0)
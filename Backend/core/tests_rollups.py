@@ -0,0 +1,146 @@
+import importlib
+import os
+import random
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.utils import timezone
+
+from .models import GlucoseDailyRollup, GlucoseHourlyRollup, GlucoseRecord, InsightReport
+from .services import rollups
+from .services.glucose_stats import summarize
+
+
+class GlucoseRollupTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='rollups', password='pass123')
+        self.now = timezone.now()
+        self.rng = random.Random(7)
+
+    def _readings(self, days, step_minutes=7):
+        return [
+            GlucoseRecord(user=self.user, glucose_level=round(self.rng.uniform(45, 320), 1),
+                          timestamp=self.now - timedelta(minutes=m, seconds=self.rng.randint(0, 59)))
+            for m in range(0, days * 24 * 60, step_minutes)
+        ]
+
+    def _load_without_signals(self, records):
+        receivers = post_save.receivers
+        post_save.receivers = []
+        try:
+            GlucoseRecord.objects.bulk_create(records)
+        finally:
+            post_save.receivers = receivers
+
+    def assertMatchesRaw(self, start, end):
+        expected = summarize(self.user, start, end)
+        got = rollups.summary(self.user, start, end)
+        self.assertEqual((got.count, got.below, got.above), (expected.count, expected.below, expected.above))
+        self.assertEqual((got.minimum, got.maximum), (expected.minimum, expected.maximum))
+        self.assertAlmostEqual(got.mean, expected.mean, places=9)
+        self.assertAlmostEqual(got.cv, expected.cv, places=6)
+
+    def test_backfill_matches_raw_for_arbitrary_ranges(self):
+        self._load_without_signals(self._readings(9))
+        call_command('backfill_glucose_rollups', stdout=open(os.devnull, 'w'))
+        self.assertGreater(GlucoseDailyRollup.objects.filter(user=self.user).count(), 7)
+        for _ in range(10):
+            a, b = sorted(self.now - timedelta(minutes=self.rng.randint(0, 10 * 24 * 60)) for _ in range(2))
+            self.assertMatchesRaw(a, b)
+        self.assertMatchesRaw(self.now - timedelta(days=30), self.now)
+
+    def test_migration_backfills_existing_readings(self):
+        self._load_without_signals(self._readings(3))
+        GlucoseRecord.objects.create(user=self.user, glucose_level=150, timestamp=self.now)  # written after 0011
+        migration = importlib.import_module('core.migrations.0021_backfill_glucose_rollups')
+        migration.backfill_rollups(apps, None)
+        self.assertMatchesRaw(self.now - timedelta(days=4), self.now)
+        daily = GlucoseDailyRollup.objects.filter(user=self.user)
+        self.assertEqual(sum(daily.values_list('count', flat=True)),
+                         GlucoseRecord.objects.filter(user=self.user).count())
+
+        migration.backfill_rollups(apps, None)  # re-running changes nothing
+        self.assertEqual(sum(GlucoseHourlyRollup.objects.filter(user=self.user).values_list('count', flat=True)),
+                         GlucoseRecord.objects.filter(user=self.user).count())
+
+    def test_incremental_maintenance(self):
+        for record in self._readings(2, step_minutes=41):
+            record.save()
+        self.assertMatchesRaw(self.now - timedelta(days=3), self.now)
+
+        moved = GlucoseRecord.objects.filter(user=self.user).order_by('timestamp').first()
+        moved.timestamp = self.now - timedelta(minutes=3)
+        moved.glucose_level = 400
+        moved.save()
+        GlucoseRecord.objects.filter(user=self.user).order_by('timestamp').first().delete()
+        self.assertMatchesRaw(self.now - timedelta(days=3), self.now)
+
+        hourly = GlucoseHourlyRollup.objects.filter(user=self.user)
+        self.assertEqual(sum(hourly.values_list('count', flat=True)),
+                         GlucoseRecord.objects.filter(user=self.user).count())
+
+    def test_refresh_upserts_rows_and_prunes_emptied_hours(self):
+        record = GlucoseRecord.objects.create(user=self.user, timestamp=self.now - timedelta(hours=2),
+                                              glucose_level=150)
+        hour = GlucoseHourlyRollup.objects.get(user=self.user)
+        day = GlucoseDailyRollup.objects.get(user=self.user)
+        # a second refresh of the same hours (e.g. a concurrent ingest) updates the rows in place
+        rollups.refresh_range(self.user, record.timestamp, record.timestamp)
+        self.assertEqual(GlucoseHourlyRollup.objects.get(user=self.user).pk, hour.pk)
+        self.assertEqual(GlucoseDailyRollup.objects.get(user=self.user).pk, day.pk)
+
+        with self.assertNumQueries(6):
+            # aggregate, hourly upsert, day's hourly rows, daily upsert, in a savepoint
+            rollups.record_glucose([GlucoseRecord(user=self.user, timestamp=record.timestamp, glucose_level=1)])
+
+        record.delete()
+        self.assertFalse(GlucoseHourlyRollup.objects.filter(user=self.user).exists())
+        self.assertFalse(GlucoseDailyRollup.objects.filter(user=self.user).exists())
+
+    def test_threshold_change_refreshes_on_read(self):
+        self._load_without_signals(self._readings(3))
+        rollups.backfill(self.user)
+        self.user.target_glucose_min = 100
+        self.user.target_glucose_max = 150
+        self.user.save()
+        start = self.now - timedelta(days=3)
+        self.assertMatchesRaw(start, self.now)
+        stale = GlucoseHourlyRollup.objects.filter(
+            user=self.user, bucket__gte=rollups.ceil_hour(start), bucket__lt=rollups.floor_hour(self.now),
+        ).exclude(low_threshold=100)
+        self.assertFalse(stale.exists())
+
+    def test_insights_from_rollups(self):
+        self._load_without_signals(self._readings(20))
+        rollups.backfill(self.user)
+        report = InsightReport(user=self.user)
+        report.save()
+        with self.assertNumQueries(6):
+            # 2 raw edge hours, hourly + daily rollup rows, meal types, report save
+            payload = report.generate_insights(days=14)
+
+        since = self.now - timedelta(days=14)
+        raw = GlucoseRecord.objects.filter(user=self.user, timestamp__gte=since, timestamp__lte=payload_now(payload))
+        levels = list(raw.values_list('glucose_level', flat=True))
+        self.assertEqual(payload['low_events'], sum(1 for v in levels if v < 70))
+        self.assertEqual(payload['high_events'], sum(1 for v in levels if v > 180))
+        self.assertAlmostEqual(payload['average_glucose_mgdl'], round(sum(levels) / len(levels), 1))
+        days = {}
+        for r in raw:
+            days.setdefault(r.timestamp.date(), []).append(r.glucose_level)
+        self.assertEqual([d['day'] for d in payload['meal_impact_series']], [str(d) for d in sorted(days)])
+        hours = [0] * 24
+        for r in raw.filter(glucose_level__gt=180):
+            hours[r.timestamp.hour] += 1
+        buckets = [sum(hours[0:6]), sum(hours[6:12]), sum(hours[12:18]), sum(hours[18:24])]
+        names = ['Night (0-5)', 'Morning (6-11)', 'Afternoon (12-17)', 'Evening (18-23)']
+        self.assertEqual(payload['time_of_day_with_spikes'], names[buckets.index(max(buckets))])
+
+
+def payload_now(payload):
+    from django.utils.dateparse import parse_datetime
+    return parse_datetime(payload['updated_at'])
@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import GlucoseRecord
+from .services import user_state
+from .services.user_state import HotState, get_user_state_cache
+
+
+class UserStateCacheTests(TestCase):
+    def setUp(self):
+        get_user_state_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            username='hot', password='x', insulin_to_carb_ratio=10, correction_factor=50,
+            target_glucose_min=80, target_glucose_max=160)
+        self.now = timezone.now()
+        GlucoseRecord.objects.create(user=self.user, timestamp=self.now - timedelta(minutes=10), glucose_level=120)
+
+    def test_warm_state_needs_no_queries(self):
+        with self.assertNumQueries(1):  # the profile part was cached when the reading was saved
+            self.assertEqual(user_state.latest_glucose(self.user.pk), 120)
+        with self.assertNumQueries(0):
+            self.assertEqual(user_state.latest_glucose(self.user.pk), 120)
+            self.assertEqual(user_state.thresholds(self.user.pk), (80, 160))
+            self.assertEqual(user_state.dosing(self.user), (10, 50))
+
+    def test_thresholds_do_not_load_the_latest_reading(self):
+        with self.assertNumQueries(0):
+            user_state.thresholds(self.user)
+        self.assertFalse(get_user_state_cache().peek(self.user.pk).latest_loaded)
+
+    def test_new_readings_write_through_and_older_ones_do_not(self):
+        user_state.latest_glucose(self.user)
+        writes = get_user_state_cache().stats()['writes']
+        with self.captureOnCommitCallbacks() as callbacks:
+            GlucoseRecord.objects.create(user=self.user, timestamp=self.now, glucose_level=180, trend_arrow='up')
+            GlucoseRecord.objects.create(user=self.user, timestamp=self.now - timedelta(hours=1), glucose_level=60)
+        # nothing is written through before the readings are committed
+        self.assertEqual(get_user_state_cache().peek(self.user.pk).latest_glucose, 120)
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(0):
+            state = user_state.get_state(self.user, with_latest=True)
+        self.assertEqual((state.latest_glucose, state.latest_timestamp, state.latest_trend), (180, self.now, 'up'))
+        self.assertEqual(get_user_state_cache().stats()['writes'], writes + 1)
+
+    def test_editing_or_deleting_a_reading_invalidates(self):
+        user_state.latest_glucose(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            record = GlucoseRecord.objects.create(user=self.user, timestamp=self.now, glucose_level=180)
+        record.glucose_level = 170
+        record.save()
+        self.assertEqual(user_state.latest_glucose(self.user), 170)
+        record.delete()
+        self.assertEqual(user_state.latest_glucose(self.user), 120)
+
+    def test_profile_update_invalidates(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        user_state.get_state(self.user)
+        resp = client.patch('/glugo/v1/auth/profile/', {'insulin_to_carb_ratio': 5, 'target_glucose_max': 200},
+                            format='json')
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(user_state.dosing(self.user.pk), (5, 50))
+        self.assertEqual(user_state.thresholds(self.user.pk), (80, 200))
+
+    def test_warm_food_entry_create_skips_the_latest_read(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        client.post('/glugo/v1/food-entries/', {'food_name': 'a', 'meal_type': 'lunch', 'total_carbs': 10},
+                    format='json')
+        resp = client.post('/glugo/v1/food-entries/', {'food_name': 'b', 'meal_type': 'lunch', 'total_carbs': 30},
+                           format='json')
+        self.assertEqual(resp.json()['insulin_recommended'], 3.4)  # 30 / 10 + (120 - 100) / 50
+        self.assertGreaterEqual(get_user_state_cache().stats()['hits'], 1)
+
+    def test_dosing_is_not_served_from_a_per_process_cache(self):
+        user_state.get_state(self.user)
+        # another worker saved the profile; this process's entry was not invalidated
+        get_user_model().objects.filter(pk=self.user.pk).update(insulin_to_carb_ratio=5)
+        self.assertEqual(user_state.dosing(self.user.pk), (5, 50))
+        self.assertFalse(get_user_state_cache().shared)
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        cache = user_state.MemoryUserStateCache(max_entries=2)
+        for user_id in (1, 2, 3):
+            cache.set(user_id, HotState(low=70, high=180))
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(3).thresholds, (70, 180))
+
+
+@override_settings(
+    USER_STATE_CACHE_BACKEND='django',
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'user-state'}},
+)
+class DjangoUserStateCacheTests(TestCase):
+    def test_round_trip_and_invalidate(self):
+        user = get_user_model().objects.create_user(username='shared', password='x', insulin_to_carb_ratio=12)
+        now = timezone.now()
+        GlucoseRecord.objects.create(user=user, timestamp=now, glucose_level=140)
+        self.assertEqual(user_state.latest_glucose(user), 140)
+        with self.assertNumQueries(0):
+            self.assertEqual(user_state.get_state(user.pk, with_latest=True).latest_timestamp, now)
+        user_state.invalidate(user)
+        self.assertIsNone(get_user_state_cache().peek(user.pk))
+        self.assertEqual(get_user_state_cache().stats()['backend'], 'DjangoUserStateCache')
+        self.assertFalse(get_user_state_cache().shared)  # LocMemCache is per process too
@@ -8,8 +8,10 @@ from core.services.api import (
     LibreOAuthStartView, LibreOAuthCallbackView, LibrePasswordLoginView,
     OpenAIAnalyzeImageView, csrf_token_view, LibreSyncNowView, GlucoseStatisticsView,
     LibreDisconnectView,LibreConnectionStatusView, GlucosePredictionView,
-    PredictionStatusView, MealGlucosePredictionView,
+    PredictionStatusView, MealGlucosePredictionView, GlucoseDownsampleView,
+    HistoryExportView, HistoryImportView, AnalysisJobListView, AnalysisJobDetailView,
 )
+from core.services.batching import concurrent_view
 from core.views import FoodEntryListCreateView, FoodEntryDetailView
 
 router = routers.DefaultRouter()
@@ -31,13 +33,18 @@ urlpatterns = [
     path('libre/disconnect/', LibreDisconnectView.as_view(), name='libre_disconnect'),
     path('libre/status/', LibreConnectionStatusView.as_view(), name='libre_status'),
     path('ai/analyze-image/', OpenAIAnalyzeImageView.as_view(), name='ai_analyze_image'),
+    path('ai/analyze-image/jobs/', AnalysisJobListView.as_view(), name='ai_analysis_jobs'),
+    path('ai/analyze-image/jobs/<uuid:job_id>/', AnalysisJobDetailView.as_view(), name='ai_analysis_job'),
     path('api/csrf/', csrf_token_view, name='csrf_token'),
     path('csrf/' ,csrf_token_view, name='csrf_token'),
     path("libre/sync-now/", LibreSyncNowView.as_view(), name="libre_sync_now"),
     path('glucose-statistics/', GlucoseStatisticsView.as_view(), name='glucose-statistics'),
+    path('glucose/downsample/', GlucoseDownsampleView.as_view(), name='glucose-downsample'),
+    path('export/<str:fmt>/', HistoryExportView.as_view(), name='history-export'),
+    path('import/<str:fmt>/', HistoryImportView.as_view(), name='history-import'),
     path('food/entries/', FoodEntryListCreateView.as_view(), name='food-entry-list-create'),
     path('food/entries/<uuid:pk>/', FoodEntryDetailView.as_view(), name='food-entry-detail'),
-    path('glucose/predict/', GlucosePredictionView.as_view(), name='glucose-predict'),
-    path('glucose/predict-meal/', MealGlucosePredictionView.as_view(), name='meal-glucose-predict'),
+    path('glucose/predict/', concurrent_view(GlucosePredictionView.as_view()), name='glucose-predict'),
+    path('glucose/predict-meal/', concurrent_view(MealGlucosePredictionView.as_view()), name='meal-glucose-predict'),
     path('glucose/predict-status/', PredictionStatusView.as_view(), name='prediction-status'),
 ]
@@ -12,17 +12,71 @@ def add_lag_rolling(df, col, lags=[1, 2, 3, 6, 12], rolls=[3, 6, 12]):
     return df
 
 
-def compute_decay_feature(df, value_col, tau, new_col):
-    vals = df[value_col].fillna(0).values
-    out = np.zeros_like(vals, dtype=float)
-    for t in range(1, len(vals)):
-        out[t] = vals[t] + out[t - 1] * np.exp(-1 / tau)
-    df[new_col] = out
+# Largest exponent span folded into one cumulative-sum chunk; keeps
+# exp(span) well inside float64 range and the rounding error near 1e-13.
+DECAY_CHUNK_SPAN = 30.0
+
+
+def decay_kernel(values, tau, steps=None, groups=None):
+    """Vectorized out[t] = values[t] + out[t-1] * exp(-steps[t] / tau).
+
+    values: 1-D array (NaN treated as 0).
+    steps:  elapsed sampling intervals per row (default 1 per row), so irregular
+            or gappy series decay by real elapsed time.
+    groups: optional per-row patient ids (rows contiguous per patient); the
+            recursion restarts at every group boundary.
+    As in the original loop, the first row of every series is 0.
+    """
+    vals = np.nan_to_num(np.asarray(values, dtype=float))
+    n = len(vals)
+    out = np.zeros(n, dtype=float)
+    if n == 0:
+        return out
+    rate = np.ones(n) / tau if steps is None else np.asarray(steps, dtype=float) / tau
+
+    starts = np.zeros(n, dtype=bool)
+    starts[0] = True
+    if groups is not None:
+        groups = np.asarray(groups)
+        starts[1:] = groups[1:] != groups[:-1]
+    rate = np.where(starts, 0.0, rate)
+    # every group start jumps a full span so it always opens a new chunk
+    level = np.cumsum(rate + starts * DECAY_CHUNK_SPAN)
+    chunk = np.floor(level / DECAY_CHUNK_SPAN).astype(np.int64)
+    bounds = np.flatnonzero(np.diff(chunk, prepend=chunk[0] - 1)).tolist() + [n]
+
+    # Within a chunk starting at c: out[t] = e^-(L[t]-L[c]) * (out[c] + sum v[s] e^(L[s]-L[c]))
+    for c, e in zip(bounds[:-1], bounds[1:]):
+        head = 0.0 if starts[c] else vals[c] + out[c - 1] * np.exp(-rate[c])
+        scale = np.exp(level[c:e] - level[c])
+        terms = vals[c:e] * scale
+        terms[0] = head
+        out[c:e] = np.cumsum(terms) / scale
+    return out
+
+
+def compute_decay_feature(df, value_col, tau, new_col, time_col=None, group_col=None, step_minutes=5):
+    """Add an exponentially decaying sum of `value_col` (IOB/COB) as `new_col`.
+
+    By default each row is one step. Pass `time_col` to decay by the elapsed
+    time in `step_minutes` units, and `group_col` to compute many patients in
+    one call (rows must be sorted by group, then time).
+    """
+    steps = None
+    if time_col is not None:
+        steps = df[time_col].diff().dt.total_seconds().fillna(0).to_numpy() / (60 * step_minutes)
+    groups = df[group_col].to_numpy() if group_col is not None else None
+    df[new_col] = decay_kernel(df[value_col].to_numpy(), tau, steps=steps, groups=groups)
     return df
 
 
 def create_features_from_csv(file_path):
     df = pd.read_csv(file_path, parse_dates=["timestamp"])
+    return create_features(df)
+
+
+def create_features(df):
+    """Build model features from a frame with ['timestamp', 'glucose', 'insulin', 'carbs']."""
     df = df.sort_values("timestamp").reset_index(drop=True)
     df["patient_id"] = 0
 
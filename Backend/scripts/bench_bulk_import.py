@@ -0,0 +1,88 @@
+"""Bulk history import vs the per-reading write path on the bundled patient CSVs.
+
+Imports each `model/<id>.csv` into its own user in a throwaway test database
+with `bulk_import.import_history` and reports rows/s. For comparison, the
+first --baseline-rows readings of each file are written one
+`GlucoseRecord.objects.create` at a time (what `GlucoseRecordViewSet.create`
+does, signals included) and extrapolated to the full file.
+
+Usage:
+    python scripts/bench_bulk_import.py
+    python scripts/bench_bulk_import.py --files 64 --baseline-rows 0
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from core.models import GlucoseRecord  # noqa: E402
+from core.services import bulk_import, feature_store  # noqa: E402,F401  (import cost out of the timings)
+
+
+def per_row_seconds(user, path, rows):
+    frame = pd.read_csv(path, nrows=rows)
+    stamps = bulk_import._parse_timestamps(frame['timestamp'].astype(str))
+    t0 = time.perf_counter()
+    for ts, g in zip(stamps.dt.to_pydatetime(), frame['glucose']):
+        GlucoseRecord.objects.create(user=user, timestamp=ts, glucose_level=float(g), source='libre')
+    return (time.perf_counter() - t0) / len(frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', nargs='+', default=['37', '38', '64', '66'])
+    parser.add_argument('--baseline-rows', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        User = get_user_model()
+        print(f"{'file':>6} {'rows':>7} | {'import s':>8} {'rows/s':>8} {'glucose':>8} {'food':>6} "
+              f"{'rejected':>8} | {'per-row s':>9} {'speedup':>8}")
+        total_rows = total_seconds = 0.0
+        for name in args.files:
+            path = os.path.join(settings.PREDICTION_MODEL_DIR, f'{name}.csv')
+            user = User.objects.create_user(username=f'patient-{name}', password='x')
+            t0 = time.perf_counter()
+            with open(path, 'rb') as f:
+                result = bulk_import.import_history(user, f, 'csv')
+            elapsed = time.perf_counter() - t0
+            total_rows += result.rows
+            total_seconds += elapsed
+
+            per_row = ''
+            speedup = ''
+            if args.baseline_rows:
+                baseline_user = User.objects.create_user(username=f'per-row-{name}', password='x')
+                estimate = per_row_seconds(baseline_user, path, args.baseline_rows) * result.rows
+                per_row = f'{estimate:.1f}'
+                speedup = f'{estimate / elapsed:.0f}x'
+            print(f"{name:>6} {result.rows:>7} | {elapsed:>8.2f} {result.rows / elapsed:>8.0f} "
+                  f"{result.glucose_created:>8} {result.food_created:>6} {result.rejected:>8} | "
+                  f"{per_row:>9} {speedup:>8}")
+        print(f"{'all':>6} {int(total_rows):>7} | {total_seconds:>8.2f} {total_rows / total_seconds:>8.0f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""IOB/COB decay: original per-element loop vs vectorized decay_kernel.
+
+Runs both over the bundled patient CSVs (one at a time, then all patients in
+one grouped call) and reports timings and the max absolute difference.
+
+Usage:
+    python scripts/bench_decay_kernel.py
+    python scripts/bench_decay_kernel.py --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from model.feature_utils import decay_kernel  # noqa: E402
+
+MODEL_DIR = os.path.join(PROJECT_DIR, 'model')
+PATIENTS = ['37', '38', '64', '66']
+FEATURES = [('insulin', 48), ('carbs', 24)]
+
+
+def loop_decay(values, tau):
+    vals = np.nan_to_num(np.asarray(values, dtype=float))
+    out = np.zeros_like(vals)
+    for t in range(1, len(vals)):
+        out[t] = vals[t] + out[t - 1] * np.exp(-1 / tau)
+    return out
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    frames = {p: pd.read_csv(os.path.join(MODEL_DIR, f'{p}.csv'), parse_dates=['timestamp'])
+              .sort_values('timestamp').reset_index(drop=True) for p in PATIENTS}
+
+    print(f"{'patient':>8} {'rows':>7} | {'loop':>9} {'kernel':>9} {'speedup':>8} | {'max |diff|':>10}")
+    loop_total = 0.0
+    for patient, df in frames.items():
+        loop_time = kernel_time = diff = 0.0
+        for col, tau in FEATURES:
+            t_loop, expected = best_of(lambda: loop_decay(df[col], tau), 1)
+            t_kernel, got = best_of(lambda: decay_kernel(df[col].to_numpy(), tau), args.repeat)
+            loop_time += t_loop
+            kernel_time += t_kernel
+            diff = max(diff, float(np.abs(got - expected).max()))
+        loop_total += loop_time
+        print(f'{patient:>8} {len(df):>7} | {loop_time * 1000:>7.1f}ms {kernel_time * 1000:>7.2f}ms '
+              f'{loop_time / kernel_time:>7.0f}x | {diff:>10.1e}')
+
+    combined = pd.concat([df.assign(patient_id=p) for p, df in frames.items()], ignore_index=True)
+    groups = combined['patient_id'].to_numpy()
+    batch_time = sum(best_of(lambda: decay_kernel(combined[col].to_numpy(), tau, groups=groups), args.repeat)[0]
+                     for col, tau in FEATURES)
+    print(f"{'all':>8} {len(combined):>7} | {loop_total * 1000:>7.1f}ms {batch_time * 1000:>7.2f}ms "
+          f'{loop_total / batch_time:>7.0f}x | (grouped call)')
+
+
+if __name__ == '__main__':
+    main()
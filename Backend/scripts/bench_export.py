@@ -0,0 +1,82 @@
+"""History export: time and peak Python memory vs history length.
+
+Loads 1-minute CGM readings (plus a meal every 4 hours) for one user into a
+throwaway test database and drains `export.iter_export` for increasing
+history lengths, reporting throughput and the tracemalloc peak. The peak
+should stay flat as the history grows.
+
+Usage:
+    python scripts/bench_export.py
+    python scripts/bench_export.py --rows 10000 100000 --format ndjson
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+from datetime import timedelta
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from core.models import FoodEntry, GlucoseRecord  # noqa: E402
+from core.services import export  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 300000])
+    parser.add_argument('--format', choices=export.FORMATS, default='csv')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='x')
+        end = timezone.now()
+        n = max(args.rows)
+        receivers = post_save.receivers
+        post_save.receivers = []  # loading fixtures only; skip alert/rollup signals
+        try:
+            GlucoseRecord.objects.bulk_create(
+                (GlucoseRecord(user=user, timestamp=end - timedelta(minutes=i),
+                               glucose_level=100 + i % 120, source='libre') for i in range(n)),
+                batch_size=5000,
+            )
+            FoodEntry.objects.bulk_create(
+                (FoodEntry(user=user, food_name='meal', total_carbs=40, insulin_rounded=4) for _ in range(0, n, 240)),
+                batch_size=1000,
+            )
+        finally:
+            post_save.receivers = receivers
+
+        print(f"{'rows':>7} | {'seconds':>8} {'rows/s':>9} {'MiB out':>8} {'peak KiB':>9}")
+        for rows in sorted(args.rows):
+            start = end - timedelta(minutes=rows - 1, seconds=30)
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            size = sum(len(block) for block in export.iter_export(user, args.format, start=start))
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{rows:>7} | {elapsed:>8.2f} {rows / elapsed:>9.0f} {size / 2 ** 20:>8.1f} {peak / 1024:>9.0f}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
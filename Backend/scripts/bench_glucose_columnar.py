@@ -0,0 +1,100 @@
+"""glucose-records chart payload: GlucoseRecordSerializer vs ?format=columnar.
+
+For 1k/10k/100k readings of one user in a throwaway test database, times
+building + rendering the JSON body both ways and reports raw and gzipped
+payload sizes.
+
+Usage:
+    python scripts/bench_glucose_columnar.py
+    python scripts/bench_glucose_columnar.py --points 1000 10000
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+import warnings
+from datetime import timedelta
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from core.models import GlucoseRecord  # noqa: E402
+from core.serializers import GlucoseRecordSerializer  # noqa: E402
+from core.services.columnar import ColumnarJSONRenderer, glucose_columns  # noqa: E402
+
+
+def serialized(qs):
+    return JSONRenderer().render(GlucoseRecordSerializer(qs.order_by('timestamp'), many=True).data)
+
+
+def columnar(qs):
+    return ColumnarJSONRenderer().render(glucose_columns(qs, max_points=10 ** 9))
+
+
+def best_of(fn, repeat):
+    best, out = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--points', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='x')
+        end = timezone.now()
+        n = max(args.points)
+        rng = np.random.default_rng(0)
+        levels = np.clip(150 + np.cumsum(rng.normal(0, 2, size=n)), 40, 400)
+        receivers = post_save.receivers
+        post_save.receivers = []  # loading fixtures only; skip alert/rollup signals
+        try:
+            GlucoseRecord.objects.bulk_create(
+                (GlucoseRecord(user=user, timestamp=end - timedelta(minutes=i), glucose_level=float(levels[i]),
+                               trend_arrow=str(rng.integers(1, 6)), source='libre') for i in range(n)),
+                batch_size=5000,
+            )
+        finally:
+            post_save.receivers = receivers
+
+        print(f"{'points':>7} | {'serializer ms':>13} {'KiB':>7} {'gz KiB':>7} | "
+              f"{'columnar ms':>11} {'KiB':>7} {'gz KiB':>7} | {'speedup':>7}")
+        for points in args.points:
+            start = end - timedelta(minutes=points - 1, seconds=30)
+            qs = GlucoseRecord.objects.filter(user=user, timestamp__gte=start)
+            t_ser, body_ser = best_of(lambda: serialized(qs), args.repeat)
+            t_col, body_col = best_of(lambda: columnar(qs), args.repeat)
+            sizes = [len(b) / 1024 for b in (body_ser, gzip.compress(body_ser), body_col, gzip.compress(body_col))]
+            print(f"{points:>7} | {t_ser * 1000:>13.1f} {sizes[0]:>7.0f} {sizes[1]:>7.0f} | "
+                  f"{t_col * 1000:>11.1f} {sizes[2]:>7.0f} {sizes[3]:>7.0f} | {t_ser / t_col:>6.0f}x")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""glucose-records list: full-history response vs cursor pages at increasing depth.
+
+Loads 1-minute CGM history for one user into a throwaway test database and
+times GET /glugo/v1/glucose-records/ through the test client: the first
+page, a page deep into the history (reached by following `next` cursors),
+and -- for comparison -- serializing the whole history the way the
+unpaginated endpoint did.
+
+Usage:
+    python scripts/bench_glucose_pagination.py
+    python scripts/bench_glucose_pagination.py --days 90 --limit 500
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import timedelta
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from core.models import GlucoseRecord  # noqa: E402
+from core.serializers import GlucoseRecordSerializer  # noqa: E402
+
+URL = '/glugo/v1/glucose-records/'
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--depths', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='x')
+        end = timezone.now()
+        n = args.days * 24 * 60
+        receivers = post_save.receivers
+        post_save.receivers = []  # loading fixtures only; skip alert/rollup signals
+        try:
+            GlucoseRecord.objects.bulk_create(
+                (GlucoseRecord(user=user, timestamp=end - timedelta(minutes=i),
+                               glucose_level=100 + i % 120, source='libre') for i in range(n)),
+                batch_size=5000,
+            )
+        finally:
+            post_save.receivers = receivers
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        print(f"{n} readings, page size {args.limit}")
+        with override_settings(ALLOWED_HOSTS=['*']):
+            client.get(f'{URL}?limit=1')  # warm up URLconf / view imports
+            url, page = f'{URL}?limit={args.limit}', 0
+            for depth in sorted(args.depths):
+                while page < depth - 1:
+                    url = client.get(url).json()['next']
+                    page += 1
+                elapsed, resp = timed(lambda: client.get(url))
+                print(f"page {depth:>5}: {elapsed * 1000:>8.1f} ms  {len(resp.content) / 1024:>8.0f} KiB")
+
+            qs = GlucoseRecord.objects.filter(user=user)
+            elapsed, data = timed(lambda: GlucoseRecordSerializer(qs, many=True).data)
+            print(f"full history (unpaginated serializer): {elapsed * 1000:>8.1f} ms  {len(data)} rows")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""GlucoseStatisticsView computation: ORM instances in Python vs one aggregate query vs rollups.
+
+Loads 1-minute CGM history for one user into a throwaway test database,
+backfills the hourly/daily rollups and times the three implementations over
+7/30/90-day ranges.
+
+Usage:
+    python scripts/bench_glucose_statistics.py
+    python scripts/bench_glucose_statistics.py --interval 5 --ranges 7 30
+"""
+import argparse
+import math
+import os
+import sys
+import time
+import warnings
+from datetime import timedelta
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.models.signals import post_save  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from core.models import GlucoseRecord  # noqa: E402
+from core.services import rollups  # noqa: E402
+from core.services.glucose_stats import summarize  # noqa: E402
+
+
+def legacy(user, start, end):
+    records = GlucoseRecord.objects.filter(user=user, timestamp__range=[start, end])
+    values = [r.glucose_level for r in records]
+    mean = sum(values) / len(values)
+    above = sum(1 for v in values if v > 180) / len(values) * 100
+    below = sum(1 for v in values if v < 70) / len(values) * 100
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+    return len(values), mean, above, below, std / mean * 100
+
+
+def aggregated(user, start, end):
+    s = summarize(user, start, end, 70, 180)
+    return s.count, s.mean, s.pct_above, s.pct_below, s.cv
+
+
+def rolled_up(user, start, end):
+    s = rollups.summary(user, start, end, 70, 180)
+    return s.count, s.mean, s.pct_above, s.pct_below, s.cv
+
+
+def best_of(fn, repeat):
+    best, out = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interval', type=int, default=1, help='minutes between readings')
+    parser.add_argument('--ranges', type=int, nargs='+', default=[7, 30, 90])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='x')
+        end = timezone.now()
+        n = max(args.ranges) * 24 * 60 // args.interval
+        rng = np.random.default_rng(0)
+        levels = np.clip(150 + np.cumsum(rng.normal(0, 2, size=n)), 40, 400)
+        receivers = post_save.receivers
+        post_save.receivers = []  # loading fixtures only; skip alert/feature signals
+        try:
+            GlucoseRecord.objects.bulk_create(
+                (GlucoseRecord(user=user, timestamp=end - timedelta(minutes=args.interval * i),
+                               glucose_level=float(levels[i]), source='libre') for i in range(n)),
+                batch_size=5000,
+            )
+        finally:
+            post_save.receivers = receivers
+        t0 = time.perf_counter()
+        rollups.backfill(user)
+        print(f"rollup backfill of {n} rows: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        print(f"{'range':>6} {'rows':>7} | {'python ms':>10} {'aggregate ms':>13} {'rollup ms':>10} {'speedup':>8}")
+        for days in args.ranges:
+            start = end - timedelta(days=days)
+            t_legacy, expected = best_of(lambda: legacy(user, start, end), args.repeat)
+            t_agg, got = best_of(lambda: aggregated(user, start, end), args.repeat)
+            t_roll, rolled = best_of(lambda: rolled_up(user, start, end), args.repeat)
+            for result in (got, rolled):
+                assert expected[0] == result[0] and all(abs(a - b) < 1e-6 for a, b in zip(expected[1:], result[1:]))
+            print(f'{days:>5}d {got[0]:>7} | {t_legacy * 1000:>10.1f} {t_agg * 1000:>13.1f} '
+                  f'{t_roll * 1000:>10.1f} {t_legacy / t_roll:>7.0f}x')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""End-to-end food-image analysis load test against the fake OpenAI server.
+
+Drives upload -> preprocess -> outbound call -> validate at a configurable
+concurrency against `fake_openai_server` (started in-process, or an
+external one with --base-url). Each client thread stands in for a web
+worker. The analysis cache is off, so every request reaches the model.
+
+Targets (--target):
+    view     multipart POST through OpenAIAnalyzeImageView (the default)
+    service  openai_service.analyze_image directly
+
+Load:
+    closed loop: --concurrency workers each send requests back to back;
+    open loop:   --rps N arrivals per second queue for the workers, so
+                 latency includes waiting for a free worker (saturation).
+
+Reported: throughput, latency p50/p95/p99/max, status codes, worker
+utilization, upstream requests per analysis (retry amplification) and
+the outbound layer's queue time, peak concurrency and breaker opens.
+
+Usage:
+    python scripts/bench_image_analysis.py --requests 400 --concurrency 16
+    python scripts/bench_image_analysis.py --concurrency 32 --p429 0.05 --ptimeout 0.02 --client-timeout 2
+    python scripts/bench_image_analysis.py --rps 40 --concurrency 16 --latency lognormal:600,0.6 --capacity 24
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import urllib.request
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+import fake_openai_server  # noqa: E402
+from core.services import openai_outbound  # noqa: E402
+from core.services.api import OpenAIAnalyzeImageView  # noqa: E402
+from core.services.openai_service import OpenAIServiceError, analyze_image  # noqa: E402
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def load_images(paths):
+    paths = paths or sorted(glob.glob(os.path.join(PROJECT_DIR, 'media', 'food_images', '*.jp*g')))
+    images = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            images.append((os.path.basename(path), f.read()))
+    if not images:
+        sys.exit('no sample images found; pass some with --images')
+    return images
+
+
+def upstream_stats(base_url):
+    root = base_url.rsplit('/v1', 1)[0]
+    with urllib.request.urlopen(f"{root}/stats", timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def reset_upstream(base_url):
+    root = base_url.rsplit('/v1', 1)[0]
+    urllib.request.urlopen(urllib.request.Request(f"{root}/reset", data=b'', method='POST'), timeout=5).read()
+
+
+def make_target(kind, user):
+    if kind == 'service':
+        def run(i, name, data):
+            try:
+                analyze_image(data, user_id=user.pk, request_id=f"bench-{i}", use_cache=False)
+                return 200
+            except OpenAIServiceError as e:
+                return getattr(e, 'status', 502)
+        return run
+
+    factory = APIRequestFactory()
+    view = OpenAIAnalyzeImageView.as_view(throttle_classes=[])
+
+    def run(i, name, data):
+        upload = SimpleUploadedFile(name, data, content_type='image/jpeg')
+        request = factory.post('/glugo/v1/ai/analyze-image/', {'image': upload}, format='multipart',
+                               HTTP_X_REQUEST_ID=f"bench-{i}")
+        force_authenticate(request, user=user)
+        return view(request).status_code
+    return run
+
+
+def drive(run, images, requests, concurrency, rps):
+    latencies, statuses = [], Counter()
+    busy = [0.0]
+    lock = threading.Lock()
+
+    def one(i, scheduled):
+        started = time.monotonic()
+        name, data = images[i % len(images)]
+        code = run(i, name, data)
+        done = time.monotonic()
+        with lock:
+            latencies.append(done - scheduled)
+            statuses[code] += 1
+            busy[0] += done - started
+
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(requests):
+            if rps:
+                scheduled = t0 + i / rps
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = None
+            pool.submit(lambda i=i, s=scheduled: one(i, s if s is not None else time.monotonic()))
+    wall = time.monotonic() - t0
+    return sorted(latencies), statuses, wall, busy[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['view', 'service'], default='view')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads (web workers)')
+    parser.add_argument('--rps', type=float, default=0, help='open-loop arrival rate (0: closed loop)')
+    parser.add_argument('--images', nargs='*')
+    parser.add_argument('--base-url', help='an already running fake server, e.g. http://127.0.0.1:8765/v1')
+    parser.add_argument('--client-timeout', type=int, default=5, help='OPENAI_TIMEOUT seconds')
+    parser.add_argument('--max-concurrency', type=int, default=8, help='OPENAI_MAX_CONCURRENCY')
+    parser.add_argument('--max-retries', type=int, default=1, help='OPENAI_MAX_RETRIES')
+    parser.add_argument('--rate-per-minute', type=float, default=6000, help='OPENAI_RATE_PER_MINUTE')
+    parser.add_argument('--queue-timeout', type=float, default=10, help='OPENAI_QUEUE_TIMEOUT')
+    parser.add_argument('--breaker-failures', type=int, default=5, help='OPENAI_BREAKER_FAILURES')
+    fake_openai_server.add_arguments(parser)
+    args = parser.parse_args()
+    logging.getLogger('core').setLevel(logging.CRITICAL)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        config = fake_openai_server.config_from_args(args)
+        config.hang = max(config.hang, args.client_timeout + 1)
+        server, base_url = fake_openai_server.start_in_thread(config)
+    images = load_images(args.images)
+
+    overrides = dict(
+        OPENAI_API_KEY='sk-fake', OPENAI_BASE_URL=base_url, OPENAI_TIMEOUT=args.client_timeout,
+        OPENAI_IMAGE_CACHE_ENABLED=False, OPENAI_MAX_CONCURRENCY=args.max_concurrency,
+        OPENAI_MAX_RETRIES=args.max_retries, OPENAI_RATE_PER_MINUTE=args.rate_per_minute,
+        OPENAI_RATE_BURST=max(1, args.max_concurrency), OPENAI_QUEUE_TIMEOUT=args.queue_timeout,
+        OPENAI_BREAKER_FAILURES=args.breaker_failures, OPENAI_RATE_LIMIT_BACKEND='local',
+    )
+    try:
+        with override_settings(**overrides):
+            user = get_user_model()(pk=1, username='bench')  # the view only reads request.user.id
+            run = make_target(args.target, user)
+            run(-1, *images[0])  # warm up: client, connection pool, PIL
+            reset_upstream(base_url)
+            latencies, statuses, wall, busy = drive(run, images, args.requests, args.concurrency, args.rps)
+            outbound = openai_outbound.outbound_stats()
+        upstream = upstream_stats(base_url)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    ok = statuses.get(200, 0)
+    print(f"target={args.target} requests={args.requests} concurrency={args.concurrency} "
+          f"rps={args.rps or 'closed-loop'} latency={args.latency} p429={args.p429} ptimeout={args.ptimeout} "
+          f"capacity={args.capacity or 'off'}")
+    print(f"  throughput      {args.requests / wall:8.1f} req/s over {wall:.1f} s")
+    print(f"  latency (s)     p50 {percentile(latencies, 0.5):.3f}  p95 {percentile(latencies, 0.95):.3f}  "
+          f"p99 {percentile(latencies, 0.99):.3f}  max {latencies[-1]:.3f}  mean {statistics.mean(latencies):.3f}")
+    print(f"  status codes    {dict(sorted(statuses.items()))}  ({ok / args.requests:.1%} ok)")
+    print(f"  worker util.    {busy / (wall * args.concurrency):.0%} of {args.concurrency} workers busy")
+    print(f"  upstream        {upstream['requests']} requests for {args.requests} analyses "
+          f"(amplification {upstream['requests'] / args.requests:.2f}x), peak in flight {upstream['peak_in_flight']}, "
+          f"429 {upstream['rate_limited'] + upstream['saturated']}, timeouts {upstream['timeouts']}")
+    queue = outbound['queue_seconds']
+    print(f"  outbound        peak in flight {outbound['peak_in_flight']}/{outbound['max_concurrency']}, "
+          f"queue p95 {queue['p95']} s, rejected {outbound['rejected_queue_timeout']}, "
+          f"breaker opens {outbound['breaker']['opens']} ({outbound['breaker']['state']}, "
+          f"{outbound['breaker']['rejected']} fast-failed)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Vision-request image preprocessing: CPU time and payload size per size tier.
+
+Compares the previous pipeline (full decode, LANCZOS only above 2048 px,
+quality 90 with optimize=True) against `image_preprocess.prepare` at each
+tier. Inputs are the sample photos under media/food_images plus
+phone-sized versions of them (4032x3024 and 3024x4032 with EXIF, as a
+camera produces), or the files given on the command line. CPU time is
+the median over --repeat runs; payload is the base64 length sent to the
+model.
+
+Usage:
+    python scripts/bench_image_preprocess.py
+    python scripts/bench_image_preprocess.py --tiers 512 1024 --repeat 9 photo1.jpg photo2.png
+"""
+import argparse
+import base64
+import glob
+import os
+import statistics
+import sys
+import time
+import warnings
+from io import BytesIO
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from PIL import Image, ImageFilter  # noqa: E402
+
+from core.services.image_preprocess import TIERS, prepare  # noqa: E402
+
+
+def legacy(image_bytes: bytes) -> bytes:
+    """The pipeline `prepare` replaced, kept here as the baseline."""
+    img = Image.open(BytesIO(image_bytes))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > 2048:
+        ratio = 2048 / max(img.size)
+        img = img.resize(tuple(int(d * ratio) for d in img.size), Image.Resampling.LANCZOS)
+    out = BytesIO()
+    img.save(out, format='JPEG', quality=90, optimize=True)
+    return out.getvalue()
+
+
+def phone_photo(sample: bytes, size) -> bytes:
+    """A camera-sized JPEG with EXIF, upscaled from a sample with some grain so it compresses like a photo."""
+    img = Image.open(BytesIO(sample)).convert('RGB').resize(size, Image.Resampling.BICUBIC)
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    img = Image.blend(img, noise, 0.08).filter(ImageFilter.SHARPEN)
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    exif[0x0110] = 'Model X'
+    out = BytesIO()
+    img.save(out, format='JPEG', quality=92, exif=exif.tobytes())
+    return out.getvalue()
+
+
+def timed(fn, data, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.process_time()
+        out = fn(data)
+        times.append(time.process_time() - t0)
+    return statistics.median(times), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--tiers', nargs='+', type=int, default=list(TIERS))
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paths = args.files or sorted(glob.glob(os.path.join(PROJECT_DIR, 'media', 'food_images', '*.jp*g')))
+    inputs = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            inputs.append((os.path.basename(path), f.read()))
+    if not args.files and inputs:
+        # the stored samples are small; add what a phone camera uploads
+        distinct = list({data: name for name, data in inputs}.items())[:2]
+        for i, (data, name) in enumerate(distinct):
+            size = (4032, 3024) if i % 2 == 0 else (3024, 4032)
+            inputs.append((f"{os.path.splitext(name)[0]}@{size[0]}x{size[1]}", phone_photo(data, size)))
+
+    columns = ['legacy'] + [str(t) for t in args.tiers]
+    print(f"{'image':<34}{'input':>14}" + ''.join(f"{c:>22}" for c in columns))
+    print(f"{'':<34}{'':>14}" + ''.join(f"{'cpu ms / b64 KB':>22}" for _ in columns))
+    totals = {c: [0.0, 0] for c in columns}
+    for name, data in inputs:
+        with Image.open(BytesIO(data)) as img:
+            dims = f"{img.width}x{img.height}"
+        row = f"{name[:33]:<34}{dims:>14}"
+        cpu, out = timed(legacy, data, args.repeat)
+        cells = [(cpu, len(base64.b64encode(out)), '')]
+        for tier in args.tiers:
+            cpu, prepared = timed(lambda d: prepare(d, max_edge=tier), data, args.repeat)
+            cells.append((cpu, len(base64.b64encode(prepared.data)), '' if prepared.reencoded else '*'))
+        for column, (cpu, size, mark) in zip(columns, cells):
+            totals[column][0] += cpu
+            totals[column][1] += size
+            row += f"{f'{cpu * 1000:.1f} / {size / 1024:.0f}{mark}':>22}"
+        print(row)
+    print(f"{'total':<34}{'':>14}" + ''.join(
+        f"{f'{totals[c][0] * 1000:.1f} / {totals[c][1] / 1024:.0f}':>22}" for c in columns))
+    print("* sent as uploaded (already fits the tier, no metadata)")
+
+
+if __name__ == '__main__':
+    main()
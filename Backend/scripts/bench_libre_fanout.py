@@ -0,0 +1,131 @@
+"""Fan-out Libre sync (core.services.libre_sync) vs the old serial loop, 1k-10k connections.
+
+Starts `fake_libre_server` in-process (or uses --base-url) and creates N
+users with stored LLU credentials but no ticket, in a throwaway
+file-backed SQLite test database. Then:
+
+  round 1  sync_connections(): every connection logs in (region redirect
+           included), fetches /connections + /graph and is bulk-ingested
+  round 2  the same with the tickets from round 1 (steady state)
+  serial   the loop the periodic sync used to be (one connection at a
+           time, /connections + /graph + ingest_payload) over the first
+           --serial-sample connections, extrapolated to N
+
+Usage:
+    python scripts/bench_libre_fanout.py --connections 1000 10000
+    python scripts/bench_libre_fanout.py --connections 2000 --concurrency 64 --region-rate 3000
+    python scripts/bench_libre_fanout.py --connections 1000 --p429 0.02 --account-rpm 6
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+import fake_libre_server  # noqa: E402
+from bench_libre_sync import create_connections, server_call  # noqa: E402
+from core.models import GlucoseRecord, LibreConnection  # noqa: E402
+from core.services import feature_store  # noqa: E402,F401  (import torch etc. outside the timed region)
+from core.services.libre import get_libreview_connection, get_libreview_graph  # noqa: E402
+from core.services.libre_ingest import ingest_payload  # noqa: E402
+from core.services.libre_sync import RegionLimiter, sync_connections  # noqa: E402
+
+
+def serial_sync(conns):
+    """The pre-fan-out periodic sync: one connection after another."""
+    ok = 0
+    for conn in conns:
+        try:
+            payloads = [get_libreview_connection(conn.api_endpoint, conn.token, conn.account_id)]
+            for item in payloads[0].get('data') or []:
+                payloads.append(get_libreview_graph(conn.api_endpoint, conn.token, conn.account_id, item['patientId']))
+            ingest_payload(conn.user, payloads, source='libre')
+            ok += 1
+        except Exception:
+            pass
+    return ok
+
+
+def report_line(label, n, report, stats):
+    summary = report.as_dict()
+    fetch = summary['fetch_seconds']
+    share = summary['ingest_seconds'] / summary['wall_seconds'] if summary['wall_seconds'] else 0
+    print(f"  {label:<8} {n / summary['wall_seconds']:8.1f} conn/s  wall {summary['wall_seconds']:7.1f}s  "
+          f"fetch p50 {fetch['p50']}s p99 {fetch['p99']}s  ingest {share:.0%} of wall  "
+          f"{summary['statuses']}  logins {summary['logins']}  rows {summary['created']}")
+    upstream = {k: v for k, v in stats.items() if k not in ('in_flight', 'accounts') and v}
+    print(f"  {'':<8} upstream {upstream}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, nargs='+', default=[1000])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--region-rate', type=float, default=6000, help='requests per minute per region')
+    parser.add_argument('--region-burst', type=int, default=50)
+    parser.add_argument('--serial-sample', type=int, default=100, help='connections timed with the serial loop (0: skip)')
+    parser.add_argument('--base-url', help='an already running fake server, e.g. http://127.0.0.1:8766')
+    fake_libre_server.add_arguments(parser)
+    args = parser.parse_args()
+    logging.getLogger('core').setLevel(logging.CRITICAL)
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url.rstrip('/')
+        region_template = base_url + '/api-{region}'
+    else:
+        server, base_url, region_template = fake_libre_server.start_in_thread(
+            fake_libre_server.config_from_args(args))
+
+    tmpdir = tempfile.mkdtemp(prefix='bench-libre-fanout-')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    print(f"fake LLU latency={args.latency} p429={args.p429} account_rpm={args.account_rpm or 'off'}; "
+          f"concurrency={args.concurrency}, region rate {args.region_rate:.0f}/min")
+    try:
+        with override_settings(LIBRE_PASSWORD_BASE_URL=base_url, LIBRE_REGION_URL_TEMPLATE=region_template):
+            for n in args.connections:
+                LibreConnection.objects.all().delete()
+                GlucoseRecord.objects.all().delete()
+                get_user_model().objects.filter(username__startswith='libre').delete()
+                create_connections(n, fake_libre_server.FakeLibreConfig.password)
+                LibreConnection.objects.update(connected=True)
+                print(f"{n} connections")
+                for label in ('round 1', 'round 2'):
+                    server_call(base_url, '/reset', 'POST')
+                    limiter = RegionLimiter(args.region_rate, args.region_burst)
+                    report = sync_connections(concurrency=args.concurrency, limiter=limiter)
+                    report_line(label, n, report, server_call(base_url, '/stats'))
+                if args.serial_sample:
+                    sample = list(LibreConnection.objects.select_related('user').order_by('pk')[:args.serial_sample])
+                    t0 = time.monotonic()
+                    ok = serial_sync(sample)
+                    elapsed = time.monotonic() - t0
+                    rate = len(sample) / elapsed
+                    print(f"  {'serial':<8} {rate:8.1f} conn/s  ({ok}/{len(sample)} ok over {elapsed:.1f}s; "
+                          f"~{n / rate:.0f}s for all {n})")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Ingest 14 days of Libre CGM history: per-row get_or_create vs bulk ingest.
+
+Builds an LLU graph-style payload at 1-minute and 5-minute resolution and
+times, against a throwaway test database:
+  - legacy:  one GlucoseRecord.objects.get_or_create per reading (post_save
+             alert/feature signals fire per row)
+  - bulk:    core.services.libre_ingest.ingest_payload
+  - re-sync: the same payload ingested again (everything already stored)
+
+Usage:
+    python scripts/bench_libre_ingest.py
+    python scripts/bench_libre_ingest.py --days 3 --skip-legacy
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from core.models import GlucoseRecord  # noqa: E402
+from core.services import feature_store  # noqa: E402,F401  (import torch etc. outside the timed region)
+from core.services.libre_ingest import LLU_TIMESTAMP_FORMAT, extract_readings, ingest_payload  # noqa: E402
+
+
+def make_payload(days, interval_minutes, end):
+    n = days * 24 * 60 // interval_minutes
+    rng = np.random.default_rng(0)
+    levels = np.clip(140 + np.cumsum(rng.normal(0, 2, size=n)), 40, 400)
+    graph = []
+    for i in range(n):
+        ts = end - timedelta(minutes=interval_minutes * (n - i))
+        graph.append({
+            'FactoryTimestamp': ts.strftime(LLU_TIMESTAMP_FORMAT),
+            'Timestamp': ts.strftime(LLU_TIMESTAMP_FORMAT),
+            'ValueInMgPerDl': round(float(levels[i])),
+            'TrendArrow': 3,
+        })
+    return {'data': {'connection': {'glucoseMeasurement': graph[-1]}, 'graphData': graph}}
+
+
+def legacy_ingest(user, payload):
+    created = 0
+    for r in extract_readings(payload):
+        _, was_created = GlucoseRecord.objects.get_or_create(
+            user=user, timestamp=r.timestamp, glucose_level=r.glucose_level, source='libre',
+            defaults={'trend_arrow': r.trend_arrow},
+        )
+        created += was_created
+    return created
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=14)
+    parser.add_argument('--intervals', type=int, nargs='+', default=[5, 1])
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        User = get_user_model()
+        end = datetime.now(dt_timezone.utc).replace(second=0, microsecond=0)
+        print(f"{'interval':>9} {'rows':>7} | {'legacy s':>9} {'bulk s':>8} {'speedup':>8} | {'re-sync s':>9} {'created':>7}")
+        for interval in args.intervals:
+            payload = make_payload(args.days, interval, end)
+            rows = len(set(extract_readings(payload)))
+            if args.skip_legacy:
+                legacy_txt, speed_txt = 'skipped', '-'
+            else:
+                legacy_user = User.objects.create_user(username=f'legacy{interval}', password='x')
+                legacy_time, _ = timed(lambda: legacy_ingest(legacy_user, payload))
+                legacy_txt = f'{legacy_time:.2f}'
+            bulk_user = User.objects.create_user(username=f'bulk{interval}', password='x')
+            bulk_time, result = timed(lambda: ingest_payload(bulk_user, payload))
+            resync_time, again = timed(lambda: ingest_payload(bulk_user, payload))
+            if not args.skip_legacy:
+                speed_txt = f'{legacy_time / bulk_time:.0f}x'
+            print(f'{interval:>7}m {rows:>7} | {legacy_txt:>9} {bulk_time:>8.2f} {speed_txt:>8} | '
+                  f'{resync_time:>9.2f} {again.created:>7}')
+            assert result.created == rows
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Adaptive Libre polling (core.services.libre_scheduler.PollPolicy) vs a fixed interval.
+
+Simulates a day of polling for N patients on the `fake_libre_server`
+glucose curves (a new reading every minute; some patients have their
+sensor off for a few hours, some an exercise dip that takes them below
+70 mg/dL) without any HTTP or database:
+
+  fixed     one poll every --fixed seconds
+  adaptive  after each poll PollPolicy picks the next interval from the
+            latest reading, its 15-minute rate of change, whether anything
+            new arrived and the patient's local time
+
+For each it reports polls (= /connections + /graph call pairs) and how
+long after glucose went below / above the target range the server first
+saw it (detection delay, mean / p95 / max).
+
+Usage:
+    python scripts/bench_libre_polling.py --patients 1000
+    python scripts/bench_libre_polling.py --patients 500 --fixed 60 --offline-share 0.2 --dip-share 0.5
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import warnings
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from fake_libre_server import glucose_at  # noqa: E402
+from core.models import LibreConnection  # noqa: E402
+from core.services.libre_ingest import LibreReading  # noqa: E402
+from core.services.libre_scheduler import PollPolicy  # noqa: E402
+from core.services.libre_sync import ConnectionResult  # noqa: E402
+
+START = datetime(2026, 10, 17, tzinfo=dt_timezone.utc)
+LOW, HIGH = 70.0, 180.0
+
+
+class Patient:
+    def __init__(self, index: int, rng: random.Random, offline_share: float, dip_share: float):
+        self.id = f'patient-{index}'
+        self.utc_offset = rng.choice(range(-8 * 60, 9 * 60, 60))
+        self.offline = None
+        if rng.random() < offline_share:
+            start = rng.randrange(0, 20 * 60)
+            self.offline = (start, start + rng.randrange(60, 4 * 60))
+        self.dip = None
+        if rng.random() < dip_share:
+            self.dip = (rng.randrange(0, 22 * 60), rng.uniform(50, 90))
+
+    def glucose(self, minute: int) -> float:
+        value = glucose_at(self.id, minute)
+        if self.dip is not None:
+            since = minute - self.dip[0]
+            if 0 <= since < 180:
+                value -= self.dip[1] * (since / 45) * math.exp(1 - since / 45)
+        return max(40.0, value)
+
+    def has_data(self, minute: int) -> bool:
+        return self.offline is None or not (self.offline[0] <= minute < self.offline[1])
+
+    def out_of_range_onsets(self, minutes: int):
+        """{'low': [...], 'high': [...]}: minutes at which glucose leaves [LOW, HIGH] (sensor on)."""
+        onsets, previous = {'low': [], 'high': []}, 'in'
+        for m in range(minutes):
+            if not self.has_data(m):
+                continue
+            value = self.glucose(m)
+            state = 'low' if value < LOW else 'high' if value > HIGH else 'in'
+            if state != 'in' and state != previous:
+                onsets[state].append(m)
+            previous = state
+        return onsets
+
+
+def latest_reading(patient: Patient, minute: int):
+    """(latest reading, rate) as the sync would see them at `minute`."""
+    seen = minute
+    while seen >= 0 and not patient.has_data(seen):
+        seen -= 1
+    if seen < 0:
+        return None, None
+    ts = START + timedelta(minutes=seen)
+    value = patient.glucose(seen)
+    rate = (value - patient.glucose(seen - 15)) / 15 if patient.has_data(seen - 15) else None
+    return LibreReading(ts, value, None), rate
+
+
+def poll_minutes_fixed(minutes: int, interval: int, offset: int):
+    return list(range(offset, minutes * 60, interval))
+
+
+def poll_minutes_adaptive(patient: Patient, policy: PollPolicy, minutes: int, offset: int):
+    conn = LibreConnection(sync_interval=policy.base_seconds, sync_failures=0, utc_offset_minutes=patient.utc_offset)
+    polls, second, last_seen = [], offset, None
+    while second < minutes * 60:
+        polls.append(second)
+        minute = second // 60
+        latest, rate = latest_reading(patient, minute)
+        created = int(latest is not None and latest.timestamp != last_seen)
+        last_seen = latest.timestamp if latest is not None else last_seen
+        result = ConnectionResult(connection_id=0, user_id=0, latest=latest, rate=rate, created=created)
+        seconds, _ = policy.interval(conn, result, LOW, HIGH, START + timedelta(seconds=second))
+        conn.sync_interval = seconds
+        second += seconds
+    return polls
+
+
+def detection_delays(onsets, polls):
+    delays, i = [], 0
+    for onset in onsets:
+        onset_second = onset * 60
+        while i < len(polls) and polls[i] < onset_second:
+            i += 1
+        if i < len(polls):
+            delays.append((polls[i] - onset_second) / 60)
+    return delays
+
+
+def delay_summary(delays):
+    delays = sorted(delays)
+    if not delays:
+        return 'n/a'
+    p95 = delays[min(len(delays) - 1, int(0.95 * (len(delays) - 1)))]
+    return f"mean {sum(delays) / len(delays):4.1f} p95 {p95:4.1f} max {delays[-1]:4.1f} min"
+
+
+def summary(label, polls, delays, patients, baseline_polls):
+    print(f"  {label:<9} {polls:8d} polls ({polls / patients:6.1f}/patient, {polls / baseline_polls:5.0%} of fixed)  "
+          f"low seen after {delay_summary(delays['low'])}  high after {delay_summary(delays['high'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--fixed', type=int, default=300, help='fixed polling interval in seconds')
+    parser.add_argument('--offline-share', type=float, default=0.1, help='share of patients with a sensor gap')
+    parser.add_argument('--dip-share', type=float, default=0.3, help='share of patients with an exercise dip')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    policy = PollPolicy.from_settings()
+    policy.rng = random.Random(args.seed)
+    minutes = args.hours * 60
+    totals = {label: [0, {'low': [], 'high': []}] for label in ('fixed', 'adaptive')}
+    for index in range(args.patients):
+        patient = Patient(index, rng, args.offline_share, args.dip_share)
+        onsets = patient.out_of_range_onsets(minutes)
+        offset = rng.randrange(args.fixed)
+        for label, polls in (('fixed', poll_minutes_fixed(minutes, args.fixed, offset)),
+                             ('adaptive', poll_minutes_adaptive(patient, policy, minutes, offset))):
+            totals[label][0] += len(polls)
+            for kind in ('low', 'high'):
+                totals[label][1][kind].extend(detection_delays(onsets[kind], polls))
+
+    print(f"{args.patients} patients over {args.hours}h, fixed every {args.fixed}s; policy min/base/max "
+          f"{policy.min_seconds}/{policy.base_seconds}/{policy.max_seconds}s, margin {policy.threshold_margin} mg/dL")
+    baseline = totals['fixed'][0]
+    for label, (polls, delays) in totals.items():
+        summary(label, polls, delays, args.patients, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Libre sync throughput for thousands of connections against the fake LLU server.
+
+Starts `fake_libre_server` in-process (or uses --base-url), creates N users
+with a LibreConnection each in a throwaway file-backed SQLite test database,
+and runs the real code paths from a thread pool:
+
+  login  LibreConnection.authenticate(): password login with region redirect
+  sync   core.tasks.sync_libre_for_user: /connections + /graph per patient,
+         then the bulk ingest (alerts, rollups, feature store)
+
+--rounds repeats the sync phase (after --pause seconds); with a short
+--token-ttl later rounds show what expired tickets do to a sync run.
+
+Reported per phase: throughput, latency p50/p95/p99/max, outcomes (ok,
+HTTP status, retry exhaustion), upstream requests per connection (urllib3
+retries included), the server's 429 / 401 / redirect counts and rows created.
+
+Usage:
+    python scripts/bench_libre_sync.py --connections 2000 --concurrency 32
+    python scripts/bench_libre_sync.py --connections 1000 --p429 0.05 --account-rpm 4
+    python scripts/bench_libre_sync.py --connections 500 --rounds 2 --token-ttl 5 --pause 6
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+import requests  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import close_old_connections, connection  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+import fake_libre_server  # noqa: E402
+from core.models import GlucoseRecord, LibreConnection  # noqa: E402
+from core.services import feature_store  # noqa: E402,F401  (import torch etc. outside the timed region)
+from core.tasks import sync_libre_for_user  # noqa: E402
+from users.utils import encrypt_password  # noqa: E402
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return float('nan')
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def server_call(base_url, path, method='GET'):
+    request = urllib.request.Request(f"{base_url}{path}", data=b'' if method == 'POST' else None, method=method)
+    with urllib.request.urlopen(request, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def outcome(exc):
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return f"http_{exc.response.status_code}"
+    if isinstance(exc, requests.exceptions.RetryError):
+        return 'retries_exhausted'
+    return type(exc).__name__
+
+
+def create_connections(n, password):
+    User = get_user_model()
+    User.objects.bulk_create([User(username=f'libre{i}', email=f'libre{i}@example.com') for i in range(n)],
+                             batch_size=1000)
+    users = User.objects.filter(username__startswith='libre').order_by('pk')
+    secret = encrypt_password(password)
+    LibreConnection.objects.bulk_create([LibreConnection(user=u, email=u.email, password_encrypted=secret)
+                                         for u in users], batch_size=1000)
+    return list(users.values_list('pk', flat=True))
+
+
+def run_phase(name, fn, items, concurrency, base_url):
+    latencies, outcomes = [], Counter()
+    lock = threading.Lock()
+
+    def one(item):
+        t0 = time.monotonic()
+        try:
+            label = fn(item)
+        except Exception as exc:
+            label = outcome(exc)
+        finally:
+            close_old_connections()
+        elapsed = time.monotonic() - t0
+        with lock:
+            latencies.append(elapsed)
+            outcomes[label] += 1
+
+    server_call(base_url, '/reset', 'POST')
+    t0 = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, items))
+    wall = time.monotonic() - t0
+    stats = server_call(base_url, '/stats')
+    latencies.sort()
+    n = len(items)
+    print(f"{name}: {n} connections, {concurrency} workers")
+    print(f"  throughput      {n / wall:8.1f} connections/s over {wall:.1f} s")
+    print(f"  latency (s)     p50 {percentile(latencies, 0.5):.3f}  p95 {percentile(latencies, 0.95):.3f}  "
+          f"p99 {percentile(latencies, 0.99):.3f}  max {latencies[-1]:.3f}  mean {statistics.mean(latencies):.3f}")
+    print(f"  outcomes        {dict(outcomes.most_common())}")
+    upstream = {k: v for k, v in stats.items() if k not in ('requests', 'in_flight', 'accounts') and v}
+    print(f"  upstream        {stats['requests']} requests ({stats['requests'] / n:.2f} per connection), {upstream}")
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=1, help='sync phases to run')
+    parser.add_argument('--pause', type=float, default=0, help='seconds between sync rounds')
+    parser.add_argument('--no-history', action='store_true', help='skip the per-patient /graph calls')
+    parser.add_argument('--base-url', help='an already running fake server, e.g. http://127.0.0.1:8766')
+    fake_libre_server.add_arguments(parser)
+    args = parser.parse_args()
+    logging.getLogger('core').setLevel(logging.CRITICAL)
+
+    server = None
+    if args.base_url:
+        base_url = args.base_url.rstrip('/')
+        region_template = base_url + '/api-{region}'
+    else:
+        server, base_url, region_template = fake_libre_server.start_in_thread(
+            fake_libre_server.config_from_args(args))
+
+    # a file database so the worker threads can share it (in-memory test DBs are per connection)
+    tmpdir = tempfile.mkdtemp(prefix='bench-libre-')
+    connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    connection.settings_dict.setdefault('OPTIONS', {})['timeout'] = 60
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(LIBRE_PASSWORD_BASE_URL=base_url, LIBRE_REGION_URL_TEMPLATE=region_template):
+            user_ids = create_connections(args.connections, fake_libre_server.FakeLibreConfig.password)
+            conns = list(LibreConnection.objects.all())
+            run_phase('login', lambda c: 'ok' if c.authenticate() else 'login_failed', conns,
+                      args.concurrency, base_url)
+            regions = Counter(LibreConnection.objects.values_list('region', flat=True))
+            print(f"  regions         {dict(regions.most_common())}")
+
+            def sync(user_id):
+                result = sync_libre_for_user(user_id, include_history=not args.no_history)
+                return 'ok' if 'error' not in result else result['error']
+
+            for i in range(args.rounds):
+                if i and args.pause:
+                    time.sleep(args.pause)
+                before = GlucoseRecord.objects.count()
+                run_phase(f"sync round {i + 1}", sync, user_ids, args.concurrency, base_url)
+                print(f"  rows created    {GlucoseRecord.objects.count() - before}")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
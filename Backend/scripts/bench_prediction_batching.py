@@ -0,0 +1,97 @@
+"""Latency/throughput of micro-batched vs per-request CNN-LSTM inference.
+
+Simulates N concurrent request threads, each predicting from its own
+48 x F window, and compares:
+  - per-request: one batch-of-one forward pass per request
+  - batched:     requests coalesced through core.services.batching.MicroBatcher
+
+Usage:
+    python scripts/bench_prediction_batching.py
+    python scripts/bench_prediction_batching.py --concurrency 1 8 32 --requests 400 --max-wait-ms 3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+warnings.filterwarnings('ignore')
+import django  # noqa: E402
+django.setup()
+
+from core.services.batching import MicroBatcher  # noqa: E402
+from core.services.inference import SEQ_LEN, get_runtime  # noqa: E402
+from model.feature_utils import create_features_from_csv  # noqa: E402
+
+
+def run_load(predict, windows, concurrency, total):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = total // concurrency
+    barrier = threading.Barrier(concurrency + 1)
+
+    def client(offset):
+        barrier.wait()
+        local = []
+        for i in range(per_thread):
+            t0 = time.perf_counter()
+            predict(windows[(offset + i) % len(windows)])
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    lat = np.array(latencies) * 1000
+    return len(lat) / elapsed, np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=512)
+    parser.add_argument('--max-batch', type=int, default=32)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    runtime = get_runtime()
+    if not runtime.cnn_lstm_ready:
+        print('CNN-LSTM artifacts not available; nothing to benchmark.')
+        return
+    df = create_features_from_csv(os.path.join(runtime.model_dir, '64.csv'))
+    values = df[runtime.feature_order].to_numpy(dtype=np.float32)
+    windows = [values[i:i + SEQ_LEN] for i in range(0, 256 * 5, 5)]
+
+    batcher = MicroBatcher(runtime.predict_cnn_lstm_batch, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    for w in windows[:8]:
+        runtime.predict_cnn_lstm(w)
+        batcher.predict(w)
+
+    print(f'torch threads={runtime.num_threads} max_batch={args.max_batch} max_wait={args.max_wait_ms}ms')
+    print(f"{'conc':>5} | {'per-request req/s':>17} {'p50':>7} {'p99':>7} | {'batched req/s':>13} {'p50':>7} {'p99':>7} {'avg batch':>9}")
+    for c in args.concurrency:
+        base = run_load(runtime.predict_cnn_lstm, windows, c, args.requests)
+        before = (batcher.batches, batcher.items)
+        batched = run_load(batcher.predict, windows, c, args.requests)
+        avg_batch = (batcher.items - before[1]) / max(1, batcher.batches - before[0])
+        print(f'{c:>5} | {base[0]:>17.0f} {base[1]:>6.1f}ms {base[2]:>6.1f}ms | '
+              f'{batched[0]:>13.0f} {batched[1]:>6.1f}ms {batched[2]:>6.1f}ms {avg_batch:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark the 5-minute resampling used by GlucosePredictionService.prepare_user_data.
+
+Compares the original slot-by-slot loop against the searchsorted-based
+engine in core.services.resample on synthetic dense Libre data (one reading
+per minute plus a few meals per day).
+
+Usage:
+    python scripts/bench_prepare_user_data.py
+    python scripts/bench_prepare_user_data.py --interval 5 --skip-legacy-over 1440
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..'))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from core.services.resample import resample, to_epoch_ns  # noqa: E402
+
+LOOKBACKS = [240, 24 * 60, 3 * 24 * 60, 7 * 24 * 60]
+
+
+def make_history(lookback_minutes, interval_minutes, end):
+    start = end - timedelta(minutes=lookback_minutes)
+    n = lookback_minutes // interval_minutes
+    rng = np.random.default_rng(0)
+    levels = 140 + np.cumsum(rng.normal(0, 2, size=n))
+    readings = [(start + timedelta(minutes=i * interval_minutes, seconds=int(rng.integers(0, 30))),
+                 float(np.clip(levels[i], 40, 400))) for i in range(n)]
+    meals = [(start + timedelta(hours=h), 45.0) for h in range(7, lookback_minutes // 60, 8)]
+    return start, readings, meals
+
+
+def legacy(readings, meals, start, end):
+    data = []
+    current = start
+    while current <= end:
+        closest, min_diff = None, float('inf')
+        for ts, level in readings:
+            diff = abs((ts - current).total_seconds())
+            if diff <= 300 and diff < min_diff:
+                closest, min_diff = level, diff
+        carbs = 0
+        for ts, c in meals:
+            if abs((ts - current).total_seconds()) <= 1800:
+                carbs += c
+        data.append({'timestamp': current, 'glucose': closest, 'carbs': carbs})
+        current += timedelta(minutes=5)
+    return data
+
+
+def vectorised(readings, meals, start, end):
+    g_ts = to_epoch_ns(r[0] for r in readings)
+    g_val = np.fromiter((r[1] for r in readings), dtype=float, count=len(readings))
+    f_ts = to_epoch_ns(m[0] for m in meals)
+    f_val = np.fromiter((m[1] for m in meals), dtype=float, count=len(meals))
+    start_ns, end_ns = to_epoch_ns([start, end])
+    return resample(g_ts, g_val, f_ts, f_val, start_ns, end_ns)
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--interval', type=int, default=1, help='minutes between CGM readings')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-legacy-over', type=int, default=None,
+                        help='skip the legacy loop for lookbacks longer than this many minutes')
+    args = parser.parse_args()
+
+    end = datetime.now(timezone.utc)
+    print(f"{'lookback':>10} {'readings':>9} {'slots':>6} {'legacy ms':>11} {'vector ms':>10} {'speedup':>8}")
+    for lookback in LOOKBACKS:
+        start, readings, meals = make_history(lookback, args.interval, end)
+        vec = best_of(lambda: vectorised(readings, meals, start, end), args.repeat)
+        slots = len(vectorised(readings, meals, start, end))
+        if args.skip_legacy_over is not None and lookback > args.skip_legacy_over:
+            leg_txt, speed_txt = 'skipped', '-'
+        else:
+            leg = best_of(lambda: legacy(readings, meals, start, end), 1)
+            leg_txt, speed_txt = f'{leg * 1000:.1f}', f'{leg / vec:.0f}x'
+        print(f'{lookback:>8}m {len(readings):>9} {slots:>6} {leg_txt:>11} {vec * 1000:>10.2f} {speed_txt:>8}')
+
+
+if __name__ == '__main__':
+    main()
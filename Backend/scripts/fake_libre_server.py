@@ -0,0 +1,420 @@
+"""Local stand-in for the LibreLinkUp (LLU) follower API.
+
+Serves the endpoints `core.services.libre` talks to, for any number of
+synthetic accounts, so Libre sync can be load tested without touching
+api-*.libreview.io:
+
+    POST /llu/auth/login                      global host: redirect to the account's region
+    POST /api-<region>/llu/auth/login         authTicket + user
+    GET  [/api-<region>]/llu/connections      followed patients with their latest glucoseMeasurement
+    GET  [/api-<region>]/llu/connections/<patientId>/graph     ~12h of graphData
+    GET  [/api-<region>]/llu/connections/<patientId>/logbook   scans of the last day
+
+Point the backend at it with
+    LIBRE_PASSWORD_BASE_URL=http://127.0.0.1:8766
+    LIBRE_REGION_URL_TEMPLATE=http://127.0.0.1:8766/api-{region}
+
+Accounts need no setup: every email is an account (password --password),
+with a region, user id and patient ids derived from a hash of the email.
+Glucose is a deterministic function of (patient, minute), with a daily
+swing, meal peaks and noise, so repeated fetches agree on past readings
+and new ones appear as the clock moves, as with a real sensor.
+
+Latency uses the --latency specs of fake_openai_server. Fault injection:
+    --p429 0.05          share of requests answered 429 with Retry-After
+    --account-rpm 10     per-account requests per minute before 429 (LLU locks out fast pollers)
+    --capacity 64        429 while more than 64 requests are in flight
+    --token-ttl 600      auth tickets expire after 600 s (401 'invalid or expired jwt')
+    --pexpire 0.01       share of data requests answered 401 as if the ticket had been revoked
+    --p500 0.01          share answered 500
+
+GET /stats returns the request counters; POST /reset clears them.
+
+Usage:
+    python scripts/fake_libre_server.py --port 8766 --latency lognormal:150,0.4 --token-ttl 900
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fake_openai_server import parse_latency
+
+LLU_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"  # core.services.libre_ingest.LLU_TIMESTAMP_FORMAT
+_SECRET = b'fake-llu'
+_PATH = re.compile(r'^(?:/api-(?P<region>[A-Za-z0-9]+))?/llu/(?P<rest>.*)$')
+
+
+@dataclass
+class FakeLibreConfig:
+    latency: str = 'lognormal:150,0.4'
+    regions: tuple = ('eu', 'us', 'ae', 'de', 'fr')
+    global_region: str = 'us'
+    password: str = 'secret'
+    patients: int = 1
+    graph_hours: int = 12
+    graph_interval: int = 15
+    p429: float = 0.0
+    account_rpm: int = 0
+    capacity: int = 0
+    token_ttl: int = 3600
+    pexpire: float = 0.0
+    p500: float = 0.0
+    retry_after: int = 1  # whole seconds; urllib3 rejects fractional Retry-After
+    seed: int = None
+
+
+def _digest(*parts) -> bytes:
+    return hashlib.sha256('|'.join(str(p) for p in parts).encode()).digest()
+
+
+def _unit(*parts) -> float:
+    """Deterministic uniform [0, 1) from the parts."""
+    return int.from_bytes(_digest(*parts)[:8], 'big') / 2 ** 64
+
+
+def glucose_at(patient_id: str, minute: int) -> float:
+    """Synthetic CGM value (mg/dL) for a patient at an epoch minute."""
+    base = 105 + 40 * _unit(patient_id, 'base')
+    phase = 2 * math.pi * _unit(patient_id, 'phase')
+    day_minute = minute % 1440
+    value = base + 25 * math.sin(2 * math.pi * day_minute / 1440 + phase)
+    for i, meal in enumerate((7 * 60 + 30, 13 * 60, 19 * 60 + 30)):
+        start = meal + 60 * (_unit(patient_id, 'meal', i) - 0.5)
+        since = day_minute - start
+        if 0 <= since < 240:
+            peak = 40 + 80 * _unit(patient_id, 'peak', i, minute // 1440)
+            value += peak * (since / 60) * math.exp(1 - since / 60)  # rise over ~1h, decay after
+    value += 8 * (_unit(patient_id, 'noise', minute // 5) - 0.5)
+    return max(40.0, min(400.0, value))
+
+
+def _trend(patient_id: str, minute: int) -> int:
+    slope = (glucose_at(patient_id, minute) - glucose_at(patient_id, minute - 15)) / 15
+    if slope < -2:
+        return 1
+    if slope < -1:
+        return 2
+    if slope <= 1:
+        return 3
+    if slope <= 2:
+        return 4
+    return 5
+
+
+def measurement(patient_id: str, minute: int, low: int = 70, high: int = 180) -> dict:
+    ts = datetime.fromtimestamp(minute * 60, tz=dt_timezone.utc).strftime(LLU_TIMESTAMP_FORMAT)
+    value = round(glucose_at(patient_id, minute))
+    return {
+        'FactoryTimestamp': ts,
+        'Timestamp': ts,
+        'type': 1,
+        'ValueInMgPerDl': value,
+        'TrendArrow': _trend(patient_id, minute),
+        'MeasurementColor': 1 if low <= value <= high else 2,
+        'GlucoseUnits': 1,
+        'Value': value,
+        'isHigh': value > high,
+        'isLow': value < low,
+    }
+
+
+class Account:
+    def __init__(self, email: str, config: FakeLibreConfig):
+        self.email = email.strip().lower()
+        self.user_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"llu-user:{self.email}"))
+        self.account_hash = hashlib.sha256(self.user_id.encode()).hexdigest()
+        self.region = config.regions[_digest(self.email)[0] % len(config.regions)]
+        self.patient_ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"llu-patient:{self.email}:{i}"))
+                            for i in range(max(1, config.patients))]
+
+
+class FakeLibreState:
+    def __init__(self, config: FakeLibreConfig):
+        self.config = config
+        self.sample_latency = parse_latency(config.latency)
+        self.random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.accounts = {}          # account hash -> Account, filled in on login
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = defaultdict(int)
+            self.windows = defaultdict(deque)
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def enter(self) -> int:
+        with self._lock:
+            self.in_flight += 1
+            self.counts['requests'] += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self.in_flight
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def draw(self) -> float:
+        with self._lock:
+            return self.random.random()
+
+    def over_account_limit(self, key: str) -> bool:
+        if not self.config.account_rpm:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = self.windows[key]
+            while window and now - window[0] > 60:
+                window.popleft()
+            if len(window) >= self.config.account_rpm:
+                return True
+            window.append(now)
+            return False
+
+    def account(self, email: str) -> Account:
+        account = Account(email, self.config)
+        with self._lock:
+            return self.accounts.setdefault(account.account_hash, account)
+
+    def issue_token(self, account: Account) -> dict:
+        issued = int(time.time())
+        expires = issued + self.config.token_ttl
+        body = f"{account.account_hash}.{account.region}.{expires}"
+        sig = hmac.new(_SECRET, body.encode(), hashlib.sha256).hexdigest()[:24]
+        return {'token': f"{body}.{sig}", 'expires': expires, 'duration': self.config.token_ttl * 1000}
+
+    def check_token(self, authorization: str, account_id: str):
+        """(account, None) for a valid ticket, else (None, reason)."""
+        token = (authorization or '').removeprefix('Bearer ').strip()
+        try:
+            account_hash, region, expires, sig = token.split('.')
+        except ValueError:
+            return None, 'unauthorized'
+        body = f"{account_hash}.{region}.{expires}"
+        if not hmac.compare_digest(sig, hmac.new(_SECRET, body.encode(), hashlib.sha256).hexdigest()[:24]):
+            return None, 'unauthorized'
+        if account_id != account_hash:
+            return None, 'unauthorized'  # account-id must be sha256(user id)
+        if int(expires) < time.time():
+            return None, 'expired'
+        with self._lock:
+            account = self.accounts.get(account_hash)
+        if account is None:
+            return None, 'unauthorized'  # issued by an earlier server process
+        return account, None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.counts, 'accounts': len(self.accounts),
+                    'in_flight': self.in_flight, 'peak_in_flight': self.peak_in_flight}
+
+
+class FakeLibreHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: FakeLibreState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _rate_limited(self, kind: str):
+        self.state.count(kind)
+        self._send(429, {'status': 429, 'data': {'code': 60, 'message': 'too many requests'}},
+                   {'Retry-After': str(self.state.config.retry_after)})
+
+    def _unauthorized(self, reason: str):
+        self.state.count(reason)
+        self._send(401, {'message': 'invalid or expired jwt' if reason == 'expired' else 'unauthorized'})
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            return self._send(200, self.state.snapshot())
+        self._handle('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if self.path.rstrip('/') == '/reset':
+            self.state.reset()
+            return self._send(200, {'reset': True})
+        self._handle('POST', raw)
+
+    def _handle(self, method: str, raw: bytes = b''):
+        match = _PATH.match(self.path.split('?')[0].rstrip('/'))
+        if not match:
+            return self._send(404, {'message': 'not found'})
+        region, rest = match.group('region'), match.group('rest')
+        state, config = self.state, self.state.config
+        in_flight = state.enter()
+        try:
+            if config.capacity and in_flight > config.capacity:
+                return self._rate_limited('saturated')
+            roll = state.draw()
+            if roll < config.p429:
+                return self._rate_limited('rate_limited')
+            time.sleep(state.sample_latency())
+            if roll - config.p429 < config.p500:
+                state.count('server_errors')
+                return self._send(500, {'message': 'internal error'})
+
+            if method == 'POST' and rest == 'auth/login':
+                return self._login(region, raw)
+            if method != 'GET' or not rest.startswith('connections'):
+                return self._send(404, {'message': 'not found'})
+
+            account, reason = state.check_token(self.headers.get('authorization'), self.headers.get('account-id'))
+            if account is None:
+                return self._unauthorized(reason)
+            if state.over_account_limit(account.account_hash):
+                return self._rate_limited('account_rate_limited')
+            if config.pexpire and state.draw() < config.pexpire:
+                return self._unauthorized('expired')
+            self._data(account, rest)
+        finally:
+            state.leave()
+
+    def _login(self, region, raw):
+        state, config = self.state, self.state.config
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            body = {}
+        email, password = body.get('email') or '', body.get('password') or ''
+        if not email or (config.password and password != config.password):
+            state.count('bad_credentials')
+            return self._send(200, {'status': 2, 'error': {'message': 'notAuthenticated'}})
+        account = state.account(email)
+        if state.over_account_limit(account.account_hash):
+            return self._rate_limited('account_rate_limited')
+        if (region or config.global_region) != account.region:
+            state.count('redirects')
+            return self._send(200, {'status': 0, 'data': {'redirect': True, 'region': account.region}})
+        state.count('logins')
+        self._send(200, {'status': 0, 'data': {
+            'user': {'id': account.user_id, 'email': account.email, 'country': account.region.upper()},
+            'authTicket': state.issue_token(account),
+        }})
+
+    def _data(self, account: Account, rest: str):
+        config = self.state.config
+        now_minute = int(time.time() // 60)
+        parts = rest.split('/')
+        if len(parts) == 1:
+            self.state.count('connections')
+            return self._send(200, {'status': 0, 'data': [self._connection(pid, now_minute)
+                                                           for pid in account.patient_ids]})
+        patient_id, kind = parts[1], parts[2] if len(parts) > 2 else ''
+        if patient_id not in account.patient_ids or kind not in ('graph', 'logbook'):
+            return self._send(404, {'message': 'not found'})
+        self.state.count(kind)
+        if kind == 'graph':
+            step = max(1, config.graph_interval)
+            last = now_minute - now_minute % step
+            graph = [measurement(patient_id, m)
+                     for m in range(last - config.graph_hours * 60 + step, last + 1, step)]
+            return self._send(200, {'status': 0, 'data': {
+                'connection': self._connection(patient_id, now_minute), 'graphData': graph}})
+        # logbook: a scan every ~3 hours over the last day
+        scans = [measurement(patient_id, now_minute - 180 * i - int(60 * _unit(patient_id, 'scan', now_minute // 180 - i)))
+                 for i in range(8)]
+        self._send(200, {'status': 0, 'data': scans})
+
+    def _connection(self, patient_id: str, minute: int) -> dict:
+        gm = measurement(patient_id, minute)
+        return {
+            'id': patient_id,
+            'patientId': patient_id,
+            'firstName': 'Synthetic',
+            'lastName': patient_id[:8],
+            'status': 2,
+            'targetLow': 70,
+            'targetHigh': 180,
+            'uom': 1,
+            'glucoseMeasurement': gm,
+            'glucoseItem': gm,
+        }
+
+
+def make_server(config: FakeLibreConfig, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    handler = type('Handler', (FakeLibreHandler,), {'state': FakeLibreState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    server.state = handler.state
+    return server
+
+
+def start_in_thread(config: FakeLibreConfig, host: str = '127.0.0.1', port: int = 0):
+    """Start a server on a background thread; returns (server, base_url, region_url_template)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-libre', daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    return server, base_url, base_url + '/api-{region}'
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', default=FakeLibreConfig.latency)
+    parser.add_argument('--regions', default=','.join(FakeLibreConfig.regions))
+    parser.add_argument('--patients', type=int, default=1, help='followed patients per account')
+    parser.add_argument('--p429', type=float, default=0.0)
+    parser.add_argument('--account-rpm', type=int, default=0, help='per-account requests per minute (0: off)')
+    parser.add_argument('--capacity', type=int, default=0, help='429 above this many requests in flight (0: off)')
+    parser.add_argument('--token-ttl', type=int, default=FakeLibreConfig.token_ttl, help='auth ticket lifetime, seconds')
+    parser.add_argument('--pexpire', type=float, default=0.0)
+    parser.add_argument('--p500', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args) -> FakeLibreConfig:
+    regions = tuple(r.strip() for r in args.regions.split(',') if r.strip())
+    return FakeLibreConfig(latency=args.latency, regions=regions, patients=args.patients, p429=args.p429,
+                           account_rpm=args.account_rpm, capacity=args.capacity, token_ttl=args.token_ttl,
+                           pexpire=args.pexpire, p500=args.p500, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(config_from_args(args), args.host, args.port)
+    print(f"Fake LibreLinkUp server on http://{args.host}:{args.port} "
+          f"(regions at http://{args.host}:{args.port}/api-{{region}}, password {server.state.config.password!r})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
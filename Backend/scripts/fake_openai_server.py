@@ -0,0 +1,277 @@
+"""Local stand-in for the OpenAI chat-completions vision endpoint.
+
+Answers POST /v1/chat/completions with a canned `OpenAIImageResponse`
+JSON (picked by a hash of the image, so the same photo always gets the
+same meal) after a sampled latency. Load tests can then exercise
+`OpenAIAnalyzeImageView`, analysis jobs and `FoodEntry.analyze_food`
+without spending API money. Point the backend at it with
+OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and any OPENAI_API_KEY.
+
+Latency distributions (--latency, milliseconds):
+    fixed:800            always 800 ms
+    uniform:300,1500     uniform between the bounds
+    lognormal:800,0.5    median 800 ms, sigma 0.5 (long right tail, like the real API)
+    exp:800              exponential with mean 800 ms
+
+Fault injection:
+    --p429 0.05          share of requests answered 429 with Retry-After
+    --ptimeout 0.02      share of requests that hang for --hang seconds (past the client timeout)
+    --p500 0.01          share answered 500
+    --capacity 16        answer 429 while more than 16 requests are in flight (provider saturation)
+    --invalid 0.01       share answered with JSON that fails OpenAIImageResponse validation
+
+GET /stats returns the request counters; POST /reset clears them.
+
+Usage:
+    python scripts/fake_openai_server.py --port 8765 --latency lognormal:800,0.5 --p429 0.05
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MEALS = [
+    {'name': 'chicken rice bowl', 'components': [{'name': 'rice', 'carbs_g': 52.0}, {'name': 'chicken', 'carbs_g': 0.0},
+                                                 {'name': 'vegetables', 'carbs_g': 8.0}],
+     'total_carbs_g': 60.0, 'confidence': 0.82, 'calories_estimate': 610.0, 'total_protein_g': 38.0,
+     'total_fat_g': 14.0},
+    {'name': 'cheeseburger with fries', 'components': [{'name': 'bun', 'carbs_g': 30.0},
+                                                       {'name': 'fries', 'carbs_g': 45.0}],
+     'total_carbs_g': 75.0, 'confidence': 0.77, 'calories_estimate': 980.0, 'total_protein_g': 32.0,
+     'total_fat_g': 48.0},
+    {'name': 'greek salad', 'components': [{'name': 'vegetables', 'carbs_g': 9.0}, {'name': 'feta', 'carbs_g': 2.0}],
+     'total_carbs_g': 11.0, 'confidence': 0.9, 'calories_estimate': 320.0, 'total_protein_g': 9.0,
+     'total_fat_g': 26.0},
+    {'name': 'oatmeal with banana', 'components': [{'name': 'oats', 'carbs_g': 27.0}, {'name': 'banana', 'carbs_g': 23.0}],
+     'total_carbs_g': 50.0, 'confidence': 0.86, 'calories_estimate': 350.0, 'total_protein_g': 10.0,
+     'total_fat_g': 6.0},
+]
+
+_DATA_URL = re.compile(r'^data:image/(jpeg|png|webp|gif);base64,')
+
+
+def parse_latency(spec: str):
+    """A zero-argument sampler (seconds) for a --latency spec."""
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v]
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == 'lognormal':
+        mu, sigma = math.log(values[0]), values[1] if len(values) > 1 else 0.5
+        return lambda: random.lognormvariate(mu, sigma) / 1000
+    if kind == 'exp':
+        return lambda: random.expovariate(1000 / values[0])
+    raise ValueError(f"unknown latency distribution {spec!r}")
+
+
+@dataclass
+class FakeConfig:
+    latency: str = 'lognormal:800,0.5'
+    p429: float = 0.0
+    ptimeout: float = 0.0
+    p500: float = 0.0
+    invalid: float = 0.0
+    hang: float = 30.0
+    capacity: int = 0
+    retry_after: float = 1.0
+    seed: int = None
+
+
+class FakeState:
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.sample_latency = parse_latency(config.latency)
+        self.random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'saturated': 0, 'timeouts': 0,
+                           'server_errors': 0, 'invalid': 0, 'bad_requests': 0}
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def count(self, name: str):
+        with self._lock:
+            self.counts[name] += 1
+
+    def enter(self) -> int:
+        with self._lock:
+            self.in_flight += 1
+            self.counts['requests'] += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return self.in_flight
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def draw(self) -> float:
+        with self._lock:
+            return self.random.random()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.counts, 'in_flight': self.in_flight, 'peak_in_flight': self.peak_in_flight}
+
+
+def _image_url(body: dict):
+    for message in body.get('messages') or []:
+        content = message.get('content')
+        if isinstance(content, list):
+            for part in content:
+                if isinstance(part, dict) and part.get('type') == 'image_url':
+                    return (part.get('image_url') or {}).get('url')
+    return None
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: FakeState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, payload: dict, headers: dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout injection)
+
+    def _error(self, status: int, message: str, kind: str, headers: dict = None):
+        self._send(status, {'error': {'message': message, 'type': kind, 'param': None, 'code': kind}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            return self._send(200, self.state.snapshot())
+        self._error(404, 'not found', 'not_found')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '/reset':
+            self.state.reset()
+            return self._send(200, {'reset': True})
+        if not path.endswith('/chat/completions'):
+            return self._error(404, 'not found', 'not_found')
+
+        state, config = self.state, self.state.config
+        in_flight = state.enter()
+        try:
+            try:
+                body = json.loads(raw or b'{}')
+            except ValueError:
+                state.count('bad_requests')
+                return self._error(400, 'invalid JSON body', 'invalid_request_error')
+            url = _image_url(body)
+            if not url or not _DATA_URL.match(url):
+                state.count('bad_requests')
+                return self._error(400, 'expected a base64 image data URL', 'invalid_image_format')
+
+            if config.capacity and in_flight > config.capacity:
+                state.count('saturated')
+                return self._error(429, 'server is overloaded', 'rate_limit_exceeded',
+                                   {'Retry-After': str(config.retry_after)})
+            roll = state.draw()
+            if roll < config.p429:
+                state.count('rate_limited')
+                return self._error(429, 'rate limit reached', 'rate_limit_exceeded',
+                                   {'Retry-After': str(config.retry_after)})
+            roll -= config.p429
+            if roll < config.ptimeout:
+                state.count('timeouts')
+                time.sleep(config.hang)
+                return self._error(504, 'upstream timed out', 'timeout')
+            roll -= config.ptimeout
+
+            time.sleep(state.sample_latency())
+            if roll < config.p500:
+                state.count('server_errors')
+                return self._error(500, 'internal error', 'server_error')
+            roll -= config.p500
+
+            digest = hashlib.sha256(url.encode()).digest()
+            meal = MEALS[digest[0] % len(MEALS)]
+            if roll < config.invalid:
+                state.count('invalid')
+                content = json.dumps({'name': meal['name']})  # missing required fields
+            else:
+                state.count('ok')
+                content = json.dumps(meal)
+            self._send(200, {
+                'id': f"chatcmpl-fake-{digest[:6].hex()}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', 'fake-vision'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'logprobs': None,
+                             'message': {'role': 'assistant', 'content': content, 'refusal': None}}],
+                'usage': {'prompt_tokens': 850, 'completion_tokens': 120, 'total_tokens': 970},
+            })
+        finally:
+            state.leave()
+
+
+def make_server(config: FakeConfig, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    handler = type('Handler', (FakeOpenAIHandler,), {'state': FakeState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    return server
+
+
+def start_in_thread(config: FakeConfig, host: str = '127.0.0.1', port: int = 0):
+    """Start a server on a background thread; returns (server, base_url ending in /v1)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name='fake-openai', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', default=FakeConfig.latency)
+    parser.add_argument('--p429', type=float, default=0.0)
+    parser.add_argument('--ptimeout', type=float, default=0.0)
+    parser.add_argument('--p500', type=float, default=0.0)
+    parser.add_argument('--invalid', type=float, default=0.0)
+    parser.add_argument('--hang', type=float, default=FakeConfig.hang, help='seconds a timed-out request hangs')
+    parser.add_argument('--capacity', type=int, default=0, help='429 above this many requests in flight (0: off)')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def config_from_args(args) -> FakeConfig:
+    return FakeConfig(latency=args.latency, p429=args.p429, ptimeout=args.ptimeout, p500=args.p500,
+                      invalid=args.invalid, hang=args.hang, capacity=args.capacity, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(config_from_args(args), args.host, args.port)
+    print(f"Fake OpenAI vision server on http://{args.host}:{args.port}/v1 ({args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -94,16 +94,29 @@ class _DevicesDetailScreenState extends State<DevicesDetailScreen>
     );
   }
 
+  static const Duration _defaultStatusInterval = Duration(seconds: 30);
+
   void _startSyncStatusMonitoring() {
-    // Poll for sync status every 2 seconds when connected
-    _syncStatusTimer = Timer.periodic(const Duration(seconds: 2), (timer) {
-      if (_isConnected && mounted) {
-        _checkSyncStatus(); // Refresh status periodically
+    _scheduleSyncStatusCheck(_defaultStatusInterval);
+  }
+
+  // Check again just after the server's next scheduled sync
+  // (poll_after_seconds) instead of on a fixed short timer
+  void _scheduleSyncStatusCheck(Duration delay) {
+    _syncStatusTimer?.cancel();
+    _syncStatusTimer = Timer(delay, () async {
+      if (!mounted) return;
+      var next = _defaultStatusInterval;
+      if (_isConnected) {
+        next = await _checkSyncStatus();
+      }
+      if (mounted) {
+        _scheduleSyncStatusCheck(next);
       }
     });
   }
 
-  Future<void> _checkSyncStatus() async{
+  Future<Duration> _checkSyncStatus() async{
     try {
       // Check if there's an ongoing sync by calling the status endpoint
       final status = await _apiService.getLibreStatus();
@@ -117,9 +130,15 @@ class _DevicesDetailScreenState extends State<DevicesDetailScreen>
           });
         }
       }
+
+      final pollAfter = status['poll_after_seconds'];
+      if (pollAfter is num) {
+        return Duration(seconds: pollAfter.toInt().clamp(5, 1800));
+      }
     } catch (e) {
       print('Error checking sync status: $e');
     }
+    return _defaultStatusInterval;
   }
 
   Future<void> _loadSyncHistory() async {
@@ -298,7 +298,8 @@ class ApiService {
 
   // ==================== GLUCOSE RECORDS ====================
 
-  /// Get glucose records with optional date range
+  /// Get glucose records with optional date range, following the cursor
+  /// pages until the range is covered or `limit` records have been read
   Future<List<dynamic>> getGlucoseRecords({
     DateTime? startDate,
     DateTime? endDate,
@@ -322,16 +323,30 @@ class ApiService {
         url += '?${Uri(queryParameters: queryParams).query}';
       }
       
-      final response = await _makeAuthenticatedRequest(() => http.get(
-        Uri.parse(url),
-        headers: _getHeaders(),
-      ));
-      
-      if (response.statusCode == 200) {
-        return json.decode(response.body);
-      } else {
-        throw Exception('Failed to load glucose records: ${response.statusCode}');
+      // list endpoints are cursor-paginated: {next, previous, results}.
+      // Follow `next` until the range is exhausted or `limit` records are in.
+      final records = <dynamic>[];
+      String? nextUrl = url;
+      while (nextUrl != null) {
+        final response = await _makeAuthenticatedRequest(() => http.get(
+          Uri.parse(nextUrl!),
+          headers: _getHeaders(),
+        ));
+
+        if (response.statusCode != 200) {
+          throw Exception('Failed to load glucose records: ${response.statusCode}');
+        }
+        final data = json.decode(response.body);
+        if (data is! Map) {
+          return data;
+        }
+        records.addAll((data['results'] ?? []) as List);
+        if (limit != null && records.length >= limit) {
+          return records.sublist(0, limit);
+        }
+        nextUrl = data['next'] as String?;
       }
+      return records;
     } on SocketException {
       throw Exception('No internet connection. Please check your network.');
     } catch (e) {
@@ -364,6 +379,40 @@ class ApiService {
     }
   }
 
+  /// Replay glucose readings queued while offline in one request.
+  /// Each item needs a unique `client_id`; replaying the same items is safe.
+  /// Returns per-item results (`created` / `duplicate` / `invalid`).
+  Future<Map<String, dynamic>> batchCreateGlucoseRecords(List<Map<String, dynamic>> items) {
+    return _postBatch('$baseUrl/glucose-records/batch/', items);
+  }
+
+  /// Replay food entries queued while offline (same contract as above).
+  Future<Map<String, dynamic>> batchCreateFoodEntries(List<Map<String, dynamic>> items) {
+    return _postBatch('$baseUrl/food-entries/batch/', items);
+  }
+
+  Future<Map<String, dynamic>> _postBatch(String url, List<Map<String, dynamic>> items) async {
+    try {
+      final response = await _makeAuthenticatedRequest(() => http.post(
+        Uri.parse(url),
+        headers: _getHeaders(),
+        body: json.encode({'items': items}),
+      ));
+
+      if (response.statusCode == 200) {
+        return json.decode(response.body) as Map<String, dynamic>;
+      } else {
+        final error = json.decode(response.body);
+        throw Exception(_formatErrorMessage(error));
+      }
+    } on SocketException {
+      throw Exception('No internet connection. Please check your network.');
+    } catch (e) {
+      print('Error replaying offline batch: $e');
+      rethrow;
+    }
+  }
+
   /// Update glucose record
   Future<dynamic> updateGlucoseRecord(String recordId, Map<String, dynamic> data) async {
     try {
@@ -685,6 +734,66 @@ class ApiService {
   }
 }
 
+  /// Analyze a food image as a background job: uploads, then polls the job
+  /// until it has succeeded (returns the analysis) or failed (throws).
+  /// Pass [foodEntryId] to have the result stored on that entry as well.
+  Future<Map<String, dynamic>> analyzeImageAsync(
+    File imageFile, {
+    String? foodEntryId,
+    Duration pollInterval = const Duration(seconds: 2),
+    Duration timeout = const Duration(minutes: 3),
+  }) async {
+    try {
+      await init();
+      if (!isLoggedIn) {
+        throw Exception('User not logged in');
+      }
+
+      final request = http.MultipartRequest('POST', Uri.parse('$baseUrl/ai/analyze-image/jobs/'));
+      request.headers['Authorization'] = 'Bearer $_accessToken';
+      request.files.add(await http.MultipartFile.fromPath(
+        'image',
+        imageFile.path,
+        contentType: MediaType('image', 'jpeg'),
+      ));
+      if (foodEntryId != null) {
+        request.fields['food_entry'] = foodEntryId;
+      }
+
+      final response = await http.Response.fromStream(await request.send());
+      if (response.statusCode != 202) {
+        throw Exception('Failed to queue image analysis: ${response.statusCode}');
+      }
+      var job = json.decode(response.body) as Map<String, dynamic>;
+      final deadline = DateTime.now().add(timeout);
+
+      while (job['status'] == 'queued' || job['status'] == 'running') {
+        if (DateTime.now().isAfter(deadline)) {
+          throw Exception('Image analysis is taking too long, please try again');
+        }
+        await Future.delayed(pollInterval);
+        final poll = await _makeAuthenticatedRequest(() => http.get(
+          Uri.parse('$baseUrl/ai/analyze-image/jobs/${job['job_id']}/'),
+          headers: _getHeaders(),
+        ));
+        if (poll.statusCode != 200) {
+          throw Exception('Failed to check image analysis: ${poll.statusCode}');
+        }
+        job = json.decode(poll.body) as Map<String, dynamic>;
+      }
+
+      if (job['status'] != 'succeeded') {
+        throw Exception('Image analysis failed: ${job['error']}');
+      }
+      return job['result'] as Map<String, dynamic>;
+    } on SocketException {
+      throw Exception('No internet connection. Please check your network.');
+    } catch (e) {
+      print('Error analyzing image: $e');
+      rethrow;
+    }
+  }
+
   // ==================== INSULIN CALCULATION ====================
 
   /// Calculate insulin dose